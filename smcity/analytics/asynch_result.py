@@ -4,10 +4,14 @@ import time
 
 from smcity.errors import NotReadyError
 
+# Bounds of the exponential backoff used when polling the job's status
+MIN_POLL_DELAY = 0.05
+MAX_POLL_DELAY = 2.0
+
 class AsynchResult:
     ''' Interface for retrieving the results of analytic calculations. '''
 
-    def __init__(self, job_factory, job_id, polygon_strategy):
+    def __init__(self, job_factory, job_id, polygon_strategy, completion_notifier=None):
         '''
         Constructor.
 
@@ -17,16 +21,107 @@ class AsynchResult:
         @paramType string/uuid
         @param polygon_strategy Used to construct the final result from the various sub-area results
         @paramType PolygonStrategy
+        @param completion_notifier Channel on which the job's completion is announced, if any
+        @paramType CompletionNotifier
         @return n/a
         '''
         assert job_factory is not None
         assert job_id is not None
         assert polygon_strategy is not None
         
+        self.completion_notifier = completion_notifier
         self.job_factory = job_factory
         self.job_id = job_id
         self.polygon_strategy = polygon_strategy
 
+    def _get_completion(self, job, num_results):
+        '''
+        @param job Job being tracked
+        @paramType Job
+        @param num_results # of sub-area results received so far
+        @paramType int
+        @returns Fraction of the sub-area results received so far
+        @returnType float between 0 and 1
+        '''
+        if job.is_finished():
+            return 1.0
+
+        return min(1.0, float(num_results) / job.get_num_sub_areas())
+
+    def cancel(self):
+        '''
+        Cancels the job, freeing up the compute nodes for other jobs. Results received so far stay
+        available, no further results are added.
+
+        @returns n/a
+        '''
+        self.job_factory.cancel_job(self.job_id)
+
+    def get_partial_results_geojson(self):
+        '''
+        Generates GeoJSON encoded results for the sub-areas finished so far. This function does not
+        block or require the job to be finished.
+
+        @returns GeoJSON encoded results so far and the fraction of the job that is complete
+        @returnType tuple (string/GeoJSON, float)
+        '''
+        job = self.job_factory.get_job(self.job_id)
+        results = job.get_results()
+
+        return self.polygon_strategy.encode_results_geojson(results), self._get_completion(job, len(results))
+
+    def get_results(self):
+        '''
+        Retrieves the sub-area results. This function is not blocking and expects the job to be
+        finished when called (@see is_finished())
+
+        @returns Sub-area results, including those of split sub-areas
+        @returnType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @throws Exception if the job is not finished
+        @throwType NotReadyError
+        '''
+        job = self.job_factory.get_job(self.job_id)
+
+        if not job.is_finished(): # If the job isn't finished
+            raise NotReadyError()
+
+        return job.get_results()
+
+    def get_results_blocking(self, timeout=None):
+        '''
+        Blocking version of the get_results function. Wakes as soon as the job's completion is
+        announced, falling back to status-only polls with exponential backoff.
+
+        @param timeout Blocking limit in seconds, if none no blocking limit is used
+        @paramType int
+        @returns Sub-area results, including those of split sub-areas
+        @returnType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @throws Exception if the job is not finished within the blocking limit
+        @throwType NotReadyError
+        '''
+        start_time = time.time()
+        delay = MIN_POLL_DELAY
+
+        while True: # Keep waiting for results until blocking time runs out
+            if self.is_finished():
+                try:
+                    return self.get_results()
+                except NotReadyError:
+                    pass # The full read lagged behind the status read
+
+            if timeout is not None:
+                remaining = start_time + timeout - time.time()
+                if remaining <= 0:
+                    raise NotReadyError() # No results were retrieved in time
+                delay = min(delay, remaining)
+
+            if self.completion_notifier is not None:
+                self.completion_notifier.wait_until_finished(self.job_id, delay)
+            else:
+                time.sleep(delay)
+
+            delay = min(delay * 2, MAX_POLL_DELAY)
+
     def get_results_geojson(self):
         '''
         Generates GeoJSON encoded results. This function is not blocking and expects
@@ -37,18 +132,11 @@ class AsynchResult:
         @throws Exception if the job is not finished
         @throwType NotReadyError
         '''
-        job = self.job_factory.get_job(self.job_id)
-
-        if not job.is_finished(): # If the job isn't finished
-            raise NotReadyError()
-
-        results = job.get_results() # Retrieve the sub-area results
-        
-        return self.polygon_strategy.encode_results_geojson(results)
+        return self.polygon_strategy.encode_results_geojson(self.get_results())
 
     def get_results_geojson_blocking(self, timeout=None):
         '''
-        Blocking version of the get_results_geojson function.
+        Blocking version of the get_results_geojson function, see get_results_blocking().
 
         @param timeout Blocking limit in seconds, if none no blocking limit is used
         @paramType int
@@ -57,40 +145,143 @@ class AsynchResult:
         @throws Exception if the job is not finished within the blocking limit
         @throwType NotReadyError
         '''
-        start_time = time.time()
+        return self.polygon_strategy.encode_results_geojson(self.get_results_blocking(timeout))
 
-        while time.time() < start_time + timeout: # Keep polling for results until blocking time runs out
-            job = self.job_factory.get_job(job_id)
+    def get_results_mvt_tile(self, zoom, x, y):
+        '''
+        Encodes the results inside the z/x/y tile as a Mapbox Vector Tile. This function is not
+        blocking and expects the job to be finished when called (@see is_finished())
 
-            if job.is_finished(): # If the job is finished
-                return self.polygon_strategy.encode_results_geojson(results)
-            else:
-                time.sleep(1) # Wait a second to keep from pounding AWS with requests
+        @param zoom Zoom level of the tile
+        @paramType int
+        @param x Column of the tile
+        @paramType int
+        @param y Row of the tile
+        @paramType int
+        @returns MVT encoded tile
+        @returnType string/binary
+        @throws Exception if the job is not finished
+        @throwType NotReadyError
+        '''
+        job = self.job_factory.get_job(self.job_id)
+
+        if not job.is_finished(): # If the job isn't finished
+            raise NotReadyError()
+
+        return self.polygon_strategy.encode_results_mvt(job.get_results(), zoom, x, y)
+
+    def get_results_png(self, pixels_per_cell=1):
+        '''
+        Renders the results as a heat map image. This function is not blocking and expects the job
+        to be finished when called (@see is_finished())
+
+        @param pixels_per_cell Width and height of each grid cell in pixels
+        @paramType int
+        @returns PNG encoded heat map
+        @returnType string/binary
+        @throws Exception if the job is not finished
+        @throwType NotReadyError
+        '''
+        job = self.job_factory.get_job(self.job_id)
+
+        if not job.is_finished(): # If the job isn't finished
+            raise NotReadyError()
+
+        return self.polygon_strategy.encode_results_png(job.get_results(), pixels_per_cell)
+
+    def get_results_png_tile(self, zoom, x, y):
+        '''
+        Renders the results as a z/x/y web mercator heat map tile. This function is not blocking and
+        expects the job to be finished when called (@see is_finished())
+
+        @param zoom Zoom level of the tile
+        @paramType int
+        @param x Column of the tile
+        @paramType int
+        @param y Row of the tile
+        @paramType int
+        @returns PNG encoded heat map tile
+        @returnType string/binary
+        @throws Exception if the job is not finished
+        @throwType NotReadyError
+        '''
+        job = self.job_factory.get_job(self.job_id)
+
+        if not job.is_finished(): # If the job isn't finished
+            raise NotReadyError()
+
+        return self.polygon_strategy.encode_results_png_tile(job.get_results(), zoom, x, y)
+
+    def get_results_since(self, cursor=0):
+        '''
+        Retrieves the sub-area results which arrived after the provided cursor. This function does
+        not block or require the job to be finished. A result returned by an earlier call may since
+        have been superseded by the results of its area's pieces, in which case its area is listed
+        among the removed areas on every later call.
+
+        @param cursor Position returned by the previous call, 0 to start from the beginning
+        @paramType int
+        @returns New sub-area results, cursor to pass to the next call, the fraction of the job
+        that is complete and the areas whose earlier returned results are to be dropped
+        @returnType tuple (list of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat',
+        'max_lon', 'result', int, float, list of dictionaries containing keys 'min_lat', 'min_lon',
+        'max_lat', 'max_lon')
+        '''
+        assert cursor >= 0, cursor
+
+        job = self.job_factory.get_job(self.job_id)
+        results, superseded = job.get_result_log()
+
+        new_results = [results[position] for position in range(cursor, len(results)) if position not in superseded]
+        removed_boxes = [
+            dict([(key, results[position][key]) for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon')])
+            for position in sorted(superseded) if position < cursor
+        ]
+
+        return new_results, len(results), self._get_completion(job, len(results) - len(superseded)), removed_boxes
 
-        raise NotReadyError() # If we made it here, no results were retrieved in time
-        
     def is_finished(self):
         '''
         @returns Whether or not the job is finished.
-        @returnType
+        @returnType boolean
+        '''
+        return self.job_factory.is_job_finished(self.job_id)
+
+    def write_results_geojson(self, stream):
+        '''
+        Streams the GeoJSON encoded results to the provided destination as they are encoded. This
+        function is not blocking and expects the job to be finished when called (@see is_finished())
+
+        @param stream Destination of the encoded results
+        @paramType file-like object with write() or socket with sendall()
+        @returns # of characters written
+        @returnType int
+        @throws Exception if the job is not finished
+        @throwType NotReadyError
         '''
         job = self.job_factory.get_job(self.job_id)
 
-        return job.is_finished()
+        if not job.is_finished(): # If the job isn't finished
+            raise NotReadyError()
+
+        return self.polygon_strategy.write_results_geojson(job.get_results(), stream)
 
 class AsynchResultFactory:
     ''' Handles creating new AsynchResult object. '''
 
-    def __init__(self, job_factory):
+    def __init__(self, job_factory, completion_notifier=None):
         '''
         Constructor.
  
         @param job_factory Interface for fetching jobs
         @paramType JobFactory
+        @param completion_notifier Channel on which job completions are announced, if any
+        @paramType CompletionNotifier
         @returns n/a
         '''
         assert job_factory is not None
         
+        self.completion_notifier = completion_notifier
         self.job_factory = job_factory
 
     def create(self, job_id, polygon_strategy):
@@ -104,4 +295,4 @@ class AsynchResultFactory:
         @returns AsynchResult monitoring the specified job
         @returnType AsynchResult
         '''
-        return AsynchResult(self.job_factory, job_id, polygon_strategy)
+        return AsynchResult(self.job_factory, job_id, polygon_strategy, self.completion_notifier)
@@ -0,0 +1,61 @@
+''' Contains the CancelledJobs cache, letting workers check for cancelled jobs without a read per task. '''
+
+import time
+
+from collections import OrderedDict
+from threading import Lock
+
+# # of job ids whose cancellation status is remembered
+MAX_CACHED_JOBS = 10000
+
+class CancelledJobs:
+    '''
+    Cached view of which jobs were cancelled. Cancellations are permanent and remembered for good,
+    jobs which were not cancelled are checked again once their status is older than the ttl.
+    Shared by every worker thread of a process.
+    '''
+
+    def __init__(self, job_factory, ttl=5, clock=time.time):
+        '''
+        Constructor.
+
+        @param job_factory Used to check the jobs' status
+        @paramType JobFactory
+        @param ttl Seconds a job's status is trusted for before it is checked again
+        @paramType float
+        @param clock Returns the current time in seconds
+        @paramType function
+        @returns n/a
+        '''
+        assert job_factory is not None
+        assert ttl >= 0, ttl
+
+        self.clock = clock
+        self.job_factory = job_factory
+        self.lock = Lock()
+        self.ttl = ttl
+
+        self.statuses = OrderedDict() # Job id to (is cancelled, when it was checked), oldest first
+
+    def is_cancelled(self, job_id):
+        '''
+        @param job_id Id of the job
+        @paramType string/uuid
+        @returns Whether the job was cancelled, as of at most ttl seconds ago
+        @returnType boolean
+        '''
+        now = self.clock()
+        with self.lock:
+            status = self.statuses.get(job_id)
+            if status is not None and (status[0] or now - status[1] < self.ttl):
+                return status[0]
+
+        is_cancelled = self.job_factory.is_job_cancelled(job_id)
+
+        with self.lock:
+            self.statuses.pop(job_id, None) # Move to the back as the most recently checked
+            self.statuses[job_id] = (is_cancelled, now)
+            while len(self.statuses) > MAX_CACHED_JOBS:
+                self.statuses.popitem(last=False)
+
+        return is_cancelled
@@ -0,0 +1,173 @@
+''' Provides coarse-to-fine access to the results of progressively refined grid calculations. '''
+
+from smcity.errors import NotReadyError
+from smcity.logging.logger import Logger
+
+logger = Logger(__name__)
+
+class ProgressiveResult:
+    '''
+    Tracks a calculation which is run as a series of increasingly fine grids. Each level is only
+    submitted once the previous one has finished, so its cells can be prioritized by the density
+    found in the coarser level (cells inside the viewport always go first).
+    '''
+
+    def __init__(self, map_queue, result_factory, levels, viewport=None):
+        '''
+        Constructor. Submits the coarsest level straight away.
+
+        @param map_queue Interface for submitting each level's tasks
+        @paramType MapQueue
+        @param result_factory Interface for tracking each level's job
+        @paramType AsynchResultFactory
+        @param levels Grid strategies to run, from coarsest to finest
+        @paramType list of SimpleGridStrategy
+        @param viewport Area the client is currently displaying, if any
+        @paramType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+        @returns n/a
+        '''
+        assert map_queue is not None
+        assert result_factory is not None
+        assert len(levels) > 0, len(levels)
+
+        self.is_cancelled = False
+        self.levels = levels
+        self.level_results = []
+        self.map_queue = map_queue
+        self.result_factory = result_factory
+        self.viewport = viewport
+
+        self._submit_level(None)
+
+    def _get_sort_key(self, parent_level, parent_results):
+        '''
+        @param parent_level Coarser grid whose results guide the refinement
+        @paramType SimpleGridStrategy
+        @param parent_results Results of the coarser grid
+        @paramType list of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @returns Sort key which orders boxes inside the viewport first, then by descending density of
+        the coarser cell containing them
+        @returnType function accepting a coordinate box dictionary
+        '''
+        densities = {} # Summed by cell, as a split cell reports its quarters separately
+        for result in parent_results:
+            position = parent_level.get_cell_position(result['min_lat'], result['min_lon'])
+            densities[position] = densities.get(position, 0) + result['result']
+
+        def sort_key(coordinate_box):
+            center_lat = (coordinate_box['min_lat'] + coordinate_box['max_lat']) / 2.0
+            center_lon = (coordinate_box['min_lon'] + coordinate_box['max_lon']) / 2.0
+
+            in_viewport = self.viewport is not None and \
+                self.viewport['min_lat'] <= center_lat <= self.viewport['max_lat'] and \
+                self.viewport['min_lon'] <= center_lon <= self.viewport['max_lon']
+            density = densities.get(parent_level.get_cell_position(center_lat, center_lon), 0)
+
+            return (not in_viewport, -density)
+
+        return sort_key
+
+    def _submit_level(self, sort_key):
+        '''
+        Submits the next level's job.
+
+        @param sort_key Orders the level's component areas, None to use the strategy's order
+        @paramType function accepting a coordinate box dictionary
+        @returns n/a
+        '''
+        level = self.levels[len(self.level_results)]
+        job_id = self.map_queue.request_count_tweets(level, sort_key)
+
+        logger.debug("Submitted refinement level %s as job %s", len(self.level_results), job_id)
+        self.level_results.append(self.result_factory.create(job_id, level))
+
+    def cancel(self):
+        '''
+        Cancels the unfinished levels and stops any further refinement, e.g. once the client pans away.
+
+        @returns n/a
+        '''
+        self.is_cancelled = True
+
+        for level_result in self.level_results:
+            if not level_result.is_finished():
+                level_result.cancel()
+
+    def get_finest_finished_level(self):
+        '''
+        Submits the next level if the latest one has finished and reports the finest level available.
+
+        @returns Index of the finest finished level or None if no level has finished yet
+        @returnType int
+        '''
+        self.refine()
+
+        for level in reversed(range(len(self.level_results))):
+            if self.level_results[level].is_finished():
+                return level
+
+        return None
+
+    def get_level_result(self, level):
+        '''
+        @param level Index of the level, 0 being the coarsest
+        @paramType int
+        @returns Interface for retrieving the level's results
+        @returnType AsynchResult
+        @throws If the level has not been submitted yet
+        @throwType NotReadyError
+        '''
+        self.refine()
+
+        if level >= len(self.level_results):
+            raise NotReadyError("Refinement level %s has not been submitted yet!" % level)
+
+        return self.level_results[level]
+
+    def get_num_levels(self):
+        '''
+        @returns # of refinement levels
+        @returnType int
+        '''
+        return len(self.levels)
+
+    def get_results_geojson(self):
+        '''
+        Generates GeoJSON encoded results of the finest finished level. This function is not blocking.
+
+        @returns GeoJSON encoded results and the index of the level they belong to
+        @returnType tuple (string/GeoJSON, int)
+        @throws If no level has finished yet
+        @throwType NotReadyError
+        '''
+        level = self.get_finest_finished_level()
+        if level is None:
+            raise NotReadyError()
+
+        return self.level_results[level].get_results_geojson(), level
+
+    def is_finished(self):
+        '''
+        @returns Whether or not the finest level is finished
+        @returnType boolean
+        '''
+        return self.get_finest_finished_level() == len(self.levels) - 1
+
+    def refine(self):
+        '''
+        Submits the next level if the latest submitted level has finished.
+
+        @returns Whether or not a new level was submitted
+        @returnType boolean
+        '''
+        if self.is_cancelled or len(self.level_results) == len(self.levels): # Cancelled or at the finest level
+            return False
+
+        parent_result = self.level_results[-1]
+        if not parent_result.is_finished():
+            return False
+
+        parent_results, cursor, completion, removed_boxes = parent_result.get_results_since(0)
+        self._submit_level(self._get_sort_key(self.levels[len(self.level_results) - 1], parent_results))
+
+        return True
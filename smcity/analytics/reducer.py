@@ -7,7 +7,7 @@ logger = Logger(__name__)
 class Reducer:
     ''' Consumers results from the reduce queue and pushes them into NoSQL. '''
     
-    def __init__(self, job_factory, reduce_queue):
+    def __init__(self, job_factory, reduce_queue, completion_notifier=None, speculator=None):
         '''
         Constructor.
 
@@ -15,14 +15,38 @@ class Reducer:
         @paramType JobFactory
         @param reduce_queue Used to retrieve results from the reduce queue
         @paramType ReduceQueue
+        @param completion_notifier Channel used to announce finished jobs, if any
+        @paramType CompletionNotifier
+        @param speculator Duplicates lagging tasks of the jobs whose tasks are reported started, if any
+        @paramType Speculator
         @returns n/a
         '''
         assert job_factory is not None
         assert reduce_queue is not None
    
+        self.completion_notifier = completion_notifier
         self.is_shutting_down = False
         self.job_factory = job_factory
         self.reduce_queue = reduce_queue
+        self.speculator = speculator
+
+    def _add_task_start(self, job, task, started_at):
+        '''
+        Records the task's start so the speculator can spot it lagging, if speculating.
+
+        @param job Job of the task
+        @paramType Job
+        @param task Summary of the started task
+        @paramType dictionary
+        @param started_at When the task was started, in seconds since the epoch
+        @paramType float
+        @returns n/a
+        '''
+        if self.speculator is None: # Nobody would look at the start
+            return
+
+        job.add_task_start(task, started_at)
+        self.speculator.watch(job.get_id())
 
     def reduce_results(self):
         '''
@@ -37,11 +61,32 @@ class Reducer:
                 if result is None: # If there are currently no results available
                     continue
 
-                logger.debug("Found result for job %s. Posting result..." % result['job_id'])
                 job = self.job_factory.get_job(result['job_id']) # Update the jobs state
-                job.add_result(result['coordinate_box'], result['result'])
+                was_finished = job.is_finished()
+                if job.is_cancelled(): # Nobody is waiting on the job anymore
+                    logger.debug("Discarding late %s for cancelled job %s", result['task'], result['job_id'])
+                elif result['task'] == 'task_started':
+                    self._add_task_start(job, result['started_task'], result['started_at'])
+                elif result['task'] == 'task_split':
+                    job.add_task_split(result['coordinate_box'])
+                elif result['task'] == 'count_tweets_combined': # Saved together below
+                    logger.debug("Found %s results for job %s. Posting results...",
+                        len(result['results']), result['job_id'])
+                    for start in result.get('starts', []):
+                        self._add_task_start(job, start['task'], start['started_at'])
+                    for cell in result['results']:
+                        if not job.add_result(cell['coordinate_box'], cell['result'], cell.get('error')):
+                            logger.debug("Dropped duplicate result for job %s", result['job_id'])
+                else:
+                    logger.debug("Found result for job %s. Posting result..." % result['job_id'])
+                    if not job.add_result(result['coordinate_box'], result['result'], result.get('error')):
+                        logger.debug("Dropped duplicate result for job %s", result['job_id'])
                 job.save_changes()
 
+                # If this result finished the job, let any waiting clients know
+                if not was_finished and job.is_finished() and self.completion_notifier is not None:
+                    self.completion_notifier.notify_finished(result['job_id'])
+
                 self.reduce_queue.finish_result(result) # Remove the result message from the queue
             except:
                 logger.exception()    
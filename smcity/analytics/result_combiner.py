@@ -0,0 +1,176 @@
+''' Contains the ResultCombiner, which pre-aggregates a worker's results before they reach the reduce queue. '''
+
+import time
+
+from threading import Lock
+
+from smcity.logging.logger import Logger
+
+logger = Logger(__name__)
+
+class ResultCombiner:
+    '''
+    Buffers a worker's count_tweets results and task starts per job and posts each job's results
+    and starts as a single combined message, so the reduce queue carries and the reducer saves one
+    message per batch of results instead of one per cell and start. The tasks behind the buffered
+    results are only finished once their results were posted, so a crashed worker's tasks are
+    handed out again rather than lost.
+    '''
+
+    def __init__(self, reduce_queue, task_queue, window=1.0, max_results=25):
+        '''
+        Constructor.
+
+        @param reduce_queue Queue the combined results are posted to
+        @paramType ReduceQueue
+        @param task_queue Queue the tasks are finished in once their results are posted
+        @paramType MapQueue
+        @param window Seconds a job's first buffered result may wait before the job's results are posted
+        @paramType float
+        @param max_results # of a job's results which are posted together at most, keeping messages
+        well under the queue's size limit
+        @paramType int
+        @returns n/a
+        '''
+        assert reduce_queue is not None
+        assert task_queue is not None
+        assert window >= 0, window
+        assert max_results > 0, max_results
+
+        self.lock = Lock()
+        self.max_results = max_results
+        self.reduce_queue = reduce_queue
+        self.task_queue = task_queue
+        self.window = window
+
+        # Job id to its buffered results and starts, the tasks waiting on them and when the first was buffered
+        self.buffers = {}
+
+    def finish_task(self, task):
+        '''
+        Finishes the task once the results buffered for its job are posted, at once if there are none.
+
+        @param task Task to be finished, as retrieved from the map queue
+        @paramType dictionary
+        @returns n/a
+        '''
+        with self.lock:
+            buffer = self.buffers.get(task['job_id'])
+            if buffer is not None:
+                buffer['tasks'].append(task)
+                return
+
+        self.task_queue.finish_task(task)
+
+    def flush(self, job_id=None):
+        '''
+        Posts the buffered results and finishes the tasks waiting on them.
+
+        @param job_id Only post this job's results, None to post every job's
+        @paramType string/uuid
+        @returns n/a
+        '''
+        with self.lock:
+            job_ids = self.buffers.keys() if job_id is None else [job_id]
+            buffers = [(job_id, self.buffers.pop(job_id)) for job_id in job_ids if job_id in self.buffers]
+
+        for job_id, buffer in buffers:
+            try:
+                self._post(job_id, buffer)
+            except: # The unfinished tasks are handed out again once their timeout expires
+                logger.exception()
+
+    def flush_expired(self, now=None):
+        '''
+        Posts the results of the jobs whose first buffered result is older than the window.
+
+        @param now Current time in seconds since the epoch, defaults to time.time()
+        @paramType float
+        @returns n/a
+        '''
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            expired = [job_id for job_id, buffer in self.buffers.items()
+                if now - buffer['buffered_at'] >= self.window]
+
+        for job_id in expired:
+            self.flush(job_id)
+
+    def get_unfinished_tasks(self):
+        '''
+        @returns Tasks whose results are buffered, and which are therefore still in progress
+        @returnType list of dictionaries
+        '''
+        with self.lock:
+            return [task for buffer in self.buffers.values() for task in buffer['tasks']]
+
+    def _post(self, job_id, buffer):
+        '''
+        Posts the job's buffered results, then finishes the tasks waiting on them.
+
+        @param job_id Tracking id of the job
+        @paramType string/uuid
+        @param buffer Buffered results and starts, and the tasks waiting on them
+        @paramType dictionary with keys 'results', 'starts', 'tasks'
+        @returns n/a
+        '''
+        if len(buffer['results']) == 1 and len(buffer['starts']) == 0: # Nothing to combine with
+            result = buffer['results'][0]
+            self.reduce_queue.post_count_tweets_result(job_id, result['coordinate_box'], result['result'],
+                result.get('error'))
+        elif len(buffer['results']) == 0 and len(buffer['starts']) == 1:
+            start = buffer['starts'][0]
+            self.reduce_queue.post_task_started(start['task'], start['started_at'])
+        else:
+            logger.debug("%s Posting %s combined results and %s starts...", job_id, len(buffer['results']),
+                len(buffer['starts']))
+            self.reduce_queue.post_combined_results(job_id, buffer['results'], buffer['starts'])
+
+        for task in buffer['tasks']:
+            self.task_queue.finish_task(task)
+
+    def post_count_tweets_result(self, job_id, coordinate_box, count, error=None):
+        ''' Buffers the result, see ReduceQueue.post_count_tweets_result(). '''
+        assert job_id is not None
+        assert coordinate_box is not None
+        assert count is not None
+
+        result = {'coordinate_box' : coordinate_box, 'result' : count}
+        if error is not None: # If the count was estimated from a sample
+            result['error'] = error
+
+        if self._buffer(job_id, 'results', result):
+            self.flush(job_id)
+
+    def _buffer(self, job_id, kind, entry):
+        '''
+        Adds the entry to the job's buffer.
+
+        @param job_id Tracking id of the job
+        @paramType string/uuid
+        @param kind 'results' or 'starts'
+        @paramType string
+        @param entry Result or start to be buffered
+        @paramType dictionary
+        @returns Whether the job's buffer is full
+        @returnType boolean
+        '''
+        with self.lock:
+            buffer = self.buffers.setdefault(job_id,
+                {'results' : [], 'starts' : [], 'tasks' : [], 'buffered_at' : time.time()})
+            buffer[kind].append(entry)
+            return len(buffer['results']) + len(buffer['starts']) >= self.max_results
+
+    def post_task_split(self, task):
+        ''' Passed straight through, see ReduceQueue.post_task_split(). '''
+        self.reduce_queue.post_task_split(task)
+
+    def post_task_started(self, task, started_at):
+        ''' Buffers the start, see ReduceQueue.post_task_started(). '''
+        assert task is not None
+        assert started_at is not None
+
+        if self._buffer(task['job_id'], 'starts', {'task' : task, 'started_at' : started_at}):
+            self.flush(task['job_id'])
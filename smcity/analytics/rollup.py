@@ -0,0 +1,188 @@
+''' Contains the TweetRollup, which compacts the raw tweets into the archive before they expire. '''
+
+import math
+import re
+import time
+
+from collections import Counter
+from threading import Lock
+
+from smcity.logging.logger import Logger
+from smcity.models.tweet_archive import get_cell, get_hour
+
+logger = Logger(__name__)
+
+# Seconds an hour is held open after it ends, for its tweets still on their way from the stream
+LATE_TWEET_DELAY = 60
+
+# Shortest word counted as a term
+MIN_TERM_LENGTH = 3
+
+def add_to_cells(cells, lat, lon, message):
+    '''
+    Counts the tweet towards its archive cell.
+
+    @param cells Cell to the cell's count and terms so far
+    @paramType dictionary
+    @param lat Latitude at which the tweet was made
+    @paramType float
+    @param lon Longitude at which the tweet was made
+    @paramType float
+    @param message Tweeted message
+    @paramType string
+    @returns n/a
+    '''
+    rollup = cells.setdefault(get_cell(lat, lon), {'count' : 0, 'terms' : Counter()})
+    rollup['count'] += 1
+    rollup['terms'].update(get_terms(message))
+
+def get_terms(message):
+    '''
+    @param message Tweeted message
+    @paramType string
+    @returns Lower cased words, hashtags and mentions of the message
+    @returnType list of strings
+    '''
+    return [term for term in re.findall(r"[#@]?\w+", message.lower(), re.UNICODE)
+        if len(term) >= MIN_TERM_LENGTH and not term.isdigit()]
+
+class TweetRollup:
+    '''
+    Rolls each complete hour's tweets up into the archive, as the # of tweets and the most frequent
+    terms per archive cell. The stream listener hands every stored tweet to add_tweet(), so the
+    hours it saw from their start are rolled up from memory without reading the tweets table. Only
+    the hours from before the rollup started, such as those missed while the listener was down, are
+    read back from the tweets table. Filtering on the timestamp does not narrow that scan, so it
+    reads the whole table, once per start of the listener.
+    '''
+
+    def __init__(self, tweet_factory, archive, max_age, max_terms=10, clock=time.time):
+        '''
+        Constructor.
+
+        @param tweet_factory Used to read the tweets being rolled up
+        @paramType TweetFactory
+        @param archive Archive the rollups are added to
+        @paramType TweetArchive
+        @param max_age Hours the raw tweets are kept for, older hours can no longer be rolled up
+        @paramType int
+        @param max_terms # of a cell's most frequent terms kept for each hour
+        @paramType int
+        @param clock Returns the current time in seconds
+        @paramType function
+        @returns n/a
+        '''
+        assert tweet_factory is not None
+        assert archive is not None
+        assert max_age > 0, max_age
+        assert max_terms >= 0, max_terms
+
+        self.archive = archive
+        self.clock = clock
+        self.lock = Lock()
+        self.max_age = max_age
+        self.max_terms = max_terms
+        self.tweet_factory = tweet_factory
+
+        # Hours starting after now are seen by add_tweet() from their start
+        self.first_live_hour = to_hour(int(math.ceil(clock() / 3600.0)) * 3600)
+        self.live_cells = {} # Hour to cell to the cell's count and terms
+
+    def add_tweet(self, lat, lon, timestamp, message):
+        '''
+        Counts a newly stored tweet towards its hour's rollup.
+
+        @param lat Latitude at which the tweet was made
+        @paramType float
+        @param lon Longitude at which the tweet was made
+        @paramType float
+        @param timestamp When the tweet was made. Format: YYYY-MM-dd HH24:mm:ss
+        @paramType string
+        @param message Tweeted message
+        @paramType string
+        @returns n/a
+        '''
+        hour = get_hour(timestamp)
+        if hour < self.first_live_hour: # Read back from the tweets table instead
+            return
+
+        with self.lock:
+            add_to_cells(self.live_cells.setdefault(hour, {}), lat, lon, message)
+
+    def get_pending_hours(self, now=None):
+        '''
+        @param now Current time in seconds since the epoch, defaults to the clock's
+        @paramType float
+        @returns Complete hours whose tweets are all still kept but which were not rolled up yet,
+        oldest first. Format: YYYY-MM-dd HH24
+        @returnType list of strings
+        '''
+        if now is None:
+            now = self.clock()
+        current_hour = int((now - LATE_TWEET_DELAY) // 3600) * 3600
+
+        hours = []
+        for hour_start in range(current_hour - (self.max_age - 1) * 3600, current_hour, 3600):
+            hour = to_hour(hour_start)
+            if not self.archive.is_rolled_up(hour):
+                hours.append(hour)
+
+        return hours
+
+    def roll_up(self):
+        '''
+        Rolls up the pending hours' tweets into the archive.
+
+        @returns # of tweets rolled up
+        @returnType int
+        '''
+        now = self.clock()
+        hours = self.get_pending_hours(now)
+
+        current_hour = to_hour(int((now - LATE_TWEET_DELAY) // 3600) * 3600)
+        with self.lock: # Only late tweets arrived for the hours which were already rolled up
+            for hour in [hour for hour in self.live_cells.keys() if hour < current_hour and hour not in hours]:
+                del self.live_cells[hour]
+
+        if len(hours) == 0:
+            return 0
+
+        logger.info("Rolling up the tweets of %s hours from %s...", len(hours), hours[0])
+        scanned = set([hour for hour in hours if hour < self.first_live_hour])
+        scanned_cells = dict([(hour, {}) for hour in scanned]) # Hour to cell to the cell's count and terms
+        if len(scanned) > 0: # Hours which began before the rollup started
+            time_range = (min(scanned) + ':00:00', max(scanned) + ':59:59')
+            for tweet in self.tweet_factory.get_tweets(time_range=time_range):
+                hour = get_hour(tweet.timestamp())
+                if hour not in scanned: # Hours in between which were already rolled up
+                    continue
+
+                add_to_cells(scanned_cells[hour], tweet.lat(), tweet.lon(), tweet.message())
+
+        num_tweets, num_cells = 0, 0
+        for hour in hours: # Oldest first, so an interrupted roll up resumes where it left off
+            with self.lock: # The live counts are copied and only dropped once their rollup is stored
+                cells = scanned_cells[hour] if hour in scanned else self.live_cells.get(hour, {})
+                rollups = dict([
+                    (cell, {'count' : rollup['count'], 'terms' : dict(rollup['terms'].most_common(self.max_terms))})
+                    for cell, rollup in cells.items()
+                ])
+
+            self.archive.add_rollup(hour, rollups)
+            with self.lock:
+                self.live_cells.pop(hour, None)
+
+            num_tweets += sum([rollup['count'] for rollup in rollups.values()])
+            num_cells += len(rollups)
+
+        logger.info("Rolled up %s tweets into %s cells!", num_tweets, num_cells)
+        return num_tweets
+
+def to_hour(hour_start):
+    '''
+    @param hour_start Start of the hour in seconds since the epoch
+    @paramType int
+    @returns The hour. Format: YYYY-MM-dd HH24
+    @returnType string
+    '''
+    return time.strftime('%Y-%m-%d %H', time.gmtime(hour_start))
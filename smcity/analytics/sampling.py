@@ -0,0 +1,60 @@
+''' Estimation of tweet counts from a random sample of the tweet table's scan segments. '''
+
+import math
+import random
+
+# # of segments the tweet table is split into when sampling
+TOTAL_SEGMENTS = 100
+
+# Standard normal quantile of a two sided 95% confidence interval
+Z_95 = 1.96
+
+def choose_segments(sample_rate, total_segments=TOTAL_SEGMENTS):
+    '''
+    Picks the table segments to be read. Each segment holds a random share of the tweets, so
+    reading a random subset of them is a random cluster sample of the table.
+
+    @param sample_rate Fraction of the table to read
+    @paramType float in (0, 1]
+    @param total_segments # of segments the table is split into
+    @paramType int
+    @returns Segments to be read, at least one
+    @returnType list of int
+    '''
+    assert 0 < sample_rate <= 1, sample_rate
+    assert total_segments > 0, total_segments
+
+    num_segments = min(total_segments, max(1, int(round(sample_rate * total_segments))))
+
+    return sorted(random.sample(range(total_segments), num_segments))
+
+def estimate_total(sample_counts, total_segments=TOTAL_SEGMENTS, z=Z_95):
+    '''
+    Scales the counts of the sampled segments up to an estimate of the whole table's count.
+
+    @param sample_counts Count found in each sampled segment
+    @paramType list of int
+    @param total_segments # of segments the table is split into
+    @paramType int
+    @param z Standard normal quantile of the desired confidence level
+    @paramType float
+    @returns Estimated count and the half width of its confidence interval
+    @returnType tuple (float, float)
+    '''
+    num_samples = len(sample_counts)
+    assert 0 < num_samples <= total_segments, num_samples
+
+    total = float(sum(sample_counts))
+    mean = total / num_samples
+    estimate = total_segments * mean
+
+    if num_samples > 1: # Estimate the spread of the segments from the sample
+        sample_variance = sum([(count - mean) ** 2 for count in sample_counts]) / (num_samples - 1)
+    else: # Fall back on treating the single segment's count as Poisson distributed
+        sample_variance = mean
+
+    # Variance of the scaled up sum, corrected for sampling without replacement
+    correction = 1.0 - float(num_samples) / total_segments
+    variance = total_segments ** 2 * correction * sample_variance / num_samples
+
+    return estimate, z * math.sqrt(variance)
@@ -0,0 +1,214 @@
+''' Contains the Speculator, which duplicates lagging tasks to bound the tail latency of jobs. '''
+
+import numpy
+import time
+
+from threading import Lock
+
+from smcity.logging.logger import Logger
+from smcity.polygons.rtree import StrTree
+
+logger = Logger(__name__)
+
+class Speculator:
+    '''
+    Watches the pending tasks of running jobs and queues a duplicate of each task which has been
+    running for much longer than the job's finished tasks took, so a slow or stuck compute node
+    does not hold the whole job up. Whichever copy reports in first provides the result, the job
+    drops the other.
+    '''
+
+    def __init__(self, job_factory, map_queue, percentile=90, multiplier=1.5, min_delay=10,
+                 min_durations=5, check_interval=5):
+        '''
+        Constructor.
+
+        @param job_factory Used to retrieve the watched jobs
+        @paramType JobFactory
+        @param map_queue Used to queue the duplicate tasks
+        @paramType MapQueue
+        @param percentile Percentile of the job's task durations the straggler threshold is based on
+        @paramType float in [0, 100]
+        @param multiplier Tasks running for longer than this multiple of the percentile are duplicated
+        @paramType float
+        @param min_delay Seconds a task must have been running for before it may be duplicated. Should
+        be at least the compute nodes' max_task_seconds, so only tasks which can no longer be split are
+        duplicated.
+        @paramType float
+        @param min_durations # of finished tasks a job needs before its tasks may be duplicated
+        @paramType int
+        @param check_interval Seconds between checks of the watched jobs
+        @paramType float
+        @returns n/a
+        '''
+        assert job_factory is not None
+        assert map_queue is not None
+        assert 0 <= percentile <= 100, percentile
+        assert multiplier > 0, multiplier
+        assert min_durations > 0, min_durations
+
+        self.check_interval = check_interval
+        self.is_shutting_down = False
+        self.job_factory = job_factory
+        self.map_queue = map_queue
+        self.min_delay = min_delay
+        self.min_durations = min_durations
+        self.multiplier = multiplier
+        self.percentile = percentile
+
+        # Watched job ids and the areas of the tasks already duplicated for each of them
+        self.duplicated = {}
+        self.lock = Lock()
+
+        # Job id to the job's boxes carrying a payload and an R-tree over them, see _restore_task()
+        self.payload_boxes = {}
+
+    def check_jobs(self, now=None):
+        '''
+        Duplicates the lagging tasks of the watched jobs, forgetting about finished jobs.
+
+        @param now Current time in seconds since the epoch, defaults to time.time()
+        @paramType float
+        @returns # of tasks duplicated
+        @returnType int
+        '''
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            job_ids = self.duplicated.keys()
+
+        num_duplicated = 0
+        for job_id in job_ids:
+            try:
+                job = self.job_factory.get_job(job_id)
+                if job.is_finished() or job.is_cancelled():
+                    with self.lock:
+                        del self.duplicated[job_id]
+                    self.payload_boxes.pop(job_id, None)
+                    continue
+
+                num_duplicated += self._duplicate_stragglers(job, now)
+            except:
+                logger.exception()
+
+        return num_duplicated
+
+    def get_threshold(self, task_durations):
+        '''
+        @param task_durations Seconds the job's finished tasks took
+        @paramType list of float
+        @returns Seconds after which a pending task is considered a straggler, None if too few tasks
+        finished to tell
+        @returnType float
+        '''
+        if len(task_durations) < self.min_durations:
+            return None
+
+        return max(self.min_delay, self.multiplier * numpy.percentile(task_durations, self.percentile))
+
+    def _duplicate_stragglers(self, job, now):
+        '''
+        @param job Unfinished job
+        @paramType Job
+        @param now Current time in seconds since the epoch
+        @paramType float
+        @returns # of tasks duplicated
+        @returnType int
+        '''
+        threshold = self.get_threshold(job.get_task_durations())
+        if threshold is None:
+            return 0
+
+        num_duplicated = 0
+        for pending in job.get_pending_tasks():
+            coordinate_box = pending['task']['coordinate_box']
+            box_key = (coordinate_box['min_lat'], coordinate_box['min_lon'],
+                coordinate_box['max_lat'], coordinate_box['max_lon'])
+
+            with self.lock: # Each task is only duplicated once
+                if now - pending['started_at'] <= threshold or box_key in self.duplicated[job.get_id()]:
+                    continue
+                self.duplicated[job.get_id()].add(box_key)
+
+            logger.debug("%s Duplicating task running for %.1f secs, over the %.1f sec threshold",
+                job.get_id(), now - pending['started_at'], threshold)
+            self.map_queue.request_speculative_task(self._restore_task(job, pending['task']))
+            num_duplicated += 1
+
+        return num_duplicated
+
+    def _restore_task(self, job, task):
+        '''
+        Restores the payload of the task's coordinate box, such as polygon rings or regions, which was
+        left out of its summary. Split tasks carry the payload of the box they were split from.
+
+        @param job Job of the task
+        @paramType Job
+        @param task Summary of a pending task, see summarize_task()
+        @paramType dictionary
+        @returns Task as it was queued
+        @returnType dictionary
+        '''
+        if job.get_id() not in self.payload_boxes: # Enumerated once per job
+            boxes, tree = list(job.get_polygon_strategy().iter_inscribed_boxes()), None
+            if any([len(coordinate_box) > 4 for coordinate_box in boxes]):
+                tree = StrTree([[coordinate_box[key] for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon')]
+                    for coordinate_box in boxes])
+            else: # Such as grid cells, which carry nothing but their bounds
+                boxes = []
+            self.payload_boxes[job.get_id()] = (boxes, tree)
+
+        boxes, tree = self.payload_boxes[job.get_id()]
+        if tree is None: # Nothing to restore
+            return task
+
+        bounds = task['coordinate_box']
+        containing_box = None
+        for position in sorted(tree.query_box(bounds)): # In the strategy's order, like a scan of its boxes
+            coordinate_box = boxes[position]
+            if coordinate_box['min_lat'] <= bounds['min_lat'] and coordinate_box['min_lon'] <= bounds['min_lon'] \
+                    and coordinate_box['max_lat'] >= bounds['max_lat'] \
+                    and coordinate_box['max_lon'] >= bounds['max_lon']:
+                containing_box = coordinate_box
+                if [coordinate_box[key] for key in bounds] == [bounds[key] for key in bounds]:
+                    break # The task's own box, it was never split
+
+        if containing_box is None: # Nothing to restore
+            return task
+
+        restored_box = dict(containing_box)
+        restored_box.update(bounds)
+        restored = dict(task)
+        restored['coordinate_box'] = restored_box
+        return restored
+
+    def shutdown(self):
+        '''
+        Cleanly shuts down the speculator.
+
+        @returns n/a
+        '''
+        self.is_shutting_down = True
+
+    def speculate(self):
+        '''
+        Continuously checks the watched jobs for lagging tasks.
+
+        @returns n/a
+        '''
+        while not self.is_shutting_down:
+            self.check_jobs()
+            time.sleep(self.check_interval)
+
+    def watch(self, job_id):
+        '''
+        Starts watching the job's tasks, until the job finishes.
+
+        @param job_id Id of the job
+        @paramType string/uuid
+        @returns n/a
+        '''
+        with self.lock:
+            if job_id not in self.duplicated:
+                self.duplicated[job_id] = set()
@@ -0,0 +1,415 @@
+''' Standing queries which incrementally maintain analytic results as tweets are ingested. '''
+
+import calendar
+import math
+import time
+
+from threading import Lock, Thread
+from uuid import uuid4
+
+from smcity.errors import ReadError
+from smcity.logging.logger import Logger
+from smcity.polygons.geometry import get_edges, points_in_polygon
+
+logger = Logger(__name__)
+
+# Seconds between the stream listener's syncs with the standing query store
+SYNC_INTERVAL = 10
+
+def get_results(boxes, counts):
+    '''
+    @param boxes Sub-areas of the standing query
+    @paramType list of dictionaries with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+    @param counts Count of each sub-area, in order. None if not counted yet.
+    @paramType list of ints
+    @returns Count of each sub-area
+    @returnType list of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+    '''
+    if counts is None:
+        counts = [0] * len(boxes)
+    assert len(counts) == len(boxes), (len(counts), len(boxes))
+
+    results = []
+    for box_index in range(len(boxes)):
+        box = boxes[box_index]
+        results.append({
+            'min_lat' : box['min_lat'],
+            'min_lon' : box['min_lon'],
+            'max_lat' : box['max_lat'],
+            'max_lon' : box['max_lon'],
+            'result' : counts[box_index]
+        })
+
+    return results
+
+class StandingQuery:
+    ''' Maintains windowed tweet counts for each sub-area of a polygon strategy. '''
+
+    def __init__(self, polygon_strategy, bucket_size=60, num_buckets=60):
+        '''
+        Constructor.
+
+        @param polygon_strategy Describes the area of interest and how to break it down into
+        component areas
+        @paramType PolygonStrategy
+        @param bucket_size Width of each time bucket in seconds
+        @paramType int
+        @param num_buckets # of time buckets kept, the window spans bucket_size * num_buckets seconds
+        @paramType int
+        @returns n/a
+        '''
+        assert polygon_strategy is not None
+        assert bucket_size > 0, bucket_size
+        assert num_buckets > 0, num_buckets
+
+        self.bucket_size = bucket_size
+        self.lock = Lock()
+        self.num_buckets = num_buckets
+        self.polygon_strategy = polygon_strategy
+        self.boxes = polygon_strategy.get_result_boxes()
+
+        # Ring buffer of per sub-area counts, bucket_ids tracks which time bucket each slot holds
+        self.buckets = [[0] * len(self.boxes) for slot in range(num_buckets)]
+        self.bucket_ids = [None] * num_buckets
+        self.newest_bucket_id = None
+        self.totals = [0] * len(self.boxes)
+
+        self._build_index()
+
+    def _build_index(self):
+        '''
+        Builds a spatial hash over the sub-areas so matching a tweet only checks nearby boxes.
+
+        @returns n/a
+        '''
+        self.cell_size = 0
+        for box in self.boxes:
+            self.cell_size = max(self.cell_size, box['max_lat'] - box['min_lat'], box['max_lon'] - box['min_lon'])
+        if self.cell_size <= 0: # All of the boxes are degenerate
+            self.cell_size = 1.0
+
+        # Sub-areas which are only part of their box are tested against their outline
+        self.edges = {}
+        for box_index in range(len(self.boxes)):
+            if 'rings' in self.boxes[box_index]:
+                self.edges[box_index] = get_edges(self.boxes[box_index]['rings'])
+
+        self.index = {}
+        for box_index in range(len(self.boxes)):
+            box = self.boxes[box_index]
+            for lat_key in range(self._key(box['min_lat']), self._key(box['max_lat']) + 1):
+                for lon_key in range(self._key(box['min_lon']), self._key(box['max_lon']) + 1):
+                    self.index.setdefault((lat_key, lon_key), []).append(box_index)
+
+    def _expire(self, bucket_id):
+        '''
+        Clears out any buckets that have fallen out of the window ending at the provided bucket.
+        Must be called while holding the lock.
+
+        @param bucket_id Newest time bucket in the window
+        @paramType int
+        @returns n/a
+        '''
+        if self.newest_bucket_id is None or bucket_id > self.newest_bucket_id:
+            self.newest_bucket_id = bucket_id
+
+        for slot in range(self.num_buckets):
+            if self.bucket_ids[slot] is not None and \
+               self.bucket_ids[slot] <= self.newest_bucket_id - self.num_buckets:
+                self._reset_slot(slot, None)
+
+    def _find_boxes(self, lat, lon):
+        '''
+        @param lat Latitude of the point
+        @paramType float
+        @param lon Longitude of the point
+        @paramType float
+        @returns Indices of the sub-areas containing the point
+        @returnType list of int
+        '''
+        matches = []
+        for box_index in self.index.get((self._key(lat), self._key(lon)), []):
+            box = self.boxes[box_index]
+            if not (box['min_lat'] <= lat <= box['max_lat'] and box['min_lon'] <= lon <= box['max_lon']):
+                continue
+            if box_index in self.edges and not points_in_polygon([lon], [lat], self.edges[box_index])[0]:
+                continue
+
+            matches.append(box_index)
+
+        return matches
+
+    def _key(self, value):
+        '''
+        @param value Latitude or longitude to hash
+        @paramType float
+        @returns Spatial hash key of the value
+        @returnType int
+        '''
+        return int(math.floor(value / self.cell_size))
+
+    def _reset_slot(self, slot, bucket_id):
+        '''
+        Removes a slot's counts from the running totals and reassigns it to a new time bucket.
+        Must be called while holding the lock.
+
+        @param slot Position in the ring buffer
+        @paramType int
+        @param bucket_id Time bucket the slot now holds
+        @paramType int
+        @returns n/a
+        '''
+        counts = self.buckets[slot]
+        for box_index in range(len(counts)):
+            if counts[box_index] > 0:
+                self.totals[box_index] -= counts[box_index]
+                counts[box_index] = 0
+        self.bucket_ids[slot] = bucket_id
+
+    def add_tweet(self, lat, lon, timestamp):
+        '''
+        Counts a newly ingested tweet against any sub-areas that contain it.
+
+        @param lat Latitude at which the tweet was made
+        @paramType float
+        @param lon Longitude at which the tweet was made
+        @paramType float
+        @param timestamp When the tweet was made. Format: YYYY-MM-dd HH24:mm:ss
+        @paramType string
+        @returns Whether or not the tweet was counted
+        @returnType boolean
+        '''
+        matches = self._find_boxes(lat, lon)
+        if len(matches) == 0: # If the tweet is outside of the area of interest
+            return False
+
+        bucket_id = int(to_epoch(timestamp) // self.bucket_size)
+
+        with self.lock:
+            self._expire(bucket_id)
+            if bucket_id <= self.newest_bucket_id - self.num_buckets: # If the tweet is too old
+                return False
+
+            slot = bucket_id % self.num_buckets
+            if self.bucket_ids[slot] != bucket_id: # If the slot is still holding an older bucket
+                self._reset_slot(slot, bucket_id)
+
+            for box_index in matches:
+                self.buckets[slot][box_index] += 1
+                self.totals[box_index] += 1
+
+        return True
+
+    def get_counts(self, now=None):
+        '''
+        @param now Time at which the window ends in seconds since the epoch, defaults to the current time
+        @paramType float
+        @returns Current count of each of the sub-areas, in order
+        @returnType list of ints
+        '''
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            self._expire(int(now // self.bucket_size))
+            return list(self.totals)
+
+    def get_results(self, now=None):
+        '''
+        @param now Time at which the window ends in seconds since the epoch, defaults to the current time
+        @paramType float
+        @returns Current counts for each of the sub-areas
+        @returnType list of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        '''
+        return get_results(self.boxes, self.get_counts(now))
+
+    def get_results_geojson(self, now=None):
+        '''
+        @param now Time at which the window ends in seconds since the epoch, defaults to the current time
+        @paramType float
+        @returns GeoJSON encoded current counts for the area of interest
+        @returnType string/GeoJSON
+        '''
+        return self.polygon_strategy.encode_results_geojson(self.get_results(now))
+
+class StandingQueryRegistry:
+    '''
+    Tracks the registered standing queries and feeds them newly ingested tweets. With a store, the
+    registry follows the queries registered in the store and publishes their counts back to it, so
+    the API processes can register and read the standing queries maintained by the stream listener.
+    '''
+
+    def __init__(self, store=None):
+        '''
+        Constructor.
+
+        @param store Store shared with the API processes, if any
+        @paramType StandingQueryStore
+        @returns n/a
+        '''
+        self.is_shutting_down = False
+        self.lock = Lock()
+        self.queries = {}
+        self.store = store
+
+    def add_tweet(self, lat, lon, timestamp):
+        '''
+        Feeds a newly ingested tweet to all of the registered standing queries.
+
+        @param lat Latitude at which the tweet was made
+        @paramType float
+        @param lon Longitude at which the tweet was made
+        @paramType float
+        @param timestamp When the tweet was made. Format: YYYY-MM-dd HH24:mm:ss
+        @paramType string
+        @returns n/a
+        '''
+        with self.lock:
+            queries = self.queries.values()
+
+        for query in queries:
+            query.add_tweet(lat, lon, timestamp)
+
+    def get_query(self, query_id):
+        '''
+        @param query_id Tracking id of the standing query
+        @paramType string/uuid
+        @returns The registered standing query
+        @returnType StandingQuery
+        @throws If no such query is registered
+        @throwType ReadError
+        '''
+        with self.lock:
+            if query_id not in self.queries:
+                raise ReadError("Standing query(%s) does not exist!" % query_id)
+
+            return self.queries[query_id]
+
+    def get_results_geojson(self, query_id):
+        '''
+        @param query_id Tracking id of the standing query
+        @paramType string/uuid
+        @returns GeoJSON encoded current results of the standing query
+        @returnType string/GeoJSON
+        @throws If no such query is registered
+        @throwType ReadError
+        '''
+        return self.get_query(query_id).get_results_geojson()
+
+    def maintain_queries(self, interval=SYNC_INTERVAL):
+        '''
+        Spins up a thread which periodically syncs the standing queries with the store.
+
+        @param interval Seconds between syncs
+        @paramType float
+        @returns n/a
+        '''
+        assert self.store is not None
+        assert interval > 0, interval
+
+        thread = Thread(target=self._maintain_queries, args=(interval,))
+        thread.daemon = True
+        thread.start()
+
+    def _maintain_queries(self, interval):
+        '''
+        Periodically syncs the standing queries with the store.
+
+        @param interval Seconds between syncs
+        @paramType float
+        @returns n/a
+        '''
+        while not self.is_shutting_down:
+            try:
+                self.sync()
+            except:
+                logger.exception()
+
+            time.sleep(interval)
+
+    def register(self, polygon_strategy, bucket_size=60, num_buckets=60, query_id=None):
+        '''
+        Registers a new standing query.
+
+        @param polygon_strategy Describes the area of interest and how to break it down into
+        component areas
+        @paramType PolygonStrategy
+        @param bucket_size Width of each time bucket in seconds
+        @paramType int
+        @param num_buckets # of time buckets kept, the window spans bucket_size * num_buckets seconds
+        @paramType int
+        @param query_id Tracking id the query was registered under elsewhere, if any
+        @paramType string/uuid
+        @returns Tracking id of the standing query
+        @returnType string/uuid
+        '''
+        if query_id is None:
+            query_id = str(uuid4())
+        query = StandingQuery(polygon_strategy, bucket_size, num_buckets)
+
+        with self.lock:
+            self.queries[query_id] = query
+
+        logger.info("Registered standing query %s over %s sub-areas", query_id, len(query.boxes))
+        return query_id
+
+    def shutdown(self):
+        '''
+        Stops syncing with the store.
+
+        @returns n/a
+        '''
+        self.is_shutting_down = True
+
+    def sync(self, now=None):
+        '''
+        Registers the queries added to the store and drops the ones removed from it, then publishes
+        the current counts of every query to the store.
+
+        @param now Time at which the window ends in seconds since the epoch, defaults to the current time
+        @paramType float
+        @returns n/a
+        '''
+        assert self.store is not None
+
+        if now is None:
+            now = time.time()
+
+        stored_queries = self.store.get_queries()
+        with self.lock:
+            query_ids = self.queries.keys()
+
+        for query_id in query_ids:
+            if query_id not in stored_queries:
+                self.unregister(query_id)
+        for query_id, stored_query in stored_queries.items():
+            if query_id not in query_ids: # Starts counting from the tweets arriving from now on
+                self.register(stored_query['polygon_strategy'], stored_query['bucket_size'],
+                    stored_query['num_buckets'], query_id)
+
+        with self.lock:
+            queries = self.queries.items()
+
+        for query_id, query in queries:
+            self.store.save_counts(query_id, query.get_counts(now), now)
+
+    def unregister(self, query_id):
+        '''
+        Stops maintaining the specified standing query.
+
+        @param query_id Tracking id of the standing query
+        @paramType string/uuid
+        @returns n/a
+        '''
+        with self.lock:
+            if query_id in self.queries:
+                del self.queries[query_id]
+
+def to_epoch(timestamp):
+    '''
+    @param timestamp UTC timestamp. Format: YYYY-MM-dd HH24:mm:ss
+    @paramType string
+    @returns Seconds since the epoch
+    @returnType int
+    '''
+    return calendar.timegm(time.strptime(timestamp, '%Y-%m-%d %H:%M:%S'))
@@ -1,12 +1,24 @@
 ''' Unit tests for the AsynchResult class. '''
 
+import time
+
+from threading import Thread
+
 from smcity.analytics.asynch_result import AsynchResult
+from smcity.errors import NotReadyError
+from smcity.models.completion_notifier import LocalCompletionNotifier
 
 class MockPolygonStrategy:
     def encode_results_geojson(self, results):
         return "GeoJSON: " + str(results)
  
 class MockJob:
+    def get_num_sub_areas(self):
+        return self.num_sub_areas
+
+    def get_result_log(self):
+        return self.results, set()
+
     def get_results(self):
         return self.results
 
@@ -14,9 +26,16 @@ class MockJob:
         return self._is_finished
 
 class MockJobFactory:
+    def __init__(self):
+        self.num_status_reads = 0
+
     def get_job(self, job_id):
         return self.job
 
+    def is_job_finished(self, job_id):
+        self.num_status_reads += 1
+        return self.job._is_finished
+
 class TestAsynchResult:
     ''' Unit tests for the AsynchResult class. '''
 
@@ -40,3 +59,59 @@ class TestAsynchResult:
 
         results = asynch_result.get_results_geojson()
         assert results == 'GeoJSON: Results', results
+
+    def test_get_results_geojson_blocking(self):
+        ''' Tests the get_results_geojson_blocking() function. '''
+        job_factory = MockJobFactory()
+        job_factory.job = MockJob()
+        job_factory.job._is_finished = False
+        job_factory.job.results = 'Results'
+        notifier = LocalCompletionNotifier()
+        asynch_result = AsynchResult(job_factory, 'job_id', MockPolygonStrategy(), notifier)
+
+        # Try to retrieve results that never finish
+        try:
+            asynch_result.get_results_geojson_blocking(timeout=0.2)
+            assert False, "Failed to raise exception when results were not ready in time"
+        except NotReadyError:
+            pass
+
+        # Finish the job from another thread and announce it
+        def finish_job():
+            time.sleep(0.3)
+            job_factory.job._is_finished = True
+            notifier.notify_finished('job_id')
+        Thread(target=finish_job).start()
+
+        start_time = time.time()
+        results = asynch_result.get_results_geojson_blocking(timeout=10)
+        assert results == 'GeoJSON: Results', results
+        assert time.time() - start_time < 1, time.time() - start_time
+
+    def test_get_partial_results(self):
+        ''' Tests the get_partial_results_geojson() and get_results_since() functions. '''
+        job_factory = MockJobFactory()
+        job_factory.job = MockJob()
+        job_factory.job._is_finished = False
+        job_factory.job.num_sub_areas = 4
+        job_factory.job.results = ['result1']
+        asynch_result = AsynchResult(job_factory, 'job_id', MockPolygonStrategy())
+
+        results, completion = asynch_result.get_partial_results_geojson()
+        assert results == "GeoJSON: ['result1']", results
+        assert completion == 0.25, completion
+
+        results, cursor, completion, removed_boxes = asynch_result.get_results_since()
+        assert results == ['result1'], results
+        assert cursor == 1, cursor
+
+        job_factory.job.results = ['result1', 'result2', 'result3']
+        results, cursor, completion, removed_boxes = asynch_result.get_results_since(cursor)
+        assert results == ['result2', 'result3'], results
+        assert cursor == 3, cursor
+        assert completion == 0.75, completion
+
+        job_factory.job._is_finished = True
+        results, cursor, completion, removed_boxes = asynch_result.get_results_since(cursor)
+        assert results == [], results
+        assert completion == 1.0, completion
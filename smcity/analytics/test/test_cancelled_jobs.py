@@ -0,0 +1,39 @@
+''' Unit tests for the CancelledJobs class. '''
+
+from smcity.analytics.cancelled_jobs import CancelledJobs
+
+class MockClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+class MockJobFactory:
+    def __init__(self):
+        self.cancelled = set()
+        self.num_reads = 0
+
+    def is_job_cancelled(self, job_id):
+        self.num_reads += 1
+        return job_id in self.cancelled
+
+class TestCancelledJobs:
+    ''' Unit tests for the CancelledJobs class. '''
+
+    def test_is_cancelled(self):
+        ''' Tests that statuses are cached for the ttl, and cancellations for good. '''
+        clock = MockClock()
+        job_factory = MockJobFactory()
+        cancelled_jobs = CancelledJobs(job_factory, ttl=5, clock=clock.time)
+
+        assert cancelled_jobs.is_cancelled('job_id') == False
+        job_factory.cancelled.add('job_id')
+        assert cancelled_jobs.is_cancelled('job_id') == False # Still cached
+        assert job_factory.num_reads == 1, job_factory.num_reads
+
+        clock.now += 6
+        assert cancelled_jobs.is_cancelled('job_id') == True
+        clock.now += 600
+        assert cancelled_jobs.is_cancelled('job_id') == True
+        assert job_factory.num_reads == 2, job_factory.num_reads
@@ -0,0 +1,134 @@
+''' Unit tests for the ProgressiveResult class. '''
+
+from smcity.analytics.progressive_result import ProgressiveResult
+from smcity.errors import NotReadyError
+from smcity.polygons.simple_grid_strategy import SimpleGridStrategy
+
+class MockAsynchResult:
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._is_finished = False
+        self.is_cancelled = False
+        self.results = []
+
+    def cancel(self):
+        self.is_cancelled = True
+
+    def get_results_geojson(self):
+        return 'GeoJSON: ' + self.job_id
+
+    def get_results_since(self, cursor):
+        return self.results[cursor:], len(self.results), 1.0, []
+
+    def is_finished(self):
+        return self._is_finished
+
+class MockMapQueue:
+    def __init__(self):
+        self.requests = []
+
+    def request_count_tweets(self, polygon_strategy, sort_key=None):
+        boxes = polygon_strategy.get_inscribed_boxes()
+        if sort_key is not None:
+            boxes = sorted(boxes, key=sort_key)
+        self.requests.append(boxes)
+        return 'job' + str(len(self.requests))
+
+class MockResultFactory:
+    def __init__(self):
+        self.results = {}
+
+    def create(self, job_id, polygon_strategy):
+        self.results[job_id] = MockAsynchResult(job_id)
+        return self.results[job_id]
+
+class TestProgressiveResult:
+    ''' Unit tests for the ProgressiveResult class. '''
+
+    def setup(self):
+        ''' Set up before each test. '''
+        coordinate_box = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 3.9, 'max_lon' : 3.9}
+        fine = SimpleGridStrategy(coordinate_box, 1, 'style')
+        self.levels = [fine.get_coarser_strategy(2), fine]
+        self.map_queue = MockMapQueue()
+        self.result_factory = MockResultFactory()
+
+    def test_refine(self):
+        ''' Tests refining from the coarse level to the fine level. '''
+        result = ProgressiveResult(self.map_queue, self.result_factory, self.levels)
+
+        assert len(self.map_queue.requests) == 1
+        assert len(self.map_queue.requests[0]) == 4, self.map_queue.requests[0]
+        assert result.get_finest_finished_level() is None
+        try:
+            result.get_results_geojson()
+            assert False, "Failed to raise exception when no level was finished"
+        except NotReadyError:
+            pass
+
+        # Finish the coarse level with the densest cell in the north east
+        coarse = self.result_factory.results['job1']
+        coarse.results = [
+            {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 2, 'max_lon' : 2, 'result' : 1},
+            {'min_lat' : 0, 'min_lon' : 2, 'max_lat' : 2, 'max_lon' : 3.9, 'result' : 5},
+            {'min_lat' : 2, 'min_lon' : 0, 'max_lat' : 3.9, 'max_lon' : 2, 'result' : 0},
+            {'min_lat' : 2, 'min_lon' : 2, 'max_lat' : 3.9, 'max_lon' : 3.9, 'result' : 9}
+        ]
+        coarse._is_finished = True
+
+        assert result.get_results_geojson() == ('GeoJSON: job1', 0)
+        assert len(self.map_queue.requests) == 2
+
+        # The fine cells of the densest coarse cell are submitted first
+        fine_boxes = self.map_queue.requests[1]
+        assert len(fine_boxes) == 16, len(fine_boxes)
+        for box in fine_boxes[:4]:
+            assert box['min_lat'] >= 2 and box['min_lon'] >= 2, box
+        for box in fine_boxes[-4:]:
+            assert box['min_lat'] >= 2 and box['min_lon'] < 2, box
+
+        assert not result.is_finished()
+        self.result_factory.results['job2']._is_finished = True
+        assert result.is_finished()
+        assert result.get_results_geojson() == ('GeoJSON: job2', 1)
+        assert len(self.map_queue.requests) == 2
+
+    def test_refine_split(self):
+        ''' Tests that the results of a split coarse cell are summed when ordering the fine cells. '''
+        result = ProgressiveResult(self.map_queue, self.result_factory, self.levels)
+
+        coarse = self.result_factory.results['job1']
+        coarse.results = [{'min_lat' : 2, 'min_lon' : 2, 'max_lat' : 3.9, 'max_lon' : 3.9, 'result' : 9}]
+        for min_lat, min_lon in ((0, 0), (0, 1), (1, 0), (1, 1)): # The south west cell split into quarters
+            coarse.results.append({'min_lat' : min_lat, 'min_lon' : min_lon, 'max_lat' : min_lat + 1,
+                'max_lon' : min_lon + 1, 'result' : 3})
+        coarse._is_finished = True
+        assert result.refine()
+
+        for box in self.map_queue.requests[1][:4]: # 12 tweets beat 9
+            assert box['min_lat'] < 2 and box['min_lon'] < 2, box
+
+    def test_refine_viewport(self):
+        ''' Tests that cells inside the viewport are refined first. '''
+        viewport = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}
+        result = ProgressiveResult(self.map_queue, self.result_factory, self.levels, viewport)
+
+        coarse = self.result_factory.results['job1']
+        coarse.results = [{'min_lat' : 2, 'min_lon' : 2, 'max_lat' : 3.9, 'max_lon' : 3.9, 'result' : 9}]
+        coarse._is_finished = True
+        assert result.refine()
+
+        first_box = self.map_queue.requests[1][0]
+        assert first_box['min_lat'] == 0 and first_box['min_lon'] == 0, first_box
+        assert result.get_level_result(1).job_id == 'job2'
+
+    def test_cancel(self):
+        ''' Tests that cancelling stops the unfinished level and any further refinement. '''
+        result = ProgressiveResult(self.map_queue, self.result_factory, self.levels)
+        self.result_factory.results['job1']._is_finished = True
+
+        result.cancel()
+
+        assert self.result_factory.results['job1'].is_cancelled == False # Already finished
+        assert result.refine() == False
+        assert len(self.map_queue.requests) == 1, self.map_queue.requests
@@ -0,0 +1,87 @@
+''' Unit tests for the ResultCombiner class. '''
+
+from smcity.analytics.result_combiner import ResultCombiner
+
+class MockReduceQueue:
+    def __init__(self):
+        self.messages = []
+        self.starts = []
+
+    def post_combined_results(self, job_id, results, starts=None):
+        self.messages.append((job_id, results))
+        self.starts.extend(starts or [])
+
+    def post_count_tweets_result(self, job_id, coordinate_box, count, error=None):
+        self.messages.append((job_id, [{'coordinate_box' : coordinate_box, 'result' : count}]))
+
+    def post_task_started(self, task, started_at):
+        self.starts.append({'task' : task, 'started_at' : started_at})
+
+class MockTaskQueue:
+    def __init__(self):
+        self.finished_tasks = []
+
+    def finish_task(self, task):
+        self.finished_tasks.append(task)
+
+class TestResultCombiner:
+    ''' Unit tests for the ResultCombiner class. '''
+
+    def setup(self):
+        ''' Set up before each test. '''
+        self.reduce_queue = MockReduceQueue()
+        self.task_queue = MockTaskQueue()
+        self.combiner = ResultCombiner(self.reduce_queue, self.task_queue, window=1.0, max_results=3)
+
+    def post(self, job_id, index):
+        box = {'min_lat' : index, 'min_lon' : 0, 'max_lat' : index + 1, 'max_lon' : 1}
+        self.combiner.post_count_tweets_result(job_id, box, index)
+        self.combiner.finish_task({'job_id' : job_id, 'coordinate_box' : box})
+
+    def test_combine(self):
+        ''' Tests that a job's results are posted together once enough are buffered. '''
+        for index in range(4):
+            self.post('job1', index)
+        self.post('job2', 0)
+
+        assert len(self.reduce_queue.messages) == 1, self.reduce_queue.messages
+        assert [result['result'] for result in self.reduce_queue.messages[0][1]] == [0, 1, 2]
+        assert len(self.task_queue.finished_tasks) == 3 # The others wait on their results
+        assert len(self.combiner.get_unfinished_tasks()) == 2
+
+        self.combiner.flush()
+        assert len(self.reduce_queue.messages) == 3, self.reduce_queue.messages
+        assert len(self.task_queue.finished_tasks) == 5
+
+    def test_flush_expired(self):
+        ''' Tests that results are posted once they waited for the window. '''
+        self.post('job1', 0)
+        buffered_at = self.combiner.buffers['job1']['buffered_at']
+
+        self.combiner.flush_expired(buffered_at + 0.5)
+        assert len(self.reduce_queue.messages) == 0
+
+        self.combiner.flush_expired(buffered_at + 1.0)
+        assert self.reduce_queue.messages == [('job1', [{'coordinate_box' : {'min_lat' : 0, 'min_lon' : 0,
+            'max_lat' : 1, 'max_lon' : 1}, 'result' : 0}])], self.reduce_queue.messages
+        assert len(self.task_queue.finished_tasks) == 1
+
+    def test_combine_starts(self):
+        ''' Tests that task starts are posted along with the job's results. '''
+        task = {'job_id' : 'job1', 'coordinate_box' : {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}}
+        self.combiner.post_task_started(task, 100)
+        self.post('job1', 0)
+        self.combiner.post_task_started(task, 101)
+        assert len(self.reduce_queue.messages) == 1, self.reduce_queue.messages
+        assert [start['started_at'] for start in self.reduce_queue.starts] == [100, 101]
+
+        self.combiner.post_task_started(task, 102) # Alone, posted as is
+        self.combiner.flush()
+        assert len(self.reduce_queue.messages) == 1, self.reduce_queue.messages
+        assert self.reduce_queue.starts[-1] == {'task' : task, 'started_at' : 102}
+
+    def test_finish_task_without_results(self):
+        ''' Tests that tasks without buffered results are finished at once. '''
+        self.combiner.finish_task({'job_id' : 'job1'})
+
+        assert len(self.task_queue.finished_tasks) == 1
@@ -0,0 +1,124 @@
+''' Unit tests for the TweetRollup class. '''
+
+import calendar
+import time
+
+from smcity.analytics.rollup import TweetRollup, get_terms
+
+class MockArchive:
+    def __init__(self, rolled_up_hours):
+        self.rollups = {}
+        self.rolled_up_hours = rolled_up_hours
+
+    def add_rollup(self, hour, cells):
+        if getattr(self, 'failure', None) is not None:
+            failure, self.failure = self.failure, None
+            raise failure
+        self.rollups[hour] = cells
+
+    def is_rolled_up(self, hour):
+        return hour in self.rolled_up_hours or hour in self.rollups
+
+class MockTweet:
+    def __init__(self, timestamp, lat, lon, message):
+        self.record = (timestamp, lat, lon, message)
+
+    def lat(self):
+        return self.record[1]
+
+    def lon(self):
+        return self.record[2]
+
+    def message(self):
+        return self.record[3]
+
+    def timestamp(self):
+        return self.record[0]
+
+class MockTweetFactory:
+    def __init__(self, tweets):
+        self.time_ranges = []
+        self.tweets = tweets
+
+    def get_tweets(self, time_range=None):
+        self.time_ranges.append(time_range)
+        return [tweet for tweet in self.tweets if time_range[0] <= tweet.timestamp() <= time_range[1]]
+
+class TestTweetRollup:
+    ''' Unit tests for the TweetRollup class. '''
+
+    def setup(self):
+        ''' Set up before each test. '''
+        self.now = calendar.timegm(time.strptime('2014-01-02 03:30:00', '%Y-%m-%d %H:%M:%S'))
+        self.archive = MockArchive(['2014-01-02 01'])
+        self.tweet_factory = MockTweetFactory([
+            MockTweet('2014-01-02 00:10:00', 0.001, 0.001, 'Too old to roll up'),
+            MockTweet('2014-01-02 01:10:00', 0.001, 0.001, 'Already rolled up'),
+            MockTweet('2014-01-02 02:10:00', 0.001, 0.001, 'Coffee #coffee'),
+            MockTweet('2014-01-02 02:20:00', 0.002, 0.003, 'more coffee, 2014'),
+            MockTweet('2014-01-02 02:30:00', 0.5, 0.5, 'tea'),
+            MockTweet('2014-01-02 03:10:00', 0.001, 0.001, 'Hour not over yet')
+        ])
+        self.rollup = TweetRollup(self.tweet_factory, self.archive, 3, clock=lambda: self.now)
+
+    def test_get_pending_hours(self):
+        ''' Tests that only complete hours whose tweets are all kept are rolled up. '''
+        assert self.rollup.get_pending_hours() == ['2014-01-02 02'], self.rollup.get_pending_hours()
+
+    def test_roll_up(self):
+        ''' Tests that the pending hours are counted per cell with their top terms. '''
+        assert self.rollup.roll_up() == 3
+        assert self.tweet_factory.time_ranges == [('2014-01-02 02:00:00', '2014-01-02 02:59:59')]
+        assert self.archive.rollups == {'2014-01-02 02' : {
+            '0_0' : {'count' : 2, 'terms' : {'coffee' : 2, '#coffee' : 1, 'more' : 1}},
+            '50_50' : {'count' : 1, 'terms' : {'tea' : 1}}
+        }}, self.archive.rollups
+
+        assert self.rollup.roll_up() == 0 # Nothing left to roll up
+        assert len(self.tweet_factory.time_ranges) == 1
+
+    def test_roll_up_live(self):
+        ''' Tests that the hours seen from their start are rolled up without reading the table. '''
+        self.rollup.add_tweet(0.001, 0.001, '2014-01-02 03:40:00', 'Hour began before the rollup')
+        self.rollup.add_tweet(0.001, 0.001, '2014-01-02 04:10:00', 'tea')
+
+        self.now = calendar.timegm(time.strptime('2014-01-02 05:00:30', '%Y-%m-%d %H:%M:%S'))
+        assert self.rollup.roll_up() == 4
+        assert self.tweet_factory.time_ranges == [('2014-01-02 02:00:00', '2014-01-02 03:59:59')]
+        assert '2014-01-02 04' not in self.archive.rollups
+
+        self.rollup.add_tweet(0.5, 0.5, '2014-01-02 04:59:59', 'late tea')
+        self.now += 120 # Hour 04 was held open for the late tweets until now
+        assert self.rollup.roll_up() == 2
+        assert len(self.tweet_factory.time_ranges) == 1 # Hour 04 was not read from the table
+        assert self.archive.rollups['2014-01-02 04'] == {
+            '0_0' : {'count' : 1, 'terms' : {'tea' : 1}},
+            '50_50' : {'count' : 1, 'terms' : {'late' : 1, 'tea' : 1}}
+        }, self.archive.rollups['2014-01-02 04']
+
+    def test_roll_up_live_failure(self):
+        ''' Tests that the live counts of an hour are kept until its rollup is stored. '''
+        self.rollup.add_tweet(0.001, 0.001, '2014-01-02 04:10:00', 'tea')
+        self.rollup.add_tweet(0.5, 0.5, '2014-01-02 04:20:00', 'more tea')
+        self.now = calendar.timegm(time.strptime('2014-01-02 05:02:00', '%Y-%m-%d %H:%M:%S'))
+        self.archive.rolled_up_hours.extend(['2014-01-02 02', '2014-01-02 03'])
+
+        self.archive.failure = IOError('Throttled')
+        try:
+            self.rollup.roll_up()
+            assert False, "Failed to raise the archive's error"
+        except IOError:
+            pass
+        assert '2014-01-02 04' not in self.archive.rollups
+
+        assert self.rollup.roll_up() == 2 # Retried with the counts intact
+        assert self.archive.rollups['2014-01-02 04'] == {
+            '0_0' : {'count' : 1, 'terms' : {'tea' : 1}},
+            '50_50' : {'count' : 1, 'terms' : {'more' : 1, 'tea' : 1}}
+        }, self.archive.rollups['2014-01-02 04']
+        assert self.rollup.live_cells == {}, self.rollup.live_cells
+
+    def test_get_terms(self):
+        ''' Tests splitting messages into terms. '''
+        terms = get_terms('Go #Seattle @home at 10:30 2014')
+        assert terms == ['#seattle', '@home'], terms
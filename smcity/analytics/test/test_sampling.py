@@ -0,0 +1,48 @@
+''' Unit tests for the sampling functions. '''
+
+import math
+
+from smcity.analytics.sampling import Z_95, choose_segments, estimate_total
+
+class TestSampling:
+    ''' Unit tests for the sampling functions. '''
+
+    def test_choose_segments(self):
+        ''' Tests the choose_segments function. '''
+        segments = choose_segments(0.25, total_segments=20)
+        assert len(segments) == 5, segments
+        assert len(set(segments)) == 5, segments
+        assert all([0 <= segment < 20 for segment in segments]), segments
+
+        # Always reads at least one segment
+        assert len(choose_segments(0.001, total_segments=20)) == 1
+
+        # Reads the whole table at a rate of 1
+        assert choose_segments(1, total_segments=20) == range(20)
+
+    def test_estimate_total(self):
+        ''' Tests the estimate_total function. '''
+        estimate, error = estimate_total([1, 3], total_segments=10)
+        assert estimate == 20, estimate
+
+        # Sample variance 2, finite population correction 0.8
+        expected = Z_95 * math.sqrt(10 ** 2 * 0.8 * 2 / 2)
+        assert abs(error - expected) < 1e-9, error
+
+    def test_estimate_total_census(self):
+        ''' Tests that reading every segment gives an exact count. '''
+        estimate, error = estimate_total([1, 3, 2], total_segments=3)
+        assert estimate == 6, estimate
+        assert error == 0, error
+
+    def test_estimate_total_single_segment(self):
+        ''' Tests the estimate_total function with a single sampled segment. '''
+        estimate, error = estimate_total([4], total_segments=1)
+        assert estimate == 4, estimate
+        assert error == 0, error
+
+        # Falls back on a Poisson variance of the segment's count
+
+        estimate, error = estimate_total([4], total_segments=5)
+        assert estimate == 20, estimate
+        assert abs(error - Z_95 * math.sqrt(25 * 0.8 * 4)) < 1e-9, error
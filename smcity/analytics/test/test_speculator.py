@@ -0,0 +1,123 @@
+''' Unit tests for the Speculator class. '''
+
+from smcity.analytics.speculator import Speculator
+
+class MockPolygonStrategy:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+    def iter_inscribed_boxes(self):
+        return iter(self.boxes)
+
+class MockJob:
+    def __init__(self, job_id, pending_tasks, task_durations, is_finished=False, boxes=None):
+        self.boxes = boxes or []
+        self.job_id = job_id
+        self.num_strategy_reads = 0
+        self.pending_tasks = pending_tasks
+        self.task_durations = task_durations
+        self._is_finished = is_finished
+
+    def get_id(self):
+        return self.job_id
+
+    def get_pending_tasks(self):
+        return self.pending_tasks
+
+    def get_polygon_strategy(self):
+        self.num_strategy_reads += 1
+        return MockPolygonStrategy(self.boxes)
+
+    def get_task_durations(self):
+        return self.task_durations
+
+    def is_cancelled(self):
+        return False
+
+    def is_finished(self):
+        return self._is_finished
+
+class MockJobFactory:
+    def __init__(self):
+        self.jobs = {}
+
+    def get_job(self, job_id):
+        return self.jobs[job_id]
+
+class MockMapQueue:
+    def __init__(self):
+        self.speculative_tasks = []
+
+    def request_speculative_task(self, task):
+        self.speculative_tasks.append(task)
+
+def make_task(min_lat):
+    return {
+        'job_id' : 'job_id',
+        'task' : 'count_tweets',
+        'coordinate_box' : {'min_lat' : min_lat, 'min_lon' : 0, 'max_lat' : min_lat + 1, 'max_lon' : 1}
+    }
+
+class TestSpeculator:
+    ''' Unit tests for the Speculator class. '''
+
+    def setup(self):
+        ''' Set up before each test. '''
+        self.job_factory = MockJobFactory()
+        self.map_queue = MockMapQueue()
+        self.speculator = Speculator(self.job_factory, self.map_queue, percentile=90, multiplier=2,
+            min_delay=1, min_durations=5)
+
+    def test_check_jobs(self):
+        ''' Tests that only the tasks running for longer than the threshold are duplicated, once. '''
+        straggler = make_task(0)
+        self.job_factory.jobs['job_id'] = MockJob('job_id', [
+            {'task' : straggler, 'started_at' : 100},
+            {'task' : make_task(1), 'started_at' : 110}
+        ], [1, 2, 2, 2, 3])
+        self.speculator.watch('job_id')
+
+        # The 90th percentile is 2.6 secs, so the threshold is 5.2 secs
+        assert self.speculator.check_jobs(now=105) == 0
+        assert self.speculator.check_jobs(now=106) == 1
+        assert self.map_queue.speculative_tasks == [straggler], self.map_queue.speculative_tasks
+
+        assert self.speculator.check_jobs(now=107) == 0 # Already duplicated
+
+    def test_check_jobs_finished(self):
+        ''' Tests that finished jobs are no longer watched. '''
+        self.job_factory.jobs['job_id'] = MockJob('job_id', [], [], is_finished=True)
+        self.speculator.watch('job_id')
+
+        self.speculator.check_jobs()
+
+        assert 'job_id' not in self.speculator.duplicated, self.speculator.duplicated
+
+    def test_check_jobs_restores_payload(self):
+        ''' Tests that duplicates of summarized tasks get their box's payload back, also once split. '''
+        box = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 2, 'max_lon' : 1, 'region_set_id' : 'region-set',
+            'region_ids' : [0, 2]}
+        quarter = make_task(0)
+        quarter['coordinate_box'] = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 0.5}
+        self.job_factory.jobs['job_id'] = MockJob('job_id', [
+            {'task' : make_task(0), 'started_at' : 100},
+            {'task' : quarter, 'started_at' : 100}
+        ], [1, 2, 2, 2, 3], boxes=[make_task(0)['coordinate_box'], box])
+        self.speculator.watch('job_id')
+
+        assert self.speculator.check_jobs(now=106) == 2
+        assert self.map_queue.speculative_tasks[0] == make_task(0), self.map_queue.speculative_tasks
+        assert self.map_queue.speculative_tasks[1]['coordinate_box'] == {'min_lat' : 0, 'min_lon' : 0,
+            'max_lat' : 1, 'max_lon' : 0.5, 'region_set_id' : 'region-set', 'region_ids' : [0, 2]
+        }, self.map_queue.speculative_tasks
+        assert self.job_factory.jobs['job_id'].num_strategy_reads == 1 # The boxes are looked up once per job
+
+        self.job_factory.jobs['job_id']._is_finished = True
+        self.speculator.check_jobs(now=107)
+        assert self.speculator.payload_boxes == {}, self.speculator.payload_boxes
+
+    def test_get_threshold(self):
+        ''' Tests the get_threshold() function. '''
+        assert self.speculator.get_threshold([1, 1, 1, 1]) is None # Too few finished tasks
+        assert self.speculator.get_threshold([0.1] * 5) == 1 # Held up by the minimum delay
+        assert abs(self.speculator.get_threshold([1, 2, 2, 2, 3]) - 5.2) < 1e-9
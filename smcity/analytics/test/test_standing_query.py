@@ -0,0 +1,128 @@
+''' Unit tests for the StandingQuery and StandingQueryRegistry classes. '''
+
+from smcity.analytics.standing_query import StandingQuery, StandingQueryRegistry, get_results, to_epoch
+from smcity.errors import ReadError
+
+class MockPolygonStrategy:
+    def __init__(self, coordinate_boxes):
+        self.coordinate_boxes = coordinate_boxes
+
+    def encode_results_geojson(self, results):
+        return "GeoJSON: " + str([result['result'] for result in results])
+
+    def get_result_boxes(self):
+        return self.coordinate_boxes
+
+class MockStore:
+    def __init__(self):
+        self.counts = {}
+        self.queries = {}
+
+    def get_queries(self):
+        return dict(self.queries)
+
+    def save_counts(self, query_id, counts, updated_at):
+        self.counts[query_id] = counts
+
+class TestStandingQuery:
+    ''' Unit tests for the StandingQuery class. '''
+
+    def setup(self):
+        ''' Set up before each test. '''
+        self.polygon_strategy = MockPolygonStrategy([
+            {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1},
+            {'min_lat' : 0, 'min_lon' : 1, 'max_lat' : 1, 'max_lon' : 2}
+        ])
+        self.query = StandingQuery(self.polygon_strategy, bucket_size=60, num_buckets=2)
+
+    def test_add_tweet(self):
+        ''' Tests the add_tweet function. '''
+        assert self.query.add_tweet(0.5, 0.5, '2014-01-01 01:00:00')
+        assert self.query.add_tweet(0.5, 1.5, '2014-01-01 01:00:30')
+        assert self.query.add_tweet(0.5, 1.5, '2014-01-01 01:00:59')
+        assert not self.query.add_tweet(5, 5, '2014-01-01 01:00:59')
+
+        results = self.query.get_results(now=to_epoch('2014-01-01 01:00:59'))
+        assert results[0]['result'] == 1, results[0]['result']
+        assert results[1]['result'] == 2, results[1]['result']
+        assert results[1]['min_lon'] == 1, results[1]['min_lon']
+
+    def test_window_expiry(self):
+        ''' Tests that counts fall out of the window as time passes. '''
+        self.query.add_tweet(0.5, 0.5, '2014-01-01 01:00:00')
+        self.query.add_tweet(0.5, 0.5, '2014-01-01 01:01:00')
+
+        results = self.query.get_results(now=to_epoch('2014-01-01 01:01:30'))
+        assert results[0]['result'] == 2, results[0]['result']
+
+        results = self.query.get_results(now=to_epoch('2014-01-01 01:02:00'))
+        assert results[0]['result'] == 1, results[0]['result']
+
+        # Tweets older than the window are ignored
+        assert not self.query.add_tweet(0.5, 0.5, '2014-01-01 01:00:00')
+
+        results = self.query.get_results(now=to_epoch('2014-01-01 01:05:00'))
+        assert results[0]['result'] == 0, results[0]['result']
+
+    def test_get_results_geojson(self):
+        ''' Tests the get_results_geojson function. '''
+        self.query.add_tweet(0.5, 0.5, '2014-01-01 01:00:00')
+
+        geojson = self.query.get_results_geojson(now=to_epoch('2014-01-01 01:00:00'))
+        assert geojson == 'GeoJSON: [1, 0]', geojson
+
+class TestStandingQueryRegistry:
+    ''' Unit tests for the StandingQueryRegistry class. '''
+
+    def test_register(self):
+        ''' Tests registering, feeding and unregistering standing queries. '''
+        registry = StandingQueryRegistry()
+        query_id = registry.register(MockPolygonStrategy([
+            {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}
+        ]))
+
+        registry.add_tweet(0.5, 0.5, '2014-01-01 01:00:00')
+        results = registry.get_query(query_id).get_results(now=to_epoch('2014-01-01 01:00:00'))
+        assert results[0]['result'] == 1, results[0]['result']
+
+        registry.unregister(query_id)
+        try:
+            registry.get_results_geojson(query_id)
+            assert False, "Failed to raise exception for an unregistered query"
+        except ReadError:
+            pass
+
+    def test_sync(self):
+        ''' Tests following the queries of a store and publishing their counts to it. '''
+        store = MockStore()
+        store.queries['query_id'] = {
+            'polygon_strategy' : MockPolygonStrategy([
+                {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1},
+                {'min_lat' : 0, 'min_lon' : 1, 'max_lat' : 1, 'max_lon' : 2}
+            ]),
+            'bucket_size' : 60,
+            'num_buckets' : 2
+        }
+        registry = StandingQueryRegistry(store)
+
+        registry.sync(now=to_epoch('2014-01-01 01:00:00'))
+        assert store.counts == {'query_id' : [0, 0]}, store.counts
+
+        registry.add_tweet(0.5, 1.5, '2014-01-01 01:00:30')
+        registry.sync(now=to_epoch('2014-01-01 01:00:30'))
+        assert store.counts == {'query_id' : [0, 1]}, store.counts
+
+        del store.queries['query_id']
+        registry.sync(now=to_epoch('2014-01-01 01:00:30'))
+        try:
+            registry.get_query('query_id')
+            assert False, "Failed to drop a query removed from the store"
+        except ReadError:
+            pass
+
+def test_get_results():
+    ''' Tests the get_results function. '''
+    boxes = [{'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}]
+
+    assert get_results(boxes, [3]) == [{'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1, 'result' : 3}]
+    assert get_results(boxes, None)[0]['result'] == 0 # Not counted yet
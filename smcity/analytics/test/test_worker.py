@@ -4,25 +4,107 @@ import time
 
 from threading import Thread
 
-from smcity.analytics.worker import Worker
+from smcity.analytics.worker import CANCEL_CHECK_INTERVAL, Worker
+from smcity.polygons.hex_grid_strategy import HexGrid, HexGridStrategy
+from smcity.polygons.test.test_multi_region_strategy import MockRegionStore
+from smcity.polygons.test.test_simple_grid_strategy import MockStyleStrategy
 
 class MockResultQueue():
-    def post_count_tweets_result(self, job_id, coordinate_box, count):
+    def __init__(self):
+        self.counts = {}
+        self.split_tasks = []
+        self.started_tasks = []
+
+    def post_combined_results(self, job_id, results, starts=None):
+        self.combined_results = (job_id, results)
+        self.counts[job_id] = [result['result'] for result in results]
+
+    def post_count_tweets_result(self, job_id, coordinate_box, count, error=None):
         self.job_id = job_id
         self.coordinate_box = coordinate_box
         self.count = count
+        self.counts[job_id] = count
+        self.error = error
+
+    def post_task_split(self, task):
+        self.split_tasks.append(task)
+
+    def post_task_started(self, task, started_at):
+        self.started_tasks.append((task, started_at))
+
+class MockArchive():
+    def __init__(self, cells):
+        self.cells = cells
+
+    def get_cells(self, hour, coordinate_box=None):
+        return self.cells[hour]
+
+    def is_rolled_up(self, hour):
+        return hour in self.cells
+
+class MockBatchTaskQueue():
+    def __init__(self, tasks):
+        self.finished_tasks = []
+        self.tasks = tasks
+
+    def finish_task(self, task):
+        self.finished_tasks.append(task)
+
+    def get_task(self):
+        if len(self.tasks) == 0:
+            return None
+        return self.tasks.pop(0)
 
 class MockTaskQueue():
+    def __init__(self):
+        self.extended_tasks = []
+        self.finished_task = None
+        self.split_boxes = None
+
+    def extend_task(self, task, visibility_timeout):
+        self.extended_tasks.append((task, visibility_timeout))
+        return True
+
     def finish_task(self, task):
         self.finished_task = task
 
+    def split_task(self, task, coordinate_boxes):
+        self.split_boxes = coordinate_boxes
+        self.split_task_arg = task
+
     def get_task(self):
         task = self.task
         self.task = None
         return task
 
+class MockCancelledJobs():
+    def __init__(self, cancelled):
+        self.cancelled = cancelled
+
+    def is_cancelled(self, job_id):
+        return job_id in self.cancelled
+
+class MockTweet():
+    def __init__(self, lat, lon):
+        self.position = (lat, lon)
+
+    def lat(self):
+        return self.position[0]
+
+    def lon(self):
+        return self.position[1]
+
 class MockTweetFactory():
-    def get_tweets(self, age_limit=None, coordinate_box=None):
+    def __init__(self):
+        self.coordinate_boxes = []
+        self.segments = []
+
+    def get_tweets(self, age_limit=None, coordinate_box=None, segment=None, total_segments=None,
+                   time_range=None):
+        self.coordinate_boxes.append(coordinate_box)
+        self.time_range = time_range
+        if segment is not None:
+            self.segments.append(segment)
         return self.tweets
 
 class TestWorker():
@@ -63,3 +145,301 @@ class TestWorker():
         assert self.result_queue.count == 3, self.result_queue.count
         
         assert self.task_queue.finished_task is not None
+        assert self.result_queue.error is None, self.result_queue.error
+        assert self.result_queue.started_tasks == [], self.result_queue.started_tasks # Not speculating
+
+    def test_perform_tasks_count_tweets_sampled(self):
+        ''' Tests the perform_tasks function when a sampled count_tweets task is received. '''
+        # Load the test data
+        self.task_queue.task = {
+            'job_id' : 'job_id',
+            'task' : 'count_tweets',
+            'coordinate_box' : {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 0, 'max_lon' : 0},
+            'sample_rate' : 0.1
+        }
+        self.tweet_factory.tweets = ['tweet', 'tweet', 'tweet']
+
+        # Launch the worker thread
+        self.worker_thread.start()
+
+        # Wait a moment before shutting the thread down
+        time.sleep(1)
+        self.worker.shutdown()
+
+        # Check the results, every sampled segment held 3 tweets
+        assert len(self.tweet_factory.segments) == 10, self.tweet_factory.segments
+        assert len(set(self.tweet_factory.segments)) == 10, self.tweet_factory.segments
+        assert self.result_queue.count == 300, self.result_queue.count
+        assert self.result_queue.error == 0, self.result_queue.error
+
+        assert self.task_queue.finished_task is not None
+
+    def test_perform_tasks_count_tweets_boundary(self):
+        ''' Tests the perform_tasks function when a count_tweets task has polygon rings. '''
+        # Load the test data, only the lower triangle of the box is of interest
+        self.task_queue.task = {
+            'job_id' : 'job_id',
+            'task' : 'count_tweets',
+            'coordinate_box' : {
+                'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1,
+                'rings' : [[[0, 0], [1, 0], [1, 1]]]
+            }
+        }
+        self.tweet_factory.tweets = [MockTweet(0.25, 0.75), MockTweet(0.75, 0.25), MockTweet(0.1, 0.9)]
+
+        # Launch the worker thread
+        self.worker_thread.start()
+
+        # Wait a moment before shutting the thread down
+        time.sleep(1)
+        self.worker.shutdown()
+
+        # Check the results
+        assert self.result_queue.count == 2, self.result_queue.count
+        assert self.task_queue.finished_task is not None
+
+    def test_perform_tasks_count_tweets_regions(self):
+        ''' Tests the perform_tasks function when a count_tweets task covers several regions. '''
+        # Load the test data
+        self.task_queue.task = {
+            'job_id' : 'job_id',
+            'task' : 'count_tweets',
+            'coordinate_box' : {
+                'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 2, 'max_lon' : 2,
+                'region_set_id' : 'region-set', 'region_ids' : [0, 1]
+            }
+        }
+        self.tweet_factory.tweets = [MockTweet(0.25, 0.75), MockTweet(0.75, 0.25), MockTweet(1.5, 0.5)]
+        self.worker = Worker(self.result_queue, self.task_queue, self.tweet_factory,
+            region_store=MockRegionStore([
+                {'name' : 'square', 'geometry' : {'type' : 'Polygon', 'coordinates' : [
+                    [[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]
+                ]}},
+                {'name' : 'triangle', 'geometry' : {'type' : 'Polygon', 'coordinates' : [
+                    [[0, 0], [2, 0], [2, 2], [0, 0]]
+                ]}}
+            ]))
+        self.worker_thread = Thread(target=self.worker.perform_tasks)
+
+        # Launch the worker thread
+        self.worker_thread.start()
+
+        # Wait a moment before shutting the thread down
+        time.sleep(1)
+        self.worker.shutdown()
+
+        # Check the results
+        assert self.result_queue.count == {'0' : 2, '1' : 1}, self.result_queue.count
+        assert self.result_queue.coordinate_box == {
+            'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 2, 'max_lon' : 2
+        }, self.result_queue.coordinate_box
+        assert self.task_queue.finished_task is not None
+
+    def test_perform_tasks_count_tweets_hexes(self):
+        ''' Tests the perform_tasks function when a count_tweets task is a tile of many hexes. '''
+        # Load the test data
+        strategy = HexGridStrategy({'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}, 0.1,
+            MockStyleStrategy(), tile_hexes=3)
+        tile = strategy.get_inscribed_boxes()[0]
+        self.task_queue.task = {'job_id' : 'job_id', 'task' : 'count_tweets', 'coordinate_box' : tile}
+
+        grid = HexGrid(tile['hex_grid']['coordinate_box'], tile['hex_grid']['resolution'])
+        (q1, r1), (q2, r2) = tile['hexes'][0], tile['hexes'][-1]
+        self.tweet_factory.tweets = [MockTweet(*grid.get_hex_center(q1, r1)),
+            MockTweet(*grid.get_hex_center(q1, r1)), MockTweet(*grid.get_hex_center(q2, r2))]
+
+        # Launch the worker thread
+        self.worker_thread.start()
+
+        # Wait a moment before shutting the thread down
+        time.sleep(1)
+        self.worker.shutdown()
+
+        # Check the results
+        assert len(self.result_queue.count) == len(tile['hexes']), self.result_queue.count
+        assert self.result_queue.count['%d_%d' % (q1, r1)] == 2, self.result_queue.count
+        assert self.result_queue.count['%d_%d' % (q2, r2)] == 1, self.result_queue.count
+        assert sum(self.result_queue.count.values()) == 3, self.result_queue.count
+        assert 'hexes' not in self.result_queue.coordinate_box, self.result_queue.coordinate_box
+
+    def test_perform_tasks_shared_scan(self):
+        ''' Tests that overlapping tasks collected in one batch share a single scan. '''
+        task_queue = MockBatchTaskQueue([
+            {'job_id' : 'job1', 'task' : 'count_tweets',
+             'coordinate_box' : {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}},
+            {'job_id' : 'job2', 'task' : 'count_tweets',
+             'coordinate_box' : {'min_lat' : 0.5, 'min_lon' : 0.5, 'max_lat' : 2, 'max_lon' : 2}},
+            {'job_id' : 'job3', 'task' : 'count_tweets',
+             'coordinate_box' : {'min_lat' : 10, 'min_lon' : 10, 'max_lat' : 11, 'max_lon' : 11}},
+        ])
+        self.tweet_factory.tweets = [MockTweet(0.25, 0.25), MockTweet(0.75, 0.75), MockTweet(1.5, 1.5)]
+        worker = Worker(self.result_queue, task_queue, self.tweet_factory, batch_window=0.1)
+
+        worker._perform_batch(worker._collect_tasks())
+
+        # The first two tasks share one scan over their combined area, the third scans on its own
+        assert len(self.tweet_factory.coordinate_boxes) == 2, self.tweet_factory.coordinate_boxes
+        assert {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 2, 'max_lon' : 2} in self.tweet_factory.coordinate_boxes
+
+        assert self.result_queue.counts['job1'] == 2, self.result_queue.counts
+        assert self.result_queue.counts['job2'] == 2, self.result_queue.counts
+        assert len(task_queue.finished_tasks) == 3, task_queue.finished_tasks
+
+    def test_perform_tasks_split_over_budget(self):
+        ''' Tests that a task which reads too many tweets is split instead of finished. '''
+        self.task_queue.task = {
+            'job_id' : 'job_id',
+            'task' : 'count_tweets',
+            'coordinate_box' : {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 2, 'max_lon' : 4, 'rings' : []}
+        }
+        self.tweet_factory.tweets = [MockTweet(0.5, 0.5)] * 3
+        self.result_queue.count = None
+        worker = Worker(self.result_queue, self.task_queue, self.tweet_factory, max_task_tweets=2)
+
+        worker._perform_batch(worker._collect_tasks())
+
+        # Nothing is posted and the task is handed back as quarters
+        assert self.result_queue.count is None, self.result_queue.count
+        assert self.result_queue.split_tasks == [self.task_queue.split_task_arg], self.result_queue.split_tasks
+        assert self.task_queue.finished_task is None, self.task_queue.finished_task
+        assert self.task_queue.split_boxes == [
+            {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 2, 'rings' : []},
+            {'min_lat' : 0, 'min_lon' : 2, 'max_lat' : 1, 'max_lon' : 4, 'rings' : []},
+            {'min_lat' : 1, 'min_lon' : 0, 'max_lat' : 2, 'max_lon' : 2, 'rings' : []},
+            {'min_lat' : 1, 'min_lon' : 2, 'max_lat' : 2, 'max_lon' : 4, 'rings' : []}
+        ], self.task_queue.split_boxes
+
+    def test_perform_tasks_speculative_never_split(self):
+        ''' Tests that a speculative duplicate runs to completion regardless of its budget. '''
+        self.task_queue.task = {
+            'job_id' : 'job_id',
+            'task' : 'count_tweets',
+            'coordinate_box' : {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 2, 'max_lon' : 4},
+            'speculative' : True
+        }
+        self.tweet_factory.tweets = [MockTweet(0.5, 0.5)] * 3
+        worker = Worker(self.result_queue, self.task_queue, self.tweet_factory, max_task_tweets=2)
+
+        worker._perform_batch(worker._collect_tasks())
+
+        assert self.result_queue.count == 3, self.result_queue.count
+        assert self.task_queue.split_boxes is None, self.task_queue.split_boxes
+        assert self.result_queue.split_tasks == [], self.result_queue.split_tasks
+
+    def test_report_starts(self):
+        ''' Tests that the start of each collected task is reported. '''
+        tasks = [{'job_id' : 'job1'}, {'job_id' : 'job2'}]
+        before = time.time()
+
+        self.worker._report_starts(tasks)
+
+        assert [task for task, started_at in self.result_queue.started_tasks] == tasks, \
+            self.result_queue.started_tasks
+        for task, started_at in self.result_queue.started_tasks:
+            assert before <= started_at <= time.time(), started_at
+
+    def test_extend_in_flight_tasks(self):
+        ''' Tests that the visibility of the tasks being performed is renewed. '''
+        tasks = [{'job_id' : 'job1'}, {'job_id' : 'job2'}]
+        worker = Worker(self.result_queue, self.task_queue, self.tweet_factory, visibility_timeout=60)
+
+        worker._extend_in_flight_tasks() # Nothing in flight
+        assert self.task_queue.extended_tasks == [], self.task_queue.extended_tasks
+
+        worker.in_flight_tasks = tasks
+        worker._extend_in_flight_tasks()
+        assert self.task_queue.extended_tasks == [(tasks[0], 60), (tasks[1], 60)], self.task_queue.extended_tasks
+
+    def test_perform_tasks_cancelled(self):
+        ''' Tests that tasks of cancelled jobs are dropped without posting a result. '''
+        task_queue = MockBatchTaskQueue([
+            {'job_id' : 'job1', 'task' : 'count_tweets',
+             'coordinate_box' : {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}},
+            {'job_id' : 'job2', 'task' : 'count_tweets',
+             'coordinate_box' : {'min_lat' : 2, 'min_lon' : 2, 'max_lat' : 3, 'max_lon' : 3}}
+        ])
+        self.tweet_factory.tweets = [MockTweet(0.5, 0.5), MockTweet(2.5, 2.5)]
+        worker = Worker(self.result_queue, task_queue, self.tweet_factory, batch_window=0.05,
+            cancelled_jobs=MockCancelledJobs(['job1']))
+
+        worker._perform_batch(worker._collect_tasks())
+
+        assert list(self.result_queue.counts.keys()) == ['job2'], self.result_queue.counts
+        assert len(task_queue.finished_tasks) == 2, task_queue.finished_tasks
+        assert len(self.tweet_factory.coordinate_boxes) == 1, self.tweet_factory.coordinate_boxes
+
+    def test_perform_tasks_cancelled_while_scanning(self):
+        ''' Tests that a task is abandoned once its job is cancelled mid scan. '''
+        cancelled_jobs = MockCancelledJobs([])
+        self.task_queue.task = {
+            'job_id' : 'job_id',
+            'task' : 'count_tweets',
+            'coordinate_box' : {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}
+        }
+        self.result_queue.count = None
+        worker = Worker(self.result_queue, self.task_queue, self.tweet_factory, cancelled_jobs=cancelled_jobs)
+
+        def tweets():
+            for index in range(CANCEL_CHECK_INTERVAL * 3):
+                if index == CANCEL_CHECK_INTERVAL: # Cancelled while the task is running
+                    cancelled_jobs.cancelled.append('job_id')
+                yield MockTweet(0.5, 0.5)
+        self.tweet_factory.tweets = tweets()
+
+        worker._perform_batch(worker._collect_tasks())
+
+        assert self.result_queue.count is None, self.result_queue.count
+        assert self.task_queue.finished_task is not None # Dropped from the queue
+
+    def test_perform_tasks_combined(self):
+        ''' Tests that results are posted together and their tasks only finished afterwards. '''
+        task_queue = MockBatchTaskQueue([
+            {'job_id' : 'job1', 'task' : 'count_tweets',
+             'coordinate_box' : {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}},
+            {'job_id' : 'job1', 'task' : 'count_tweets',
+             'coordinate_box' : {'min_lat' : 2, 'min_lon' : 2, 'max_lat' : 3, 'max_lon' : 3}}
+        ])
+        self.tweet_factory.tweets = [MockTweet(0.5, 0.5)]
+        worker = Worker(self.result_queue, task_queue, self.tweet_factory, batch_window=0.05,
+            combine_window=60)
+
+        worker._perform_batch(worker._collect_tasks())
+        assert self.result_queue.counts == {}, self.result_queue.counts
+        assert len(task_queue.finished_tasks) == 0, task_queue.finished_tasks
+
+        worker.shutdown()
+        worker.perform_tasks() # Flushes on the way out
+
+        assert self.result_queue.counts == {'job1' : [1, 1]}, self.result_queue.counts
+        assert len(task_queue.finished_tasks) == 2, task_queue.finished_tasks
+
+    def test_perform_tasks_archived(self):
+        ''' Tests that the rolled up hours of a time range are counted from the archive. '''
+        archive = MockArchive({
+            '2014-01-01 00' : [{'lat' : 0.005, 'lon' : 0.005, 'count' : 3}],
+            '2014-01-01 01' : [{'lat' : 0.005, 'lon' : 0.005, 'count' : 4}]
+        })
+        task = {
+            'job_id' : 'job_id',
+            'task' : 'count_tweets',
+            'coordinate_box' : {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1},
+            'time_range' : ['2014-01-01 00:30:00', '2014-01-01 02:15:00']
+        }
+        self.task_queue.task = task
+        self.tweet_factory.tweets = ['tweet', 'tweet']
+        worker = Worker(self.result_queue, self.task_queue, self.tweet_factory, archive=archive)
+
+        worker._perform_batch(worker._collect_tasks())
+
+        assert self.result_queue.count == 9, self.result_queue.count # Rolled up hours count whole
+        assert self.tweet_factory.time_range == ('2014-01-01 02:00:00', '2014-01-01 02:15:00'), \
+            self.tweet_factory.time_range
+
+        # A range which was rolled up entirely is not scanned at all
+        self.task_queue.task = dict(task, time_range=['2014-01-01 00:00:00', '2014-01-01 01:59:59'])
+        self.tweet_factory.coordinate_boxes = []
+
+        worker._perform_batch(worker._collect_tasks())
+
+        assert self.result_queue.count == 7, self.result_queue.count
+        assert self.tweet_factory.coordinate_boxes == [], self.tweet_factory.coordinate_boxes
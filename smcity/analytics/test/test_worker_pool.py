@@ -0,0 +1,85 @@
+''' Unit tests for the WorkerPool class. '''
+
+import time
+
+from smcity.analytics.worker_pool import WorkerPool
+
+class MockMapQueue:
+    def __init__(self):
+        self.num_tasks = 0
+
+    def get_num_tasks(self):
+        return self.num_tasks
+
+class MockWorker:
+    def __init__(self):
+        self.is_shutting_down = False
+        self.stats = {'num_tasks' : 0, 'busy_seconds' : 0.0, 'num_throttled' : 0}
+
+    def get_stats(self):
+        return dict(self.stats)
+
+    def perform_tasks(self):
+        while not self.is_shutting_down:
+            time.sleep(0.01)
+
+    def shutdown(self):
+        self.is_shutting_down = True
+
+class TestWorkerPool:
+    ''' Unit tests for the WorkerPool class. '''
+
+    def setup(self):
+        ''' Set up before each test. '''
+        self.map_queue = MockMapQueue()
+        self.pool = WorkerPool(MockWorker, self.map_queue, 1, 4, tasks_per_worker=10, max_task_seconds=2)
+
+    def teardown(self):
+        ''' Clean up after each test. '''
+        self.pool.shutdown()
+
+    def test_resize_backlog(self):
+        ''' Tests that the pool grows with the backlog at once and shrinks one worker at a time. '''
+        assert self.pool.resize() == 1 # Quiet
+
+        self.map_queue.num_tasks = 25
+        assert self.pool.resize() == 3
+
+        self.map_queue.num_tasks = 1000
+        assert self.pool.resize() == 4 # Capped
+
+        self.map_queue.num_tasks = 0
+        assert self.pool.resize() == 3
+        assert self.pool.resize() == 2
+        assert self.pool.resize() == 1
+        assert self.pool.resize() == 1 # Floored
+
+    def test_resize_throttled(self):
+        ''' Tests that the pool sheds a worker whenever the workers were throttled. '''
+        self.map_queue.num_tasks = 40
+        assert self.pool.resize() == 4
+
+        self.pool.workers[0].stats['num_throttled'] = 1
+        assert self.pool.resize() == 3
+
+        assert self.pool.resize() == 4 # No further throttling
+
+    def test_resize_slow_tasks(self):
+        ''' Tests that the pool stops growing while tasks are slow. '''
+        self.map_queue.num_tasks = 20
+        assert self.pool.resize() == 2
+
+        self.pool.workers[0].stats.update({'num_tasks' : 2, 'busy_seconds' : 10.0})
+        self.map_queue.num_tasks = 40
+        assert self.pool.resize() == 2
+
+    def test_shutdown(self):
+        ''' Tests that shutting the pool down shuts down its workers. '''
+        self.map_queue.num_tasks = 20
+        self.pool.resize()
+        workers = list(self.pool.workers)
+
+        self.pool.shutdown()
+
+        assert self.pool.get_size() == 0
+        assert all([worker.is_shutting_down for worker in workers])
@@ -1,13 +1,72 @@
 ''' Contains the backend worker that actually handles performing the analytical tasks. '''
 
+import calendar
+import numpy
+import time
+
+from threading import Thread
+
+from smcity.analytics.result_combiner import ResultCombiner
+from smcity.analytics.sampling import TOTAL_SEGMENTS, choose_segments, estimate_total
+from smcity.errors import CancelledError, OverBudgetError, ThrottledError
 from smcity.logging.logger import Logger
+from smcity.models.tweet_archive import get_hour
+from smcity.polygons.geometry import get_edges, points_in_polygon
+from smcity.polygons.hex_grid_strategy import HexIndex
+from smcity.polygons.multi_region_strategy import get_tile_index
 
 logger = Logger(__name__)
 
+# # of tweets read between checks of whether the task's job was cancelled
+CANCEL_CHECK_INTERVAL = 1000
+
+# # of tweets tested against a boundary box's polygon or attributed to regions or hexes at a time
+POINT_TEST_CHUNK_SIZE = 10000
+
+def get_area_index(coordinate_box, region_store=None):
+    '''
+    @param coordinate_box Area being searched
+    @paramType dictionary
+    @param region_store Holds the region sets of multi-region tiles
+    @paramType RegionStore
+    @returns Index attributing the tweets to the areas a scan tile reports counts for, None if the
+    box reports a single count. Tiles refer to their regions under keys 'region_set_id' and
+    'region_ids', or hold their hexes under keys 'hexes' and 'hex_grid'.
+    @returnType RegionIndex or HexIndex
+    '''
+    if 'region_ids' in coordinate_box:
+        assert region_store is not None, "No region store to load the tile's regions from!"
+        return get_tile_index(region_store, coordinate_box)
+    if 'hexes' in coordinate_box:
+        return HexIndex(coordinate_box['hex_grid'], coordinate_box['hexes'])
+    return None
+
+def split_box(coordinate_box):
+    '''
+    @param coordinate_box Box to be split, any keys besides the bounds are copied to each quarter
+    @paramType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+    @returns Quarters of the box
+    @returnType list of dictionaries
+    '''
+    mid_lat = (coordinate_box['min_lat'] + coordinate_box['max_lat']) / 2.0
+    mid_lon = (coordinate_box['min_lon'] + coordinate_box['max_lon']) / 2.0
+
+    quarters = []
+    for min_lat, max_lat in ((coordinate_box['min_lat'], mid_lat), (mid_lat, coordinate_box['max_lat'])):
+        for min_lon, max_lon in ((coordinate_box['min_lon'], mid_lon), (mid_lon, coordinate_box['max_lon'])):
+            quarter = dict(coordinate_box)
+            quarter.update({'min_lat' : min_lat, 'min_lon' : min_lon, 'max_lat' : max_lat, 'max_lon' : max_lon})
+            quarters.append(quarter)
+
+    return quarters
+
 class Worker():
     ''' Handles actually performing the analytical tasks. '''
   
-    def __init__(self, result_queue, task_queue, tweet_factory):
+    def __init__(self, result_queue, task_queue, tweet_factory, batch_window=0, max_batch_size=100,
+                 max_task_tweets=None, max_task_seconds=None, min_split_size=0.0001, visibility_timeout=None,
+                 cancelled_jobs=None, combine_window=None, max_combined_results=25, archive=None,
+                 report_starts=False, region_store=None):
         '''
         Constructor.
  
@@ -17,35 +76,552 @@ class Worker():
         @paramType TaskQueue
         @param tweet_factory Interface for retrieving tweets
         @paramType TweetFactory
+        @param batch_window Seconds spent collecting further tasks once one arrives, so tasks with
+        overlapping areas can share a single scan. 0 performs each task as it arrives.
+        @paramType float
+        @param max_batch_size Largest # of tasks collected into a batch
+        @paramType int
+        @param max_task_tweets # of tweets a count_tweets task may read before it is abandoned and
+        split into quarters for other workers to pick up. None for no limit.
+        @paramType int
+        @param max_task_seconds Seconds a count_tweets task may run before it is abandoned and split.
+        None for no limit.
+        @paramType float
+        @param min_split_size Tasks whose boxes are this small in degrees are never split
+        @paramType float
+        @param visibility_timeout Seconds the tasks being performed are kept hidden from other
+        workers for, renewed every third of the timeout. None leaves the queue's own timeout alone.
+        @paramType int
+        @param cancelled_jobs Tells whether a job was cancelled, tasks of cancelled jobs are dropped
+        before they start and abandoned while scanning. None to perform every task.
+        @paramType CancelledJobs
+        @param combine_window Seconds results are buffered for, so each job's results are posted as
+        combined messages. None posts each result as it is counted.
+        @paramType float
+        @param max_combined_results # of a job's results combined into a single message at most
+        @paramType int
+        @param archive Answers the rolled up hours of time ranged tasks, if any. Otherwise every hour
+        is read from the tweets table.
+        @paramType TweetArchive
+        @param report_starts Whether the tasks' starts are reported, so a speculator can duplicate
+        lagging tasks. Only worthwhile while speculation is enabled.
+        @paramType boolean
+        @param region_store Holds the region sets of multi-region tasks, if any
+        @paramType RegionStore
         @returns n/a
         '''
         assert result_queue is not None
         assert task_queue is not None
         assert tweet_factory is not None
+        assert batch_window >= 0, batch_window
+        assert max_batch_size > 0, max_batch_size
+        assert visibility_timeout is None or visibility_timeout > 0, visibility_timeout
 
+        self.archive = archive
+        self.batch_window = batch_window
+        self.cancelled_jobs = cancelled_jobs
+        self.busy_seconds = 0.0
+        self.combiner = None
+        self.in_flight_tasks = []
         self.is_shutting_down = False
+        self.max_batch_size = max_batch_size
+        self.max_task_seconds = max_task_seconds
+        self.max_task_tweets = max_task_tweets
+        self.min_split_size = min_split_size
+        self.num_tasks_performed = 0
+        self.num_throttled = 0
+        self.region_store = region_store
+        self.report_starts = report_starts
         self.result_queue = result_queue
         self.task_queue = task_queue
         self.tweet_factory = tweet_factory
+        self.visibility_timeout = visibility_timeout
 
-    def _count_tweets(self, job_id, coordinate_box):
+        if combine_window is not None: # Results are posted, and their tasks finished, by the combiner
+            self.combiner = ResultCombiner(result_queue, task_queue, combine_window, max_combined_results)
+            self.result_queue = self.combiner
+
+    def _count_tweets(self, job_id, coordinate_box, sample_rate=None, splittable=True, time_range=None):
         '''
         Counts the number of tweets that have occurred within the specified coordinate box.
 
         @param job_id Tracking id of the job
         @paramType uuid/string
-        @param coordinate_box Area in which to search
-        @paramType uuid/string
+        @param coordinate_box Area in which to search. If it holds key 'rings', only tweets inside
+        those polygon rings are counted. If it holds key 'region_ids' or 'hexes', the tweets are
+        counted per region or hex.
+        @paramType dictionary
+        @param sample_rate Fraction of the tweets to read, the count is then estimated from the sample.
+        If None, every tweet is read and the count is exact. Region and hex counts are always exact.
+        @paramType float in (0, 1]
+        @param splittable Whether the task may be abandoned once it runs over its budget
+        @paramType boolean
+        @param time_range Only counts tweets made between the two times, inclusive. None counts every
+        tweet. Format: YYYY-MM-dd HH24:mm:ss
+        @paramType tuple of strings (start, end)
         @returns n/a
+        @throws If the task ran over its budget before finishing, nothing is posted
+        @throwType OverBudgetError
+        @throws If the job was cancelled before the task finished, nothing is posted
+        @throwType CancelledError
         '''
         assert job_id is not None
 
-        num_tweets = 0 # Count the number of tweets in the specified area
-        for tweet in self.tweet_factory.get_tweets(coordinate_box=coordinate_box):
+        archived_cells = []
+        if time_range is not None and self.archive is not None: # Count the rolled up hours from the archive
+            archived_cells, time_range = self._split_time_range(time_range, coordinate_box)
+
+        area_index = get_area_index(coordinate_box, self.region_store)
+        if area_index is not None: # Attribute the tweets to the regions or hexes in a single scan
+            self._count_areas(job_id, area_index, coordinate_box, splittable, time_range, archived_cells)
+            return
+
+        num_archived = self._count_archived(archived_cells, coordinate_box)
+        if sample_rate is None or sample_rate >= 1: # Count every tweet in the specified area
+            tweets = self._iter_within_budget(
+                self._get_tweets(job_id, coordinate_box=coordinate_box, time_range=time_range),
+                coordinate_box, splittable)
+            num_tweets = self._count_matching(tweets, coordinate_box) + num_archived
+
+            logger.debug("Found %s tweets in my sub-area; Posting results..." % num_tweets)
+            self.result_queue.post_count_tweets_result(job_id, coordinate_box, num_tweets)
+            return
+
+        sample_counts = [] # Count the tweets in a random sample of the table's segments
+        for segment in choose_segments(sample_rate):
+            tweets = self._get_tweets(job_id, coordinate_box=coordinate_box, segment=segment,
+                total_segments=TOTAL_SEGMENTS, time_range=time_range)
+            sample_counts.append(self._count_matching(tweets, coordinate_box))
+
+        estimate, error = estimate_total(sample_counts)
+        logger.debug("Estimated %s +/- %s tweets in my sub-area from %s segments; Posting results...",
+            estimate, error, len(sample_counts))
+        self.result_queue.post_count_tweets_result(job_id, coordinate_box, int(round(estimate)) + num_archived,
+            error)
+
+    def _count_archived(self, cells, coordinate_box):
+        '''
+        @param cells Archived cells inside the coordinate box, see TweetArchive.get_cells()
+        @paramType list of dictionaries
+        @param coordinate_box Area being searched, optionally holding polygon rings under key 'rings'
+        @paramType dictionary
+        @returns # of archived tweets inside the area, each cell located by its center
+        @returnType int
+        '''
+        if len(cells) == 0:
+            return 0
+
+        counts = numpy.array([cell['count'] for cell in cells], dtype=int)
+        if 'rings' not in coordinate_box: # Every cell in the box counts
+            return int(counts.sum())
+
+        lats = numpy.array([cell['lat'] for cell in cells], dtype=float)
+        lons = numpy.array([cell['lon'] for cell in cells], dtype=float)
+        return int(counts[points_in_polygon(lons, lats, get_edges(coordinate_box['rings']))].sum())
+
+    def _count_matching(self, tweets, coordinate_box):
+        '''
+        @param tweets Tweets inside the coordinate box
+        @paramType iterable of Tweet
+        @param coordinate_box Area being searched, optionally holding polygon rings under key 'rings'
+        @paramType dictionary
+        @returns # of tweets inside the area, tested against the rings in chunks if there are any
+        @returnType int
+        '''
+        if 'rings' not in coordinate_box: # Every tweet in the box counts
+            num_tweets = 0
+            for tweet in tweets:
+                num_tweets += 1
+            return num_tweets
+
+        edges = get_edges(coordinate_box['rings'])
+        num_tweets = 0
+        for lats, lons in self._iter_position_chunks(tweets):
+            num_tweets += int(points_in_polygon(lons, lats, edges).sum())
+
+        return num_tweets
+
+    def _count_areas(self, job_id, area_index, coordinate_box, splittable=True, time_range=None,
+                     archived_cells=None):
+        '''
+        Counts the tweets inside each of the regions or hexes overlapping the coordinate box.
+
+        @param job_id Tracking id of the job
+        @paramType uuid/string
+        @param area_index Attributes the tweets to the tile's regions or hexes, see get_area_index()
+        @paramType RegionIndex or HexIndex
+        @param coordinate_box Scan tile
+        @paramType dictionary
+        @param splittable Whether the task may be abandoned once it runs over its budget
+        @paramType boolean
+        @param time_range Only counts tweets made between the two times, inclusive, if any
+        @paramType tuple of strings (start, end)
+        @param archived_cells Archived cells inside the tile, counted towards the areas containing
+        their centers
+        @paramType list of dictionaries, see TweetArchive.get_cells()
+        @returns n/a
+        '''
+        bounds = dict([(key, coordinate_box[key]) for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon')])
+
+        counts = dict([(str(area_id), 0) for area_id in area_index.ids])
+        tweets = self._iter_within_budget(self._get_tweets(job_id, coordinate_box=bounds, time_range=time_range),
+            coordinate_box, splittable)
+        for lats, lons in self._iter_position_chunks(tweets):
+            for area_id, count in area_index.count_points(lats, lons).items():
+                counts[str(area_id)] += count
+
+        if archived_cells: # Attribute the archived tweets by their cells' centers
+            archived_counts = area_index.count_points([cell['lat'] for cell in archived_cells],
+                [cell['lon'] for cell in archived_cells], [cell['count'] for cell in archived_cells])
+            for area_id, count in archived_counts.items():
+                counts[str(area_id)] += count
+
+        logger.debug("Counted tweets for %s areas in my sub-area; Posting results...", len(counts))
+        self.result_queue.post_count_tweets_result(job_id, bounds, counts)
+
+    def _get_tweets(self, job_id, **kwargs):
+        '''
+        Retrieves the tweets for one of the job's tasks, giving up once the job is cancelled.
+
+        @param job_id Tracking id of the job
+        @paramType uuid/string
+        @param kwargs Arguments of TweetFactory.get_tweets()
+        @returns Iterator over the tweets, empty without a scan if the time range is empty
+        @returnType iterator of Tweet
+        @throws If the job is cancelled while the tweets are being read
+        @throwType CancelledError
+        '''
+        time_range = kwargs.get('time_range')
+        if time_range is not None and time_range[0] > time_range[1]: # Fully answered from the archive
+            return iter([])
+        if time_range is None: # Keep the calls of untimed tasks unchanged
+            kwargs.pop('time_range', None)
+
+        tweets = self.tweet_factory.get_tweets(**kwargs)
+        if self.cancelled_jobs is None:
+            return tweets
+
+        return self._iter_until_cancelled(tweets, job_id)
+
+    def _is_cancelled(self, job_id):
+        '''
+        @param job_id Tracking id of the job
+        @paramType uuid/string
+        @returns Whether the job was cancelled, False if unknown
+        @returnType boolean
+        '''
+        if self.cancelled_jobs is None:
+            return False
+
+        try:
+            return self.cancelled_jobs.is_cancelled(job_id)
+        except: # Better to finish the task than to lose it
+            logger.exception()
+            return False
+
+    def _iter_until_cancelled(self, tweets, job_id):
+        '''
+        Passes the tweets through, checking every CANCEL_CHECK_INTERVAL tweets whether the job was cancelled.
+
+        @param tweets Tweets being read for the task
+        @paramType iterable of Tweet
+        @param job_id Tracking id of the job
+        @paramType uuid/string
+        @returns Iterator over the tweets
+        @returnType iterator of Tweet
+        @throws If the job is cancelled
+        @throwType CancelledError
+        '''
+        num_tweets = 0
+        for tweet in tweets:
             num_tweets += 1
+            if num_tweets % CANCEL_CHECK_INTERVAL == 0 and self._is_cancelled(job_id):
+                raise CancelledError("%s Job cancelled after reading %s tweets" % (job_id, num_tweets))
+
+            yield tweet
 
-        logger.debug("Found %s tweets in my sub-area; Posting results..." % num_tweets)
-        self.result_queue.post_count_tweets_result(job_id, coordinate_box, num_tweets)
+    def _iter_within_budget(self, tweets, coordinate_box, splittable=True):
+        '''
+        Passes the tweets through, giving up once the task runs over its budget.
+
+        @param tweets Tweets being read for the task
+        @paramType iterable of Tweet
+        @param coordinate_box Area the task covers
+        @paramType dictionary
+        @param splittable Whether the task may be abandoned at all
+        @paramType boolean
+        @returns Iterator over the tweets
+        @returnType iterator of Tweet
+        @throws If the task runs over its budget and its box is large enough to be split
+        @throwType OverBudgetError
+        '''
+        splittable = splittable and max(coordinate_box['max_lat'] - coordinate_box['min_lat'],
+            coordinate_box['max_lon'] - coordinate_box['min_lon']) > self.min_split_size
+        if not splittable or (self.max_task_tweets is None and self.max_task_seconds is None):
+            for tweet in tweets:
+                yield tweet
+            return
+
+        deadline = time.time() + self.max_task_seconds if self.max_task_seconds is not None else None
+        num_tweets = 0
+        for tweet in tweets:
+            num_tweets += 1
+            if self.max_task_tweets is not None and num_tweets > self.max_task_tweets:
+                raise OverBudgetError("Read more than %s tweets!" % self.max_task_tweets)
+            if deadline is not None and num_tweets % 1000 == 0 and time.time() > deadline:
+                raise OverBudgetError("Ran for more than %s seconds!" % self.max_task_seconds)
+
+            yield tweet
+
+    def _iter_position_chunks(self, tweets):
+        '''
+        @param tweets Tweets to be located
+        @paramType iterable of Tweet
+        @returns Positions of the tweets, POINT_TEST_CHUNK_SIZE tweets at a time
+        @returnType iterator of tuples of lists of float (lats, lons)
+        '''
+        lats, lons = [], []
+        for tweet in tweets:
+            lats.append(tweet.lat())
+            lons.append(tweet.lon())
+
+            if len(lats) == POINT_TEST_CHUNK_SIZE:
+                yield lats, lons
+                lats, lons = [], []
+
+        if len(lats) > 0:
+            yield lats, lons
+
+    def _collect_tasks(self):
+        '''
+        Waits for a task and then keeps collecting tasks until the batch window closes or the batch is full.
+
+        @returns Collected tasks, empty if no task was available
+        @returnType list of dictionaries
+        '''
+        task = self.task_queue.get_task()
+        if task is None:
+            return []
+
+        tasks = [task]
+        deadline = time.time() + self.batch_window
+        while len(tasks) < self.max_batch_size and time.time() < deadline:
+            task = self.task_queue.get_task()
+            if task is None: # Give other tasks a moment to arrive
+                time.sleep(min(0.01, max(0, deadline - time.time())))
+            else:
+                tasks.append(task)
+
+        return tasks
+
+    def _count_tweets_shared(self, tasks):
+        '''
+        Performs the count_tweets tasks with a single scan over the bounds of all of their areas,
+        fanning each tweet out to every task whose area contains it.
+
+        @param tasks count_tweets tasks whose areas overlap, none of them sampled
+        @paramType list of dictionaries
+        @returns n/a
+        '''
+        keys = ('min_lat', 'min_lon', 'max_lat', 'max_lon')
+        boxes = numpy.array([[task['coordinate_box'][key] for key in keys] for task in tasks], dtype=float)
+        merged_box = {
+            'min_lat' : boxes[:, 0].min(), 'min_lon' : boxes[:, 1].min(),
+            'max_lat' : boxes[:, 2].max(), 'max_lon' : boxes[:, 3].max()
+        }
+
+        # Prepare each task's point tests and counters
+        edges = [None] * len(tasks)
+        area_indices = [None] * len(tasks)
+        counts = [0] * len(tasks)
+        for index in range(len(tasks)):
+            coordinate_box = tasks[index]['coordinate_box']
+            area_indices[index] = get_area_index(coordinate_box, self.region_store)
+            if area_indices[index] is not None:
+                counts[index] = dict([(str(area_id), 0) for area_id in area_indices[index].ids])
+            elif 'rings' in coordinate_box:
+                edges[index] = get_edges(coordinate_box['rings'])
+
+        logger.debug("Sharing a single scan of %s between %s tasks...", merged_box, len(tasks))
+        for lats, lons in self._iter_position_chunks(self.tweet_factory.get_tweets(coordinate_box=merged_box)):
+            if all([self._is_cancelled(task['job_id']) for task in tasks]): # Nobody is waiting on the scan
+                raise CancelledError("Jobs of all %s tasks cancelled" % len(tasks))
+
+            lats, lons = numpy.array(lats), numpy.array(lons)
+
+            for index in range(len(tasks)):
+                inside = (lats >= boxes[index, 0]) & (lons >= boxes[index, 1]) & \
+                    (lats <= boxes[index, 2]) & (lons <= boxes[index, 3])
+
+                if area_indices[index] is not None:
+                    for area_id, count in area_indices[index].count_points(lats[inside], lons[inside]).items():
+                        counts[index][str(area_id)] += count
+                elif edges[index] is not None:
+                    counts[index] += int(points_in_polygon(lons[inside], lats[inside], edges[index]).sum())
+                else:
+                    counts[index] += int(inside.sum())
+
+        for index in range(len(tasks)): # Post the results
+            coordinate_box = tasks[index]['coordinate_box']
+            if area_indices[index] is not None:
+                coordinate_box = dict([(key, coordinate_box[key]) for key in keys])
+
+            if not self._is_cancelled(tasks[index]['job_id']):
+                self.result_queue.post_count_tweets_result(tasks[index]['job_id'], coordinate_box, counts[index])
+            self._finish_task(tasks[index])
+
+    def _group_overlapping(self, tasks):
+        '''
+        @param tasks Tasks to be grouped
+        @paramType list of dictionaries with key 'coordinate_box'
+        @returns Groups of tasks whose areas are connected by overlapping or touching
+        @returnType list of lists of dictionaries
+        '''
+        groups = [] # Each group is its bounding box and its tasks
+        for task in tasks:
+            box = dict([(key, task['coordinate_box'][key]) for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon')])
+            members = [task]
+
+            remaining = []
+            for group_box, group_tasks in groups: # Absorb every group the task connects with
+                if group_box['min_lat'] <= box['max_lat'] and group_box['max_lat'] >= box['min_lat'] and \
+                        group_box['min_lon'] <= box['max_lon'] and group_box['max_lon'] >= box['min_lon']:
+                    box = {
+                        'min_lat' : min(box['min_lat'], group_box['min_lat']),
+                        'min_lon' : min(box['min_lon'], group_box['min_lon']),
+                        'max_lat' : max(box['max_lat'], group_box['max_lat']),
+                        'max_lon' : max(box['max_lon'], group_box['max_lon'])
+                    }
+                    members = group_tasks + members
+                else:
+                    remaining.append((group_box, group_tasks))
+
+            groups = remaining + [(box, members)]
+
+        return [group_tasks for group_box, group_tasks in groups]
+
+    def _finish_task(self, task):
+        '''
+        Removes the performed task from the task queue, once its result is posted if results are combined.
+
+        @param task Task which was performed
+        @paramType dictionary
+        @returns n/a
+        '''
+        if self.combiner is not None:
+            self.combiner.finish_task(task)
+        else:
+            self.task_queue.finish_task(task)
+
+    def get_stats(self):
+        '''
+        @returns Running totals of the # of tasks performed, the seconds spent performing them and
+        the # of tasks throttled by the tweets table
+        @returnType dictionary with keys 'num_tasks', 'busy_seconds', 'num_throttled'
+        '''
+        return {
+            'num_tasks' : self.num_tasks_performed,
+            'busy_seconds' : self.busy_seconds,
+            'num_throttled' : self.num_throttled
+        }
+
+    def _perform_batch(self, tasks):
+        '''
+        Performs the batch of tasks, unsampled count_tweets tasks with overlapping areas sharing scans.
+
+        @param tasks Tasks to be performed
+        @paramType list of dictionaries
+        @returns n/a
+        '''
+        shareable = []
+        for task in tasks:
+            sample_rate = task.get('sample_rate')
+            if self._is_cancelled(task['job_id']): # Drop the task without posting anything
+                self._drop_task(task)
+            elif task['task'] == 'count_tweets' and (sample_rate is None or sample_rate >= 1) and \
+                    'time_range' not in task:
+                shareable.append(task)
+            else:
+                self._perform_task(task)
+
+        for group in self._group_overlapping(shareable):
+            if len(group) == 1: # Nothing to share the scan with
+                self._perform_task(group[0])
+                continue
+
+            try:
+                self._count_tweets_shared(group)
+            except CancelledError as e:
+                logger.debug("Abandoning shared scan: %s", e)
+                for task in group:
+                    self._drop_task(task)
+            except ThrottledError as e:
+                self.num_throttled += 1
+                logger.warn("Shared scan of %s tasks throttled: %s", len(group), e)
+            except:
+                logger.exception()
+
+    def _split_time_range(self, time_range, coordinate_box):
+        '''
+        Splits off the hours at the start of the time range which were rolled up into the archive.
+
+        @param time_range Times between which tweets are counted, inclusive
+        @paramType tuple of strings (start, end)
+        @param coordinate_box Area being searched
+        @paramType dictionary
+        @returns Archived cells of the rolled up hours inside the box, and the rest of the time range
+        to be read from the tweets table, empty (start after end) if every hour was rolled up
+        @returnType tuple of (list of dictionaries, tuple of strings)
+        '''
+        bounds = dict([(key, coordinate_box[key]) for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon')])
+        first_hour = calendar.timegm(time.strptime(get_hour(time_range[0]), '%Y-%m-%d %H'))
+        last_hour = calendar.timegm(time.strptime(get_hour(time_range[1]), '%Y-%m-%d %H'))
+
+        archived_cells = []
+        hour_start = first_hour
+        while hour_start <= last_hour: # Rolled up hours are counted whole
+            hour = time.strftime('%Y-%m-%d %H', time.gmtime(hour_start))
+            if not self.archive.is_rolled_up(hour):
+                break
+
+            archived_cells += self.archive.get_cells(hour, bounds)
+            hour_start += 3600
+
+        if hour_start == first_hour: # Nothing was rolled up yet
+            return [], time_range
+
+        return archived_cells, (time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(hour_start)), time_range[1])
+
+    def _perform_task(self, task):
+        '''
+        Performs the task and removes it from the task queue.
+
+        @param task Task to be performed
+        @paramType dictionary
+        @returns n/a
+        '''
+        try:
+            logger.debug("%s Received request for '%s'...", task['job_id'], task['task'])
+            if task['task'] == 'count_tweets':
+                # Speculative duplicates are never split, the original may already have been
+                self._count_tweets(task['job_id'], task['coordinate_box'], task.get('sample_rate'),
+                    not task.get('speculative', False), task.get('time_range'))
+            else:
+                raise Exception("%s Unknown task '%s'!" % (task['job_id'], task['task']))
+
+            self._finish_task(task) # Finish the task
+        except CancelledError as e:
+            logger.debug("Abandoning task: %s", e)
+            self._drop_task(task)
+        except OverBudgetError as e: # Hand the pieces over to any idle workers
+            logger.debug("%s Splitting oversized task: %s", task['job_id'], e)
+            self.result_queue.post_task_split(task) # Stop waiting on the whole area first
+            self.task_queue.split_task(task, split_box(task['coordinate_box']))
+        except ThrottledError as e: # The task becomes visible again once its timeout expires
+            self.num_throttled += 1
+            logger.warn("%s Task throttled: %s", task['job_id'], e)
+        except:
+            logger.exception()
 
     def perform_tasks(self):
         '''
@@ -53,21 +629,92 @@ class Worker():
   
         @returns n/a
         '''
+        if self.visibility_timeout is not None: # Keep long running tasks from being handed out again
+            heartbeat_thread = Thread(target=self._send_heartbeats)
+            heartbeat_thread.daemon = True
+            heartbeat_thread.start()
+
         while not self.is_shutting_down:
             try:
-                task = self.task_queue.get_task() # Get the next task
-                if task is None:
+                if self.combiner is not None: # Post the results which waited long enough
+                    self.combiner.flush_expired()
+
+                tasks = self._collect_tasks() # Get the next tasks
+                if len(tasks) == 0:
                     continue
 
-                logger.debug("%s Received request for '%s'...", task['job_id'], task['task'])
-                if task['task'] == 'count_tweets':
-                    self._count_tweets(task['job_id'], task['coordinate_box'])
-                else:
-                    raise Exception("%s Unknown task '%s'!", task['job_id'], task['task'])
+                self.in_flight_tasks = tasks
+                if self.report_starts:
+                    self._report_starts(tasks)
 
-                self.task_queue.finish_task(task) # Finish the task
+                started_at = time.time()
+                self._perform_batch(tasks)
+                self.busy_seconds += time.time() - started_at
+                self.num_tasks_performed += len(tasks)
             except:
                 logger.exception()
+            finally:
+                self.in_flight_tasks = []
+
+        if self.combiner is not None: # Post whatever is still buffered
+            self.combiner.flush()
+
+    def _report_starts(self, tasks):
+        '''
+        Reports that the tasks are being started, so lagging tasks can be duplicated.
+
+        @param tasks Tasks about to be performed
+        @paramType list of dictionaries
+        @returns n/a
+        '''
+        started_at = time.time()
+        for task in tasks:
+            try:
+                self.result_queue.post_task_started(task, started_at)
+            except: # The task can still be performed, it just can not be sped up
+                logger.exception()
+
+    def _drop_task(self, task):
+        '''
+        Removes the task of a cancelled job from the task queue without posting a result.
+
+        @param task Task to be dropped
+        @paramType dictionary
+        @returns n/a
+        '''
+        try:
+            logger.debug("%s Dropping task of cancelled job", task['job_id'])
+            self.task_queue.finish_task(task)
+        except:
+            logger.exception()
+
+    def _extend_in_flight_tasks(self):
+        '''
+        Renews the visibility timeout of the tasks currently being performed, and of those whose
+        results are yet to be posted.
+
+        @returns n/a
+        '''
+        tasks = list(self.in_flight_tasks)
+        if self.combiner is not None:
+            tasks += self.combiner.get_unfinished_tasks()
+
+        for task in tasks:
+            try:
+                self.task_queue.extend_task(task, self.visibility_timeout)
+            except: # The task may have been finished while its timeout was being renewed
+                logger.exception()
+
+    def _send_heartbeats(self):
+        '''
+        Renews the visibility timeout of the tasks being performed every third of the timeout,
+        until the worker shuts down.
+
+        @returns n/a
+        '''
+        while not self.is_shutting_down:
+            time.sleep(self.visibility_timeout / 3.0)
+            self._extend_in_flight_tasks()
 
     def shutdown(self):
         ''' Shutdowns down the worker perform_task routine. '''
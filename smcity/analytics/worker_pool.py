@@ -0,0 +1,194 @@
+''' Contains the WorkerPool, which grows and shrinks the # of worker threads with the workload. '''
+
+import math
+import time
+
+from threading import Lock, Thread
+
+from smcity.logging.logger import Logger
+
+logger = Logger(__name__)
+
+class WorkerPool:
+    '''
+    Elastic pool of worker threads. The pool is sized to the map queue's backlog, but stops growing
+    while tasks take longer than expected and sheds a worker whenever the tweets table throttles
+    the workers, since more concurrent scans would only be throttled further. The pool grows at
+    once but shrinks one worker per check, so it does not flap between bursts.
+    '''
+
+    def __init__(self, create_worker, map_queue, min_workers, max_workers, tasks_per_worker=10,
+                 max_task_seconds=None, check_interval=30):
+        '''
+        Constructor.
+
+        @param create_worker Creates a new worker along with its own connections
+        @paramType function returning a Worker
+        @param map_queue Queue whose backlog the pool is sized to
+        @paramType MapQueue
+        @param min_workers # of workers kept running however quiet it is
+        @paramType int
+        @param max_workers Largest # of workers ever running
+        @paramType int
+        @param tasks_per_worker # of queued tasks each worker is expected to work through per check
+        @paramType int
+        @param max_task_seconds Average seconds per task above which the pool stops growing, as
+        it is a sign the tweets table is saturated. None to ignore task latency.
+        @paramType float
+        @param check_interval Seconds between adjustments of the pool's size
+        @paramType float
+        @returns n/a
+        '''
+        assert create_worker is not None
+        assert map_queue is not None
+        assert 0 < min_workers <= max_workers, (min_workers, max_workers)
+        assert tasks_per_worker > 0, tasks_per_worker
+
+        self.check_interval = check_interval
+        self.create_worker = create_worker
+        self.is_shutting_down = False
+        self.lock = Lock()
+        self.map_queue = map_queue
+        self.max_task_seconds = max_task_seconds
+        self.max_workers = max_workers
+        self.min_workers = min_workers
+        self.tasks_per_worker = tasks_per_worker
+
+        # Running workers, and the totals of the workers which were retired
+        self.workers = []
+        self.worker_threads = {}
+        self.retired_stats = {'num_tasks' : 0, 'busy_seconds' : 0.0, 'num_throttled' : 0}
+        self.last_stats = dict(self.retired_stats)
+
+    def get_desired_size(self, num_queued, stats):
+        '''
+        @param num_queued Approximate # of tasks waiting in the map queue
+        @paramType int
+        @param stats Change in the workers' stats since the last check, see Worker.get_stats()
+        @paramType dictionary with keys 'num_tasks', 'busy_seconds', 'num_throttled'
+        @returns # of workers the pool should be running
+        @returnType int
+        '''
+        size = len(self.workers)
+        wanted = int(math.ceil(num_queued / float(self.tasks_per_worker)))
+
+        if stats['num_throttled'] > 0: # Back off from the tweets table
+            wanted = size - 1
+        elif wanted > size and self.max_task_seconds is not None and stats['num_tasks'] > 0 and \
+                stats['busy_seconds'] / stats['num_tasks'] > self.max_task_seconds:
+            wanted = size # Tasks are already slowing down, more workers would not help
+        elif wanted < size:
+            wanted = size - 1 # Shrink gradually
+
+        return max(self.min_workers, min(self.max_workers, wanted))
+
+    def get_size(self):
+        '''
+        @returns # of workers currently running
+        @returnType int
+        '''
+        return len(self.workers)
+
+    def resize(self):
+        '''
+        Adjusts the # of workers to the current backlog, task latency and throttling.
+
+        @returns # of workers running after the adjustment
+        @returnType int
+        '''
+        with self.lock:
+            stats = self._get_total_stats()
+            stats_delta = dict([(key, stats[key] - self.last_stats[key]) for key in stats.keys()])
+            self.last_stats = stats
+
+            num_queued = self.map_queue.get_num_tasks()
+            desired = self.get_desired_size(num_queued, stats_delta)
+            if desired != len(self.workers):
+                logger.info("Resizing the worker pool from %s to %s workers (%s tasks queued, %s throttled)",
+                    len(self.workers), desired, num_queued, stats_delta['num_throttled'])
+
+            while len(self.workers) < desired:
+                self._start_worker()
+            while len(self.workers) > desired:
+                self._stop_worker()
+
+            return len(self.workers)
+
+    def run(self):
+        '''
+        Starts the minimum # of workers and then keeps resizing the pool until it is shut down.
+
+        @returns n/a
+        '''
+        with self.lock:
+            while len(self.workers) < self.min_workers:
+                self._start_worker()
+
+        while not self.is_shutting_down:
+            time.sleep(self.check_interval)
+            if self.is_shutting_down:
+                break
+
+            try:
+                self.resize()
+            except:
+                logger.exception()
+
+    def shutdown(self, timeout=0):
+        '''
+        Stops resizing the pool and shuts down all of the workers.
+
+        @param timeout Seconds to wait for the workers to finish their current tasks and post any
+        buffered results
+        @paramType float
+        @returns n/a
+        '''
+        self.is_shutting_down = True
+
+        with self.lock:
+            threads = [self.worker_threads[worker] for worker in self.workers]
+            while len(self.workers) > 0:
+                self._stop_worker()
+
+        deadline = time.time() + timeout
+        for thread in threads:
+            thread.join(max(0, deadline - time.time()))
+
+    def _get_total_stats(self):
+        '''
+        @returns Stats summed over the running and retired workers
+        @returnType dictionary with keys 'num_tasks', 'busy_seconds', 'num_throttled'
+        '''
+        totals = dict(self.retired_stats)
+        for worker in self.workers:
+            for key, value in worker.get_stats().items():
+                totals[key] += value
+
+        return totals
+
+    def _start_worker(self):
+        '''
+        Starts a new worker thread.
+
+        @returns n/a
+        '''
+        worker = self.create_worker()
+        worker_thread = Thread(target=worker.perform_tasks)
+        worker_thread.daemon = True
+        worker_thread.start()
+
+        self.workers.append(worker)
+        self.worker_threads[worker] = worker_thread
+
+    def _stop_worker(self):
+        '''
+        Shuts down the most recently started worker once it finishes its current tasks.
+
+        @returns n/a
+        '''
+        worker = self.workers.pop()
+        worker.shutdown()
+        del self.worker_threads[worker]
+
+        for key, value in worker.get_stats().items(): # Keep the totals from going backwards
+            self.retired_stats[key] += value
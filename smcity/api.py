@@ -1,11 +1,23 @@
 ''' Public facing API for requesting analytic calculations on geographic areas. '''
 
+import atexit
+import copy
+
 from ConfigParser import ConfigParser
 
 from smcity.analytics.asynch_result import AsynchResultFactory
+from smcity.analytics.progressive_result import ProgressiveResult
+from smcity.analytics.standing_query import get_results
+from smcity.models.aws.aws_completion_notifier import AwsCompletionNotifier
 from smcity.models.aws.aws_job import AwsJobFactory
 from smcity.models.aws.aws_map_queue import AwsMapQueue
+from smcity.models.aws.aws_region_store import create_region_store
+from smcity.models.aws.aws_standing_query_store import AwsStandingQueryStore
+from smcity.models.map_queue import INTERACTIVE
 from smcity.polygons.abstract_polygon_strategy_factory import AbstractPolygonStrategyFactory
+from smcity.polygons.multi_region_strategy import MultiRegionStrategy
+from smcity.polygons.quadtree_strategy import build_quadtree_strategy, estimate_from_results
+from smcity.polygons.simple_grid_strategy import SimpleGridStrategy
 from smcity.styles.abstract_style_strategy_factory import AbstractStyleStrategyFactory
 from smcity.styles.color_swatch import ColorSwatchFactory
 
@@ -29,22 +41,191 @@ class AwsApi:
         # Set up the required components
         color_swatch_factory = ColorSwatchFactory()
         style_strategy_factory = AbstractStyleStrategyFactory(color_swatch_factory)
-        polygon_strategy_factory = AbstractPolygonStrategyFactory(style_strategy_factory)
+        self.region_store = create_region_store(config)
+        polygon_strategy_factory = AbstractPolygonStrategyFactory(style_strategy_factory, self.region_store)
         job_factory = AwsJobFactory(config, polygon_strategy_factory)
         self.map_queue = AwsMapQueue(config, job_factory)
-        self.result_factory = AsynchResultFactory(job_factory)
 
-    def count_tweets(self, polygon_strategy):
+        # Listen for job completions if a notification topic is configured
+        self.completion_notifier = None
+        if config.has_option('compute_api', 'notification_topic'):
+            self.completion_notifier = AwsCompletionNotifier(config)
+            self.completion_notifier.listen()
+            atexit.register(self.shutdown) # Remove the listener queue even if shutdown() is never called
+
+        self.result_factory = AsynchResultFactory(job_factory, self.completion_notifier)
+
+        # Share standing queries with the stream listener if a table is configured
+        self.standing_query_store = None
+        if config.has_option('database', 'standing_query_table'):
+            self.standing_query_store = AwsStandingQueryStore(config, polygon_strategy_factory)
+
+    def count_tweets(self, polygon_strategy, sample_rate=None, priority=INTERACTIVE, time_range=None):
         '''
         Counts tweets in the area described by the provided polygon strategy.
  
         @param polygon_strategy Describes the areas whose tweets are to be counted
         @paramType PolygonStrategy
+        @param sample_rate Fraction of the tweets to read. Lower rates finish sooner and read less
+        of the table, but each count is an estimate carrying the half width of its 95% confidence
+        interval under the result's 'error' key. If None, every tweet is read and counts are exact.
+        @paramType float in (0, 1]
+        @param priority INTERACTIVE, or BATCH for large background jobs which should not hold up
+        interactive requests
+        @paramType string
+        @param time_range Only counts tweets made between the two times, inclusive. Hours older than
+        the tweets table keeps are counted from the hourly archive. Format: YYYY-MM-dd HH24:mm:ss
+        @paramType tuple of strings (start, end)
         @return Interface for checking the progress of the calculation and retrieving the results
         @returnType AsynchResult
         '''
         assert polygon_strategy is not None
 
-        job_id = self.map_queue.request_count_tweets(polygon_strategy)
+        job_id = self.map_queue.request_count_tweets(polygon_strategy, sample_rate=sample_rate, priority=priority,
+            time_range=time_range)
         
         return self.result_factory.create(job_id, polygon_strategy)
+
+    def count_tweets_adaptive(self, coordinate_box, max_count, style_strategy, resolution, sample_rate=0.1,
+            max_depth=12, priority=INTERACTIVE, time_range=None, timeout=None):
+        '''
+        Counts tweets on a quadtree over the area, split finer where there are more tweets. The
+        density is first estimated by a sampled count on a coarse grid, which this function waits
+        for, then the cells are split until each holds about max_count tweets at most.
+
+        @param coordinate_box Area whose tweets are to be counted
+        @paramType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+        @param max_count Largest estimated # of tweets a quadtree cell may hold before it is split
+        @paramType float
+        @param style_strategy Strategy used to stylize the polygons
+        @paramType StyleStrategy
+        @param resolution Cell size of the coarse grid the density is estimated on, in degrees
+        @paramType float
+        @param sample_rate Fraction of the tweets read to estimate the density
+        @paramType float in (0, 1]
+        @param max_depth # of times a cell may be split, bounding the size of the smallest cells
+        @paramType int
+        @param priority INTERACTIVE, or BATCH for large background jobs which should not hold up
+        interactive requests
+        @paramType string
+        @param time_range Only counts tweets made between the two times, inclusive. Format: YYYY-MM-dd HH24:mm:ss
+        @paramType tuple of strings (start, end)
+        @param timeout Seconds to wait for the density estimate at most, if none no limit is used
+        @paramType int
+        @return Interface for checking the progress of the calculation and retrieving the results
+        @returnType AsynchResult
+        @throws Exception if the density estimate is not finished in time
+        @throwType NotReadyError
+        '''
+        assert coordinate_box is not None
+        assert style_strategy is not None
+
+        density_grid = SimpleGridStrategy(coordinate_box, resolution, copy.deepcopy(style_strategy))
+        density = self.count_tweets(density_grid, sample_rate=sample_rate, priority=priority,
+            time_range=time_range)
+        density_results = density_grid.get_cell_results(density.get_results_blocking(timeout))
+
+        quadtree_strategy = build_quadtree_strategy(coordinate_box, estimate_from_results(density_results),
+            max_count, style_strategy, max_depth)
+        return self.count_tweets(quadtree_strategy, priority=priority, time_range=time_range)
+
+    def count_tweets_progressive(self, grid_strategy, num_levels=3, factor=4, viewport=None):
+        '''
+        Counts tweets on a series of increasingly fine grids, ending with the requested grid, so a
+        rough map is available long before the exact one. Each level is refined from the densest
+        (and in-viewport) cells of the previous level first.
+
+        @param grid_strategy Describes the area whose tweets are to be counted and the final resolution
+        @paramType SimpleGridStrategy
+        @param num_levels # of grids to run including the final one
+        @paramType int
+        @param factor How many times larger each level's cells are than the next level's
+        @paramType int
+        @param viewport Area the client is currently displaying, if any
+        @paramType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+        @return Interface for retrieving the results of each level as they finish
+        @returnType ProgressiveResult
+        '''
+        assert grid_strategy is not None
+        assert num_levels > 0, num_levels
+
+        levels = [grid_strategy.get_coarser_strategy(factor ** level) for level in range(num_levels - 1, 0, -1)]
+        levels.append(grid_strategy)
+
+        return ProgressiveResult(self.map_queue, self.result_factory, levels, viewport)
+
+    def create_multi_region_strategy(self, regions, tile_size, style_strategy):
+        '''
+        Stores the regions, so jobs and tasks only refer to them, and sets up a strategy counting them.
+
+        @param regions Regions of interest
+        @paramType list of dictionaries with keys 'name' and 'geometry' (GeoJSON Polygon or MultiPolygon)
+        @param tile_size Width and height of each scan tile in degrees
+        @paramType float
+        @param style_strategy Strategy used to stylize the polygons
+        @paramType StyleStrategy
+        @returns Strategy counting the regions, see count_tweets()
+        @returnType MultiRegionStrategy
+        '''
+        assert self.region_store is not None, "No region_table is configured!"
+
+        return MultiRegionStrategy(regions, tile_size, style_strategy, self.region_store.add_regions(regions))
+
+    def get_standing_query_geojson(self, query_id):
+        '''
+        Reads the counts of a standing query, as last published by the stream listener. They lag
+        the stream by up to the listener's sync interval and are all 0 until it picks the query up.
+
+        @param query_id Tracking id of the standing query
+        @paramType string/uuid
+        @returns GeoJSON encoded current counts of the standing query's area
+        @returnType string/GeoJSON
+        @throws If no such query is registered
+        @throwType ReadError
+        '''
+        assert self.standing_query_store is not None, "No standing_query_table is configured!"
+
+        query = self.standing_query_store.get_query(query_id)
+        polygon_strategy = query['polygon_strategy']
+        return polygon_strategy.encode_results_geojson(get_results(polygon_strategy.get_result_boxes(),
+            query['counts']))
+
+    def register_standing_query(self, polygon_strategy, bucket_size=60, num_buckets=60):
+        '''
+        Registers a standing query, whose counts the stream listener keeps up to date as tweets arrive.
+
+        @param polygon_strategy Describes the area of interest and how to break it down into
+        component areas
+        @paramType PolygonStrategy
+        @param bucket_size Width of each time bucket in seconds
+        @paramType int
+        @param num_buckets # of time buckets kept, the window spans bucket_size * num_buckets seconds
+        @paramType int
+        @returns Tracking id of the standing query
+        @returnType string/uuid
+        '''
+        assert self.standing_query_store is not None, "No standing_query_table is configured!"
+        assert polygon_strategy is not None
+
+        return self.standing_query_store.add_query(polygon_strategy, bucket_size, num_buckets)
+
+    def shutdown(self):
+        '''
+        Stops listening for job completions. Call once done with the API.
+
+        @returns n/a
+        '''
+        if self.completion_notifier is not None:
+            self.completion_notifier.shutdown()
+
+    def unregister_standing_query(self, query_id):
+        '''
+        Stops maintaining the standing query.
+
+        @param query_id Tracking id of the standing query
+        @paramType string/uuid
+        @returns n/a
+        '''
+        assert self.standing_query_store is not None, "No standing_query_table is configured!"
+
+        self.standing_query_store.remove_query(query_id)
@@ -1,5 +1,11 @@
 ''' Assorted exceptions. '''
 
+class CancelledError(Exception):
+    ''' Exception thrown when the job a task belongs to was cancelled while the task was running. '''
+
+    def __init__(self, message="Job was cancelled!", orig_exception=None):
+        Exception.__init__(self, message, orig_exception)
+
 class CreateError(Exception):
     ''' Exception thrown when unable to create a new database record. '''
     
@@ -12,12 +18,24 @@ class NotReadyError(Exception):
     def __init__(self, message="Tried to access results before they were ready!", orig_exception=None):
         Exception.__init__(self, message, orig_exception)
 
+class OverBudgetError(Exception):
+    ''' Exception thrown when a task exceeds the time or size budget it may use. '''
+
+    def __init__(self, message="Task exceeded its budget!", orig_exception=None):
+        Exception.__init__(self, message, orig_exception)
+
 class ReadError(Exception):
     ''' Exception thrown when unable to retrieve a desired database record. '''
     
     def __init__(self, message="Failed to retrieve database record!", orig_exception=None):
         Exception.__init__(self, message, orig_exception)
 
+class ThrottledError(Exception):
+    ''' Exception thrown when the database refuses a request for exceeding its provisioned throughput. '''
+
+    def __init__(self, message="Exceeded the database's provisioned throughput!", orig_exception=None):
+        Exception.__init__(self, message, orig_exception)
+
 class UpdateError(Exception):
     ''' Exception thrown when unable to update a database record. '''
  
@@ -0,0 +1,183 @@
+''' AWS specific implementation of the job completion notification channel. '''
+
+import boto.sns
+import boto.sqs
+import json
+import time
+
+from threading import Thread
+from uuid import uuid4
+
+from smcity.logging.logger import Logger
+from smcity.models.completion_notifier import LocalCompletionNotifier
+
+logger = Logger(__name__)
+
+# Seconds between a listener's heartbeats, each renewing the retention period of its queue
+HEARTBEAT_INTERVAL = 300
+
+# Seconds a completion is kept in a listener queue, its waiters have long timed out by then
+NOTIFICATION_RETENTION = 300
+
+# Prefix of the listener queues' names
+QUEUE_PREFIX = 'smcity_completions_'
+
+# Seconds without a heartbeat after which a listener queue is considered abandoned
+STALE_QUEUE_AGE = 3600
+
+class AwsCompletionNotifier(LocalCompletionNotifier):
+    '''
+    Publishes job completions to an SNS topic. Listeners subscribe their own short lived SQS queue
+    to the topic and long poll it, waking any local waiters as soon as a completion arrives. Each
+    listener renews its queue's attributes as a heartbeat, and new listeners remove the queues of
+    listeners which stopped without shutting down.
+    '''
+
+    def __init__(self, config):
+        '''
+        Constructor.
+
+        @param config Configuration settings. Requires the following definitions:
+
+        Section: compute_api
+        Key:     region
+        Type:    string
+        Desc:    AWS data center to connect to
+
+        Section: compute_api
+        Key:     notification_topic
+        Type:    string
+        Desc:    ARN of the SNS topic job completions are published to
+        @paramType ConfigParser
+        @returns n/a
+        '''
+        LocalCompletionNotifier.__init__(self)
+
+        self.is_shutting_down = False
+        self.queue = None
+        self.region = config.get('compute_api', 'region')
+        self.sns = boto.sns.connect_to_region(self.region)
+        self.sqs = boto.sqs.connect_to_region(self.region)
+        self.subscription_arn = None
+        self.topic = config.get('compute_api', 'notification_topic')
+
+    def _consume_notifications(self):
+        '''
+        Long polls the listener queue, waking local waiters for each completion received.
+
+        @returns n/a
+        '''
+        last_heartbeat = time.time()
+
+        while not self.is_shutting_down:
+            try:
+                if time.time() - last_heartbeat > HEARTBEAT_INTERVAL: # Keep the queue from being reaped
+                    self.queue.set_attribute('MessageRetentionPeriod', NOTIFICATION_RETENTION)
+                    last_heartbeat = time.time()
+
+                message = self.queue.read(wait_time_seconds=20)
+                if message is None: # If no completions arrived
+                    continue
+
+                notification = json.loads(json.loads(message.get_body())['Message'])
+                LocalCompletionNotifier.notify_finished(self, notification['job_id'])
+                self.queue.delete_message(message)
+            except:
+                if not self.is_shutting_down: # The queue is deleted while shutting down
+                    logger.exception()
+
+    def _get_subscriptions(self):
+        '''
+        @returns ARNs of the completion topic's subscriptions, keyed by their endpoint
+        @returnType dictionary
+        '''
+        subscriptions = {}
+        next_token = None
+        while True: # Read the subscriptions page by page
+            response = self.sns.get_all_subscriptions_by_topic(self.topic, next_token)
+            result = response['ListSubscriptionsByTopicResponse']['ListSubscriptionsByTopicResult']
+            for subscription in result['Subscriptions']:
+                subscriptions[subscription['Endpoint']] = subscription['SubscriptionArn']
+
+            next_token = result['NextToken']
+            if next_token is None:
+                return subscriptions
+
+    def listen(self):
+        '''
+        Subscribes a new listener queue to the completion topic and starts consuming it. Call
+        shutdown() once done listening.
+
+        @returns n/a
+        '''
+        try: # Clean up after any listeners which stopped without shutting down
+            self.reap_stale_queues()
+        except:
+            logger.exception()
+
+        self.queue = self.sqs.create_queue(QUEUE_PREFIX + uuid4().hex)
+        self.queue.set_attribute('MessageRetentionPeriod', NOTIFICATION_RETENTION)
+
+        response = self.sns.subscribe_sqs_queue(self.topic, self.queue)
+        self.subscription_arn = response['SubscribeResponse']['SubscribeResult']['SubscriptionArn']
+
+        thread = Thread(target=self._consume_notifications)
+        thread.daemon = True
+        thread.start()
+
+    def notify_finished(self, job_id):
+        ''' {@inheritDocs} '''
+        LocalCompletionNotifier.notify_finished(self, job_id)
+
+        self.sns.publish(topic=self.topic, message=json.dumps({'job_id' : str(job_id)}))
+
+    def reap_stale_queues(self, now=None):
+        '''
+        Removes the listener queues without a recent heartbeat, and unsubscribes them from the topic.
+
+        @param now Current time in seconds since the epoch, defaults to time.time()
+        @paramType float
+        @returns # of listener queues removed
+        @returnType int
+        '''
+        if now is None:
+            now = time.time()
+
+        subscriptions = None
+        num_reaped = 0
+        for queue in self.sqs.get_all_queues(prefix=QUEUE_PREFIX):
+            if self.queue is not None and queue.name == self.queue.name: # Still listening
+                continue
+
+            try:
+                attributes = queue.get_attributes()
+                if now - int(attributes['LastModifiedTimestamp']) < STALE_QUEUE_AGE:
+                    continue
+
+                if subscriptions is None: # Only read once any queue turned out stale
+                    subscriptions = self._get_subscriptions()
+                if attributes['QueueArn'] in subscriptions:
+                    self.sns.unsubscribe(subscriptions[attributes['QueueArn']])
+                queue.delete()
+                num_reaped += 1
+            except: # Such as when another listener reaped the queue first
+                logger.exception()
+
+        if num_reaped > 0:
+            logger.info("Removed %s abandoned completion listener queues", num_reaped)
+        return num_reaped
+
+    def shutdown(self):
+        '''
+        Stops listening and removes the listener queue. Safe to call more than once.
+
+        @returns n/a
+        '''
+        self.is_shutting_down = True
+
+        if self.subscription_arn is not None:
+            self.sns.unsubscribe(self.subscription_arn)
+            self.subscription_arn = None
+        if self.queue is not None:
+            self.queue.delete()
+            self.queue = None
@@ -1,26 +1,45 @@
 ''' AWS specific implementation of the Job model and the corresponding JobFactory. '''
 
 import json
+import math
+import time
 
+from boto.dynamodb2.exceptions import ProvisionedThroughputExceededException
 from boto.dynamodb2.table import Table
 from uuid import uuid4
 
 from smcity.errors import CreateError, ReadError, UpdateError
 from smcity.logging.logger import Logger
 from smcity.models.job import Job, JobFactory
+from smcity.models.map_queue import summarize_task
 
 logger = Logger(__name__)
 
+# # of the most recent task durations kept to base the straggler threshold on
+MAX_TASK_DURATIONS = 1000
+
+def _get_box_key(coordinate_box):
+    '''
+    @param coordinate_box Area covered by a task
+    @paramType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+    @returns Key identifying the area
+    @returnType string
+    '''
+    return '%r_%r_%r_%r' % (coordinate_box['min_lat'], coordinate_box['min_lon'],
+        coordinate_box['max_lat'], coordinate_box['max_lon'])
+
 class AwsJob(Job):
     ''' AWS specific implementation of the Job model '''
 
-    def __init__(self, record, polygon_strategy):
+    def __init__(self, record, polygon_strategy, write_limiter=None):
         '''
         Constructor.
 
         @param record Database record describing the job's state
         @paramType DynamoDB record
         @param polygon_strategy Strategy used to break up this job's area of interest
+        @param write_limiter Limits the rate at which the record is written, if any
+        @paramType TokenBucketRateLimiter
         @returns n/a
         '''
         assert record is not None
@@ -36,23 +55,46 @@ class AwsJob(Job):
         self.needs_to_be_saved = False
         self.record = record
         self.polygon_strategy = polygon_strategy
+        self.write_limiter = write_limiter
 
-    def add_result(self, coordinate_box, result):
+    def add_result(self, coordinate_box, result, error=None):
         ''' {@inheritDocs} '''
+        box_key = _get_box_key(coordinate_box)
+        task_starts = self._get_task_starts()
         results = json.loads(self.record['results'])
-        results.append({
+
+        # Drop results of duplicate tasks and of tasks which were split
+        if (box_key in task_starts and task_starts[box_key] is None) or \
+                box_key in set([_get_box_key(entry) for entry in results]):
+            return False
+
+        entry = {
             'min_lat' : coordinate_box['min_lat'],
             'min_lon' : coordinate_box['min_lon'],
             'max_lat' : coordinate_box['max_lat'],
             'max_lon' : coordinate_box['max_lon'],
             'result' : result
-        })
+        }
+        if error is not None: # If the result was estimated from a sample
+            entry['error'] = error
+
+        results.append(entry)
         self.record['results'] = json.dumps(results)
 
-        if len(results) == self.record['num_sub_areas']: # If we have received all the sub-area results
+        if box_key in task_starts: # The task is no longer pending, remember how long it took
+            task_durations = self.get_task_durations()
+            task_durations.append(round(time.time() - task_starts[box_key]['started_at'], 3))
+            self.record['task_durations'] = json.dumps(task_durations[-MAX_TASK_DURATIONS:])
+
+            del task_starts[box_key]
+            self.record['task_starts'] = json.dumps(task_starts)
+
+        # If we have received all the sub-area results
+        if len(results) - len(self._get_superseded(results, task_starts)) == self.record['num_sub_areas']:
             self.record['is_finished'] = True
 
         self.needs_to_be_saved = True
+        return True
 
     def add_run_time(self, subtask, run_time):
         ''' {@inheritDocs} '''
@@ -64,17 +106,61 @@ class AwsJob(Job):
             self.record['run_times'] = json.dumps(run_times)
             self.needs_to_be_saved = True
     
+    def add_task_split(self, coordinate_box):
+        ''' {@inheritDocs} '''
+        box_key = _get_box_key(coordinate_box)
+        task_starts = self._get_task_starts()
+        task_starts[box_key] = None # Leave a marker to drop late starts and results
+        self.record['task_starts'] = json.dumps(task_starts)
+
+        # A speculative duplicate may already have reported the whole area, the marker supersedes
+        # its result. The results stay append-only, so the cursors handed out remain valid.
+        if box_key in set([_get_box_key(entry) for entry in json.loads(self.record['results'])]):
+            logger.debug("%s Superseding the result of a split area by its pieces", self.record['id'])
+            self.record['is_finished'] = False
+
+        self.needs_to_be_saved = True
+
+    def add_task_start(self, task, started_at):
+        ''' {@inheritDocs} '''
+        box_key = _get_box_key(task['coordinate_box'])
+        task_starts = self._get_task_starts()
+
+        if box_key in task_starts: # Keep the earliest start, ignore starts of split areas
+            return
+        if box_key in set([_get_box_key(entry) for entry in json.loads(self.record['results'])]):
+            return # The start was reported after the result
+
+        # Only the summary is kept, the job record must stay small
+        task_starts[box_key] = {'task' : summarize_task(task), 'started_at' : started_at}
+        self.record['task_starts'] = json.dumps(task_starts)
+        self.needs_to_be_saved = True
+
     def get_id(self):
         ''' {@inheritDocs} '''
         return self.record['id']
 
+    def get_num_sub_areas(self):
+        ''' {@inheritDocs} '''
+        return self.record['num_sub_areas']
+
+    def get_pending_tasks(self):
+        ''' {@inheritDocs} '''
+        return [task_start for task_start in self._get_task_starts().values() if task_start is not None]
+
     def get_polygon_strategy(self):
         ''' {@inheritDocs} '''
         return self.polygon_strategy
 
+    def get_result_log(self):
+        ''' {@inheritDocs} '''
+        results = json.loads(self.record['results'])
+        return results, self._get_superseded(results, self._get_task_starts())
+
     def get_results(self):
         ''' {@inheritDocs} '''
-        return json.loads(self.record['results'])
+        results, superseded = self.get_result_log()
+        return [results[position] for position in range(len(results)) if position not in superseded]
 
     def get_run_times(self):
         ''' {@inheritDocs} '''
@@ -84,6 +170,39 @@ class AwsJob(Job):
         ''' {@inheritDocs} '''
         return self.record['task']
 
+    def get_task_durations(self):
+        ''' {@inheritDocs} '''
+        if self.record['task_durations'] is None: # Jobs created before durations were tracked
+            return []
+
+        return json.loads(self.record['task_durations'])
+
+    def _get_superseded(self, results, task_starts):
+        '''
+        @param results Every result added so far
+        @paramType list of dictionaries
+        @param task_starts Starts of the pending tasks, see _get_task_starts()
+        @paramType dictionary
+        @returns Positions of the results whose area was split since they were added
+        @returnType set of int
+        '''
+        return set([position for position in range(len(results))
+            if task_starts.get(_get_box_key(results[position]), False) is None])
+
+    def _get_task_starts(self):
+        '''
+        @returns Starts of the pending tasks keyed by their area, None for areas which were split
+        @returnType dictionary
+        '''
+        if self.record['task_starts'] is None: # Jobs created before starts were tracked
+            return {}
+
+        return json.loads(self.record['task_starts'])
+
+    def is_cancelled(self):
+        ''' {@inheritDocs} '''
+        return bool(self.record['is_cancelled']) # Not set on jobs which were never cancelled
+
     def is_finished(self):
         ''' {@inheritDocs} '''
         return self.record['is_finished']
@@ -91,7 +210,18 @@ class AwsJob(Job):
     def save_changes(self):
         ''' {@inheritDocs} '''
         if self.needs_to_be_saved:
-            if not self.record.partial_save():
+            if self.write_limiter is not None: # Each KB written consumes a write capacity unit
+                size = len(self.record['results']) + len(self.record['task_starts'] or '')
+                self.write_limiter.acquire(max(1, int(math.ceil(size / 1024.0))))
+
+            try:
+                saved = self.record.partial_save()
+            except ProvisionedThroughputExceededException as e:
+                if self.write_limiter is not None:
+                    self.write_limiter.report_throttled()
+                raise UpdateError('%s Throttled while updating database entry!' % self.record['id'], e)
+
+            if not saved:
                 raise UpdateError('%s Failed to update database entry!' % self.record['id'])
 
             self.needs_to_be_saved = True
@@ -111,7 +241,7 @@ class AwsJob(Job):
 class AwsJobFactory(JobFactory):
     ''' AWS specific implementation of the JobFactory '''
 
-    def __init__(self, config, strategy_factory):
+    def __init__(self, config, strategy_factory, write_limiter=None):
         '''
         Constructor.
 
@@ -124,6 +254,8 @@ class AwsJobFactory(JobFactory):
         @paramType ConfigParser
         @param strategy_factory Interface for marshalling polygon strategies
         @paramType PolygonStrategyFactory
+        @param write_limiter Limits the rate at which job records are written, if any
+        @paramType TokenBucketRateLimiter
         @returns n/a
         '''
         assert config is not None
@@ -131,6 +263,32 @@ class AwsJobFactory(JobFactory):
 
         self.jobs = Table(config.get('database', 'jobs_table'))
         self.strategy_factory = strategy_factory
+        self.write_limiter = write_limiter
+
+    def add_sub_areas(self, job_id, num_sub_areas):
+        ''' {@inheritDocs} '''
+        assert num_sub_areas > 0, num_sub_areas
+
+        if self.write_limiter is not None:
+            self.write_limiter.acquire()
+
+        # ADD is applied by DynamoDB itself, so concurrent splits never lose an update
+        self.jobs.connection.update_item(
+            self.jobs.table_name,
+            {'id' : {'S' : str(job_id)}},
+            attribute_updates={'num_sub_areas' : {'Action' : 'ADD', 'Value' : {'N' : str(num_sub_areas)}}}
+        )
+
+    def cancel_job(self, job_id):
+        ''' {@inheritDocs} '''
+        record = self.jobs.get_item(id = str(job_id), attributes=['id', 'is_cancelled'])
+        if record is None:
+            raise ReadError("Job(%s) does not exist!" % job_id)
+
+        # Only the flag is written, so the reducer's concurrent updates of the results are kept
+        record['is_cancelled'] = True
+        if not record.partial_save():
+            raise UpdateError('%s Failed to cancel the job!' % job_id)
 
     def create_job(self, task, polygon_strategy, num_sub_areas):
         ''' {@inheritDocs} ''' 
@@ -146,7 +304,9 @@ class AwsJobFactory(JobFactory):
             'polygon_strategy' : json.dumps(polygon_strategy.to_dict()),
             'results' : '[]',
             'run_times' : '{}',
-            'task' : task
+            'task' : task,
+            'task_durations' : '[]',
+            'task_starts' : '{}'
         })
 
         if result is False:
@@ -161,4 +321,20 @@ class AwsJobFactory(JobFactory):
             raise ReadError("Job(%s) does not exist!" % job_id)
         
         polygon_strategy = self.strategy_factory.from_dict(json.loads(record['polygon_strategy']))
-        return AwsJob(record, polygon_strategy)
+        return AwsJob(record, polygon_strategy, self.write_limiter)
+
+    def is_job_cancelled(self, job_id):
+        ''' {@inheritDocs} '''
+        record = self.jobs.get_item(id = str(job_id), attributes=['id', 'is_cancelled'])
+        if record is None:
+            raise ReadError("Job(%s) does not exist!" % job_id)
+
+        return bool(record['is_cancelled'])
+
+    def is_job_finished(self, job_id):
+        ''' {@inheritDocs} '''
+        record = self.jobs.get_item(id = str(job_id), attributes=['id', 'is_finished'])
+        if record is None:
+            raise ReadError("Job(%s) does not exist!" % job_id)
+
+        return record['is_finished']
@@ -1,19 +1,64 @@
 ''' Model for the task queue used to communicate work requests to the computing nodes. '''
 
+import base64
 import boto.sqs
 import json
 
-from boto.sqs.message import Message
-
 from smcity.logging.logger import Logger
-from smcity.models.map_queue import MapQueue
+from smcity.models.fair_scheduler import FairScheduler
+from smcity.models.map_queue import BATCH, INTERACTIVE, MapQueue
 
 logger = Logger(__name__)
 
+# Seconds a task of a job at its concurrency cap is put back for. Each time it is put back counts
+# towards the queue's redrive limit, which has to leave room for that.
+CAPPED_TASK_DELAY = 10
+
+# Largest # of messages SQS accepts in a single batch write
+MAX_BATCH_SIZE = 10
+
+# Largest total size of the message bodies SQS accepts in a single batch write, and of a single message
+MAX_BATCH_BYTES = 256 * 1024
+
+def create_fair_scheduler(config):
+    '''
+    Sets up the scheduler shared by the map queues of a compute node.
+
+    @param config Configuration settings. Supports the following optional definitions:
+
+    Section: compute_api
+    Key:     interactive_weight
+    Type:    int
+    Desc:    Share of the tasks taken from the interactive lane, 4 by default
+
+    Section: compute_api
+    Key:     batch_weight
+    Type:    int
+    Desc:    Share of the tasks taken from the batch lane, 1 by default
+
+    Section: compute_api
+    Key:     max_tasks_per_job
+    Type:    int
+    Desc:    # of a job's tasks the compute node works on at once. No cap if not set.
+    @paramType ConfigParser
+    @returns Scheduler for the lanes
+    @returnType FairScheduler
+    '''
+    lane_weights = {INTERACTIVE : 4, BATCH : 1}
+    for lane in lane_weights.keys():
+        if config.has_option('compute_api', lane + '_weight'):
+            lane_weights[lane] = config.getint('compute_api', lane + '_weight')
+
+    max_tasks_per_job = None
+    if config.has_option('compute_api', 'max_tasks_per_job'):
+        max_tasks_per_job = config.getint('compute_api', 'max_tasks_per_job')
+
+    return FairScheduler(lane_weights, max_tasks_per_job)
+
 class AwsMapQueue(MapQueue):
     ''' AWS specific implementation of the map queue. '''
 
-    def __init__(self, config, job_factory):
+    def __init__(self, config, job_factory, scheduler=None):
         '''
         Constructor.
  
@@ -28,32 +73,62 @@ class AwsMapQueue(MapQueue):
         Section: compute_api
         Key:     map_queue
         Type:    string
-        Desc:    name of the map queue in SQS
+        Desc:    name of the map queue in SQS, holding the interactive lane
+
+        Optionally supports the following definitions:
+
+        Section: compute_api
+        Key:     batch_map_queue
+        Type:    string
+        Desc:    name of the map queue in SQS holding the batch lane. Batch tasks share the
+                 interactive lane if not set, where they hold up interactive tasks queued after them.
         @paramType ConfigParser
         @param job_factory Interface for retrieving job records
         @paramType JobFactory
+        @param scheduler Chooses between the lanes and caps the tasks worked on per job, shared by
+        the compute node's map queues. Set up from the configuration if None, see create_fair_scheduler().
+        @paramType FairScheduler
         @returns n/a
         '''
         assert job_factory is not None
 
         self.job_factory = job_factory
+        self.scheduler = scheduler if scheduler is not None else create_fair_scheduler(config)
 
-        # Retrieve the map queue
+        # Retrieve the map queue of each lane
         conn = boto.sqs.connect_to_region(config.get('compute_api', 'region'))
         self.queue = conn.get_queue(config.get('compute_api', 'map_queue'))
         assert self.queue is not None, \
             "Map queue '%s' does not exist!" % config.get('compute_api', 'map_queue')
 
+        self.lane_queues = {INTERACTIVE : self.queue, BATCH : self.queue}
+        if config.has_option('compute_api', 'batch_map_queue'):
+            self.lane_queues[BATCH] = conn.get_queue(config.get('compute_api', 'batch_map_queue'))
+            assert self.lane_queues[BATCH] is not None, \
+                "Map queue '%s' does not exist!" % config.get('compute_api', 'batch_map_queue')
+        else:
+            logger.warn("No batch_map_queue configured, batch tasks share the interactive map queue!")
+
         # Set up a dictionary for tracking currently consumed messages
         self.in_progress_messages = {}
 
+    def extend_task(self, task, visibility_timeout):
+        ''' {@inheritDocs} '''
+        message = self.in_progress_messages.get(self._generate_hash(task))
+        if message is None: # The task was finished or split in the meantime
+            return False
+
+        message.change_visibility(visibility_timeout)
+        return True
+
     def finish_task(self, task):
         ''' {@inheritDocs} '''
         task_hash = self._generate_hash(task)
 
         if task_hash in self.in_progress_messages.keys(): # If the corresponding message exists
-            self.queue.delete_message(self.in_progress_messages[task_hash])
+            self.in_progress_messages[task_hash].delete() # Deleted from whichever lane it came from
             del self.in_progress_messages[task_hash]
+            self.scheduler.finish_task(task['job_id'])
         else: # If there is not corresponding message
             raise Exception("Corresponding message does not exist for task(%s)" % str(task))
 
@@ -74,45 +149,136 @@ class AwsMapQueue(MapQueue):
         
         return task_hash
 
+    def get_num_tasks(self):
+        ''' {@inheritDocs} '''
+        queues = dict([(queue.url, queue) for queue in self.lane_queues.values()]).values()
+
+        return sum([queue.count() for queue in queues]) # SQS' ApproximateNumberOfMessages
+
     def get_task(self):
         ''' {@inheritDocs} '''
-        message = self.queue.read()
+        for lane in self.scheduler.get_lane_order(): # Fall through to the other lanes if it is empty
+            message = self.lane_queues[lane].read()
 
-        if message is None: # If no message is available
-            return None
+            if message is None: # If no message is available
+                continue
 
-        task = json.loads(message.get_body()) # Parse the task request
+            task = json.loads(message.get_body()) # Parse the task request
 
-        # Verify that the message is well formed
-        if ('job_id' not in task.keys() or
-            'task' not in task.keys() or
-            'coordinate_box' not in task.keys()):
-            logger.warn('Malformed task request: %s', str(task))
-            return None # No need to delete the message, let it drop into the dead letter queue
+            # Verify that the message is well formed
+            if ('job_id' not in task.keys() or
+                'task' not in task.keys() or
+                'coordinate_box' not in task.keys()):
+                logger.warn('Malformed task request: %s', str(task))
+                continue # No need to delete the message, let it drop into the dead letter queue
 
-        task_hash = self._generate_hash(task) # Save the message for later deletion
-        self.in_progress_messages[task_hash] = message
- 
-        return task
+            if not self.scheduler.try_start_task(task['job_id']): # Leave it to the job's running tasks
+                message.change_visibility(CAPPED_TASK_DELAY)
+                continue
+
+            task_hash = self._generate_hash(task) # Save the message for later deletion
+            self.in_progress_messages[task_hash] = message
 
-    def request_count_tweets(self, polygon_strategy):
+            return task
+
+        return None
+
+    def request_count_tweets(self, polygon_strategy, sort_key=None, sample_rate=None, priority=INTERACTIVE,
+                             time_range=None):
         ''' {@inheritDocs} '''
+        assert sample_rate is None or 0 < sample_rate <= 1, sample_rate
+        assert priority in self.lane_queues, priority
+        assert time_range is None or time_range[0] <= time_range[1], time_range
+
         logger.debug("Breaking the area of interest into its component lat/lon boxes...")
-        coordinate_boxes = polygon_strategy.get_inscribed_boxes()
+        if sort_key is not None: # Submit the most important areas first, which needs them all at once
+            coordinate_boxes = sorted(polygon_strategy.get_inscribed_boxes(), key=sort_key)
+            num_boxes = len(coordinate_boxes)
+        else: # Generate the areas as they are submitted, keeping memory use constant
+            coordinate_boxes = polygon_strategy.iter_inscribed_boxes()
+            num_boxes = polygon_strategy.get_num_boxes()
 
         logger.debug("Creating a new job for this request...")
-        job_id = self.job_factory.create_job('count_tweets', polygon_strategy, len(coordinate_boxes))
+        job_id = self.job_factory.create_job('count_tweets', polygon_strategy, num_boxes)
 
-        logger.debug("Area of interest broken into %s sub-areas!" % len(coordinate_boxes))
+        logger.debug("Area of interest broken into %s sub-areas!" % num_boxes)
+        batch = []
         for coordinate_box in coordinate_boxes: # Write out each of the coordinate boxes
-            message = Message() # Set up the message
-            message.set_body(json.dumps({
+            task = {
                 'job_id' : job_id,
                 'task' : 'count_tweets',
                 'coordinate_box' : coordinate_box,
-            }))
-            
-            result = self.queue.write(message) # Write out the request
-            assert result is not None, 'Failed to push request to queue!'
+                'priority' : priority
+            }
+            if sample_rate is not None: # Only read a sample of the tweets
+                task['sample_rate'] = sample_rate
+            if time_range is not None: # Only count the tweets of the time range
+                task['time_range'] = list(time_range)
+
+            batch.append(task)
+            if len(batch) == MAX_BATCH_SIZE:
+                self._write_batch(batch)
+                batch = []
+
+        if len(batch) > 0:
+            self._write_batch(batch)
 
         return job_id
+
+    def request_speculative_task(self, task):
+        ''' {@inheritDocs} '''
+        duplicate = dict(task)
+        duplicate['speculative'] = True
+
+        self._write_batch([duplicate])
+
+    def split_task(self, task, coordinate_boxes):
+        ''' {@inheritDocs} '''
+        assert len(coordinate_boxes) > 1, len(coordinate_boxes)
+
+        # Grow the job first, so it can never be considered finished before the pieces report in
+        self.job_factory.add_sub_areas(task['job_id'], len(coordinate_boxes) - 1)
+
+        sub_tasks = []
+        for coordinate_box in coordinate_boxes:
+            sub_task = dict(task)
+            sub_task['coordinate_box'] = coordinate_box
+            sub_tasks.append(sub_task)
+
+        for start in range(0, len(sub_tasks), MAX_BATCH_SIZE):
+            self._write_batch(sub_tasks[start:start + MAX_BATCH_SIZE]) # Stay in the task's lane
+
+        self.finish_task(task)
+
+    def _write_batch(self, tasks):
+        '''
+        Writes out task requests of the same lane, in as few calls as SQS' limits on the # of
+        messages and on the total size of a batch allow.
+
+        @param tasks Task requests to be written
+        @paramType list of dictionaries, optionally with key 'priority'
+        @returns n/a
+        '''
+        queue = self.lane_queues[tasks[0].get('priority', INTERACTIVE)]
+
+        # Bodies are base64 encoded to match what Message.get_body() expects to decode
+        messages = [
+            (str(index), base64.b64encode(json.dumps(tasks[index])), 0) for index in range(len(tasks))
+        ]
+
+        for message in messages:
+            assert len(message[1]) <= MAX_BATCH_BYTES, "Task request of %s bytes is too large!" % len(message[1])
+
+        start = 0
+        while start < len(messages): # Write out the requests, as many at a time as fit into a batch
+            end = start + 1
+            batch_bytes = len(messages[start][1])
+            while end < len(messages) and end - start < MAX_BATCH_SIZE and \
+                    batch_bytes + len(messages[end][1]) <= MAX_BATCH_BYTES:
+                batch_bytes += len(messages[end][1])
+                end += 1
+
+            result = queue.write_batch(messages[start:end])
+            assert result is not None and len(result.errors) == 0, \
+                'Failed to push requests to queue! %s' % (result.errors if result is not None else None)
+            start = end
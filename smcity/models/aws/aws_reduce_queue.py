@@ -5,8 +5,12 @@ import json
 
 from boto.sqs.message import Message
 
+from smcity.logging.logger import Logger
+from smcity.models.map_queue import summarize_task
 from smcity.models.reduce_queue import ReduceQueue
 
+logger = Logger(__name__)
+
 class AwsReduceQueue(ReduceQueue):
     ''' AWS specific implementation of the reduce queue. '''
 
@@ -85,7 +89,29 @@ class AwsReduceQueue(ReduceQueue):
 
         return result
 
-    def post_count_tweets_result(self, job_id, coordinate_box, count):
+    def post_combined_results(self, job_id, results, starts=None):
+        ''' {@inheritDocs} '''
+        assert job_id is not None
+        starts = [{'task' : summarize_task(start['task']), 'started_at' : start['started_at']}
+            for start in starts or []]
+        assert len(results) + len(starts) > 0
+
+        boxes = [result['coordinate_box'] for result in results] + \
+            [start['task']['coordinate_box'] for start in starts]
+        self._write_body({
+            'job_id' : job_id,
+            'task' : 'count_tweets_combined',
+            'results' : results,
+            'starts' : starts,
+            'coordinate_box' : { # Bounds of the combined areas, identifying the message
+                'min_lat' : min([box['min_lat'] for box in boxes]),
+                'min_lon' : min([box['min_lon'] for box in boxes]),
+                'max_lat' : max([box['max_lat'] for box in boxes]),
+                'max_lon' : max([box['max_lon'] for box in boxes])
+            }
+        })
+
+    def post_count_tweets_result(self, job_id, coordinate_box, count, error=None):
         '''
         Submits the results of the tweet count.
 
@@ -93,21 +119,61 @@ class AwsReduceQueue(ReduceQueue):
         @paramType uuid/string
         @param coordinate_box Box in which the tweets were counted
         @paramType dictionary
-        @param count # of tweets in the coordinate_box
-        @paramType int
+        @param count # of tweets in the coordinate_box, or the # of tweets of each region keyed by
+        region id for multi-region tiles
+        @paramType int or dictionary
+        @param error Half width of the 95% confidence interval of an estimated count, None if exact
+        @paramType float
         @returns n/a
         '''
         assert job_id is not None
         assert coordinate_box is not None
         assert count is not None
 
-        message = Message() # Set up the message
-        message.set_body(json.dumps({
+        body = {
             'job_id' : job_id,
             'task' : 'count_tweets',
             'result' : count,
             'coordinate_box' : coordinate_box
-        }))
+        }
+        if error is not None: # If the count was estimated from a sample
+            body['error'] = error
+
+        self._write_body(body)
+
+    def post_task_split(self, task):
+        ''' {@inheritDocs} '''
+        assert task is not None
+
+        self._write_body({
+            'job_id' : task['job_id'],
+            'task' : 'task_split',
+            'coordinate_box' : task['coordinate_box']
+        })
+
+    def post_task_started(self, task, started_at):
+        ''' {@inheritDocs} '''
+        assert task is not None
+        assert started_at is not None
+
+        self._write_body({
+            'job_id' : task['job_id'],
+            'task' : 'task_started',
+            'coordinate_box' : task['coordinate_box'],
+            'started_task' : summarize_task(task), # Keeps polygon payloads out of the job record
+            'started_at' : started_at
+        })
+
+    def _write_body(self, body):
+        '''
+        Writes the message body out to the queue.
+
+        @param body Message body
+        @paramType dictionary
+        @returns n/a
+        '''
+        message = Message() # Set up the message
+        message.set_body(json.dumps(body))
 
         result = self.queue.write(message) # Write out the request
         assert result is not None, 'Failed to push results to queue!'
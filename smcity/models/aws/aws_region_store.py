@@ -0,0 +1,104 @@
+''' AWS specific implementation of the RegionStore. '''
+
+import json
+
+from boto.dynamodb2.fields import HashKey, RangeKey
+from boto.dynamodb2.table import Table
+from collections import OrderedDict
+from threading import Lock
+from uuid import uuid4
+
+from smcity.errors import ReadError
+from smcity.logging.logger import Logger
+from smcity.models.region_store import RegionStore
+
+logger = Logger(__name__)
+
+# # of region sets kept in memory, region sets never change
+MAX_CACHED_REGION_SETS = 100
+
+def create_region_store(config):
+    '''
+    Sets up the region store, if configured.
+
+    @param config Configuration settings. Supports the following optional definitions:
+
+    Section: database
+    Key:     region_table
+    Type:    string
+    Desc:    Name of the NoSQL table holding the region sets of multi-region jobs
+    @paramType ConfigParser
+    @returns Region store, None if no region table is configured
+    @returnType AwsRegionStore
+    '''
+    if not config.has_option('database', 'region_table'):
+        return None
+
+    return AwsRegionStore(config)
+
+class AwsRegionStore(RegionStore):
+    '''
+    Keeps the region sets in DynamoDB, one item per region, hashed on the region set so a set is
+    read with a single query. Each set is cached once read.
+    '''
+
+    def __init__(self, config):
+        '''
+        Constructor.
+
+        @param config Configuration settings. Requires the following definitions:
+
+        Section: database
+        Key:     region_table
+        Type:    string
+        Desc:    Name of the NoSQL table holding the regions, hashed on 'region_set_id' with range 'region_id'
+        @paramType ConfigParser
+        @returns n/a
+        '''
+        assert config is not None
+
+        self.cached_sets = OrderedDict() # Region set id to its regions, least recently read first
+        self.lock = Lock()
+        self.table = Table(config.get('database', 'region_table'), schema=[
+            HashKey('region_set_id'), RangeKey('region_id')
+        ])
+
+    def add_regions(self, regions):
+        ''' {@inheritDocs} '''
+        assert len(regions) > 0, len(regions)
+
+        region_set_id = str(uuid4())
+        with self.table.batch_write() as batch: # Sent 25 regions at a time
+            for region_id in range(len(regions)):
+                batch.put_item(data={
+                    'region_set_id' : region_set_id,
+                    'region_id' : region_id,
+                    'name' : regions[region_id]['name'],
+                    'geometry' : json.dumps(regions[region_id]['geometry'])
+                })
+
+        logger.info("Added region set %s of %s regions", region_set_id, len(regions))
+        return region_set_id
+
+    def get_regions(self, region_set_id):
+        ''' {@inheritDocs} '''
+        assert region_set_id is not None
+
+        with self.lock:
+            regions = self.cached_sets.pop(region_set_id, None)
+
+        if regions is None: # Read the set once
+            records = sorted(self.table.query_2(region_set_id__eq=region_set_id),
+                key=lambda record: int(record['region_id']))
+            if len(records) == 0:
+                raise ReadError("Region set(%s) does not exist!" % region_set_id)
+
+            regions = [{'name' : record['name'], 'geometry' : json.loads(record['geometry'])}
+                for record in records]
+
+        with self.lock: # Move to the back as the most recently read
+            self.cached_sets[region_set_id] = regions
+            while len(self.cached_sets) > MAX_CACHED_REGION_SETS:
+                self.cached_sets.popitem(last=False)
+
+        return regions
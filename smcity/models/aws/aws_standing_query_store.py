@@ -0,0 +1,125 @@
+''' AWS specific implementation of the StandingQueryStore. '''
+
+import json
+
+from boto.dynamodb2.exceptions import ConditionalCheckFailedException, ItemNotFound
+from boto.dynamodb2.fields import HashKey
+from boto.dynamodb2.table import Table
+from uuid import uuid4
+
+from smcity.errors import ReadError
+from smcity.logging.logger import Logger
+from smcity.models.standing_query_store import StandingQueryStore
+
+logger = Logger(__name__)
+
+class AwsStandingQueryStore(StandingQueryStore):
+    '''
+    Keeps the standing queries in DynamoDB, one item per query holding its polygon strategy and
+    its latest counts. Only the counts are published, in the order of the strategy's result boxes,
+    so a query's item stays small next to its polygon strategy.
+    '''
+
+    def __init__(self, config, polygon_strategy_factory):
+        '''
+        Constructor.
+
+        @param config Configuration settings. Requires the following definitions:
+
+        Section: database
+        Key:     standing_query_table
+        Type:    string
+        Desc:    Name of the NoSQL table holding the standing queries, hashed on 'query_id'
+        @paramType ConfigParser
+        @param polygon_strategy_factory Used to decode the stored polygon strategies
+        @paramType PolygonStrategyFactory
+        @returns n/a
+        '''
+        assert config is not None
+        assert polygon_strategy_factory is not None
+
+        self.polygon_strategy_factory = polygon_strategy_factory
+        self.table = Table(config.get('database', 'standing_query_table'), schema=[
+            HashKey('query_id')
+        ])
+
+    def add_query(self, polygon_strategy, bucket_size, num_buckets):
+        ''' {@inheritDocs} '''
+        assert polygon_strategy is not None
+        assert bucket_size > 0, bucket_size
+        assert num_buckets > 0, num_buckets
+
+        query_id = str(uuid4())
+        self.table.put_item(data={
+            'query_id' : query_id,
+            'polygon_strategy' : json.dumps(polygon_strategy.to_dict()),
+            'bucket_size' : bucket_size,
+            'num_buckets' : num_buckets
+        })
+
+        logger.info("Added standing query %s", query_id)
+        return query_id
+
+    def _decode(self, record):
+        '''
+        @param record Stored standing query
+        @paramType Item
+        @returns The standing query, see get_query()
+        @returnType dictionary
+        '''
+        counts = None
+        if record['counts'] is not None: # Once the stream listener published them
+            counts = json.loads(record['counts'])
+
+        return {
+            'polygon_strategy' : self.polygon_strategy_factory.from_dict(json.loads(record['polygon_strategy'])),
+            'bucket_size' : int(record['bucket_size']),
+            'num_buckets' : int(record['num_buckets']),
+            'counts' : counts,
+            'updated_at' : None if record['updated_at'] is None else int(record['updated_at'])
+        }
+
+    def get_queries(self):
+        ''' {@inheritDocs} '''
+        queries = {}
+        for record in self.table.scan(attributes=['query_id', 'polygon_strategy', 'bucket_size',
+                'num_buckets']): # The counts are only of use to the API processes
+            queries[record['query_id']] = self._decode(record)
+
+        return queries
+
+    def get_query(self, query_id):
+        ''' {@inheritDocs} '''
+        assert query_id is not None
+
+        try:
+            record = self.table.get_item(query_id=query_id)
+        except ItemNotFound as e:
+            raise ReadError("Standing query(%s) does not exist!" % query_id, e)
+
+        return self._decode(record)
+
+    def remove_query(self, query_id):
+        ''' {@inheritDocs} '''
+        assert query_id is not None
+
+        self.table.delete_item(query_id=query_id)
+
+    def save_counts(self, query_id, counts, updated_at):
+        ''' {@inheritDocs} '''
+        assert query_id is not None
+        assert counts is not None
+
+        # A single conditional write, which fails rather than bring back a query removed in the meantime
+        try:
+            self.table.connection.update_item(
+                self.table.table_name,
+                {'query_id' : {'S' : str(query_id)}},
+                attribute_updates={
+                    'counts' : {'Action' : 'PUT', 'Value' : {'S' : json.dumps(counts)}},
+                    'updated_at' : {'Action' : 'PUT', 'Value' : {'N' : str(int(updated_at))}}
+                },
+                expected={'query_id' : {'Exists' : True, 'Value' : {'S' : str(query_id)}}}
+            )
+        except ConditionalCheckFailedException:
+            logger.debug("Standing query %s removed before saving its counts", query_id)
@@ -0,0 +1,112 @@
+''' AWS specific implementation of the TokenStore, and construction of rate limiters from configuration. '''
+
+import time
+
+from boto.dynamodb2.exceptions import ConditionalCheckFailedException, ItemNotFound
+from boto.dynamodb2.table import Table
+from decimal import Decimal
+
+from smcity.logging.logger import Logger
+from smcity.models.rate_limiter import TokenBucketRateLimiter, TokenStore
+
+logger = Logger(__name__)
+
+# # of times a take is retried when another process updates the bucket at the same time
+MAX_TAKE_ATTEMPTS = 5
+
+# # of decimal places kept of the stored token counts and times
+STORED_PLACES = 6
+
+def to_number(value):
+    '''
+    @param value Token count or time to be stored
+    @paramType float
+    @returns Value rounded to STORED_PLACES, exact enough for DynamoDB's number type
+    @returnType Decimal
+    '''
+    return Decimal(repr(round(value, STORED_PLACES)))
+
+def create_rate_limiter(config, kind):
+    '''
+    Sets up the rate limiter for the kind of storage access, if configured.
+
+    @param config Configuration settings. Supports the following optional definitions:
+
+    Section: database
+    Key:     [kind]_rate
+    Type:    float
+    Desc:    # of capacity units this process may consume per second. No limit if not set.
+
+    Section: database
+    Key:     [kind]_shared_rate
+    Type:    float
+    Desc:    # of capacity units all processes together may consume per second. Requires token_table.
+
+    Section: database
+    Key:     token_table
+    Type:    string
+    Desc:    Name of the NoSQL table holding the shared token buckets
+    @paramType ConfigParser
+    @param kind Kind of storage access, such as 'read', 'write' or 'janitor_read'
+    @paramType string
+    @returns Rate limiter, None if no rate is configured
+    @returnType TokenBucketRateLimiter
+    '''
+    if not config.has_option('database', kind + '_rate'):
+        return None
+
+    token_store = None
+    shared_rate = None
+    if config.has_option('database', kind + '_shared_rate'): # Coordinate with the other processes
+        token_store = AwsTokenStore(config)
+        shared_rate = config.getfloat('database', kind + '_shared_rate')
+
+    return TokenBucketRateLimiter(config.getfloat('database', kind + '_rate'), token_store=token_store,
+        bucket=kind, shared_rate=shared_rate)
+
+class AwsTokenStore(TokenStore):
+    ''' Keeps the shared token buckets in DynamoDB, updated with conditional writes. '''
+
+    def __init__(self, config):
+        '''
+        Constructor.
+
+        @param config Configuration settings. Requires the following definitions:
+
+        Section: database
+        Key:     token_table
+        Type:    string
+        Desc:    Name of the NoSQL table holding the token buckets, hashed on 'bucket'
+        @paramType ConfigParser
+        @returns n/a
+        '''
+        assert config is not None
+
+        self.table = Table(config.get('database', 'token_table'))
+
+    def take_tokens(self, bucket, amount, rate, burst):
+        ''' {@inheritDocs} '''
+        for attempt in range(MAX_TAKE_ATTEMPTS):
+            now = time.time()
+            try:
+                record = self.table.get_item(bucket=bucket, consistent=True)
+            except ItemNotFound:
+                record = None
+
+            try:
+                if record is None: # Start out with a full bucket
+                    taken = min(amount, burst)
+                    self.table.put_item(data={'bucket' : bucket, 'tokens' : to_number(burst - taken),
+                        'updated_at' : to_number(now)})
+                    return taken
+
+                tokens = min(burst, float(record['tokens']) + (now - float(record['updated_at'])) * rate)
+                taken = min(amount, tokens)
+                record['tokens'] = to_number(tokens - taken)
+                record['updated_at'] = to_number(now)
+                record.partial_save() # Only succeeds if nobody else updated the bucket in the meantime
+                return taken
+            except ConditionalCheckFailedException:
+                logger.debug("Token bucket %s updated concurrently, retrying...", bucket)
+
+        return 0.0 # The bucket is contended, try again later
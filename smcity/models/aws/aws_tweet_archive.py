@@ -0,0 +1,117 @@
+''' AWS specific implementation of the TweetArchive. '''
+
+import json
+
+from boto.dynamodb2.exceptions import ItemNotFound
+from boto.dynamodb2.fields import HashKey, RangeKey
+from boto.dynamodb2.table import Table
+from collections import OrderedDict
+from threading import Lock
+
+from smcity.logging.logger import Logger
+from smcity.models.tweet_archive import TweetArchive, get_cell_center
+
+logger = Logger(__name__)
+
+# Cell key of the item marking an hour as completely rolled up, written after the hour's cells
+ROLLED_UP_MARKER = 'rolled_up'
+
+# # of hours whose cells are kept in memory, rolled up hours never change
+MAX_CACHED_HOURS = 1000
+
+class AwsTweetArchive(TweetArchive):
+    '''
+    Keeps the rollups in DynamoDB, one item per hour and cell, hashed on the hour so an hour's
+    cells are read with a single query. Each hour's cells are cached once read.
+    '''
+
+    def __init__(self, config, write_limiter=None):
+        '''
+        Constructor.
+
+        @param config Configuration settings. Requires the following definitions:
+
+        Section: database
+        Key:     archive_table
+        Type:    string
+        Desc:    Name of the NoSQL table holding the rollups, hashed on 'hour' with range 'cell'
+        @paramType ConfigParser
+        @param write_limiter Limits the rate at which rollups are written, if any
+        @paramType TokenBucketRateLimiter
+        @returns n/a
+        '''
+        assert config is not None
+
+        self.lock = Lock()
+        self.write_limiter = write_limiter
+        self.table = Table(config.get('database', 'archive_table'), schema=[
+            HashKey('hour'), RangeKey('cell')
+        ])
+
+        self.cached_cells = OrderedDict() # Hour to its cells, least recently read first
+        self.rolled_up_hours = set()
+
+    def add_rollup(self, hour, cells):
+        ''' {@inheritDocs} '''
+        assert hour is not None
+        assert cells is not None
+
+        with self.table.batch_write() as batch: # Sent 25 cells at a time
+            for cell, rollup in cells.items():
+                if self.write_limiter is not None:
+                    self.write_limiter.acquire()
+                batch.put_item(data={
+                    'hour' : hour,
+                    'cell' : cell,
+                    'count' : rollup['count'],
+                    'terms' : json.dumps(rollup['terms'])
+                })
+
+        # Only mark the hour once all of its cells are in, an interrupted rollup is simply redone
+        self.table.put_item(data={'hour' : hour, 'cell' : ROLLED_UP_MARKER, 'num_cells' : len(cells)},
+            overwrite=True)
+        with self.lock:
+            self.rolled_up_hours.add(hour)
+
+    def get_cells(self, hour, coordinate_box=None):
+        ''' {@inheritDocs} '''
+        with self.lock:
+            cells = self.cached_cells.pop(hour, None)
+
+        if cells is None: # Read the hour's cells once
+            cells = []
+            for record in self.table.query_2(hour__eq=hour):
+                if record['cell'] == ROLLED_UP_MARKER:
+                    continue
+
+                lat, lon = get_cell_center(record['cell'])
+                cells.append({'lat' : lat, 'lon' : lon, 'count' : int(record['count']),
+                    'terms' : json.loads(record['terms'])})
+
+        with self.lock: # Move to the back as the most recently read, unless the hour may still change
+            if hour in self.rolled_up_hours:
+                self.cached_cells[hour] = cells
+            while len(self.cached_cells) > MAX_CACHED_HOURS:
+                self.cached_cells.popitem(last=False)
+
+        if coordinate_box is None:
+            return cells
+
+        return [cell for cell in cells
+            if coordinate_box['min_lat'] <= cell['lat'] <= coordinate_box['max_lat'] and
+               coordinate_box['min_lon'] <= cell['lon'] <= coordinate_box['max_lon']]
+
+    def is_rolled_up(self, hour):
+        ''' {@inheritDocs} '''
+        with self.lock:
+            if hour in self.rolled_up_hours:
+                return True
+
+        try:
+            self.table.get_item(hour=hour, cell=ROLLED_UP_MARKER)
+        except ItemNotFound:
+            return False
+
+        with self.lock: # Rolled up hours stay rolled up
+            self.rolled_up_hours.add(hour)
+        return True
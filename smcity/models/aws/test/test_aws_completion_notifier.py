@@ -0,0 +1,84 @@
+''' Unit tests for the AwsCompletionNotifier class. '''
+
+from ConfigParser import ConfigParser
+
+from smcity.models.aws.aws_completion_notifier import STALE_QUEUE_AGE, AwsCompletionNotifier
+
+class MockQueue:
+    def __init__(self, name, last_modified):
+        self.attributes = {'LastModifiedTimestamp' : str(last_modified), 'QueueArn' : 'arn:' + name}
+        self.is_deleted = False
+        self.name = name
+
+    def delete(self):
+        self.is_deleted = True
+
+    def get_attributes(self):
+        return self.attributes
+
+class MockSns:
+    def __init__(self, subscriptions):
+        self.subscriptions = subscriptions
+
+    def get_all_subscriptions_by_topic(self, topic, next_token=None):
+        page = 0 if next_token is None else int(next_token)
+        return {'ListSubscriptionsByTopicResponse' : {'ListSubscriptionsByTopicResult' : {
+            'Subscriptions' : self.subscriptions[page:page + 1],
+            'NextToken' : str(page + 1) if page + 1 < len(self.subscriptions) else None
+        }}}
+
+    def unsubscribe(self, subscription_arn):
+        self.subscriptions = [subscription for subscription in self.subscriptions
+            if subscription['SubscriptionArn'] != subscription_arn]
+
+class MockSqs:
+    def __init__(self, queues):
+        self.queues = queues
+
+    def get_all_queues(self, prefix=''):
+        return [queue for queue in self.queues if queue.name.startswith(prefix)]
+
+class TestAwsCompletionNotifier():
+    ''' Unit tests for the AwsCompletionNotifier class. '''
+
+    def setup(self):
+        ''' Set up before each test. '''
+        config = ConfigParser()
+        config.add_section('compute_api')
+        config.set('compute_api', 'region', 'us-west-2')
+        config.set('compute_api', 'notification_topic', 'topic')
+        self.notifier = AwsCompletionNotifier(config)
+
+    def test_reap_stale_queues(self):
+        ''' Tests that only the queues without a recent heartbeat are removed. '''
+        now = 1400000000
+        stale_queue = MockQueue('smcity_completions_stale', now - STALE_QUEUE_AGE - 1)
+        live_queue = MockQueue('smcity_completions_live', now - 60)
+        own_queue = MockQueue('smcity_completions_own', now - STALE_QUEUE_AGE - 1)
+        other_queue = MockQueue('other', now - STALE_QUEUE_AGE - 1)
+
+        self.notifier.queue = own_queue
+        self.notifier.sqs = MockSqs([stale_queue, live_queue, own_queue, other_queue])
+        self.notifier.sns = MockSns([
+            {'Endpoint' : 'arn:smcity_completions_live', 'SubscriptionArn' : 'live'},
+            {'Endpoint' : 'arn:smcity_completions_stale', 'SubscriptionArn' : 'stale'}
+        ])
+
+        assert self.notifier.reap_stale_queues(now) == 1
+        assert stale_queue.is_deleted
+        assert not live_queue.is_deleted and not own_queue.is_deleted and not other_queue.is_deleted
+        assert self.notifier.sns.subscriptions == [
+            {'Endpoint' : 'arn:smcity_completions_live', 'SubscriptionArn' : 'live'}
+        ], self.notifier.sns.subscriptions
+
+    def test_shutdown(self):
+        ''' Tests that shutting down twice only removes the listener queue once. '''
+        own_queue = MockQueue('smcity_completions_own', 0)
+        self.notifier.queue = own_queue
+        self.notifier.subscription_arn = 'own'
+        self.notifier.sns = MockSns([{'Endpoint' : 'arn:smcity_completions_own', 'SubscriptionArn' : 'own'}])
+
+        self.notifier.shutdown()
+        self.notifier.shutdown()
+        assert own_queue.is_deleted
+        assert self.notifier.sns.subscriptions == [], self.notifier.sns.subscriptions
@@ -5,7 +5,9 @@ import json
 from boto.dynamodb2.table import Table
 from ConfigParser import ConfigParser
 
-from smcity.models.aws.aws_job import AwsJobFactory
+from smcity.analytics.asynch_result import AsynchResult
+from smcity.analytics.worker import split_box
+from smcity.models.aws.aws_job import AwsJob, AwsJobFactory
 
 class MockPolygonStrategy:
     def __init__(self, rep):
@@ -14,6 +16,17 @@ class MockPolygonStrategy:
     def to_dict(self):
         return self.rep
 
+class MockRecord(dict):
+    def partial_save(self):
+        return True
+
+class MockJobFactory:
+    def __init__(self, job):
+        self.job = job
+
+    def get_job(self, job_id):
+        return self.job
+
 class MockPolygonStrategyFactory:
     def from_dict(self, state):
         return state['class']
@@ -36,6 +49,37 @@ class TestAwsJob:
         for job in self.jobs.scan():
             job.delete()
 
+    def test_add_result_duplicate(self):
+        ''' Tests that only the first result for an area is added. '''
+        coordinate_box = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}
+        task = {'job_id' : 'job_id', 'task' : 'count_tweets', 'coordinate_box' : coordinate_box}
+
+        job_id = self.job_factory.create_job('task', MockPolygonStrategy({'class' : 'mock'}), 1)
+        job = self.job_factory.get_job(job_id)
+        job.add_task_start(task, 100)
+        assert job.get_pending_tasks() == [{'task' : task, 'started_at' : 100}], job.get_pending_tasks()
+
+        assert job.add_result(coordinate_box, 5) == True
+        assert job.add_result(coordinate_box, 6) == False # The speculative duplicate's result
+
+        assert job.is_finished() == True
+        assert job.get_pending_tasks() == [], job.get_pending_tasks()
+        assert len(job.get_task_durations()) == 1, job.get_task_durations()
+        assert [result['result'] for result in job.get_results()] == [5], job.get_results()
+
+    def test_add_task_split(self):
+        ''' Tests that split areas are no longer waited on and their late results are dropped. '''
+        coordinate_box = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}
+        task = {'job_id' : 'job_id', 'task' : 'count_tweets', 'coordinate_box' : coordinate_box}
+
+        job_id = self.job_factory.create_job('task', MockPolygonStrategy({'class' : 'mock'}), 4)
+        job = self.job_factory.get_job(job_id)
+        job.add_task_start(task, 100)
+        job.add_task_split(coordinate_box)
+
+        assert job.get_pending_tasks() == [], job.get_pending_tasks()
+        assert job.add_result(coordinate_box, 5) == False
+
     def test_create_job(self):
         ''' Tests the create_job function. '''
         task = 'task'
@@ -97,3 +141,54 @@ class TestAwsJob:
         assert record['results_size'] == results_size
         assert record['is_finished'] == True
         
+
+class TestAwsJobSplits:
+    ''' Unit tests for the AwsJob model's handling of splits, on an in-memory record. '''
+
+    def test_split_after_speculative_result(self):
+        ''' Tests that a split replaces a whole area result a speculative duplicate already reported. '''
+        cell_a = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}
+        cell_b = {'min_lat' : 1, 'min_lon' : 0, 'max_lat' : 2, 'max_lon' : 1}
+        record = MockRecord(id='job_id', is_finished=False, num_sub_areas=2, polygon_strategy='{}', results='[]',
+            run_times='{}', task='count_tweets', task_durations='[]', task_starts='{}')
+        job = AwsJob(record, MockPolygonStrategy({'class' : 'mock'}))
+
+        assert job.add_result(cell_a, 100) == True # The duplicate reports the whole cell
+        job.add_task_split(cell_a) # The original then runs over budget and splits
+        record['num_sub_areas'] += 3
+
+        for quarter in split_box(cell_a):
+            assert job.add_result(quarter, 25) == True
+        assert job.is_finished() == False # Still waiting on cell B
+
+        assert job.add_result(cell_b, 50) == True
+        assert job.is_finished() == True
+        assert sum([result['result'] for result in job.get_results()]) == 150, job.get_results()
+
+    def test_split_after_result_read(self):
+        ''' Tests that a cursor stays valid when a split supersedes a result it already returned. '''
+        cell_a = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}
+        cell_b = {'min_lat' : 1, 'min_lon' : 0, 'max_lat' : 2, 'max_lon' : 1}
+        record = MockRecord(id='job_id', is_finished=False, num_sub_areas=2, polygon_strategy='{}', results='[]',
+            run_times='{}', task='count_tweets', task_durations='[]', task_starts='{}')
+        job = AwsJob(record, MockPolygonStrategy({'class' : 'mock'}))
+        asynch_result = AsynchResult(MockJobFactory(job), 'job_id', MockPolygonStrategy({'class' : 'mock'}))
+
+        job.add_result(cell_a, 100) # A speculative duplicate reports the whole cell
+        job.add_result(cell_b, 50)
+        results, cursor, completion, removed_boxes = asynch_result.get_results_since(0)
+        assert [result['result'] for result in results] == [100, 50], results
+        assert removed_boxes == [], removed_boxes
+
+        job.add_task_split(cell_a) # The original then splits after the client read the duplicate's result
+        record['num_sub_areas'] += 3
+        for quarter in split_box(cell_a):
+            job.add_result(quarter, 25)
+
+        results, cursor, completion, removed_boxes = asynch_result.get_results_since(cursor)
+        assert [result['result'] for result in results] == [25, 25, 25, 25], results
+        assert removed_boxes == [cell_a], removed_boxes
+        assert cursor == 6, cursor
+        assert completion == 1.0, completion
+        assert job.is_finished() == True
+        assert sum([result['result'] for result in job.get_results()]) == 150, job.get_results()
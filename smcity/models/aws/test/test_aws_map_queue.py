@@ -3,10 +3,12 @@
 import boto.sqs
 import ConfigParser
 import json
+import time
 
 from boto.sqs.message import Message
 
-from smcity.models.aws.aws_map_queue import AwsMapQueue
+from smcity.models.aws.aws_map_queue import CAPPED_TASK_DELAY, MAX_BATCH_BYTES, AwsMapQueue
+from smcity.models.fair_scheduler import FairScheduler
 
 class MockPolygonStrategy:
     def __init__(self, coordinate_boxes):
@@ -15,6 +17,18 @@ class MockPolygonStrategy:
     def get_inscribed_boxes(self):
         return self.coordinate_boxes
 
+class MockBatchResult:
+    def __init__(self):
+        self.errors = []
+
+class MockQueue:
+    def __init__(self):
+        self.batches = []
+
+    def write_batch(self, messages):
+        self.batches.append(messages)
+        return MockBatchResult()
+
 class MockJobFactory:
     def create_job(self, task, polygon_strategy, num_sub_areas):
         self.created_job = (task, polygon_strategy, num_sub_areas)
@@ -41,6 +55,24 @@ class TestAwsMapQueue():
             self.queue.delete_message(message)
             message = self.queue.read()
 
+    def test_extend_task(self):
+        ''' Tests the extend_task function. '''
+        map_queue = AwsMapQueue(self.config, MockJobFactory())
+
+        message = Message()
+        message.set_body(json.dumps({
+            'job_id' : 'job_id',
+            'task' : 'task',
+            'coordinate_box' : {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}
+        }))
+        self.queue.write(message)
+        task = map_queue.get_task()
+
+        assert map_queue.extend_task(task, 60) == True
+
+        map_queue.finish_task(task)
+        assert map_queue.extend_task(task, 60) == False # No longer in progress
+
     def test_finish_task(self):
         ''' Tests the finish_task function. '''
         map_queue = AwsMapQueue(self.config, MockJobFactory())
@@ -86,6 +118,30 @@ class TestAwsMapQueue():
         assert task['coordinate_box']['min_lon'] == 0, task['coordinate_box']['min_lon']
         assert task['coordinate_box']['max_lon'] == 1, task['coordinate_box']['max_lon']
 
+    def test_get_task_capped(self):
+        ''' Tests that tasks of a job at its cap are put back until the job's running task finishes. '''
+        map_queue = AwsMapQueue(self.config, MockJobFactory(), FairScheduler({'interactive' : 1}, 1))
+
+        for min_lat in [0, 1]:
+            message = Message()
+            message.set_body(json.dumps({
+                'job_id' : 'job_id',
+                'task' : 'task',
+                'coordinate_box' : {'min_lat' : min_lat, 'min_lon' : 0, 'max_lat' : min_lat + 1, 'max_lon' : 1}
+            }))
+            self.queue.write(message)
+
+        task = map_queue.get_task()
+        assert task is not None
+        assert map_queue.get_task() is None # The other task is capped
+
+        map_queue.finish_task(task)
+        time.sleep(CAPPED_TASK_DELAY + 1)
+
+        messages = self.queue.get_messages(attributes='ApproximateReceiveCount')
+        assert len(messages) == 1, messages
+        assert messages[0].attributes['ApproximateReceiveCount'] == '2', messages[0].attributes
+
     def test_request_count_tweets(self):
         ''' Tests the request_count_tweets function. '''
         coordinate_box_1 = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}
@@ -106,6 +162,7 @@ class TestAwsMapQueue():
         assert message['coordinate_box']['max_lat'] == 1, message['coordinate_box']['max_lat']
         assert message['coordinate_box']['min_lon'] == 0, message['coordinate_box']['min_lon']
         assert message['coordinate_box']['max_lon'] == 1, message['coordinate_box']['max_lon']
+        assert message['priority'] == 'interactive', message['priority']
         
         sqs_message = self.queue.read()
         assert sqs_message is None
@@ -114,3 +171,16 @@ class TestAwsMapQueue():
         assert job_task == 'count_tweets', job_task
         assert job_strategy == strategy, str(job_strategy)
         assert job_size == 1, job_size
+
+    def test_write_batch_large(self):
+        ''' Tests that large task requests are written in batches within SQS' size limit. '''
+        map_queue = AwsMapQueue(self.config, MockJobFactory())
+        map_queue.lane_queues['interactive'] = MockQueue()
+
+        tasks = [{'job_id' : 'job_id', 'task' : 'count_tweets', 'payload' : 'x' * 60000} for index in range(10)]
+        map_queue._write_batch(tasks)
+
+        batches = map_queue.lane_queues['interactive'].batches
+        assert sum([len(batch) for batch in batches]) == 10, batches
+        for batch in batches:
+            assert sum([len(message[1]) for message in batch]) <= MAX_BATCH_BYTES, len(batch)
@@ -95,3 +95,18 @@ class TestResultQueue():
         sqs_message = self.queue.read()
         assert sqs_message is None
 
+
+    def test_post_combined_results(self):
+        ''' Tests the post_combined_results function. '''
+        self.result_queue.post_combined_results('job_id', [
+            {'coordinate_box' : {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}, 'result' : 1},
+            {'coordinate_box' : {'min_lat' : 1, 'min_lon' : 2, 'max_lat' : 2, 'max_lon' : 3}, 'result' : 2}
+        ])
+
+        # Check the results
+        result = self.result_queue.get_result()
+        assert result is not None
+        assert result['task'] == 'count_tweets_combined', result['task']
+        assert [cell['result'] for cell in result['results']] == [1, 2], result['results']
+        assert result['coordinate_box'] == {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 2, 'max_lon' : 3}, \
+            result['coordinate_box']
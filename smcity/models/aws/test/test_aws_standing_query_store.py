@@ -0,0 +1,92 @@
+''' Unit tests for the AwsStandingQueryStore class. '''
+
+from boto.dynamodb2.exceptions import ConditionalCheckFailedException
+from boto.dynamodb2.table import Table
+from ConfigParser import ConfigParser
+
+from smcity.errors import ReadError
+from smcity.models.aws.aws_standing_query_store import AwsStandingQueryStore
+
+class MockPolygonStrategy:
+    def __init__(self, state):
+        self.state = state
+
+    def to_dict(self):
+        return self.state
+
+class MockPolygonStrategyFactory:
+    def from_dict(self, state):
+        return MockPolygonStrategy(state)
+
+class MockConnection:
+    def __init__(self, query_ids):
+        self.query_ids = query_ids
+        self.updates = []
+
+    def update_item(self, table_name, key, attribute_updates=None, expected=None):
+        if expected['query_id']['Value']['S'] not in self.query_ids:
+            raise ConditionalCheckFailedException(400, 'Bad Request', {})
+        self.updates.append((key, attribute_updates))
+
+class TestAwsStandingQueryStore():
+    ''' Unit tests for the AwsStandingQueryStore class. '''
+
+    def setup(self):
+        ''' Set up before each test. '''
+        config = ConfigParser()
+        config.add_section('database')
+        config.set('database', 'standing_query_table', 'test_standing_queries')
+        self.store = AwsStandingQueryStore(config, MockPolygonStrategyFactory())
+
+        # Empty the test table
+        for record in Table('test_standing_queries').scan():
+            record.delete()
+
+    def test_add_query(self):
+        ''' Tests registering a query and publishing its counts. '''
+        query_id = self.store.add_query(MockPolygonStrategy({'class' : 'mock'}), 60, 10)
+
+        queries = self.store.get_queries()
+        assert queries.keys() == [query_id], queries
+        assert queries[query_id]['polygon_strategy'].state == {'class' : 'mock'}
+        assert queries[query_id]['num_buckets'] == 10, queries[query_id]
+
+        query = self.store.get_query(query_id)
+        assert query['counts'] is None, query # Not picked up by the stream listener yet
+
+        self.store.save_counts(query_id, [1, 0, 2], 1388538000)
+        query = self.store.get_query(query_id)
+        assert query['counts'] == [1, 0, 2], query
+        assert query['updated_at'] == 1388538000, query
+
+    def test_remove_query(self):
+        ''' Tests that removed queries stay removed. '''
+        query_id = self.store.add_query(MockPolygonStrategy({'class' : 'mock'}), 60, 10)
+        self.store.remove_query(query_id)
+
+        self.store.save_counts(query_id, [1], 1388538000) # Must not bring the query back
+        assert self.store.get_queries() == {}
+        try:
+            self.store.get_query(query_id)
+            assert False, "Failed to raise exception for a removed query"
+        except ReadError:
+            pass
+
+class TestAwsStandingQueryStoreCounts:
+    ''' Unit tests for the AwsStandingQueryStore's publishing of counts, on an in-memory connection. '''
+
+    def test_save_counts_removed(self):
+        ''' Tests that counts are saved in a single write which skips removed queries. '''
+        config = ConfigParser()
+        config.add_section('database')
+        config.set('database', 'standing_query_table', 'test_standing_queries')
+        store = AwsStandingQueryStore(config, MockPolygonStrategyFactory())
+        store.table.connection = MockConnection(['query'])
+
+        store.save_counts('query', [1, 0, 2], 1388538000.5)
+        store.save_counts('removed', [1], 1388538000) # Must not bring the query back
+
+        assert store.table.connection.updates == [({'query_id' : {'S' : 'query'}}, {
+            'counts' : {'Action' : 'PUT', 'Value' : {'S' : '[1, 0, 2]'}},
+            'updated_at' : {'Action' : 'PUT', 'Value' : {'N' : '1388538000'}}
+        })], store.table.connection.updates
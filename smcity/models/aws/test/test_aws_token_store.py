@@ -0,0 +1,56 @@
+''' Unit tests for the AwsTokenStore class. '''
+
+from boto.dynamodb.types import Dynamizer
+from boto.dynamodb2.exceptions import ItemNotFound
+from ConfigParser import ConfigParser
+
+from smcity.models.aws.aws_token_store import AwsTokenStore, to_number
+
+class MockRecord(dict):
+    def partial_save(self):
+        pass
+
+class MockTable():
+    def __init__(self):
+        self.records = {}
+
+    def get_item(self, bucket, consistent=False):
+        if bucket not in self.records:
+            raise ItemNotFound()
+        return self.records[bucket]
+
+    def put_item(self, data, overwrite=False):
+        self.records[data['bucket']] = MockRecord(data)
+
+class TestAwsTokenStore():
+    ''' Unit tests for the AwsTokenStore class. '''
+
+    def setup(self):
+        ''' Set up before each test. '''
+        config = ConfigParser()
+        config.add_section('database')
+        config.set('database', 'token_table', 'test_tokens')
+        self.token_store = AwsTokenStore(config)
+        self.token_store.table = MockTable()
+
+    def test_take_tokens_encodable(self):
+        ''' Tests that the stored token counts and times survive DynamoDB's number encoding. '''
+        dynamizer = Dynamizer()
+
+        assert self.token_store.take_tokens('read', 1.0 / 3, 10.0 / 3, 10.0 / 3) == 1.0 / 3
+        assert self.token_store.take_tokens('read', 1.0 / 3, 10.0 / 3, 10.0 / 3) > 0
+
+        record = self.token_store.table.records['read']
+        for key in ['tokens', 'updated_at']:
+            value = dynamizer.decode(dynamizer.encode(record[key])) # Raises on inexact numbers
+            assert value == record[key], (key, value, record[key])
+        assert abs(float(record['tokens']) - 8.0 / 3) < 0.01, record['tokens']
+
+    def test_to_number(self):
+        ''' Tests the to_number() function. '''
+        dynamizer = Dynamizer()
+
+        for value in [0.1, 1.0 / 3, 1413000000.123456789, 0]:
+            number = to_number(value)
+            assert dynamizer.decode(dynamizer.encode(number)) == number
+            assert abs(float(number) - value) <= 1e-6, (number, value)
@@ -0,0 +1,35 @@
+''' Unit tests for the AwsTweetArchive class. '''
+
+from boto.dynamodb2.table import Table
+from ConfigParser import ConfigParser
+
+from smcity.models.aws.aws_tweet_archive import AwsTweetArchive
+
+class TestAwsTweetArchive():
+    ''' Unit tests for the AwsTweetArchive class. '''
+
+    def setup(self):
+        ''' Set up before each test. '''
+        config = ConfigParser()
+        config.add_section('database')
+        config.set('database', 'archive_table', 'test_archive')
+        self.archive = AwsTweetArchive(config)
+
+        # Empty the test table
+        for record in Table('test_archive').scan():
+            record.delete()
+
+    def test_add_rollup(self):
+        ''' Tests archiving an hour and reading its cells back. '''
+        assert self.archive.is_rolled_up('2014-01-01 00') == False
+
+        self.archive.add_rollup('2014-01-01 00', {
+            '0_0' : {'count' : 3, 'terms' : {'coffee' : 2}},
+            '100_100' : {'count' : 1, 'terms' : {}}
+        })
+
+        assert self.archive.is_rolled_up('2014-01-01 00') == True
+        coordinate_box = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 0.5, 'max_lon' : 0.5}
+        cells = self.archive.get_cells('2014-01-01 00', coordinate_box)
+        assert cells == [{'lat' : 0.005, 'lon' : 0.005, 'count' : 3, 'terms' : {'coffee' : 2}}], cells
+        assert len(self.archive.get_cells('2014-01-01 00')) == 2
@@ -0,0 +1,79 @@
+''' Interface definition and in-process implementation of the job completion notification channel. '''
+
+import time
+
+from collections import deque
+from threading import Condition
+
+class CompletionNotifier:
+    ''' Channel used by the reducer to announce that jobs have finished. '''
+
+    def notify_finished(self, job_id):
+        '''
+        Announces that the specified job has finished.
+
+        @param job_id Tracking id of the finished job
+        @paramType string/uuid
+        @returns n/a
+        '''
+        raise NotImplementedError()
+
+    def wait_until_finished(self, job_id, timeout):
+        '''
+        Blocks until the specified job is announced as finished or the timeout expires.
+
+        @param job_id Tracking id of the job
+        @paramType string/uuid
+        @param timeout Blocking limit in seconds
+        @paramType float
+        @returns Whether or not the job was announced as finished
+        @returnType boolean
+        '''
+        raise NotImplementedError()
+
+class LocalCompletionNotifier(CompletionNotifier):
+    ''' In-process completion notification channel. '''
+
+    def __init__(self, max_remembered=10000):
+        '''
+        Constructor.
+
+        @param max_remembered # of finished jobs to remember for late waiters
+        @paramType int
+        @returns n/a
+        '''
+        assert max_remembered > 0, max_remembered
+
+        self.condition = Condition()
+        self.finished_jobs = set()
+        self.finished_order = deque()
+        self.max_remembered = max_remembered
+
+    def notify_finished(self, job_id):
+        ''' {@inheritDocs} '''
+        job_id = str(job_id)
+
+        with self.condition:
+            if job_id not in self.finished_jobs:
+                self.finished_jobs.add(job_id)
+                self.finished_order.append(job_id)
+
+                if len(self.finished_order) > self.max_remembered: # Forget the oldest job
+                    self.finished_jobs.discard(self.finished_order.popleft())
+
+            self.condition.notify_all()
+
+    def wait_until_finished(self, job_id, timeout):
+        ''' {@inheritDocs} '''
+        job_id = str(job_id)
+        deadline = time.time() + timeout
+
+        with self.condition:
+            while job_id not in self.finished_jobs:
+                remaining = deadline - time.time()
+                if remaining <= 0: # Ran out of time
+                    return False
+
+                self.condition.wait(remaining)
+
+        return True
@@ -0,0 +1,94 @@
+''' Weighted fair choice between the map queue's priority lanes and per-job concurrency caps. '''
+
+import time
+
+from threading import Lock
+
+class FairScheduler:
+    '''
+    Decides which priority lane a compute node takes its next task from, and how many of a job's
+    tasks the compute node may work on at once. Lanes are served by smooth weighted round robin,
+    so a lane with weight 4 is offered four tasks for every one of a lane with weight 1, yet the
+    lighter lane is never starved and an empty lane gives its turn away. Shared by every worker
+    thread of a process.
+    '''
+
+    def __init__(self, lane_weights, max_tasks_per_job=None, lease_seconds=300, clock=time.time):
+        '''
+        Constructor.
+
+        @param lane_weights Relative share of the tasks taken from each lane
+        @paramType dictionary of lane name, positive int pairs
+        @param max_tasks_per_job # of a job's tasks which may be worked on at once, None for no cap
+        @paramType int
+        @param lease_seconds Seconds after which a started task no longer counts against its job's
+        cap, in case the task failed without being finished
+        @paramType float
+        @param clock Returns the current time in seconds
+        @paramType function
+        @returns n/a
+        '''
+        assert len(lane_weights) > 0
+        assert min(lane_weights.values()) > 0, lane_weights
+        assert max_tasks_per_job is None or max_tasks_per_job > 0, max_tasks_per_job
+
+        self.clock = clock
+        self.lane_weights = lane_weights
+        self.lease_seconds = lease_seconds
+        self.lock = Lock()
+        self.max_tasks_per_job = max_tasks_per_job
+
+        self.current_weights = dict([(lane, 0) for lane in lane_weights.keys()])
+        self.job_tasks = {} # Job id to the start times of its tasks being worked on
+
+    def finish_task(self, job_id):
+        '''
+        Records that one of the job's tasks is no longer being worked on.
+
+        @param job_id Id of the job
+        @paramType string/uuid
+        @returns n/a
+        '''
+        with self.lock:
+            start_times = self.job_tasks.get(job_id)
+            if start_times: # Forget the oldest, the others may still be running
+                start_times.pop(0)
+                if len(start_times) == 0:
+                    del self.job_tasks[job_id]
+
+    def get_lane_order(self):
+        '''
+        @returns Lanes in the order they should be checked for the next task, the lane whose turn
+        it is first
+        @returnType list of strings
+        '''
+        with self.lock:
+            for lane, weight in self.lane_weights.items():
+                self.current_weights[lane] += weight
+
+            order = sorted(self.current_weights.keys(), key=lambda lane: (-self.current_weights[lane], lane))
+            self.current_weights[order[0]] -= sum(self.lane_weights.values())
+
+            return order
+
+    def try_start_task(self, job_id):
+        '''
+        Records that one of the job's tasks is being worked on, unless the job is at its cap.
+
+        @param job_id Id of the job
+        @paramType string/uuid
+        @returns Whether the task may be worked on
+        @returnType boolean
+        '''
+        with self.lock:
+            now = self.clock()
+            start_times = [started_at for started_at in self.job_tasks.get(job_id, [])
+                if now - started_at < self.lease_seconds]
+
+            if self.max_tasks_per_job is not None and len(start_times) >= self.max_tasks_per_job:
+                self.job_tasks[job_id] = start_times
+                return False
+
+            start_times.append(now)
+            self.job_tasks[job_id] = start_times
+            return True
@@ -3,7 +3,7 @@
 class Job:
     ''' Models a compute job and its underlying database record. '''
 
-    def add_result(self, coordinate_box, result):
+    def add_result(self, coordinate_box, result, error=None):
         '''
         Adds to the accumulating results for the area of interest.
     
@@ -11,7 +11,12 @@ class Job:
         @paramType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
         @param results Result for the area
         @paramType typically float, but anything that handles str()
-        @returns n/a
+        @param error Half width of the 95% confidence interval of an estimated result, None if exact.
+        Stored under the result's 'error' key.
+        @paramType float
+        @returns Whether the result was added. Results for an area which already reported in, such
+        as those of a speculative duplicate task, or for an area which was split are dropped.
+        @returnType boolean
         '''
         raise NotImplementedError()
 
@@ -27,6 +32,33 @@ class Job:
         '''
         raise NotImplementedError()
 
+    def add_task_split(self, coordinate_box):
+        '''
+        Records that the task covering the area was split into smaller tasks, so it is no longer
+        waited on and any result reported for the whole area is dropped in favour of the pieces'
+        results. A result reported earlier by a speculative duplicate is kept in the result log,
+        but superseded, see get_result_log().
+
+        @param coordinate_box Area of the split task
+        @paramType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+        @returns n/a
+        '''
+        raise NotImplementedError()
+
+    def add_task_start(self, task, started_at):
+        '''
+        Records that a compute node started working on the task. Only the earliest start of each
+        area is kept, and starts of areas which already reported in or were split are ignored.
+        Only the task's summary is kept, see summarize_task().
+
+        @param task Task being performed
+        @paramType dictionary with keys 'job_id', 'task', 'coordinate_box'
+        @param started_at When the task was started, in seconds since the epoch
+        @paramType float
+        @returns n/a
+        '''
+        raise NotImplementedError()
+
     def get_id(self):
         '''
         @returns Id of the job
@@ -34,6 +66,20 @@ class Job:
         '''
         raise NotImplementedError()
 
+    def get_num_sub_areas(self):
+        '''
+        @returns # of sub areas results are expected for
+        @returnType int
+        '''
+        raise NotImplementedError()
+
+    def get_pending_tasks(self):
+        '''
+        @returns Summaries of the tasks which were started but have not reported in yet
+        @returnType list of dictionaries with keys 'task' and 'started_at'
+        '''
+        raise NotImplementedError()
+
     def get_polygon_strategy(self):
         '''
         @returns The polygon strategy used to break down the job's area of interest
@@ -41,9 +87,20 @@ class Job:
         '''
         raise NotImplementedError()
 
+    def get_result_log(self):
+        '''
+        @returns Every result added so far, in the order they were added, and the positions of
+        those superseded since by the results of their area's pieces. The log is only appended
+        to, so positions in it stay valid.
+        @returnType tuple (list of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat',
+        'max_lon', 'result', set of int)
+        '''
+        raise NotImplementedError()
+
     def get_results(self):
         '''
-        @returns Results so far for the job's area of interest
+        @returns Results so far for the job's area of interest, in the order they were added,
+        without the superseded ones
         @returnType list of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
         '''
         raise NotImplementedError()
@@ -62,6 +119,20 @@ class Job:
         '''
         raise NotImplementedError()
 
+    def get_task_durations(self):
+        '''
+        @returns Seconds between the most recent tasks being started and their results being added
+        @returnType list of float
+        '''
+        raise NotImplementedError()
+
+    def is_cancelled(self):
+        '''
+        @returns Whether or not the job was cancelled, in which case any further results are discarded
+        @returnType boolean
+        '''
+        raise NotImplementedError()
+
     def is_finished(self):
         '''
         @returns Whether or not the job is finished
@@ -90,6 +161,29 @@ class Job:
 class JobFactory:
     ''' Constructs and fetches job instances. '''
 
+    def add_sub_areas(self, job_id, num_sub_areas):
+        '''
+        Atomically grows the # of sub areas the job expects results for, e.g. when a task is split.
+
+        @param job_id Id of the job
+        @paramType string/uuid
+        @param num_sub_areas # of sub areas to add
+        @paramType int
+        @returns n/a
+        '''
+        raise NotImplementedError()
+
+    def cancel_job(self, job_id):
+        '''
+        Marks the job cancelled. Its pending tasks are dropped as compute nodes come across them,
+        running tasks are abandoned and late results are discarded.
+
+        @param job_id Id of the job
+        @paramType string/uuid
+        @returns n/a
+        '''
+        raise NotImplementedError()
+
     def create_job(self, task, polygon_strategy, num_sub_areas):
         '''
         Creates a new job instance.
@@ -115,3 +209,25 @@ class JobFactory:
         @returnType Job
         '''
         raise NotImplementedError()
+
+    def is_job_cancelled(self, job_id):
+        '''
+        Lightweight cancellation check which avoids fetching and parsing the job's results.
+
+        @param job_id Id of the job
+        @paramType string/uuid
+        @returns Whether or not the job was cancelled
+        @returnType boolean
+        '''
+        raise NotImplementedError()
+
+    def is_job_finished(self, job_id):
+        '''
+        Lightweight status check which avoids fetching and parsing the job's results.
+
+        @param job_id Id of the job
+        @paramType string/uuid
+        @returns Whether or not the job is finished
+        @returnType boolean
+        '''
+        raise NotImplementedError()
@@ -1,8 +1,43 @@
 ''' Interface definition for the mapped task queue. '''
 
+# Priority lanes, interactive tasks are served ahead of batch tasks without starving them
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+
+# Keys of a task small enough to be copied into progress reports, see summarize_task()
+TASK_OPTIONS = ('job_id', 'task', 'priority', 'sample_rate', 'time_range')
+
+def summarize_task(task):
+    '''
+    @param task Task as retrieved from the map queue
+    @paramType dictionary
+    @returns Copy of the task holding only its options and the bounds of its coordinate box, leaving
+    out payloads like polygon rings and regions, which can be restored from the job's polygon strategy
+    @returnType dictionary
+    '''
+    summary = dict([(key, task[key]) for key in TASK_OPTIONS if key in task])
+    summary['coordinate_box'] = dict([(key, task['coordinate_box'][key])
+        for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon')])
+
+    return summary
+
 class MapQueue:
     ''' Interface for requesting the execution of tasks by the computing nodes '''
 
+    def extend_task(self, task, visibility_timeout):
+        '''
+        Keeps the task hidden from other compute nodes for a while longer, so long running tasks
+        are not handed out and computed twice.
+
+        @param task Task being performed, as retrieved via get_task()
+        @paramType dictionary
+        @param visibility_timeout Seconds from now the task stays hidden for
+        @paramType int
+        @returns Whether the task was still in progress
+        @returnType boolean
+        '''
+        raise NotImplementedError()
+
     def finish_task(self, task):
         '''
         Removes the provided task from the queue, preventing any other compute nodes from trying
@@ -15,9 +50,17 @@ class MapQueue:
         '''
         raise NotImplementedError()
 
+    def get_num_tasks(self):
+        '''
+        @returns Approximate # of tasks waiting in the queue, not counting those in progress
+        @returnType int
+        '''
+        raise NotImplementedError()
+
     def get_task(self):
         '''
-        Retrieves the next task in the queue.
+        Retrieves the next task in the queue, choosing between the priority lanes by their weights
+        and passing over tasks of jobs which already have as many tasks running as they may.
  
         @returns dictionary with at least keys 'job_id', 'task', 'coordinate_box' or 
         None if no task is available
@@ -25,7 +68,8 @@ class MapQueue:
         '''
         raise NotImplementedError()
 
-    def request_count_tweets(self, polygon_strategy):
+    def request_count_tweets(self, polygon_strategy, sort_key=None, sample_rate=None, priority=INTERACTIVE,
+                             time_range=None):
         '''
         Submits the requests needed to count the number of tweets in the area described by the 
         provides polygon strategy.
@@ -33,7 +77,45 @@ class MapQueue:
         @param polygon_strategy Describes the area of interest and how to break it down into
         component areas
         @paramType PolygonStrategy
+        @param sort_key Orders the component areas' requests, those with the lowest keys are
+        submitted first. If None, the polygon strategy's order is used.
+        @paramType function accepting a coordinate box dictionary
+        @param sample_rate Fraction of the tweets to read, trading accuracy for latency and read
+        cost. Counts are then estimated from the sample and carry the half width of their 95%
+        confidence interval under the result's 'error' key. If None, counts are exact.
+        @paramType float in (0, 1]
+        @param priority Lane the requests are queued in, INTERACTIVE or BATCH. Large background jobs
+        belong in the BATCH lane, so they do not hold up interactive requests.
+        @paramType string
+        @param time_range Only counts tweets made between the two times, inclusive. Hours which were
+        rolled up into the archive are counted from it, whole and at the archive's resolution. If
+        None, every tweet still kept is counted. Format: YYYY-MM-dd HH24:mm:ss
+        @paramType tuple of strings (start, end)
         @returns Tracking id of the job
         @returnType string/uuid
         '''
         raise NotImplementedError()
+
+    def request_speculative_task(self, task):
+        '''
+        Queues a duplicate of a task which is lagging behind, whichever copy reports in first
+        provides the result. The duplicate is marked with key 'speculative' and is never split.
+
+        @param task Task to be duplicated
+        @paramType dictionary with keys 'job_id', 'task', 'coordinate_box'
+        @returns n/a
+        '''
+        raise NotImplementedError()
+
+    def split_task(self, task, coordinate_boxes):
+        '''
+        Replaces the task with a copy for each of the provided sub-boxes so idle compute nodes can
+        share the work. The job's expected # of sub areas is grown before the copies are queued.
+
+        @param task Task to be split, as retrieved via get_task()
+        @paramType dictionary
+        @param coordinate_boxes Sub-boxes covering the task's coordinate box
+        @paramType list of dictionaries
+        @returns n/a
+        '''
+        raise NotImplementedError()
@@ -0,0 +1,186 @@
+''' Token bucket rate limiting of storage access, optionally coordinated across hosts. '''
+
+import time
+
+from threading import Lock
+
+# Shortfall of tokens small enough to be rounding error
+TOKEN_TOLERANCE = 1e-9
+
+class TokenStore:
+    ''' Interface for a token bucket shared by every process drawing on the same budget. '''
+
+    def take_tokens(self, bucket, amount, rate, burst):
+        '''
+        Takes up to the requested # of tokens out of the shared bucket.
+
+        @param bucket Name of the bucket
+        @paramType string
+        @param amount # of tokens wanted
+        @paramType float
+        @param rate # of tokens the bucket refills with per second
+        @paramType float
+        @param burst Largest # of tokens the bucket holds
+        @paramType float
+        @returns # of tokens taken, between 0 and amount
+        @returnType float
+        '''
+        raise NotImplementedError()
+
+class LocalTokenStore(TokenStore):
+    ''' In memory stand-in for a shared token store, only shared by the threads of a process. '''
+
+    def __init__(self, clock=time.time):
+        '''
+        Constructor.
+
+        @param clock Returns the current time in seconds
+        @paramType function
+        @returns n/a
+        '''
+        self.buckets = {} # Bucket name to (# of tokens, when it was last refilled)
+        self.clock = clock
+        self.lock = Lock()
+
+    def take_tokens(self, bucket, amount, rate, burst):
+        ''' {@inheritDocs} '''
+        with self.lock:
+            now = self.clock()
+            tokens, updated_at = self.buckets.get(bucket, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+
+            taken = min(amount, tokens)
+            self.buckets[bucket] = (tokens - taken, now)
+
+            return taken
+
+class TokenBucketRateLimiter:
+    '''
+    Thread safe token bucket limiting the rate of a process' storage requests. Throttling reported
+    by the storage halves the rate, which then recovers gradually towards the configured rate, so
+    the process settles just below the throughput the storage actually grants instead of retrying
+    in bursts. If given a token store, tokens are also leased from a bucket shared by every process
+    on the same budget, capping their combined rate.
+    '''
+
+    def __init__(self, rate, burst=None, min_rate=None, recovery=0.05, token_store=None, bucket=None,
+                 shared_rate=None, clock=time.time, sleep=time.sleep):
+        '''
+        Constructor.
+
+        @param rate # of tokens granted per second to this process
+        @paramType float
+        @param burst Largest # of tokens granted at once after a quiet spell, defaults to a second's worth
+        @paramType float
+        @param min_rate Lowest rate throttling may push the rate down to, defaults to a tenth of the rate
+        @paramType float
+        @param recovery Fraction of the configured rate regained per second without throttling
+        @paramType float
+        @param token_store Store holding the bucket shared with other processes, if any
+        @paramType TokenStore
+        @param bucket Name of the shared bucket
+        @paramType string
+        @param shared_rate # of tokens granted per second across all of the processes sharing the bucket
+        @paramType float
+        @param clock Returns the current time in seconds
+        @paramType function
+        @param sleep Waits for the given # of seconds
+        @paramType function
+        @returns n/a
+        '''
+        assert rate > 0, rate
+        assert token_store is None or (bucket is not None and shared_rate > 0), (bucket, shared_rate)
+
+        self.bucket = bucket
+        self.burst = float(burst if burst is not None else rate)
+        self.clock = clock
+        self.lock = Lock()
+        self.max_rate = float(rate)
+        self.min_rate = float(min_rate if min_rate is not None else rate / 10.0)
+        self.rate = float(rate)
+        self.recovery = recovery
+        self.shared_rate = shared_rate
+        self.sleep = sleep
+        self.token_store = token_store
+
+        self.leased_tokens = 0.0 # Taken from the shared bucket but not granted yet
+        self.tokens = self.burst
+        self.updated_at = clock()
+
+    def acquire(self, amount=1):
+        '''
+        Blocks until the tokens are granted.
+
+        @param amount # of tokens needed, e.g. the # of capacity units about to be consumed. Requests
+        for more than the burst are granted once the bucket is full, later requests repaying the debt.
+        @paramType float
+        @returns Seconds spent waiting
+        @returnType float
+        '''
+        assert amount > 0, amount
+
+        needed = min(amount, self.burst)
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens + TOKEN_TOLERANCE < needed: # Wait for this process' bucket to refill
+                    wait = (needed - self.tokens) / self.rate
+                elif not self._lease(needed): # Wait for the shared bucket to refill
+                    wait = (needed - self.leased_tokens) / self.shared_rate
+                else:
+                    self.tokens -= amount
+                    self.leased_tokens -= amount
+                    return waited
+
+            self.sleep(wait)
+            waited += wait
+
+    def get_rate(self):
+        '''
+        @returns Current # of tokens granted per second to this process
+        @returnType float
+        '''
+        return self.rate
+
+    def report_throttled(self):
+        '''
+        Reports that the storage throttled a request, halving the rate.
+
+        @returns n/a
+        '''
+        with self.lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2.0)
+            self.tokens = min(self.tokens, 0.0) # Let the storage recover before the next request
+
+    def _lease(self, amount):
+        '''
+        @param amount # of tokens about to be granted
+        @paramType float
+        @returns Whether enough tokens are leased from the shared bucket, always True without one
+        @returnType boolean
+        '''
+        if self.token_store is None:
+            self.leased_tokens = amount
+            return True
+
+        if self.leased_tokens + TOKEN_TOLERANCE < amount: # Lease a tenth of a second's worth at a time
+            wanted = max(amount - self.leased_tokens, self.rate / 10.0)
+            self.leased_tokens += self.token_store.take_tokens(
+                self.bucket, wanted, self.shared_rate, max(self.shared_rate, wanted))
+
+        return self.leased_tokens + TOKEN_TOLERANCE >= amount
+
+    def _refill(self):
+        '''
+        Adds the tokens accrued since the last refill and lets the rate recover.
+
+        @returns n/a
+        '''
+        now = self.clock()
+        elapsed = max(0.0, now - self.updated_at)
+        self.updated_at = now
+
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.rate = min(self.max_rate, self.rate + elapsed * self.recovery * self.max_rate)
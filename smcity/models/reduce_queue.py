@@ -17,7 +17,10 @@ class ReduceQueue:
 
     def get_result(self):
         '''
-        Retrieves a task result from the queue.
+        Retrieves a task result from the queue. Task splits and starts reported via post_task_split()
+        and post_task_started() are retrieved too, their 'task' being 'task_split' and 'task_started'.
+        Results posted via post_combined_results() are retrieved as one result whose 'task' is
+        'count_tweets_combined', the individual results under 'results' and the starts under 'starts'.
 
         @returns dictionary with at least keys 'job_id', 'task', 'coordinate_box' or None if
         no result is available
@@ -25,7 +28,21 @@ class ReduceQueue:
         '''
         raise NotImplementedError()
 
-    def post_count_tweets_result(self, job_id, coordinate_box, count):
+    def post_combined_results(self, job_id, results, starts=None):
+        '''
+        Submits the results and starts of several of the job's count tweet tasks as a single message.
+
+        @param job_id Tracking id of the job
+        @paramType uuid/string
+        @param results Results of the tasks, see post_count_tweets_result() for the values
+        @paramType list of dictionaries with keys 'coordinate_box', 'result' and optionally 'error'
+        @param starts Starts of tasks, see post_task_started(), if any
+        @paramType list of dictionaries with keys 'task', 'started_at'
+        @returns n/a
+        '''
+        raise NotImplementedError()
+
+    def post_count_tweets_result(self, job_id, coordinate_box, count, error=None):
         '''
         Submits the results of a count tweet task.
 
@@ -33,8 +50,35 @@ class ReduceQueue:
         @paramType uuid/string
         @param coordinate_box Box in which the tweets were counted
         @paramType dictionary
-        @param count # of tweets in the coordinate_box
-        @paramType int
+        @param count # of tweets in the coordinate_box, or the # of tweets of each region keyed by
+        region id for multi-region tiles
+        @paramType int or dictionary
+        @param error Half width of the 95% confidence interval of an estimated count, None if exact
+        @paramType float
+        @returns n/a
+        '''
+        raise NotImplementedError()
+
+    def post_task_split(self, task):
+        '''
+        Reports that the task was split into smaller tasks instead of being performed.
+
+        @param task Task which was split, as retrieved from the map queue
+        @paramType dictionary with keys 'job_id', 'task', 'coordinate_box'
+        @returns n/a
+        '''
+        raise NotImplementedError()
+
+    def post_task_started(self, task, started_at):
+        '''
+        Reports that a compute node started working on the task, so stragglers can be spotted.
+        Retrieved via get_result() with 'task' set to 'task_started', the task's summary under
+        'started_task' (see summarize_task()) and the start time under 'started_at'.
+
+        @param task Task being performed, as retrieved from the map queue
+        @paramType dictionary with keys 'job_id', 'task', 'coordinate_box'
+        @param started_at When the task was started, in seconds since the epoch
+        @paramType float
         @returns n/a
         '''
         raise NotImplementedError()
@@ -0,0 +1,29 @@
+''' Interface definition of the store holding the region sets of multi-region jobs. '''
+
+class RegionStore:
+    '''
+    Keeps the outlines of region sets apart from the jobs counting them, so neither the job record
+    nor the tasks need to carry hundreds of region outlines. Region sets never change once added.
+    '''
+
+    def add_regions(self, regions):
+        '''
+        Stores a new set of regions.
+
+        @param regions Regions of interest
+        @paramType list of dictionaries with keys 'name' and 'geometry' (GeoJSON Polygon or MultiPolygon)
+        @returns Tracking id of the region set
+        @returnType string/uuid
+        '''
+        raise NotImplementedError()
+
+    def get_regions(self, region_set_id):
+        '''
+        @param region_set_id Tracking id of the region set
+        @paramType string/uuid
+        @returns Regions of the set, in the order they were added. Each region's id is its position.
+        @returnType list of dictionaries with keys 'name' and 'geometry'
+        @throws If no such region set exists
+        @throwType ReadError
+        '''
+        raise NotImplementedError()
@@ -0,0 +1,67 @@
+''' Interface definition of the store sharing standing queries between processes. '''
+
+class StandingQueryStore:
+    '''
+    Shares the standing queries between the API processes, which register them and read their
+    results, and the stream listener, which maintains them as tweets arrive and publishes their counts.
+    '''
+
+    def add_query(self, polygon_strategy, bucket_size, num_buckets):
+        '''
+        Registers a new standing query, picked up by the stream listener on its next sync.
+
+        @param polygon_strategy Describes the area of interest and how to break it down into
+        component areas
+        @paramType PolygonStrategy
+        @param bucket_size Width of each time bucket in seconds
+        @paramType int
+        @param num_buckets # of time buckets kept, the window spans bucket_size * num_buckets seconds
+        @paramType int
+        @returns Tracking id of the standing query
+        @returnType string/uuid
+        '''
+        raise NotImplementedError()
+
+    def get_queries(self):
+        '''
+        @returns Every registered standing query, keyed by tracking id
+        @returnType dictionary of dictionaries with keys 'polygon_strategy', 'bucket_size', 'num_buckets'
+        '''
+        raise NotImplementedError()
+
+    def get_query(self, query_id):
+        '''
+        @param query_id Tracking id of the standing query
+        @paramType string/uuid
+        @returns The standing query and its counts as last published, which are None until the
+        stream listener picked the query up
+        @returnType dictionary with keys 'polygon_strategy', 'bucket_size', 'num_buckets', 'counts'
+        (list of ints in the order of the polygon strategy's result boxes), 'updated_at'
+        @throws If no such query is registered
+        @throwType ReadError
+        '''
+        raise NotImplementedError()
+
+    def remove_query(self, query_id):
+        '''
+        Unregisters the standing query, dropped by the stream listener on its next sync.
+
+        @param query_id Tracking id of the standing query
+        @paramType string/uuid
+        @returns n/a
+        '''
+        raise NotImplementedError()
+
+    def save_counts(self, query_id, counts, updated_at):
+        '''
+        Publishes the current counts of the standing query.
+
+        @param query_id Tracking id of the standing query
+        @paramType string/uuid
+        @param counts Count of each of the polygon strategy's result boxes, in order
+        @paramType list of ints
+        @param updated_at Time at which the counts' window ends in seconds since the epoch
+        @paramType float
+        @returns n/a
+        '''
+        raise NotImplementedError()
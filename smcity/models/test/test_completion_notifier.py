@@ -0,0 +1,37 @@
+''' Unit tests for the LocalCompletionNotifier class. '''
+
+import time
+
+from threading import Thread
+
+from smcity.models.completion_notifier import LocalCompletionNotifier
+
+class TestLocalCompletionNotifier:
+    ''' Unit tests for the LocalCompletionNotifier class. '''
+
+    def test_wait_until_finished(self):
+        ''' Tests the wait_until_finished function. '''
+        notifier = LocalCompletionNotifier()
+
+        # Try to wait on a job that never finishes
+        assert not notifier.wait_until_finished('job_id', 0.1)
+
+        # Wait on a job that finishes while we're waiting
+        Thread(target=lambda: (time.sleep(0.1), notifier.notify_finished('job_id'))).start()
+        start_time = time.time()
+        assert notifier.wait_until_finished('job_id', 5)
+        assert time.time() - start_time < 1, time.time() - start_time
+
+        # Late waiters are told straight away
+        assert notifier.wait_until_finished('job_id', 0)
+
+    def test_max_remembered(self):
+        ''' Tests that only the most recently finished jobs are remembered. '''
+        notifier = LocalCompletionNotifier(max_remembered=2)
+        notifier.notify_finished('job1')
+        notifier.notify_finished('job2')
+        notifier.notify_finished('job3')
+
+        assert not notifier.wait_until_finished('job1', 0)
+        assert notifier.wait_until_finished('job2', 0)
+        assert notifier.wait_until_finished('job3', 0)
@@ -0,0 +1,48 @@
+''' Unit tests for the FairScheduler class. '''
+
+from smcity.models.fair_scheduler import FairScheduler
+
+class MockClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+class TestFairScheduler:
+    ''' Unit tests for the FairScheduler class. '''
+
+    def test_get_lane_order(self):
+        ''' Tests that the lanes are offered the first turn in proportion to their weights. '''
+        scheduler = FairScheduler({'interactive' : 4, 'batch' : 1})
+
+        orders = [scheduler.get_lane_order() for index in range(10)]
+
+        firsts = [order[0] for order in orders]
+        assert firsts.count('interactive') == 8, firsts
+        assert firsts.count('batch') == 2, firsts
+        assert 'batch' in firsts[:5], firsts # Interleaved, not starved
+        assert all([sorted(order) == ['batch', 'interactive'] for order in orders]), orders
+
+    def test_try_start_task(self):
+        ''' Tests that a job's tasks are capped until some of them finish. '''
+        scheduler = FairScheduler({'interactive' : 1}, max_tasks_per_job=2)
+
+        assert scheduler.try_start_task('job1') == True
+        assert scheduler.try_start_task('job1') == True
+        assert scheduler.try_start_task('job1') == False
+        assert scheduler.try_start_task('job2') == True # Other jobs are unaffected
+
+        scheduler.finish_task('job1')
+        assert scheduler.try_start_task('job1') == True
+
+    def test_try_start_task_lease(self):
+        ''' Tests that tasks which were never finished stop counting against the cap. '''
+        clock = MockClock()
+        scheduler = FairScheduler({'interactive' : 1}, max_tasks_per_job=1, lease_seconds=60, clock=clock.time)
+
+        assert scheduler.try_start_task('job1') == True
+        assert scheduler.try_start_task('job1') == False
+
+        clock.now += 61
+        assert scheduler.try_start_task('job1') == True
@@ -0,0 +1,84 @@
+''' Unit tests for the rate limiter and the local token store. '''
+
+from smcity.models.rate_limiter import LocalTokenStore, TokenBucketRateLimiter
+
+class MockClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def time(self):
+        return self.now
+
+class TestTokenBucketRateLimiter:
+    ''' Unit tests for the TokenBucketRateLimiter class. '''
+
+    def setup(self):
+        ''' Set up before each test. '''
+        self.clock = MockClock()
+
+    def create_limiter(self, rate, **kwargs):
+        return TokenBucketRateLimiter(rate, clock=self.clock.time, sleep=self.clock.sleep, **kwargs)
+
+    def test_acquire(self):
+        ''' Tests that tokens are granted at the configured rate after the initial burst. '''
+        limiter = self.create_limiter(10)
+
+        waited = sum([limiter.acquire() for index in range(30)])
+
+        assert abs(waited - 2.0) < 1e-6, waited # The first 10 are the burst, the next 20 take 2 secs
+
+    def test_acquire_over_burst(self):
+        ''' Tests that requests larger than the burst are granted and repaid. '''
+        limiter = self.create_limiter(10)
+
+        assert limiter.acquire(25) == 0 # Granted on a full bucket
+        assert abs(limiter.acquire(1) - 1.6) < 1e-6 # Repays the 15 token debt first
+
+    def test_report_throttled(self):
+        ''' Tests that throttling halves the rate, which then recovers. '''
+        limiter = self.create_limiter(10, min_rate=2, recovery=0.1)
+
+        limiter.report_throttled()
+        assert limiter.get_rate() == 5
+        limiter.report_throttled()
+        limiter.report_throttled()
+        assert limiter.get_rate() == 2 # Floored at the minimum rate
+
+        self.clock.sleep(5) # Regains a tenth of the rate per second
+        limiter.acquire()
+        assert abs(limiter.get_rate() - 7) < 1e-6, limiter.get_rate()
+
+        self.clock.sleep(60)
+        limiter.acquire()
+        assert limiter.get_rate() == 10 # Capped at the configured rate
+
+    def test_shared_bucket(self):
+        ''' Tests that processes sharing a bucket are held to its rate between them. '''
+        token_store = LocalTokenStore(clock=self.clock.time)
+        limiters = [self.create_limiter(10, token_store=token_store, bucket='read', shared_rate=10)
+            for index in range(2)]
+
+        waited = 0.0
+        for index in range(20):
+            waited += limiters[index % 2].acquire()
+
+        # Either process alone could have taken 20 tokens in 1 sec, together they only get 10 per sec
+        assert waited > 0.9, waited
+
+class TestLocalTokenStore:
+    ''' Unit tests for the LocalTokenStore class. '''
+
+    def test_take_tokens(self):
+        ''' Tests that the bucket starts full, runs dry and refills at the rate. '''
+        clock = MockClock()
+        token_store = LocalTokenStore(clock=clock.time)
+
+        assert token_store.take_tokens('read', 8, 5, 10) == 8
+        assert token_store.take_tokens('read', 8, 5, 10) == 2
+        assert token_store.take_tokens('write', 1, 5, 10) == 1 # Buckets are independent
+
+        clock.sleep(1)
+        assert token_store.take_tokens('read', 8, 5, 10) == 5
@@ -1,5 +1,6 @@
 ''' Unit tests for the tweets model and factory. '''
 
+import calendar
 import datetime
 import logging
 import time
@@ -7,10 +8,51 @@ import time
 from boto.dynamodb2.table import Table
 from ConfigParser import ConfigParser
 
-from smcity.models.tweet import TweetFactory, TweetJanitor
+from smcity.models.tweet import TweetFactory, TweetIterator, TweetJanitor, scan_metered
 
 logger = logging.getLogger(__name__)
 
+class MockConnection:
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def scan(self, table_name, **kwargs):
+        self.requests.append(kwargs)
+        return self.pages[len(self.requests) - 1]
+
+class MockReadLimiter:
+    def __init__(self):
+        self.acquired = []
+
+    def acquire(self, amount=1):
+        self.acquired.append(amount)
+        return 0.0
+
+def make_raw_tweet(id):
+    return {'id' : {'S' : id}, 'timestamp' : {'S' : '2013-01-01 01:01:01'}, 'lat' : {'N' : '0'},
+        'lon' : {'N' : '0'}, 'message' : {'S' : 'message'}}
+
+class TestScanMetered:
+    ''' Unit tests for the scan_metered function. '''
+
+    def test_scan_metered(self):
+        ''' Tests that each page is charged its consumed capacity, however few tweets it matched. '''
+        connection = MockConnection([
+            {'Items' : [make_raw_tweet('user1')], 'ScannedCount' : 500,
+                'ConsumedCapacity' : {'CapacityUnits' : 62.5}, 'LastEvaluatedKey' : {'id' : {'S' : 'user1'}}},
+            {'Items' : [], 'ScannedCount' : 40} # Without its consumed capacity
+        ])
+        read_limiter = MockReadLimiter()
+
+        tweets = TweetIterator(scan_metered(Table('test_tweets', connection=connection), read_limiter,
+            timestamp__gte='2013-01-01 00:00:00'), read_limiter)
+
+        assert [tweet.id() for tweet in tweets] == ['user1']
+        assert read_limiter.acquired == [63, 4], read_limiter.acquired
+        assert connection.requests[0]['return_consumed_capacity'] == 'TOTAL'
+        assert connection.requests[1]['exclusive_start_key'] == {'id' : {'S' : 'user1'}}, connection.requests
+
 class TestTweetFactory:
     ''' Unit tests for the TweetFactory class. '''
 
@@ -241,6 +283,23 @@ class TestTweetJanitor:
     def teardown(self):
         self.tweet_janitor.shutdown()
 
+    def test_create_tweet_expiry(self):
+        ''' Tests that tweets are stamped with when they expire. '''
+        self.tweet_factory.create_tweet('user1', 'message', 'city', '2013-01-01 01:01:01', 0, 0)
+
+        record = self.table.get_item(id='user1', timestamp='2013-01-01 01:01:01')
+        expected = calendar.timegm(time.strptime('2013-01-01 01:01:01', '%Y-%m-%d %H:%M:%S')) + 3600
+        assert record['expires_at'] == expected, record['expires_at']
+
+    def test_delete_old_tweets(self):
+        ''' Tests that a single pass deletes exactly the old tweets. '''
+        self.tweet_factory.create_tweet('user1', 'message', 'city', '2013-01-01 01:01:01', 0, 0)
+        self.tweet_factory.create_tweet('user2', 'message', 'city',
+            datetime.datetime.fromtimestamp(time.time()).strftime('%Y-%m-%d %H:%M:%S'), 0, 0)
+
+        assert self.tweet_janitor.delete_old_tweets() == 1
+        assert [tweet.id() for tweet in self.tweet_factory.get_tweets()] == ['user2']
+
     def test_maintain_tweets(self):
         ''' Tests the maintain_tweets routine. '''
         logger.info('Setting up test data...')
@@ -0,0 +1,17 @@
+''' Unit tests for the archive cell grid helpers. '''
+
+from smcity.models.tweet_archive import get_cell, get_cell_center, get_hour
+
+class TestTweetArchive:
+    ''' Unit tests for the archive cell grid helpers. '''
+
+    def test_get_cell(self):
+        ''' Tests that points map to the cell whose center lies within a half cell of them. '''
+        assert get_cell(0.015, -0.015) == '1_-2', get_cell(0.015, -0.015)
+
+        lat, lon = get_cell_center(get_cell(47.6062, -122.3321))
+        assert abs(lat - 47.605) < 1e-9 and abs(lon + 122.335) < 1e-9, (lat, lon)
+
+    def test_get_hour(self):
+        ''' Tests truncating timestamps to their hour. '''
+        assert get_hour('2014-01-02 03:04:05') == '2014-01-02 03'
@@ -1,17 +1,91 @@
 ''' Model of the Tweets NoSQL table as well as variety of helper functions. '''
 
+import calendar
 import datetime
+import math
 import time
 import re
 
+from boto.dynamodb2.exceptions import ProvisionedThroughputExceededException
 from boto.dynamodb2.fields import AllIndex, HashKey, RangeKey
-from boto.dynamodb2.table import Table
+from boto.dynamodb2.items import Item
+from boto.dynamodb2.results import ResultSet
+from boto.dynamodb2.table import FILTER_OPERATORS, Table
 from threading import Thread
 
+from smcity.errors import ThrottledError
 from smcity.logging.logger import Logger
 
 logger = Logger(__name__)
 
+# Attribute holding when a tweet expires in seconds since the epoch, for the table's time to live
+EXPIRY_ATTRIBUTE = 'expires_at'
+
+# # of seconds in an hour, the unit of max_tweet_age
+ONE_HOUR = 3600
+
+# Rough # of tweets read per read capacity unit, used to meter scan pages lacking their consumed capacity
+TWEETS_PER_READ_UNIT = 10
+
+def scan_metered(table, read_limiter=None, segment=None, total_segments=None, attributes=None, **filters):
+    '''
+    Scans the table like Table.scan(), charging the read capacity each page consumed to the read
+    limiter. A filtered scan consumes capacity for every item it reads, whether it matches or not,
+    so metering the items returned would undercount sparse scans.
+
+    @param table Table to be scanned
+    @paramType boto.dynamodb2.table.Table
+    @param read_limiter Charged with each page's consumed read capacity, if any
+    @paramType TokenBucketRateLimiter
+    @param segment Restricts to a single segment of the table, see Table.scan()
+    @paramType int
+    @param total_segments # of segments the table is split into when segment is specified
+    @paramType int
+    @param attributes Only these attributes are read, all of them if None
+    @paramType list of strings
+    @param filters Scan filters, see Table.scan()
+    @returns Iterator over the matching records
+    @returnType boto.dynamodb2.ResultSet
+    '''
+    def scan_page(exclusive_start_key=None, limit=None):
+        kwargs = {
+            'attributes_to_get' : attributes,
+            'limit' : limit,
+            'return_consumed_capacity' : 'TOTAL',
+            'scan_filter' : table._build_filters(filters, using=FILTER_OPERATORS),
+            'segment' : segment,
+            'total_segments' : total_segments
+        }
+        if exclusive_start_key:
+            kwargs['exclusive_start_key'] = dict([(key, table._dynamizer.encode(value))
+                for key, value in exclusive_start_key.items()])
+
+        raw_results = table.connection.scan(table.table_name, **kwargs)
+
+        if read_limiter is not None: # Charged after the fact, the next page waits out the debt
+            if 'ConsumedCapacity' in raw_results:
+                units = raw_results['ConsumedCapacity']['CapacityUnits']
+            else:
+                units = raw_results.get('ScannedCount', 0) / float(TWEETS_PER_READ_UNIT)
+            read_limiter.acquire(max(1, int(math.ceil(units))))
+
+        results = []
+        for raw_item in raw_results.get('Items', []):
+            item = Item(table)
+            item.load({'Item' : raw_item})
+            results.append(item)
+
+        last_key = None
+        if raw_results.get('LastEvaluatedKey'):
+            last_key = dict([(key, table._dynamizer.decode(value))
+                for key, value in raw_results['LastEvaluatedKey'].items()])
+
+        return {'results' : results, 'last_key' : last_key}
+
+    results = ResultSet()
+    results.to_call(scan_page)
+    return results
+
 class Tweet():
     ''' Model of the Tweets NoSQL table. '''
 
@@ -48,7 +122,7 @@ class Tweet():
 class TweetFactory:
     ''' Factory pattern for creating Tweet objects and their corresponding database records. '''
 
-    def __init__(self, config):
+    def __init__(self, config, read_limiter=None):
         '''
         Constructor.
 
@@ -58,9 +132,21 @@ class TweetFactory:
         Key:         tweets_table
         Type:        string
         Description: Name of the Tweets model table
+
+        Section:     database
+        Key:         max_tweet_age
+        Type:        int
+        Description: Optional, max time a tweet is kept in hours. Tweets are stamped with when they
+                     expire, so the table's time to live can delete them.
         @paramType ConfigParser
+        @param read_limiter Limits the rate at which tweets are read, if any
+        @paramType TokenBucketRateLimiter
         @returns n/a
         '''
+        self.max_age = None
+        if config.has_option('database', 'max_tweet_age'):
+            self.max_age = config.getint('database', 'max_tweet_age')
+        self.read_limiter = read_limiter
         self.table = Table(config.get('database', 'tweets_table'), schema=[
             HashKey('id'), RangeKey('timestamp')
         ])
@@ -124,6 +210,9 @@ class TweetFactory:
             'place' : place,
             'timestamp' : timestamp
         }
+        if self.max_age is not None: # Let the table expire the tweet without a scan
+            data[EXPIRY_ATTRIBUTE] = calendar.timegm(time.strptime(timestamp, '%Y-%m-%d %H:%M:%S')) + \
+                self.max_age * ONE_HOUR
         result = self.table.put_item(data=data)
 
         # If we failed to create the database record
@@ -132,77 +221,97 @@ class TweetFactory:
             logger.error(message)
             raise Exception(message)
 
-    def get_tweets(self, age_limit=None, coordinate_box=None):
+    def get_tweets(self, age_limit=None, coordinate_box=None, segment=None, total_segments=None,
+                   time_range=None):
         '''
         Retrieves an iterator set to iterate over all tweets associated with provided city.
 
+        @param age_limit Restricts to tweets made at or after this time. Format: YYYY-MM-dd HH24:mm:ss
+        @paramType string
+        @param time_range Restricts to tweets made between the two times, inclusive. Not combined
+        with age_limit. Format: YYYY-MM-dd HH24:mm:ss
+        @paramType tuple of strings (start, end)
         @param coordinate_box Restricts to tweets within the specified coordinate box
         @paramType dictionary featuring the following keys: min_lon, min_lat, max_lon, max_lat
+        @param segment Restricts to a single segment of the table, each segment holds a random
+        1/total_segments share of the tweets
+        @paramType int
+        @param total_segments # of segments the table is split into when segment is specified
+        @paramType int
         @returns Iterator over the fetched data
         @returnType boto.dynamodb2.ResultSet
         '''
+        filters = {}
+
         if coordinate_box is not None: # Unroll the coordinate box
             assert 'min_lon' in coordinate_box.keys(), "Expected min_lon as key in coordinate_box"
             assert 'min_lat' in coordinate_box.keys(), "Expected min_lat as key in coordinate box"
             assert 'max_lon' in coordinate_box.keys(), "Expected max_lon as key in coordinate box"
             assert 'max_lat' in coordinate_box.keys(), "Expected max_lat as key in coordinate box"
 
-        if age_limit is None and coordinate_box is None: # If no coordinate box or age limit is specified
-            logger.debug("Scanning for all record...")
-            return TweetIterator(self.table.scan())
-        elif age_limit is None: # If a coordinate box is specified
-            logger.debug("Scanning for records inside coordinate box '%s'", coordinate_box)
-            return TweetIterator(
-                self.table.scan(
-                    lat__lte=int(coordinate_box['max_lat'] * 10000000),
-                    lat_copy__gte=int(coordinate_box['min_lat'] * 10000000),
-                    lon__lte=int(coordinate_box['max_lon'] * 10000000),
-                    lon_copy__gte=int(coordinate_box['min_lon'] * 10000000)
-                )
-            )
-        elif coordinate_box is None: # If the age limit is specified
-            logger.debug("Scanning for records which are newer than %s", age_limit)
-            return TweetIterator(
-                self.table.scan(timestamp__gte=age_limit)
-            )
-        else: # If both the age limit and coordinate box are specified
-            logger.debug("Scanning for records which are newer than %s and inside coordinate box '%s'",
-                age_limit, coordinate_box)
-            return TweetIterator(
-                self.table.scan(
-                    lat__lte=int(coordinate_box['max_lat'] * 10000000),
-                    lat_copy__gte=int(coordinate_box['min_lat'] * 10000000),
-                    lon__lte=int(coordinate_box['max_lon'] * 10000000),
-                    lon_copy__gte=int(coordinate_box['min_lon'] * 10000000),
-                    timestamp__gte=age_limit
-                )
-            )
+            filters['lat__lte'] = int(coordinate_box['max_lat'] * 10000000)
+            filters['lat_copy__gte'] = int(coordinate_box['min_lat'] * 10000000)
+            filters['lon__lte'] = int(coordinate_box['max_lon'] * 10000000)
+            filters['lon_copy__gte'] = int(coordinate_box['min_lon'] * 10000000)
+
+        if age_limit is not None: # Restrict to the newer tweets
+            assert time_range is None, "Expected either age_limit or time_range, not both"
+            filters['timestamp__gte'] = age_limit
+
+        if time_range is not None: # Restrict to the tweets of the time range
+            filters['timestamp__between'] = list(time_range)
+
+        if segment is not None: # Restrict to a single segment of the table
+            assert total_segments is not None, "Expected total_segments when segment is specified"
+            assert 0 <= segment < total_segments, "Expected 0 <= segment < %s, got %r" % (total_segments, segment)
+
+        logger.debug("Scanning for records newer than %s or between %s inside coordinate box '%s' " +
+            "(segment %s of %s)...", age_limit, time_range, coordinate_box, segment, total_segments)
+        return TweetIterator(
+            scan_metered(self.table, self.read_limiter, segment=segment, total_segments=total_segments, **filters),
+            self.read_limiter
+        )
 
 class TweetIterator:
     ''' Wrapper around the DynamoDB2 ResultSet iterator. '''
 
-    def __init__(self, result_set):
+    def __init__(self, result_set, read_limiter=None):
         '''
         Constructor.
 
         @param result_set DynamoDB2 ResultSet to wrap.
         @param boto.dynamodb2.ResultSet
+        @param read_limiter Limiter the scan is metered against, if any, see scan_metered(). Throttling
+        by the table is reported to it.
+        @paramType TokenBucketRateLimiter
         @returns n/a
         '''
         assert result_set is not None, "result_set must not be None!"
  
+        self.read_limiter = read_limiter
         self.result_set = result_set
 
     def __iter__(self):
         return self
 
     def next(self):
-        return Tweet(self.result_set.next())
+        try:
+            return Tweet(self.result_set.next())
+        except ProvisionedThroughputExceededException as e: # boto already retried with back off
+            if self.read_limiter is not None:
+                self.read_limiter.report_throttled()
+            raise ThrottledError("Scan throttled by the tweets table!", e)
 
 class TweetJanitor:
-    ''' Cleans up out of data tweets. '''
+    '''
+    Cleans up out of date tweets. Tweets are stamped with their expiry when created, so once the
+    tweets table's time to live is enabled on that attribute the table deletes them itself, at no
+    capacity cost, and the janitor has nothing left to do. Otherwise the janitor falls back to an
+    hourly scan for the old tweets, deleting them in batches and at a limited rate. Either way the
+    tweets can be rolled up into an archive each hour, well before they expire.
+    '''
     
-    def __init__(self, config):
+    def __init__(self, config, read_limiter=None, write_limiter=None, rollup=None):
         '''
         @param config Configuration settings. Expected definitions:
         Section:     database
@@ -214,15 +323,62 @@ class TweetJanitor:
         Key:         tweets_table
         Type:        string
         Description: Name of the Tweets model table
+
+        Section:     database
+        Key:         tweets_ttl
+        Type:        boolean
+        Description: Optional, whether the table's time to live is enabled on the expires_at
+                     attribute. If so, the janitor never scans. Defaults to False.
         @paramType ConfigParser
+        @param read_limiter Limits the rate at which the fallback scan reads tweets, if any
+        @paramType TokenBucketRateLimiter
+        @param write_limiter Limits the rate at which the fallback scan deletes tweets, if any
+        @paramType TokenBucketRateLimiter
+        @param rollup Rolls the complete hours up into the archive every hour, if any
+        @paramType TweetRollup
         @returns n/a
         '''
+        self.is_expired_by_table = config.has_option('database', 'tweets_ttl') and \
+            config.getboolean('database', 'tweets_ttl')
         self.is_shutting_down = False
         self.max_age = config.getint('database', 'max_tweet_age')
+        self.read_limiter = read_limiter
+        self.rollup = rollup
+        self.write_limiter = write_limiter
         self.table = Table(config.get('database', 'tweets_table'), schema=[
             HashKey('id'), RangeKey('timestamp')
         ])
 
+    def delete_old_tweets(self, now=None):
+        '''
+        Deletes the tweets older than the max tweet age with a single scan.
+
+        @param now Current time in seconds since the epoch, defaults to time.time()
+        @paramType float
+        @returns # of tweets deleted
+        @returnType int
+        '''
+        if now is None:
+            now = time.time()
+
+        age_limit = datetime.datetime.fromtimestamp(now - self.max_age * ONE_HOUR).strftime('%Y-%m-%d %H:%M:%S')
+        logger.info("Scanning with an age threshold of '%s'...", age_limit)
+
+        # Only the keys are needed to delete the tweets
+        tweets = TweetIterator(scan_metered(self.table, self.read_limiter, attributes=['id', 'timestamp'],
+            timestamp__lt=age_limit), self.read_limiter)
+
+        num_tweets_deleted = 0
+        with self.table.batch_write() as batch: # Sent 25 deletes at a time
+            for tweet in tweets:
+                if self.write_limiter is not None:
+                    self.write_limiter.acquire()
+                batch.delete_item(id=tweet.id(), timestamp=tweet.timestamp())
+                num_tweets_deleted += 1
+
+        logger.info("Deleted %s old tweets!", num_tweets_deleted)
+        return num_tweets_deleted
+
     def _maintain_tweets(self):
         '''
         Periodically deletes any tweets that are too old.
@@ -230,30 +386,34 @@ class TweetJanitor:
         @returns n/a
         '''
         last_scan = 0
-        one_hour = 3600
 
         while not self.is_shutting_down: # While the janitor hasn't begun the shutdown process
-            if time.time() - last_scan > one_hour: # If it's been over an hour since the last scan
-                age_limit = datetime.datetime.fromtimestamp(time.time() - self.max_age * one_hour) \
-                                             .strftime('%Y-%m-%d %H:%M:%S')
-                logger.info("Scanning with an age threshold of '%s'...", age_limit)
-
-                num_tweets_deleted = 0
-                for tweet in self.table.scan(timestamp__lt = age_limit): # Fetch all of the old tweets
-                    tweet.delete() # Delete the tweet
-                    num_tweets_deleted += 1
-                logger.info("Deleted %s old tweets!", num_tweets_deleted)
-
-                age_limit = time.time()
+            if time.time() - last_scan > ONE_HOUR: # If it's been over an hour since the last scan
+                try:
+                    if self.rollup is not None: # Archive the tweets before they expire
+                        self.rollup.roll_up()
+                    if not self.is_expired_by_table:
+                        self.delete_old_tweets()
+                except ThrottledError as e: # Try again next hour rather than compete with the workers
+                    logger.warn("Old tweet scan throttled: %s", e)
+                except:
+                    logger.exception()
+
+                last_scan = time.time()
 
             time.sleep(5) # Wait a bit before checking again 
 
     def maintain_tweets(self):
         '''
-        Spins up a thread which periodically deletes any tweets that are too old.
+        Spins up a thread which periodically rolls up the tweets and deletes any tweets that are too
+        old, unless the table expires them itself.
 
         @returns n/a
         '''
+        if self.is_expired_by_table and self.rollup is None:
+            logger.info("Tweets table expires old tweets itself, no maintenance needed.")
+            return
+
         thread = Thread(target=self._maintain_tweets)
         thread.daemon = True
         thread.start() 
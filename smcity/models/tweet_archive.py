@@ -0,0 +1,76 @@
+''' Interface definition of the archive of hourly tweet rollups, and the cell grid it is kept on. '''
+
+import math
+
+# Width and height of the archive's cells in degrees, roughly a kilometer
+ARCHIVE_CELL_SIZE = 0.01
+
+def get_cell(lat, lon):
+    '''
+    @param lat Latitude of the point
+    @paramType float
+    @param lon Longitude of the point
+    @paramType float
+    @returns Key of the archive cell containing the point
+    @returnType string
+    '''
+    return '%d_%d' % (int(math.floor(lat / ARCHIVE_CELL_SIZE)), int(math.floor(lon / ARCHIVE_CELL_SIZE)))
+
+def get_cell_center(cell):
+    '''
+    @param cell Key of the archive cell, see get_cell()
+    @paramType string
+    @returns Latitude and longitude of the cell's center
+    @returnType tuple of floats (lat, lon)
+    '''
+    lat_index, lon_index = [int(index) for index in cell.split('_')]
+    return (lat_index + 0.5) * ARCHIVE_CELL_SIZE, (lon_index + 0.5) * ARCHIVE_CELL_SIZE
+
+def get_hour(timestamp):
+    '''
+    @param timestamp Timestamp of a tweet. Format: YYYY-MM-dd HH24:mm:ss
+    @paramType string
+    @returns Hour the timestamp falls in. Format: YYYY-MM-dd HH24
+    @returnType string
+    '''
+    return timestamp[:13]
+
+class TweetArchive:
+    '''
+    Compact archive of the tweets, kept as the # of tweets and the most frequent terms per archive
+    cell per hour. Outlives the raw tweets, so counts over old time ranges can still be answered,
+    at the resolution of the cells and of whole hours.
+    '''
+
+    def add_rollup(self, hour, cells):
+        '''
+        Archives the rollup of an hour's tweets. The hour counts as rolled up once this returns.
+
+        @param hour Hour the tweets were made in. Format: YYYY-MM-dd HH24
+        @paramType string
+        @param cells Rollup of each cell holding tweets, keyed by cell, see get_cell()
+        @paramType dictionary of dictionaries with keys 'count' (int) and 'terms' (dictionary of
+        term, count pairs)
+        @returns n/a
+        '''
+        raise NotImplementedError()
+
+    def get_cells(self, hour, coordinate_box=None):
+        '''
+        @param hour Rolled up hour. Format: YYYY-MM-dd HH24
+        @paramType string
+        @param coordinate_box Restricts to the cells whose centers are within the box, if any
+        @paramType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+        @returns Rollup of the hour's cells
+        @returnType list of dictionaries with keys 'lat', 'lon' (the cell's center), 'count', 'terms'
+        '''
+        raise NotImplementedError()
+
+    def is_rolled_up(self, hour):
+        '''
+        @param hour Hour of interest. Format: YYYY-MM-dd HH24
+        @paramType string
+        @returns Whether the hour's tweets were archived
+        @returnType boolean
+        '''
+        raise NotImplementedError()
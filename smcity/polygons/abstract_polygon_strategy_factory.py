@@ -1,19 +1,29 @@
 ''' Concrete polygon strategy factory. '''
 
+from smcity.polygons.geojson_polygon_strategy import GeoJsonPolygonStrategyFactory
+from smcity.polygons.hex_grid_strategy import HexGridStrategyFactory
+from smcity.polygons.multi_region_strategy import MultiRegionStrategyFactory
 from smcity.polygons.polygon_strategy import PolygonStrategyFactory
+from smcity.polygons.quadtree_strategy import QuadtreeStrategyFactory
 from smcity.polygons.simple_grid_strategy import SimpleGridStrategyFactory
 
 class AbstractPolygonStrategyFactory(PolygonStrategyFactory):
     ''' Marshalls PolygonStrategies from the serialized dictionary forms. ''' 
  
-    def __init__(self, style_strategy_factory):
+    def __init__(self, style_strategy_factory, region_store=None):
         ''' 
         Constructor. 
 
         @param style_strategy_factory Interface for reconstructing style strategies
         @paramType StyleStrategyFactory
+        @param region_store Holds the region sets of multi-region strategies, if any
+        @paramType RegionStore
         @returns n/a
         '''
+        self.geojson_polygon_factory = GeoJsonPolygonStrategyFactory(style_strategy_factory)
+        self.hex_grid_factory = HexGridStrategyFactory(style_strategy_factory)
+        self.multi_region_factory = MultiRegionStrategyFactory(style_strategy_factory, region_store)
+        self.quadtree_factory = QuadtreeStrategyFactory(style_strategy_factory)
         self.simple_grid_factory = SimpleGridStrategyFactory(style_strategy_factory)
 
     def from_dict(self, state):  
@@ -29,6 +39,14 @@ class AbstractPolygonStrategyFactory(PolygonStrategyFactory):
  
         if state['class'] == 'simple_grid':
             return self.simple_grid_factory.from_dict(state)
+        elif state['class'] == 'geojson_polygon':
+            return self.geojson_polygon_factory.from_dict(state)
+        elif state['class'] == 'hex_grid':
+            return self.hex_grid_factory.from_dict(state)
+        elif state['class'] == 'multi_region':
+            return self.multi_region_factory.from_dict(state)
+        elif state['class'] == 'quadtree':
+            return self.quadtree_factory.from_dict(state)
         else:
             raise Exception("Unknown polygon stategy '%s'!" % state['class'])
 
@@ -0,0 +1,108 @@
+''' Streaming GeoJSON encoding of sub-area results. '''
+
+import geojson
+
+from geojson import Feature, Polygon
+
+def encode_result_feature(result, style_strategy, geometry=None):
+    '''
+    Encodes a single sub-area result as a GeoJSON polygon feature. Estimated results carry the
+    half width of their confidence interval in the feature's 'error' property and named results
+    carry their name in the 'name' property.
+
+    @param result Sub-area result to be encoded
+    @paramType dictionary containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result' and
+    optionally 'error' and 'name'
+    @param style_strategy Strategy used to stylize the polygon, must already be primed
+    @paramType StyleStrategy
+    @param geometry Outline of the sub-area, None to use the result's box
+    @paramType GeoJSON Polygon or MultiPolygon geometry
+    @returns Styled polygon feature
+    @returnType geojson.Feature
+    '''
+    if geometry is None: # Outline the result's box
+        corner1 = (result['min_lon'], result['min_lat'])
+        corner2 = (result['min_lon'], result['max_lat'])
+        corner3 = (result['max_lon'], result['max_lat'])
+        corner4 = (result['max_lon'], result['min_lat'])
+        geometry = Polygon([[corner1, corner2, corner3, corner4, corner1]])
+
+    properties = dict(style_strategy.style_result_geojson(result))
+    if 'error' in result: # If the result was estimated from a sample
+        properties['error'] = result['error']
+    if 'name' in result: # If the sub-area is a named region
+        properties['name'] = result['name']
+
+    return Feature(geometry=geometry, properties=properties)
+
+def iter_feature_collection(features, chunk_size=1000):
+    '''
+    Generates a GeoJSON FeatureCollection in chunks, encoding each feature as it is reached so
+    only a single chunk is ever held in memory.
+
+    @param features Features to be encoded
+    @paramType iterable of geojson.Feature
+    @param chunk_size # of features to encode per chunk
+    @paramType int
+    @returns Iterator over the encoded chunks
+    @returnType iterator of string/GeoJSON
+    '''
+    assert chunk_size > 0, chunk_size
+
+    chunk = ['{"type": "FeatureCollection", "features": [']
+    separator = ''
+    num_features = 0
+
+    for feature in features:
+        chunk.append(separator + geojson.dumps(feature))
+        separator = ', '
+        num_features += 1
+
+        if num_features % chunk_size == 0: # If the chunk is full
+            yield ''.join(chunk)
+            chunk = []
+
+    chunk.append(']}')
+    yield ''.join(chunk)
+
+def iter_results_geojson(results, style_strategy, chunk_size=1000):
+    '''
+    Generates GeoJSON encoded results in chunks straight from the results.
+
+    @param results Sub-area results to be encoded. Must be re-iterable as the style strategy makes
+    a priming pass over them first.
+    @paramType iterable of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+    @param style_strategy Strategy used to stylize the polygons
+    @paramType StyleStrategy
+    @param chunk_size # of features to encode per chunk
+    @paramType int
+    @returns Iterator over the encoded chunks
+    @returnType iterator of string/GeoJSON
+    '''
+    style_strategy.prep_styling(results)
+
+    features = (encode_result_feature(result, style_strategy) for result in results)
+    return iter_feature_collection(features, chunk_size)
+
+def write_chunks(chunks, stream):
+    '''
+    Writes the encoded chunks out as they are generated.
+
+    @param chunks Encoded chunks to be written
+    @paramType iterable of string
+    @param stream Destination of the chunks
+    @paramType file-like object with write() or socket with sendall()
+    @returns # of characters written
+    @returnType int
+    '''
+    if hasattr(stream, 'write'):
+        write = stream.write
+    else:
+        write = stream.sendall
+
+    num_written = 0
+    for chunk in chunks:
+        write(chunk)
+        num_written += len(chunk)
+
+    return num_written
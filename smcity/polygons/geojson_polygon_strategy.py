@@ -0,0 +1,249 @@
+''' Strategy for breaking arbitrary GeoJSON (multi)polygons, like counties and cities, into boxes. '''
+
+import hashlib
+import json
+
+from collections import OrderedDict
+from threading import Lock
+
+from smcity.logging.logger import Logger
+from smcity.polygons.geojson_encoder import iter_results_geojson, write_chunks
+from smcity.polygons.geometry import clip_ring, edges_crossing_box, get_edges, get_rings, points_in_polygon
+from smcity.polygons.mvt_encoder import encode_results_mvt
+from smcity.polygons.polygon_strategy import PolygonStrategy, PolygonStrategyFactory, \
+    get_containing_box_finder, sum_results
+
+logger = Logger(__name__)
+
+# # of decompositions kept in the cache
+MAX_CACHED_DECOMPOSITIONS = 256
+
+# Decompositions already computed, keyed by get_polygon_hash(), oldest first
+_decomposition_cache = OrderedDict()
+_decomposition_cache_lock = Lock()
+
+def decompose_polygon(geometry, resolution):
+    '''
+    Breaks the polygon down into boxes with a quadtree. Cells entirely inside the polygon are kept
+    whole and then merged with their neighbours, cells crossed by the polygon's outline are split
+    until they are no larger than the resolution. Those boundary boxes carry the polygon's rings
+    clipped to the box under the 'rings' key so points inside them can be tested individually.
+
+    @param geometry GeoJSON Polygon or MultiPolygon geometry
+    @paramType dictionary
+    @param resolution Largest size of a boundary box in degrees
+    @paramType float
+    @returns Inside boxes followed by the boundary boxes
+    @returnType list of dictionaries with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon' and
+    optionally 'rings'
+    '''
+    assert resolution > 0, resolution
+
+    rings = get_rings(geometry)
+    all_edges = get_edges(rings)
+    assert len(all_edges) > 0, "Expected the geometry to have at least one ring"
+
+    inside_boxes = []
+    boundary_boxes = []
+    cells = [({
+        'min_lat' : float(min(all_edges[:, 1].min(), all_edges[:, 3].min())),
+        'min_lon' : float(min(all_edges[:, 0].min(), all_edges[:, 2].min())),
+        'max_lat' : float(max(all_edges[:, 1].max(), all_edges[:, 3].max())),
+        'max_lon' : float(max(all_edges[:, 0].max(), all_edges[:, 2].max()))
+    }, all_edges)]
+
+    while len(cells) > 0:
+        cell, edges = cells.pop()
+        edges = edges[edges_crossing_box(edges, cell)] # Children only need the edges crossing their parent
+
+        if len(edges) == 0: # The cell is entirely inside or outside of the polygon
+            center_lon = (cell['min_lon'] + cell['max_lon']) / 2.0
+            center_lat = (cell['min_lat'] + cell['max_lat']) / 2.0
+            if points_in_polygon([center_lon], [center_lat], all_edges)[0]:
+                inside_boxes.append(cell)
+            continue
+
+        if max(cell['max_lat'] - cell['min_lat'], cell['max_lon'] - cell['min_lon']) <= resolution:
+            clipped_rings = [clip_ring(ring, cell) for ring in rings]
+            clipped_rings = [ring for ring in clipped_rings if len(ring) >= 3]
+            if len(clipped_rings) > 0: # Only keep boundary boxes which overlap the polygon
+                boundary_box = dict(cell)
+                boundary_box['rings'] = clipped_rings
+                boundary_boxes.append(boundary_box)
+            continue
+
+        mid_lat = (cell['min_lat'] + cell['max_lat']) / 2.0
+        mid_lon = (cell['min_lon'] + cell['max_lon']) / 2.0
+        for min_lat, max_lat in ((mid_lat, cell['max_lat']), (cell['min_lat'], mid_lat)):
+            for min_lon, max_lon in ((mid_lon, cell['max_lon']), (cell['min_lon'], mid_lon)):
+                cells.append(({
+                    'min_lat' : min_lat, 'min_lon' : min_lon, 'max_lat' : max_lat, 'max_lon' : max_lon
+                }, edges))
+
+    inside_boxes = _merge_boxes(_merge_boxes(inside_boxes, 'lon'), 'lat')
+    logger.debug("Decomposed polygon into %s inside and %s boundary boxes", len(inside_boxes), len(boundary_boxes))
+
+    return inside_boxes + boundary_boxes
+
+def get_decomposition(geometry, resolution):
+    '''
+    Retrieves the polygon's decomposition from the cache, decomposing it on a miss.
+
+    @param geometry GeoJSON Polygon or MultiPolygon geometry
+    @paramType dictionary
+    @param resolution Largest size of a boundary box in degrees
+    @paramType float
+    @returns See decompose_polygon(). Must not be modified.
+    @returnType list of dictionaries
+    '''
+    polygon_hash = get_polygon_hash(geometry, resolution)
+
+    with _decomposition_cache_lock:
+        if polygon_hash in _decomposition_cache: # Move to the back as the most recently used
+            boxes = _decomposition_cache.pop(polygon_hash)
+            _decomposition_cache[polygon_hash] = boxes
+            return boxes
+
+    boxes = decompose_polygon(geometry, resolution)
+
+    with _decomposition_cache_lock:
+        _decomposition_cache[polygon_hash] = boxes
+        while len(_decomposition_cache) > MAX_CACHED_DECOMPOSITIONS: # Forget the least recently used
+            _decomposition_cache.popitem(last=False)
+
+    return boxes
+
+def get_polygon_hash(geometry, resolution):
+    '''
+    @param geometry GeoJSON Polygon or MultiPolygon geometry
+    @paramType dictionary
+    @param resolution Largest size of a boundary box in degrees
+    @paramType float
+    @returns Key identifying the polygon's decomposition
+    @returnType string
+    '''
+    encoded = json.dumps({'geometry' : geometry, 'resolution' : resolution}, sort_keys=True)
+
+    return hashlib.sha1(encoded).hexdigest()
+
+def _merge_boxes(boxes, axis):
+    '''
+    Merges boxes which share a side along the axis and the same extent along the other axis.
+
+    @param boxes Boxes to be merged
+    @paramType list of dictionaries with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+    @param axis Axis along which to merge, 'lat' or 'lon'
+    @paramType string
+    @returns Merged boxes
+    @returnType list of dictionaries with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+    '''
+    other = 'lon' if axis == 'lat' else 'lat'
+    boxes = sorted(boxes, key=lambda box: (box['min_' + other], box['max_' + other], box['min_' + axis]))
+
+    merged = []
+    for box in boxes:
+        previous = merged[-1] if len(merged) > 0 else None
+        if previous is not None and previous['min_' + other] == box['min_' + other] and \
+                previous['max_' + other] == box['max_' + other] and previous['max_' + axis] == box['min_' + axis]:
+            previous['max_' + axis] = box['max_' + axis]
+        else:
+            merged.append(dict(box))
+
+    return merged
+
+class GeoJsonPolygonStrategy(PolygonStrategy):
+    ''' Strategy for breaking a GeoJSON (multi)polygon into inside and boundary boxes. '''
+
+    def __init__(self, geometry, resolution, style_strategy):
+        '''
+        Constructor.
+
+        @param geometry Area of interest
+        @paramType dictionary holding a GeoJSON Polygon or MultiPolygon geometry
+        @param resolution Largest size of the boxes along the polygon's outline in degrees
+        @paramType float
+        @param style_strategy Strategy used to stylize the polygons
+        @paramType StyleStrategy
+        @returns n/a
+        '''
+        assert geometry.get('type') in ('Polygon', 'MultiPolygon'), geometry.get('type')
+        assert resolution > 0, resolution
+        assert style_strategy is not None
+
+        self.geometry = geometry
+        self.resolution = resolution
+        self.style_strategy = style_strategy
+
+    def encode_results_geojson(self, results):
+        ''' {@inheritDocs} '''
+        return ''.join(self.iter_results_geojson(results))
+
+    def encode_results_mvt(self, results, zoom, x, y):
+        ''' {@inheritDocs} '''
+        return encode_results_mvt(self.get_box_results(results), self.style_strategy, zoom, x, y)
+
+    def get_box_results(self, results):
+        '''
+        @param results Sub-area results, including those of split boxes
+        @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @returns One result per box of the decomposition reported on, see sum_results()
+        @returnType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        '''
+        return sum_results(results, get_containing_box_finder(get_decomposition(self.geometry, self.resolution)))
+
+    def get_inscribed_boxes(self):
+        '''
+        Boxes along the polygon's outline carry the polygon's rings clipped to the box under the
+        'rings' key, only points inside those rings belong to the area of interest.
+
+        {@inheritDocs}
+        '''
+        return [dict(box) for box in get_decomposition(self.geometry, self.resolution)]
+
+    def get_num_boxes(self):
+        ''' {@inheritDocs} '''
+        return len(get_decomposition(self.geometry, self.resolution))
+
+    def iter_inscribed_boxes(self):
+        ''' {@inheritDocs} '''
+        return iter(self.get_inscribed_boxes())
+
+    def iter_results_geojson(self, results, chunk_size=1000):
+        ''' Split boxes are encoded whole, see get_box_results(). {@inheritDocs} '''
+        return iter_results_geojson(self.get_box_results(results), self.style_strategy, chunk_size)
+
+    def to_dict(self):
+        ''' {@inheritDocs} '''
+        return {
+            'class' : 'geojson_polygon',
+            'geometry' : self.geometry,
+            'resolution' : self.resolution,
+            'style_strategy' : self.style_strategy.to_dict()
+        }
+
+    def write_results_geojson(self, results, stream, chunk_size=1000):
+        ''' {@inheritDocs} '''
+        return write_chunks(self.iter_results_geojson(results, chunk_size), stream)
+
+class GeoJsonPolygonStrategyFactory(PolygonStrategyFactory):
+    ''' GeoJSON polygon strategy implementation of the PolygonStrategyFactory. '''
+
+    def __init__(self, style_strategy_factory):
+        '''
+        Constructor.
+
+        @param style_strategy_factory Interface for reconstructing the style strategy associated
+        with the to be reconstructed polygon strategy
+        @paramType StyleStrategyFactory
+        @returns n/a
+        '''
+        assert style_strategy_factory is not None
+
+        self.style_strategy_factory = style_strategy_factory
+
+    def from_dict(self, state):
+        ''' {@inheritDocs} '''
+        return GeoJsonPolygonStrategy(
+            state['geometry'], state['resolution'],
+            self.style_strategy_factory.from_dict(state['style_strategy'])
+        )
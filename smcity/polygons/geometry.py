@@ -0,0 +1,146 @@
+''' Vectorised planar geometry helpers for working with GeoJSON polygon rings. '''
+
+import numpy
+
+def clip_ring(ring, coordinate_box):
+    '''
+    Clips a polygon ring to the coordinate box (Sutherland-Hodgman). Points strictly inside the
+    box are inside the clipped ring exactly when they are inside the original ring.
+
+    @param ring Closed or open polygon ring
+    @paramType list of [lon, lat] positions
+    @param coordinate_box Clipping window
+    @paramType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+    @returns Clipped ring, empty if the ring does not overlap the box
+    @returnType list of [lon, lat] positions
+    '''
+    def clip(points, inside, intersect):
+        clipped = []
+        for index in range(len(points)):
+            current = points[index]
+            previous = points[index - 1]
+
+            if inside(current):
+                if not inside(previous):
+                    clipped.append(intersect(previous, current))
+                clipped.append(current)
+            elif inside(previous):
+                clipped.append(intersect(previous, current))
+
+        return clipped
+
+    def at_lon(lon):
+        return lambda start, end: [lon, start[1] + (end[1] - start[1]) * (lon - start[0]) / (end[0] - start[0])]
+
+    def at_lat(lat):
+        return lambda start, end: [start[0] + (end[0] - start[0]) * (lat - start[1]) / (end[1] - start[1]), lat]
+
+    points = [list(position[:2]) for position in ring]
+    if len(points) > 1 and points[0] == points[-1]: # Drop the closing position
+        points = points[:-1]
+
+    edges = [
+        (lambda point: point[0] >= coordinate_box['min_lon'], at_lon(coordinate_box['min_lon'])),
+        (lambda point: point[0] <= coordinate_box['max_lon'], at_lon(coordinate_box['max_lon'])),
+        (lambda point: point[1] >= coordinate_box['min_lat'], at_lat(coordinate_box['min_lat'])),
+        (lambda point: point[1] <= coordinate_box['max_lat'], at_lat(coordinate_box['max_lat']))
+    ]
+    for inside, intersect in edges:
+        if len(points) == 0:
+            break
+        points = clip(points, inside, intersect)
+
+    return points
+
+def edges_crossing_box(edges, coordinate_box):
+    '''
+    @param edges Polygon edges
+    @paramType numpy array of float with shape (n, 4) holding start lon, start lat, end lon, end lat
+    @param coordinate_box Area to be tested
+    @paramType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+    @returns Whether or not each edge passes through the inside of the box (Liang-Barsky). Edges
+    which only run along or touch the box's sides do not.
+    @returnType numpy array of boolean
+    '''
+    start_lons, start_lats = edges[:, 0], edges[:, 1]
+    delta_lons, delta_lats = edges[:, 2] - start_lons, edges[:, 3] - start_lats
+
+    t_enter = numpy.zeros(len(edges))
+    t_exit = numpy.ones(len(edges))
+    rejected = numpy.zeros(len(edges), dtype=bool)
+
+    for p, q in (
+            (-delta_lons, start_lons - coordinate_box['min_lon']),
+            (delta_lons, coordinate_box['max_lon'] - start_lons),
+            (-delta_lats, start_lats - coordinate_box['min_lat']),
+            (delta_lats, coordinate_box['max_lat'] - start_lats)):
+        rejected |= (p == 0) & (q <= 0) # Parallel to and outside of or along this side of the box
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            ratios = q / p
+        t_enter = numpy.where(p < 0, numpy.maximum(t_enter, ratios), t_enter)
+        t_exit = numpy.where(p > 0, numpy.minimum(t_exit, ratios), t_exit)
+
+    return ~rejected & (t_enter < t_exit)
+
+def get_edges(rings):
+    '''
+    @param rings Polygon rings
+    @paramType list of lists of [lon, lat] positions
+    @returns Edges of the rings, each ring being closed
+    @returnType numpy array of float with shape (n, 4) holding start lon, start lat, end lon, end lat
+    '''
+    edges = []
+    for ring in rings:
+        points = numpy.array([position[:2] for position in ring], dtype=float).reshape(-1, 2)
+        if len(points) < 2:
+            continue
+        edges.append(numpy.hstack([points, numpy.roll(points, -1, axis=0)]))
+
+    if len(edges) == 0:
+        return numpy.zeros((0, 4))
+
+    return numpy.vstack(edges)
+
+def get_rings(geometry):
+    '''
+    @param geometry GeoJSON Polygon or MultiPolygon geometry
+    @paramType dictionary
+    @returns Every exterior and interior ring of the geometry. Holes and separate parts are
+    handled by the even-odd rule, so the rings need not be told apart.
+    @returnType list of lists of [lon, lat] positions
+    '''
+    if geometry['type'] == 'Polygon':
+        return list(geometry['coordinates'])
+    elif geometry['type'] == 'MultiPolygon':
+        return [ring for polygon in geometry['coordinates'] for ring in polygon]
+    else:
+        raise Exception("Unsupported geometry type '%s'!" % geometry['type'])
+
+def points_in_polygon(lons, lats, edges):
+    '''
+    Tests which points fall inside the polygon using even-odd ray casting.
+
+    @param lons Longitudes of the points
+    @paramType numpy array of float
+    @param lats Latitudes of the points
+    @paramType numpy array of float
+    @param edges Edges of the polygon's rings, see get_edges()
+    @paramType numpy array of float with shape (n, 4) holding start lon, start lat, end lon, end lat
+    @returns Whether or not each point is inside
+    @returnType numpy array of boolean
+    '''
+    lons = numpy.asarray(lons, dtype=float)
+    lats = numpy.asarray(lats, dtype=float)
+    inside = numpy.zeros(lons.shape, dtype=bool)
+
+    for start_lon, start_lat, end_lon, end_lat in edges:
+        if start_lat == end_lat: # Horizontal edges never cross the ray
+            continue
+
+        # Flip for every edge crossed by the ray cast east from each point
+        spans = (start_lat > lats) != (end_lat > lats)
+        crossing_lons = start_lon + (lats - start_lat) * (end_lon - start_lon) / (end_lat - start_lat)
+        inside ^= spans & (lons < crossing_lons)
+
+    return inside
@@ -0,0 +1,475 @@
+''' Hexagonal grid strategy built on an axial coordinate hex grid. '''
+
+import math
+import numpy
+
+from geojson import Polygon
+
+from smcity.logging.logger import Logger
+from smcity.polygons.geojson_encoder import encode_result_feature, iter_feature_collection, write_chunks
+from smcity.polygons.mvt_encoder import encode_results_mvt
+from smcity.polygons.polygon_strategy import PolygonStrategy, PolygonStrategyFactory
+
+logger = Logger(__name__)
+
+SQRT_3 = math.sqrt(3)
+
+# Width and height of each scan tile in hexes, by default
+DEFAULT_TILE_HEXES = 8
+
+def get_hex_key(q, r):
+    '''
+    @param q Axial column of the hex
+    @paramType int
+    @param r Axial row of the hex
+    @paramType int
+    @returns Key the hex's count is reported under
+    @returnType string
+    '''
+    return '%d_%d' % (q, r)
+
+class HexGrid:
+    '''
+    Pointy topped hexagonal grid over a coordinate box. Longitudes are scaled by the cosine of the
+    box's central latitude before the grid is laid out, so the hexes keep their shape away from
+    the equator. Each hex is addressed by its axial (q, r) position, (0, 0) being centered on the
+    box's south west corner.
+    '''
+
+    def __init__(self, coordinate_box, resolution):
+        '''
+        Constructor.
+
+        @param coordinate_box Coordinate box which should be covered by hexes
+        @paramType dictionary with keys 'min_lat', 'max_lat', 'min_lon', 'max_lon'
+        @param resolution Distance from the center of each hex to its corners in degrees of latitude
+        @paramType float
+        @returns n/a
+        '''
+        assert 'min_lat' in coordinate_box.keys()
+        assert 'max_lat' in coordinate_box.keys()
+        assert 'min_lon' in coordinate_box.keys()
+        assert 'max_lon' in coordinate_box.keys()
+        assert resolution > 0
+
+        self.coordinate_box = coordinate_box
+        self.resolution = resolution
+
+        center_lat = (coordinate_box['min_lat'] + coordinate_box['max_lat']) / 2.0
+        self.lon_scale = math.cos(math.radians(center_lat))
+
+    def bin_points(self, lats, lons):
+        '''
+        Counts the points falling in each hex in a single vectorised pass.
+
+        @param lats Latitudes of the points
+        @paramType numpy array of float
+        @param lons Longitudes of the points
+        @paramType numpy array of float
+        @returns # of points in each hex, in the order of get_hex_boxes(). Points outside of the
+        grid are dropped.
+        @returnType numpy array of int
+        '''
+        return self._bin_flat(lats, lons)[self._get_hex_indices()]
+
+    def _bin_flat(self, lats, lons, weights=None):
+        '''
+        @param lats Latitudes of the points
+        @paramType numpy array of float
+        @param lons Longitudes of the points
+        @paramType numpy array of float
+        @param weights How much each point counts for, None counts each point once
+        @paramType numpy array of int
+        @returns # of points in each hex of the grid's extent, by flattened (row * num_qs + column)
+        index. Points outside of the extent are dropped.
+        @returnType numpy array of int
+        '''
+        qs, rs = self.get_hex_positions(lats, lons)
+        min_q, min_r, num_qs, num_rs = self._get_grid_extent()
+
+        columns, rows = qs - min_q, rs - min_r
+        inside = (columns >= 0) & (columns < num_qs) & (rows >= 0) & (rows < num_rs)
+        if weights is not None:
+            weights = numpy.asarray(weights, dtype=int)[inside]
+        counts = numpy.bincount(rows[inside] * num_qs + columns[inside], weights, minlength=num_qs * num_rs)
+
+        return counts.astype(int)
+
+    def get_hex_bounds(self, q, r):
+        '''
+        @param q Axial column of the hex
+        @paramType int
+        @param r Axial row of the hex
+        @paramType int
+        @returns Bounding box of the hex
+        @returnType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+        '''
+        center_lat, center_lon = self.get_hex_center(q, r)
+        half_width = self.resolution * SQRT_3 / 2 / self.lon_scale
+
+        return {
+            'min_lat' : center_lat - self.resolution,
+            'min_lon' : center_lon - half_width,
+            'max_lat' : center_lat + self.resolution,
+            'max_lon' : center_lon + half_width
+        }
+
+    def get_hex_boxes(self):
+        '''
+        @returns Each hex's bounding box, holding the hex's outline under the 'rings' key so only
+        points inside the hex are counted, ordered by row and then column
+        @returnType list of dictionaries with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'rings'
+        '''
+        coordinate_boxes = []
+        for q, r in self.get_hex_positions_overlapping():
+            coordinate_box = self.get_hex_bounds(q, r)
+            coordinate_box['rings'] = [self.get_hex_ring(q, r)]
+            coordinate_boxes.append(coordinate_box)
+
+        return coordinate_boxes
+
+    def get_hex_center(self, q, r):
+        '''
+        @param q Axial column of the hex
+        @paramType int
+        @param r Axial row of the hex
+        @paramType int
+        @returns Center of the hex
+        @returnType tuple of float (lat, lon)
+        '''
+        x = self.resolution * SQRT_3 * (q + r / 2.0)
+        y = self.resolution * 1.5 * r
+
+        return self.coordinate_box['min_lat'] + y, self.coordinate_box['min_lon'] + x / self.lon_scale
+
+    def get_hex_positions(self, lats, lons):
+        '''
+        Finds the hex containing each point in O(1) per point, vectorised over all of the points.
+
+        @param lats Latitudes of the points
+        @paramType numpy array of float
+        @param lons Longitudes of the points
+        @paramType numpy array of float
+        @returns Axial positions of the hexes containing the points
+        @returnType tuple of numpy arrays of int (q, r)
+        '''
+        x = (numpy.asarray(lons, dtype=float) - self.coordinate_box['min_lon']) * self.lon_scale
+        y = numpy.asarray(lats, dtype=float) - self.coordinate_box['min_lat']
+
+        # Fractional cube coordinates
+        cube_x = (SQRT_3 / 3 * x - y / 3.0) / self.resolution
+        cube_z = (2 / 3.0 * y) / self.resolution
+        cube_y = -cube_x - cube_z
+
+        # Round to the nearest hex, fixing up the component with the largest rounding error
+        round_x, round_y, round_z = numpy.rint(cube_x), numpy.rint(cube_y), numpy.rint(cube_z)
+        diff_x, diff_y, diff_z = abs(round_x - cube_x), abs(round_y - cube_y), abs(round_z - cube_z)
+
+        fix_x = (diff_x > diff_y) & (diff_x > diff_z)
+        fix_z = ~fix_x & (diff_z >= diff_y)
+        round_x = numpy.where(fix_x, -round_y - round_z, round_x)
+        round_z = numpy.where(fix_z, -round_x - round_y, round_z)
+
+        return round_x.astype(int), round_z.astype(int)
+
+    def get_hex_positions_overlapping(self, coordinate_box=None):
+        '''
+        @param coordinate_box Restricts to the hexes whose bounding boxes overlap this box, if any
+        @paramType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+        @returns Axial positions of the hexes overlapping the grid's coordinate box, ordered by row
+        and then column
+        @returnType list of tuples of int (q, r)
+        '''
+        min_q, min_r, num_qs, num_rs = self._get_grid_extent()
+        indices = self._get_hex_indices()
+        qs, rs = min_q + indices % num_qs, min_r + indices // num_qs
+
+        if coordinate_box is not None: # Keep the hexes whose bounding boxes overlap the box
+            center_lats = self.coordinate_box['min_lat'] + self.resolution * 1.5 * rs
+            center_lons = self.coordinate_box['min_lon'] + \
+                self.resolution * SQRT_3 * (qs + rs / 2.0) / self.lon_scale
+            half_width = self.resolution * SQRT_3 / 2 / self.lon_scale
+            overlaps = (center_lats + self.resolution > coordinate_box['min_lat']) & \
+                (center_lats - self.resolution < coordinate_box['max_lat']) & \
+                (center_lons + half_width > coordinate_box['min_lon']) & \
+                (center_lons - half_width < coordinate_box['max_lon'])
+            qs, rs = qs[overlaps], rs[overlaps]
+
+        return [(int(q), int(r)) for q, r in zip(qs, rs)]
+
+    def get_hex_ring(self, q, r):
+        '''
+        @param q Axial column of the hex
+        @paramType int
+        @param r Axial row of the hex
+        @paramType int
+        @returns Outline of the hex, starting and ending on the same corner
+        @returnType list of [lon, lat] positions
+        '''
+        center_lat, center_lon = self.get_hex_center(q, r)
+
+        ring = []
+        for corner in range(7):
+            angle = math.radians(60 * (corner % 6) + 30)
+            ring.append([
+                center_lon + self.resolution * math.cos(angle) / self.lon_scale,
+                center_lat + self.resolution * math.sin(angle)
+            ])
+
+        return ring
+
+    def _get_grid_extent(self):
+        '''
+        @returns Smallest axial column and row of the hexes considered and the # of columns and rows
+        @returnType tuple of int (min_q, min_r, num_qs, num_rs)
+        '''
+        width = (self.coordinate_box['max_lon'] - self.coordinate_box['min_lon']) * self.lon_scale
+        height = self.coordinate_box['max_lat'] - self.coordinate_box['min_lat']
+
+        min_r = -1
+        max_r = int(math.ceil((height + self.resolution) / (1.5 * self.resolution)))
+        min_q = int(math.floor(-1 - max_r / 2.0))
+        max_q = int(math.ceil((width + self.resolution) / (SQRT_3 * self.resolution))) + 1
+
+        return min_q, min_r, max_q - min_q + 1, max_r - min_r + 1
+
+    def _get_hex_indices(self):
+        '''
+        @returns Flattened (row * num_qs + column) index of each hex overlapping the coordinate box,
+        ordered by row and then column
+        @returnType numpy array of int
+        '''
+        min_q, min_r, num_qs, num_rs = self._get_grid_extent()
+        rs, qs = numpy.mgrid[min_r:min_r + num_rs, min_q:min_q + num_qs]
+
+        # Keep the hexes whose bounding boxes overlap the coordinate box
+        half_width = self.resolution * SQRT_3 / 2
+        x = self.resolution * SQRT_3 * (qs + rs / 2.0)
+        y = self.resolution * 1.5 * rs
+        width = (self.coordinate_box['max_lon'] - self.coordinate_box['min_lon']) * self.lon_scale
+        height = self.coordinate_box['max_lat'] - self.coordinate_box['min_lat']
+        overlaps = (x + half_width > 0) & (x - half_width < width) & \
+            (y + self.resolution > 0) & (y - self.resolution < height)
+
+        return numpy.flatnonzero(overlaps.ravel())
+
+class HexIndex:
+    '''
+    Attributes points to the hexes of a scan tile, by the same interface as the RegionIndex, so a
+    worker bins a tile's tweets into per hex counts in a single pass.
+    '''
+
+    def __init__(self, hex_grid, hexes):
+        '''
+        Constructor.
+
+        @param hex_grid Grid the hexes belong to
+        @paramType dictionary with keys 'coordinate_box' and 'resolution', see HexGrid
+        @param hexes Axial positions of the tile's hexes
+        @paramType list of [q, r] positions
+        @returns n/a
+        '''
+        assert len(hexes) > 0, len(hexes)
+
+        self.grid = HexGrid(hex_grid['coordinate_box'], hex_grid['resolution'])
+        self.ids = [get_hex_key(q, r) for q, r in hexes]
+
+        min_q, min_r, num_qs, num_rs = self.grid._get_grid_extent()
+        self.flat_indices = numpy.array([(r - min_r) * num_qs + (q - min_q) for q, r in hexes], dtype=int)
+
+    def count_points(self, lats, lons, weights=None):
+        '''
+        @param lats Latitudes of the points
+        @paramType numpy array of float
+        @param lons Longitudes of the points
+        @paramType numpy array of float
+        @param weights How much each point counts for, such as the # of tweets an archived cell
+        stands for. None counts each point once.
+        @paramType numpy array of int
+        @returns # of points inside each of the tile's hexes, keyed by hex key, see get_hex_key().
+        Points in other hexes are dropped.
+        @returnType dictionary
+        '''
+        counts = self.grid._bin_flat(lats, lons, weights)[self.flat_indices]
+        return dict(zip(self.ids, [int(count) for count in counts]))
+
+class HexGridStrategy(HexGrid, PolygonStrategy):
+    '''
+    Counts the hexes of a hexagonal grid, see HexGrid. The grid is split into scan tiles spanning
+    many hexes each, every tile listing the positions of the hexes overlapping it under the 'hexes'
+    key and the grid under the 'hex_grid' key. Workers scan each tile once and bin its tweets into
+    per hex counts through a HexIndex, which are summed back up per hex when the results are encoded.
+    '''
+
+    def __init__(self, coordinate_box, resolution, style_strategy, tile_hexes=DEFAULT_TILE_HEXES):
+        '''
+        Constructor.
+
+        @param coordinate_box Coordinate box which should be covered by hexes
+        @paramType dictionary with keys 'min_lat', 'max_lat', 'min_lon', 'max_lon'
+        @param resolution Distance from the center of each hex to its corners in degrees of latitude
+        @paramType float
+        @param style_strategy Strategy used to stylize the polygons
+        @paramType StyleStrategy
+        @param tile_hexes Width and height of each scan tile in hexes
+        @paramType int
+        @returns n/a
+        '''
+        assert style_strategy is not None
+        assert tile_hexes > 0, tile_hexes
+
+        HexGrid.__init__(self, coordinate_box, resolution)
+        self.style_strategy = style_strategy
+        self.tile_hexes = tile_hexes
+
+    def encode_results_geojson(self, results):
+        ''' {@inheritDocs} '''
+        return ''.join(self.iter_results_geojson(results))
+
+    def encode_results_mvt(self, results, zoom, x, y):
+        ''' Hexes are encoded by their bounding boxes. {@inheritDocs} '''
+        return encode_results_mvt(self.get_hex_results(results), self.style_strategy, zoom, x, y)
+
+    def get_hex_results(self, results):
+        '''
+        Sums the results per hex.
+
+        @param results Tile results, holding counts keyed by hex key, or results of single hexes,
+        such as those of standing queries, which are matched back to their hex by the center of their box
+        @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @returns Results of the hexes reported on so far, ordered by row and then column, each
+        covering the hex's bounding box
+        @returnType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon',
+        'result', 'q', 'r'
+        '''
+        totals = {}
+        hex_results = [result for result in results if not isinstance(result['result'], dict)]
+        if len(hex_results) > 0:
+            center_lats = [(result['min_lat'] + result['max_lat']) / 2.0 for result in hex_results]
+            center_lons = [(result['min_lon'] + result['max_lon']) / 2.0 for result in hex_results]
+            qs, rs = self.get_hex_positions(center_lats, center_lons)
+            for index in range(len(hex_results)):
+                key = (int(qs[index]), int(rs[index]))
+                totals[key] = totals.get(key, 0) + hex_results[index]['result']
+
+        for result in results:
+            if isinstance(result['result'], dict):
+                for hex_key, count in result['result'].items():
+                    key = tuple([int(index) for index in hex_key.split('_')])
+                    totals[key] = totals.get(key, 0) + count
+
+        summed_results = []
+        for q, r in sorted(totals.keys(), key=lambda position: (position[1], position[0])):
+            summed_result = self.get_hex_bounds(q, r)
+            summed_result.update({'result' : totals[(q, r)], 'q' : q, 'r' : r})
+            summed_results.append(summed_result)
+
+        return summed_results
+
+    def get_inscribed_boxes(self):
+        '''
+        Scan tiles of about tile_hexes by tile_hexes hexes, each holding the grid under the
+        'hex_grid' key and the positions of the hexes overlapping it under the 'hexes' key.
+
+        {@inheritDocs}
+        '''
+        hex_grid = {'coordinate_box' : self.coordinate_box, 'resolution' : self.resolution}
+
+        tiles = []
+        for tile in self._get_tile_bounds():
+            hexes = self.get_hex_positions_overlapping(tile)
+            if len(hexes) > 0:
+                tile['hex_grid'] = hex_grid
+                tile['hexes'] = [[q, r] for q, r in hexes]
+                tiles.append(tile)
+
+        return tiles
+
+    def get_num_boxes(self):
+        ''' {@inheritDocs} '''
+        return len(self._get_tile_bounds())
+
+    def get_result_boxes(self):
+        ''' Each hex's bounding box, see get_hex_boxes(). {@inheritDocs} '''
+        return self.get_hex_boxes()
+
+    def _get_tile_bounds(self):
+        '''
+        @returns Bounds of the scan tiles covering the coordinate box, ordered by row and then column
+        @returnType list of dictionaries with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+        '''
+        tile_height = self.tile_hexes * 1.5 * self.resolution
+        tile_width = self.tile_hexes * SQRT_3 * self.resolution / self.lon_scale
+        lat_steps = max(1, int(math.ceil(
+            (self.coordinate_box['max_lat'] - self.coordinate_box['min_lat']) / tile_height)))
+        lon_steps = max(1, int(math.ceil(
+            (self.coordinate_box['max_lon'] - self.coordinate_box['min_lon']) / tile_width)))
+
+        tiles = []
+        for lat_step in range(lat_steps):
+            for lon_step in range(lon_steps):
+                tiles.append({
+                    'min_lat' : self.coordinate_box['min_lat'] + lat_step * tile_height,
+                    'min_lon' : self.coordinate_box['min_lon'] + lon_step * tile_width,
+                    'max_lat' : min(self.coordinate_box['min_lat'] + (lat_step + 1) * tile_height,
+                        self.coordinate_box['max_lat']),
+                    'max_lon' : min(self.coordinate_box['min_lon'] + (lon_step + 1) * tile_width,
+                        self.coordinate_box['max_lon'])
+                })
+
+        return tiles
+
+    def iter_inscribed_boxes(self):
+        ''' {@inheritDocs} '''
+        return iter(self.get_inscribed_boxes())
+
+    def iter_results_geojson(self, results, chunk_size=1000):
+        ''' Each hex is encoded with its own outline, see get_hex_results(). {@inheritDocs} '''
+        hex_results = self.get_hex_results(results)
+        self.style_strategy.prep_styling(hex_results)
+
+        features = (
+            encode_result_feature(
+                result, self.style_strategy, Polygon([self.get_hex_ring(result['q'], result['r'])])
+            )
+            for result in hex_results
+        )
+        return iter_feature_collection(features, chunk_size)
+
+    def to_dict(self):
+        ''' {@inheritDocs} '''
+        return {
+            'class' : 'hex_grid',
+            'coordinate_box' : self.coordinate_box,
+            'resolution' : self.resolution,
+            'style_strategy' : self.style_strategy.to_dict(),
+            'tile_hexes' : self.tile_hexes
+        }
+
+    def write_results_geojson(self, results, stream, chunk_size=1000):
+        ''' {@inheritDocs} '''
+        return write_chunks(self.iter_results_geojson(results, chunk_size), stream)
+
+class HexGridStrategyFactory(PolygonStrategyFactory):
+    ''' Hex grid strategy implementation of the PolygonStrategyFactory. '''
+
+    def __init__(self, style_strategy_factory):
+        '''
+        Constructor.
+
+        @param style_strategy_factory Interface for reconstructing the style strategy associated
+        with the to be reconstructed polygon strategy
+        @paramType StyleStrategyFactory
+        @returns n/a
+        '''
+        assert style_strategy_factory is not None
+
+        self.style_strategy_factory = style_strategy_factory
+
+    def from_dict(self, state):
+        ''' {@inheritDocs} '''
+        return HexGridStrategy(
+            state['coordinate_box'], state['resolution'],
+            self.style_strategy_factory.from_dict(state['style_strategy']),
+            state.get('tile_hexes', DEFAULT_TILE_HEXES)
+        )
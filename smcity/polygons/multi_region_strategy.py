@@ -0,0 +1,289 @@
+''' Strategy for counting many named regions, like neighbourhoods or districts, in a single scan. '''
+
+import math
+import numpy
+
+from smcity.logging.logger import Logger
+from smcity.polygons.geojson_encoder import encode_result_feature, iter_feature_collection, write_chunks
+from smcity.polygons.geometry import clip_ring, get_edges, get_rings, points_in_polygon
+from smcity.polygons.mvt_encoder import encode_results_mvt
+from smcity.polygons.polygon_strategy import PolygonStrategy, PolygonStrategyFactory
+from smcity.polygons.rtree import StrTree
+
+logger = Logger(__name__)
+
+def _get_bounds(edges):
+    '''
+    @param edges Polygon edges, see get_edges()
+    @paramType numpy array of float with shape (n, 4)
+    @returns Bounding box of the edges
+    @returnType list of float [min_lat, min_lon, max_lat, max_lon]
+    '''
+    return [
+        min(edges[:, 1].min(), edges[:, 3].min()), min(edges[:, 0].min(), edges[:, 2].min()),
+        max(edges[:, 1].max(), edges[:, 3].max()), max(edges[:, 0].max(), edges[:, 2].max())
+    ]
+
+def clip_regions(region_rings, region_ids, coordinate_box):
+    '''
+    @param region_rings Outline of each region, by region id
+    @paramType list or dictionary of lists of [lon, lat] position lists
+    @param region_ids Regions to be clipped
+    @paramType list of int
+    @param coordinate_box Clipping window
+    @paramType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+    @returns Outlines of the regions overlapping the box, clipped to it
+    @returnType list of dictionaries with keys 'id' and 'rings' (list of [lon, lat] position lists)
+    '''
+    clipped_regions = []
+    for region_id in region_ids:
+        clipped_rings = [clip_ring(ring, coordinate_box) for ring in region_rings[region_id]]
+        clipped_rings = [ring for ring in clipped_rings if len(ring) >= 3]
+        if len(clipped_rings) > 0:
+            clipped_regions.append({'id' : region_id, 'rings' : clipped_rings})
+
+    return clipped_regions
+
+def get_tile_index(region_store, tile):
+    '''
+    Loads the outlines of a scan tile's regions and clips them to the tile.
+
+    @param region_store Holds the tile's region set, whose regions are cached once read
+    @paramType RegionStore
+    @param tile Scan tile, or a quarter of one
+    @paramType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'region_set_id', 'region_ids'
+    @returns Index attributing points to the tile's regions
+    @returnType RegionIndex
+    '''
+    regions = region_store.get_regions(tile['region_set_id'])
+    region_rings = dict([(region_id, get_rings(regions[region_id]['geometry']))
+        for region_id in tile['region_ids']])
+
+    return RegionIndex(clip_regions(region_rings, tile['region_ids'], tile))
+
+class RegionIndex:
+    ''' Attributes points to the regions containing them through an R-tree over the regions' bounds. '''
+
+    def __init__(self, regions):
+        '''
+        Constructor.
+
+        @param regions Regions to attribute points to
+        @paramType list of dictionaries with keys 'id' and 'rings' (list of [lon, lat] position lists)
+        @returns n/a
+        '''
+        self.ids = [region['id'] for region in regions]
+        self.edges = [get_edges(region['rings']) for region in regions]
+        self.tree = StrTree([_get_bounds(edges) for edges in self.edges])
+
+    def count_points(self, lats, lons, weights=None):
+        '''
+        @param lats Latitudes of the points
+        @paramType numpy array of float
+        @param lons Longitudes of the points
+        @paramType numpy array of float
+        @param weights How much each point counts for, such as the # of tweets an archived cell
+        stands for. None counts each point once.
+        @paramType numpy array of int
+        @returns # of points inside each region, keyed by region id. Points inside overlapping
+        regions count towards each of them.
+        @returnType dictionary
+        '''
+        if len(self.ids) == 0: # None of the regions overlap a split tile's quarter
+            return {}
+
+        lats = numpy.asarray(lats, dtype=float)
+        lons = numpy.asarray(lons, dtype=float)
+        point_positions, region_positions = self.tree.query_points(lats, lons)
+        if weights is not None:
+            weights = numpy.asarray(weights, dtype=int)
+
+        counts = dict([(region_id, 0) for region_id in self.ids])
+        for region_position in numpy.unique(region_positions): # Test the candidates against the outline
+            candidates = point_positions[region_positions == region_position]
+            inside = points_in_polygon(lons[candidates], lats[candidates], self.edges[region_position])
+            if weights is not None:
+                counts[self.ids[region_position]] += int(weights[candidates][inside].sum())
+            else:
+                counts[self.ids[region_position]] += int(inside.sum())
+
+        return counts
+
+class MultiRegionStrategy(PolygonStrategy):
+    '''
+    Counts many regions at once. The regions are kept in a RegionStore and only referred to by
+    their region set, so neither the job record nor the tasks grow with the regions' outlines. The
+    regions' combined bounds are split into scan tiles, each tile listing the ids of the regions
+    overlapping it under the 'region_ids' key. Workers load the region set once, scan each tile
+    once and attribute its tweets to the regions clipped to the tile, see get_tile_index(). The
+    per region counts they post are summed back up when the results are encoded.
+    '''
+
+    def __init__(self, regions, tile_size, style_strategy, region_set_id):
+        '''
+        Constructor.
+
+        @param regions Regions of interest
+        @paramType list of dictionaries with keys 'name' and 'geometry' (GeoJSON Polygon or MultiPolygon)
+        @param tile_size Width and height of each scan tile in degrees
+        @paramType float
+        @param style_strategy Strategy used to stylize the polygons
+        @paramType StyleStrategy
+        @param region_set_id Tracking id the regions were stored under, see RegionStore.add_regions()
+        @paramType string/uuid
+        @returns n/a
+        '''
+        assert len(regions) > 0, len(regions)
+        assert tile_size > 0, tile_size
+        assert style_strategy is not None
+        assert region_set_id is not None
+
+        self.region_set_id = region_set_id
+        self.regions = regions
+        self.style_strategy = style_strategy
+        self.tile_size = tile_size
+
+        self.region_rings = [get_rings(region['geometry']) for region in regions]
+        self.region_bounds = numpy.array([_get_bounds(get_edges(rings)) for rings in self.region_rings])
+        self.tree = StrTree(self.region_bounds)
+        self.tiles = None
+
+    def encode_results_geojson(self, results):
+        ''' {@inheritDocs} '''
+        return ''.join(self.iter_results_geojson(results))
+
+    def encode_results_mvt(self, results, zoom, x, y):
+        ''' Regions are encoded by their bounding boxes. {@inheritDocs} '''
+        return encode_results_mvt(self.get_region_results(results), self.style_strategy, zoom, x, y)
+
+    def get_inscribed_boxes(self):
+        ''' {@inheritDocs} '''
+        if self.tiles is None:
+            self.tiles = self._build_tiles()
+
+        return [dict(tile) for tile in self.tiles]
+
+    def get_num_boxes(self):
+        ''' {@inheritDocs} '''
+        return len(self.get_inscribed_boxes())
+
+    def get_region_results(self, results):
+        '''
+        Sums the per region counts of the tile results.
+
+        @param results Tile results
+        @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+        and 'result', the latter holding counts keyed by region id
+        @returns Results of the regions reported on so far, in the order the regions were provided,
+        each covering the region's bounding box and holding its name
+        @returnType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon',
+        'result', 'name', 'region_id'
+        '''
+        totals = {}
+        for result in results:
+            for region_id, count in result['result'].items():
+                region_id = int(region_id) # JSON object keys are strings
+                totals[region_id] = totals.get(region_id, 0) + count
+
+        region_results = []
+        for region_id in sorted(totals.keys()):
+            bounds = self.region_bounds[region_id]
+            region_results.append({
+                'min_lat' : float(bounds[0]),
+                'min_lon' : float(bounds[1]),
+                'max_lat' : float(bounds[2]),
+                'max_lon' : float(bounds[3]),
+                'result' : totals[region_id],
+                'name' : self.regions[region_id]['name'],
+                'region_id' : region_id
+            })
+
+        return region_results
+
+    def iter_inscribed_boxes(self):
+        ''' {@inheritDocs} '''
+        return iter(self.get_inscribed_boxes())
+
+    def iter_results_geojson(self, results, chunk_size=1000):
+        ''' Each region is encoded with its own outline. {@inheritDocs} '''
+        region_results = self.get_region_results(results)
+        self.style_strategy.prep_styling(region_results)
+
+        features = (
+            encode_result_feature(result, self.style_strategy, self.regions[result['region_id']]['geometry'])
+            for result in region_results
+        )
+        return iter_feature_collection(features, chunk_size)
+
+    def to_dict(self):
+        ''' {@inheritDocs} '''
+        return {
+            'class' : 'multi_region',
+            'region_set_id' : self.region_set_id,
+            'style_strategy' : self.style_strategy.to_dict(),
+            'tile_size' : self.tile_size
+        }
+
+    def write_results_geojson(self, results, stream, chunk_size=1000):
+        ''' {@inheritDocs} '''
+        return write_chunks(self.iter_results_geojson(results, chunk_size), stream)
+
+    def _build_tiles(self):
+        '''
+        @returns Scan tiles overlapping at least one region, each holding the ids of the regions
+        overlapping it
+        @returnType list of dictionaries with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon',
+        'region_set_id', 'region_ids'
+        '''
+        min_lat, min_lon = self.region_bounds[:, 0].min(), self.region_bounds[:, 1].min()
+        max_lat, max_lon = self.region_bounds[:, 2].max(), self.region_bounds[:, 3].max()
+        lat_steps = max(1, int(math.ceil((max_lat - min_lat) / self.tile_size)))
+        lon_steps = max(1, int(math.ceil((max_lon - min_lon) / self.tile_size)))
+
+        tiles = []
+        for lat_step in range(lat_steps):
+            for lon_step in range(lon_steps):
+                tile = {
+                    'min_lat' : float(min_lat + lat_step * self.tile_size),
+                    'min_lon' : float(min_lon + lon_step * self.tile_size),
+                    'max_lat' : float(min(min_lat + (lat_step + 1) * self.tile_size, max_lat)),
+                    'max_lon' : float(min(min_lon + (lon_step + 1) * self.tile_size, max_lon))
+                }
+
+                # Only regions whose outlines reach into the tile, not just their bounds
+                tile_regions = clip_regions(self.region_rings, self.tree.query_box(tile), tile)
+                if len(tile_regions) > 0: # Skip tiles between the regions
+                    tile['region_set_id'] = self.region_set_id
+                    tile['region_ids'] = [int(region['id']) for region in tile_regions]
+                    tiles.append(tile)
+
+        logger.debug("Split %s regions into %s scan tiles", len(self.regions), len(tiles))
+        return tiles
+
+class MultiRegionStrategyFactory(PolygonStrategyFactory):
+    ''' Multi-region strategy implementation of the PolygonStrategyFactory. '''
+
+    def __init__(self, style_strategy_factory, region_store=None):
+        '''
+        Constructor.
+
+        @param style_strategy_factory Interface for reconstructing the style strategy associated
+        with the to be reconstructed polygon strategy
+        @paramType StyleStrategyFactory
+        @param region_store Holds the region sets of the strategies, None if no region store is configured
+        @paramType RegionStore
+        @returns n/a
+        '''
+        assert style_strategy_factory is not None
+
+        self.region_store = region_store
+        self.style_strategy_factory = style_strategy_factory
+
+    def from_dict(self, state):
+        ''' {@inheritDocs} '''
+        assert self.region_store is not None, "No region store to load the regions from!"
+
+        return MultiRegionStrategy(
+            self.region_store.get_regions(state['region_set_id']), state['tile_size'],
+            self.style_strategy_factory.from_dict(state['style_strategy']), state['region_set_id']
+        )
@@ -0,0 +1,175 @@
+''' Mapbox Vector Tile (MVT) encoding of sub-area results. '''
+
+import struct
+
+from smcity.polygons.tiles import MAX_LAT, lat_to_tile_y, lon_to_tile_x
+
+# Geometry command ids
+MOVE_TO = 1
+LINE_TO = 2
+CLOSE_PATH = 7
+
+# Feature geometry type of polygons
+POLYGON = 3
+
+def _bytes_field(field, data):
+    '''
+    @returns Length delimited protobuf field
+    @returnType string/binary
+    '''
+    return _varint((field << 3) | 2) + _varint(len(data)) + data
+
+def _command(command_id, count):
+    '''
+    @returns Geometry command integer
+    @returnType int
+    '''
+    return (command_id & 0x7) | (count << 3)
+
+def _packed_field(field, values):
+    '''
+    @returns Packed repeated varint protobuf field
+    @returnType string/binary
+    '''
+    return _bytes_field(field, ''.join([_varint(value) for value in values]))
+
+def _value(value):
+    '''
+    @returns Encoded Value message of the tag value
+    @returnType string/binary
+    '''
+    if isinstance(value, basestring):
+        return _bytes_field(1, value.encode('utf-8'))
+    elif isinstance(value, bool):
+        return _varint((7 << 3) | 0) + _varint(int(value))
+    else:
+        return _varint((3 << 3) | 1) + struct.pack('<d', value)
+
+def _varint(value):
+    '''
+    @returns Protobuf base 128 varint encoding of the non-negative value
+    @returnType string/binary
+    '''
+    encoded = []
+    while value > 0x7f:
+        encoded.append(chr((value & 0x7f) | 0x80))
+        value >>= 7
+    encoded.append(chr(value))
+
+    return ''.join(encoded)
+
+def _varint_field(field, value):
+    '''
+    @returns Varint protobuf field
+    @returnType string/binary
+    '''
+    return _varint(field << 3) + _varint(value)
+
+def _zigzag(value):
+    '''
+    @returns Zig-zag encoding of the signed value
+    @returnType int
+    '''
+    return (value << 1) ^ (value >> 31)
+
+def encode_box_geometry(min_x, min_y, max_x, max_y):
+    '''
+    Encodes a tile coordinate box as polygon geometry commands. Tile coordinates grow to the east
+    and to the south, so the ring is wound clockwise on screen as an exterior ring must be.
+
+    @returns Geometry commands and parameters
+    @returnType list of int
+    '''
+    return [
+        _command(MOVE_TO, 1), _zigzag(min_x), _zigzag(min_y),
+        _command(LINE_TO, 3),
+        _zigzag(max_x - min_x), _zigzag(0),
+        _zigzag(0), _zigzag(max_y - min_y),
+        _zigzag(min_x - max_x), _zigzag(0),
+        _command(CLOSE_PATH, 1)
+    ]
+
+def encode_results_mvt(results, style_strategy, zoom, x, y, layer_name='results', extent=4096, buffer=64):
+    '''
+    Encodes the results which fall inside the z/x/y tile as a Mapbox Vector Tile. Coordinates are
+    quantised onto the tile's integer grid and clipped to the tile plus a small buffer, so each
+    polygon costs a few bytes regardless of the precision of the underlying results.
+
+    @param results Sub-area results to be encoded
+    @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+    @param style_strategy Strategy used to stylize the polygons
+    @paramType StyleStrategy
+    @param zoom Zoom level of the tile
+    @paramType int
+    @param x Column of the tile, 0 being the western most
+    @paramType int
+    @param y Row of the tile, 0 being the northern most
+    @paramType int
+    @param layer_name Name of the tile layer holding the polygons
+    @paramType string
+    @param extent Size of the tile's integer coordinate grid
+    @paramType int
+    @param buffer Distance outside of the tile polygons are clipped at, in tile coordinates
+    @paramType int
+    @returns MVT encoded tile
+    @returnType string/binary
+    '''
+    assert extent > 0, extent
+    assert buffer >= 0, buffer
+
+    style_strategy.prep_styling(results)
+
+    keys = []
+    key_indices = {}
+    values = []
+    value_indices = {}
+    features = []
+
+    for result in results:
+        # Project and quantise the box onto the tile's coordinate grid
+        min_x = int(round((lon_to_tile_x(zoom, result['min_lon']) - x) * extent))
+        max_x = int(round((lon_to_tile_x(zoom, result['max_lon']) - x) * extent))
+        min_y = int(round((lat_to_tile_y(zoom, min(result['max_lat'], MAX_LAT)) - y) * extent))
+        max_y = int(round((lat_to_tile_y(zoom, max(result['min_lat'], -MAX_LAT)) - y) * extent))
+
+        if max_x < -buffer or min_x > extent + buffer or max_y < -buffer or min_y > extent + buffer:
+            continue # Outside of the tile
+
+        min_x, max_x = max(min_x, -buffer), min(max_x, extent + buffer)
+        min_y, max_y = max(min_y, -buffer), min(max_y, extent + buffer)
+        if min_x >= max_x or min_y >= max_y:
+            continue # Smaller than a tile coordinate at this zoom level
+
+        # Build up the feature's tags
+        properties = dict(style_strategy.style_result_geojson(result))
+        properties['result'] = result['result']
+        if 'error' in result: # If the result was estimated from a sample
+            properties['error'] = result['error']
+
+        tags = []
+        for key in sorted(properties.keys()):
+            if key not in key_indices:
+                key_indices[key] = len(keys)
+                keys.append(key)
+
+            value = (type(properties[key]), properties[key])
+            if value not in value_indices:
+                value_indices[value] = len(values)
+                values.append(properties[key])
+
+            tags.extend([key_indices[key], value_indices[value]])
+
+        features.append(
+            _varint_field(1, len(features) + 1) +
+            _packed_field(2, tags) +
+            _varint_field(3, POLYGON) +
+            _packed_field(4, encode_box_geometry(min_x, min_y, max_x, max_y))
+        )
+
+    layer = _varint_field(15, 2) + _bytes_field(1, layer_name)
+    layer += ''.join([_bytes_field(2, feature) for feature in features])
+    layer += ''.join([_bytes_field(3, key.encode('utf-8')) for key in keys])
+    layer += ''.join([_bytes_field(4, _value(value)) for value in values])
+    layer += _varint_field(5, extent)
+
+    return _bytes_field(3, layer)
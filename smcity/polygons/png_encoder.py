@@ -0,0 +1,45 @@
+''' Minimal PNG encoder for rendering raster results. '''
+
+import numpy
+import struct
+import zlib
+
+PNG_SIGNATURE = '\x89PNG\r\n\x1a\n'
+
+def _chunk(chunk_type, data):
+    '''
+    @param chunk_type Four letter PNG chunk type
+    @paramType string
+    @param data Chunk payload
+    @paramType string
+    @returns Length prefixed, checksummed PNG chunk
+    @returnType string
+    '''
+    return struct.pack('>I', len(data)) + chunk_type + data + \
+        struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff)
+
+def encode_png(pixels, compression_level=6):
+    '''
+    Encodes an RGBA image as a PNG.
+
+    @param pixels Image to encode, rows run from top to bottom
+    @paramType numpy array of uint8 with shape (height, width, 4)
+    @param compression_level zlib compression level to use
+    @paramType int
+    @returns PNG encoded image
+    @returnType string/binary
+    '''
+    assert len(pixels.shape) == 3 and pixels.shape[2] == 4, pixels.shape
+
+    height, width = pixels.shape[0], pixels.shape[1]
+    assert height > 0 and width > 0, pixels.shape
+
+    # Each scanline is prefixed with its filter type, 0 (none)
+    scanlines = numpy.zeros((height, width * 4 + 1), dtype=numpy.uint8)
+    scanlines[:, 1:] = pixels.reshape(height, width * 4)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0) # 8 bit RGBA, not interlaced
+
+    return PNG_SIGNATURE + _chunk('IHDR', header) + \
+        _chunk('IDAT', zlib.compress(scanlines.tostring(), compression_level)) + \
+        _chunk('IEND', '')
@@ -3,9 +3,92 @@ Interface definition of a strategy for breaking complex polygons, like counties,
 into inscribed coordinate boxes which can be more easily used in analytic calculations.
 '''
 
+import math
+
+from collections import OrderedDict
+
+# Keys of a coordinate box's bounds
+BOUNDS = ('min_lat', 'min_lon', 'max_lat', 'max_lon')
+
+def get_containing_box_finder(boxes):
+    '''
+    @param boxes Inscribed boxes of a strategy
+    @paramType list of dictionaries with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+    @returns Finds the box a result's area belongs to, the result itself if no box contains it.
+    Results of whole boxes are looked up directly, those of split tasks searched for.
+    @returnType function accepting a result dictionary and returning a coordinate box dictionary
+    '''
+    index = dict([(tuple([box[key] for key in BOUNDS]), box) for box in boxes])
+
+    def find_containing_box(result):
+        box = index.get(tuple([result[key] for key in BOUNDS]))
+        if box is not None:
+            return box
+
+        for box in boxes: # Part of a split box
+            if box['min_lat'] <= result['min_lat'] and box['min_lon'] <= result['min_lon'] and \
+                    box['max_lat'] >= result['max_lat'] and box['max_lon'] >= result['max_lon']:
+                return box
+
+        return result
+
+    return find_containing_box
+
+def sum_results(results, get_box):
+    '''
+    Sums the results of the tasks split off the same box, so each box is reported once and in full.
+
+    @param results Sub-area results, some of which may only cover part of a box
+    @paramType iterable of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon',
+    'result' and optionally 'error'
+    @param get_box Finds the box a result's area belongs to
+    @paramType function accepting a result dictionary and returning a coordinate box dictionary
+    @returns One result per box, in the order the boxes were first reported on. The errors of
+    estimated results are combined as independent estimates.
+    @returnType list of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon',
+    'result' and optionally 'error'
+    '''
+    totals = OrderedDict()
+    for result in results:
+        box = get_box(result)
+        key = tuple([box[bound] for bound in BOUNDS])
+
+        total = totals.get(key)
+        if total is None:
+            total = totals[key] = dict([(bound, box[bound]) for bound in BOUNDS] + [('result', 0)])
+        total['result'] += result['result']
+        if 'error' in result: # If the result was estimated from a sample
+            total['error'] = math.sqrt(total.get('error', 0) ** 2 + result['error'] ** 2)
+
+    return totals.values()
+
 class PolygonStrategy:
     ''' Strategy for breaking complex polygons into inscribed coordinate boxes. '''
 
+    def encode_results_geojson(self, results):
+        '''
+        @param results Sub-area results to be encoded
+        @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @returns GeoJSON encoded results for the area of interest
+        @returnType string/GeoJSON
+        '''
+        raise NotImplementedError()
+
+    def encode_results_mvt(self, results, zoom, x, y):
+        '''
+        @param results Sub-area results to be encoded
+        @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @param zoom Zoom level of the tile
+        @paramType int
+        @param x Column of the tile
+        @paramType int
+        @param y Row of the tile
+        @paramType int
+        @returns Mapbox Vector Tile holding the results which fall inside the z/x/y tile
+        @returnType string/binary
+        '''
+        raise NotImplementedError()
+
     def get_inscribed_boxes(self):
         '''
         @returns The coordinates boxes inscribed inside the complex polygon.
@@ -13,6 +96,41 @@ class PolygonStrategy:
         '''
         raise NotImplementedError()
 
+    def get_num_boxes(self):
+        '''
+        @returns # of coordinate boxes get_inscribed_boxes() would return, computed without
+        enumerating them where possible
+        @returnType int
+        '''
+        raise NotImplementedError()
+
+    def get_result_boxes(self):
+        '''
+        @returns The sub-areas results are reported for, when tweets are attributed to them one by
+        one, such as by a standing query. Usually the inscribed boxes themselves.
+        @returnType List of dictionaries containing keys 'min_lat', 'max_lat', 'min_lon', 'max_lon'
+        '''
+        return self.get_inscribed_boxes()
+
+    def iter_inscribed_boxes(self):
+        '''
+        @returns The coordinate boxes inscribed inside the complex polygon, generated lazily where
+        possible so very large areas never need to be held in memory at once
+        @returnType iterator of dictionaries containing keys 'min_lat', 'max_lat', 'min_lon', 'max_lon'
+        '''
+        raise NotImplementedError()
+
+    def iter_results_geojson(self, results, chunk_size=1000):
+        '''
+        @param results Sub-area results to be encoded
+        @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @param chunk_size # of polygons to encode per chunk
+        @paramType int
+        @returns Iterator over the GeoJSON encoded results in chunks
+        @returnType iterator of string/GeoJSON
+        '''
+        raise NotImplementedError()
+
     def to_dict(self):
         '''
         Serializes the polygon strategies state into a dictionary for later JSON encoding.
@@ -23,6 +141,21 @@ class PolygonStrategy:
         '''
         raise NotImplementedError()
 
+    def write_results_geojson(self, results, stream, chunk_size=1000):
+        '''
+        Writes the GeoJSON encoded results to the stream as they are encoded.
+
+        @param results Sub-area results to be encoded
+        @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @param stream Destination of the encoded results
+        @paramType file-like object with write() or socket with sendall()
+        @param chunk_size # of polygons to encode per chunk
+        @paramType int
+        @returns # of characters written
+        @returnType int
+        '''
+        raise NotImplementedError()
+
 class PolygonStrategyFactory:
     ''' Handles constructing and reconstructing the polygon strategy. '''
     
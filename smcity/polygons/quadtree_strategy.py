@@ -0,0 +1,223 @@
+''' Adaptive resolution quadtree strategy which splits dense cells. '''
+
+import numpy
+
+from smcity.logging.logger import Logger
+from smcity.polygons.geojson_encoder import iter_results_geojson, write_chunks
+from smcity.polygons.mvt_encoder import encode_results_mvt
+from smcity.polygons.polygon_strategy import PolygonStrategy, PolygonStrategyFactory, \
+    get_containing_box_finder, sum_results
+
+logger = Logger(__name__)
+
+# Flags marking each cell of the quadtree as split or kept, visiting the cells in pre-order
+SPLIT = '1'
+LEAF = '0'
+
+def build_quadtree_strategy(coordinate_box, estimate_count, max_count, style_strategy, max_depth=12):
+    '''
+    Builds a quadtree over the coordinate box, splitting each cell into quarters until its
+    estimated # of tweets is at most max_count, so every task does a similar amount of work.
+
+    @param coordinate_box Area of interest
+    @paramType dictionary with keys 'min_lat', 'max_lat', 'min_lon', 'max_lon'
+    @param estimate_count Estimates the # of tweets in a cell, see estimate_from_results()
+    @paramType function accepting a coordinate box dictionary and returning a float
+    @param max_count Largest estimated # of tweets a cell may hold before it is split
+    @paramType float
+    @param style_strategy Strategy used to stylize the polygons
+    @paramType StyleStrategy
+    @param max_depth # of times a cell may be split, bounding the size of the smallest cells
+    @paramType int
+    @returns Quadtree strategy over the area
+    @returnType QuadtreeStrategy
+    '''
+    assert max_count > 0, max_count
+    assert max_depth >= 0, max_depth
+
+    splits = []
+    cells = [(coordinate_box, 0)]
+    while len(cells) > 0: # Depth first, so the flags come out in pre-order
+        cell, depth = cells.pop()
+
+        if depth == max_depth or estimate_count(cell) <= max_count: # Sparse enough, keep the cell
+            splits.append(LEAF)
+            continue
+
+        splits.append(SPLIT)
+        cells.extend([(quarter, depth + 1) for quarter in reversed(get_quarters(cell))])
+
+    strategy = QuadtreeStrategy(coordinate_box, ''.join(splits), style_strategy)
+    logger.debug("Split the area of interest into %s quadtree cells", strategy.get_num_boxes())
+    return strategy
+
+def estimate_from_results(results):
+    '''
+    Builds a density estimate out of coarse results, such as those of a sampled count_tweets job
+    over a SimpleGridStrategy. Tweets are assumed to be spread evenly within each result's box.
+
+    @param results Coarse sub-area results
+    @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+    @returns Estimates the # of tweets in a coordinate box
+    @returnType function accepting a coordinate box dictionary and returning a float
+    '''
+    min_lats = numpy.array([result['min_lat'] for result in results], dtype=float)
+    min_lons = numpy.array([result['min_lon'] for result in results], dtype=float)
+    max_lats = numpy.array([result['max_lat'] for result in results], dtype=float)
+    max_lons = numpy.array([result['max_lon'] for result in results], dtype=float)
+    values = numpy.array([result['result'] for result in results], dtype=float)
+    areas = (max_lats - min_lats) * (max_lons - min_lons)
+
+    def estimate_count(coordinate_box):
+        lat_overlaps = numpy.clip(
+            numpy.minimum(max_lats, coordinate_box['max_lat']) - numpy.maximum(min_lats, coordinate_box['min_lat']),
+            0, None)
+        lon_overlaps = numpy.clip(
+            numpy.minimum(max_lons, coordinate_box['max_lon']) - numpy.maximum(min_lons, coordinate_box['min_lon']),
+            0, None)
+        overlaps = lat_overlaps * lon_overlaps
+
+        has_area = areas > 0
+        return float(numpy.sum(values[has_area] * overlaps[has_area] / areas[has_area]))
+
+    return estimate_count
+
+def get_leaves(coordinate_box, splits):
+    '''
+    @param coordinate_box Area of interest, the root of the quadtree
+    @paramType dictionary with keys 'min_lat', 'max_lat', 'min_lon', 'max_lon'
+    @param splits SPLIT or LEAF flag of each cell of the quadtree, in pre-order
+    @paramType string
+    @returns Cells of the quadtree which are not split any further, in pre-order
+    @returnType list of dictionaries with keys 'min_lat', 'max_lat', 'min_lon', 'max_lon'
+    '''
+    leaves = []
+    cells = [coordinate_box]
+    for split in splits:
+        assert len(cells) > 0, "More split flags than quadtree cells"
+        cell = cells.pop()
+
+        if split == LEAF:
+            leaves.append(cell)
+        else:
+            cells.extend(reversed(get_quarters(cell)))
+    assert len(cells) == 0, "Fewer split flags than quadtree cells"
+
+    return leaves
+
+def get_quarters(cell):
+    '''
+    @param cell Quadtree cell being split
+    @paramType dictionary with keys 'min_lat', 'max_lat', 'min_lon', 'max_lon'
+    @returns Quarters of the cell, south west, south east, north west, then north east
+    @returnType list of dictionaries with keys 'min_lat', 'max_lat', 'min_lon', 'max_lon'
+    '''
+    mid_lat = (cell['min_lat'] + cell['max_lat']) / 2.0
+    mid_lon = (cell['min_lon'] + cell['max_lon']) / 2.0
+
+    quarters = []
+    for min_lat, max_lat in ((cell['min_lat'], mid_lat), (mid_lat, cell['max_lat'])):
+        for min_lon, max_lon in ((cell['min_lon'], mid_lon), (mid_lon, cell['max_lon'])):
+            quarters.append({'min_lat' : min_lat, 'min_lon' : min_lon, 'max_lat' : max_lat, 'max_lon' : max_lon})
+
+    return quarters
+
+class QuadtreeStrategy(PolygonStrategy):
+    '''
+    Adaptive resolution strategy whose cells are the leaves of a quadtree over the area of interest.
+    The tree is kept as one split flag per cell, so even trees of many thousands of leaves fit into
+    the job record.
+    '''
+
+    def __init__(self, coordinate_box, splits, style_strategy):
+        '''
+        Constructor. Use build_quadtree_strategy() to split the area based on density estimates.
+
+        @param coordinate_box Area of interest
+        @paramType dictionary with keys 'min_lat', 'max_lat', 'min_lon', 'max_lon'
+        @param splits SPLIT or LEAF flag of each cell of the quadtree, in pre-order
+        @paramType string
+        @param style_strategy Strategy used to stylize the polygons
+        @paramType StyleStrategy
+        @returns n/a
+        '''
+        assert 'min_lat' in coordinate_box.keys()
+        assert 'max_lat' in coordinate_box.keys()
+        assert 'min_lon' in coordinate_box.keys()
+        assert 'max_lon' in coordinate_box.keys()
+        assert len(splits) > 0, len(splits)
+        assert style_strategy is not None
+
+        self.coordinate_box = coordinate_box
+        self.leaves = get_leaves(coordinate_box, splits)
+        self.splits = splits
+        self.style_strategy = style_strategy
+
+    def encode_results_geojson(self, results):
+        ''' {@inheritDocs} '''
+        return ''.join(self.iter_results_geojson(results))
+
+    def encode_results_mvt(self, results, zoom, x, y):
+        ''' {@inheritDocs} '''
+        return encode_results_mvt(self.get_leaf_results(results), self.style_strategy, zoom, x, y)
+
+    def get_inscribed_boxes(self):
+        ''' {@inheritDocs} '''
+        return [dict(leaf) for leaf in self.leaves]
+
+    def get_leaf_results(self, results):
+        '''
+        @param results Sub-area results, including those of split leaves
+        @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @returns One result per leaf reported on, see sum_results()
+        @returnType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        '''
+        return sum_results(results, get_containing_box_finder(self.leaves))
+
+    def get_num_boxes(self):
+        ''' {@inheritDocs} '''
+        return len(self.leaves)
+
+    def iter_inscribed_boxes(self):
+        ''' {@inheritDocs} '''
+        return iter(self.get_inscribed_boxes())
+
+    def iter_results_geojson(self, results, chunk_size=1000):
+        ''' Split leaves are encoded whole, see get_leaf_results(). {@inheritDocs} '''
+        return iter_results_geojson(self.get_leaf_results(results), self.style_strategy, chunk_size)
+
+    def to_dict(self):
+        ''' {@inheritDocs} '''
+        return {
+            'class' : 'quadtree',
+            'coordinate_box' : self.coordinate_box,
+            'splits' : self.splits,
+            'style_strategy' : self.style_strategy.to_dict()
+        }
+
+    def write_results_geojson(self, results, stream, chunk_size=1000):
+        ''' {@inheritDocs} '''
+        return write_chunks(self.iter_results_geojson(results, chunk_size), stream)
+
+class QuadtreeStrategyFactory(PolygonStrategyFactory):
+    ''' Quadtree strategy implementation of the PolygonStrategyFactory. '''
+
+    def __init__(self, style_strategy_factory):
+        '''
+        Constructor.
+
+        @param style_strategy_factory Interface for reconstructing the style strategy associated
+        with the to be reconstructed polygon strategy
+        @paramType StyleStrategyFactory
+        @returns n/a
+        '''
+        assert style_strategy_factory is not None
+
+        self.style_strategy_factory = style_strategy_factory
+
+    def from_dict(self, state):
+        ''' {@inheritDocs} '''
+        return QuadtreeStrategy(
+            state['coordinate_box'], state['splits'],
+            self.style_strategy_factory.from_dict(state['style_strategy'])
+        )
@@ -0,0 +1,126 @@
+''' Static R-tree over coordinate boxes, bulk loaded with Sort-Tile-Recursive (STR) packing. '''
+
+import math
+import numpy
+
+class StrTree:
+    '''
+    Read only R-tree over a fixed set of coordinate boxes. Packing the boxes with STR keeps
+    sibling nodes from overlapping much, so queries only visit the few branches near the point.
+    '''
+
+    def __init__(self, boxes, node_capacity=16):
+        '''
+        Constructor. Bulk loads the tree.
+
+        @param boxes Boxes to be indexed, referred to by their position
+        @paramType numpy array of float with shape (n, 4) holding columns min_lat, min_lon, max_lat, max_lon
+        @param node_capacity Largest # of children of each node
+        @paramType int
+        @returns n/a
+        '''
+        assert node_capacity > 1, node_capacity
+
+        self.node_capacity = node_capacity
+
+        # Each level holds its boxes and, above the items, the indices of each node's children
+        boxes = numpy.asarray(boxes, dtype=float).reshape(-1, 4)
+        self.level_boxes = [boxes]
+        self.level_children = [None]
+
+        while len(self.level_boxes[-1]) > node_capacity:
+            children = self._pack(self.level_boxes[-1])
+            below = self.level_boxes[-1]
+
+            self.level_boxes.append(numpy.array([
+                [below[group, 0].min(), below[group, 1].min(), below[group, 2].max(), below[group, 3].max()]
+                for group in children
+            ]))
+            self.level_children.append(children)
+
+    def _pack(self, boxes):
+        '''
+        @param boxes Boxes of the level being packed
+        @paramType numpy array of float with shape (n, 4)
+        @returns Groups of at most node_capacity boxes which are close together, sliced by
+        longitude and then latitude
+        @returnType list of numpy arrays of int
+        '''
+        num_nodes = int(math.ceil(len(boxes) / float(self.node_capacity)))
+        slice_size = int(math.ceil(math.sqrt(num_nodes))) * self.node_capacity
+
+        center_lats = (boxes[:, 0] + boxes[:, 2]) / 2.0
+        center_lons = (boxes[:, 1] + boxes[:, 3]) / 2.0
+
+        groups = []
+        by_lon = numpy.argsort(center_lons, kind='mergesort')
+        for start in range(0, len(boxes), slice_size):
+            vertical_slice = by_lon[start:start + slice_size]
+            vertical_slice = vertical_slice[numpy.argsort(center_lats[vertical_slice], kind='mergesort')]
+
+            for group_start in range(0, len(vertical_slice), self.node_capacity):
+                groups.append(vertical_slice[group_start:group_start + self.node_capacity])
+
+        return groups
+
+    def query_box(self, coordinate_box):
+        '''
+        @param coordinate_box Area of interest
+        @paramType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+        @returns Positions of the indexed boxes which overlap the area
+        @returnType list of int
+        '''
+        def overlaps(boxes):
+            return (boxes[:, 0] <= coordinate_box['max_lat']) & (boxes[:, 2] >= coordinate_box['min_lat']) & \
+                (boxes[:, 1] <= coordinate_box['max_lon']) & (boxes[:, 3] >= coordinate_box['min_lon'])
+
+        top = len(self.level_boxes) - 1
+        candidates = numpy.flatnonzero(overlaps(self.level_boxes[top]))
+
+        for level in range(top, 0, -1): # Descend into the overlapping nodes
+            children = numpy.concatenate([self.level_children[level][node] for node in candidates]) \
+                if len(candidates) > 0 else numpy.zeros(0, dtype=int)
+            candidates = children[overlaps(self.level_boxes[level - 1][children])]
+
+        return sorted(candidates.tolist())
+
+    def query_points(self, lats, lons):
+        '''
+        Finds the indexed boxes containing each point, filtering all of the points through each
+        visited node at once.
+
+        @param lats Latitudes of the points
+        @paramType numpy array of float
+        @param lons Longitudes of the points
+        @paramType numpy array of float
+        @returns Matching (point position, box position) pairs
+        @returnType tuple of numpy arrays of int (point positions, box positions)
+        '''
+        lats = numpy.asarray(lats, dtype=float)
+        lons = numpy.asarray(lons, dtype=float)
+
+        point_matches = []
+        box_matches = []
+
+        # Each entry is a level, a node on that level and the points which may fall inside it
+        pending = [(len(self.level_boxes) - 1, node, numpy.arange(len(lats)))
+            for node in range(len(self.level_boxes[-1]))]
+        while len(pending) > 0:
+            level, node, points = pending.pop()
+
+            box = self.level_boxes[level][node]
+            points = points[(lats[points] >= box[0]) & (lats[points] <= box[2]) &
+                (lons[points] >= box[1]) & (lons[points] <= box[3])]
+            if len(points) == 0:
+                continue
+
+            if level == 0: # Reached an indexed box
+                point_matches.append(points)
+                box_matches.append(numpy.repeat(node, len(points)))
+            else:
+                pending.extend([(level - 1, child, points) for child in self.level_children[level][node]])
+
+        if len(point_matches) == 0:
+            return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int)
+
+        return numpy.concatenate(point_matches), numpy.concatenate(box_matches)
@@ -1,14 +1,21 @@
 ''' Simple arbitrary resolution grid strategy. '''
 
-import geojson
-
-from geojson import Feature, FeatureCollection, Polygon
+import copy
+import math
+import numpy
 
 from smcity.logging.logger import Logger
-from smcity.polygons.polygon_strategy import PolygonStrategy, PolygonStrategyFactory
+from smcity.polygons.geojson_encoder import iter_results_geojson, write_chunks
+from smcity.polygons.mvt_encoder import encode_results_mvt
+from smcity.polygons.png_encoder import encode_png
+from smcity.polygons.tiles import get_pixel_lats, get_pixel_lons
+from smcity.polygons.polygon_strategy import PolygonStrategy, PolygonStrategyFactory, sum_results
 
 logger = Logger(__name__)
 
+# Slack used when snapping result coordinates back onto grid positions
+GRID_EPSILON = 1e-9
+
 class SimpleGridStrategy(PolygonStrategy):
     ''' Simple arbitrary resolution grid strategy. '''
 
@@ -44,59 +51,272 @@ class SimpleGridStrategy(PolygonStrategy):
         @returns GeoJSON encoded results for the grid area
         @returnType string/GeoJSON
         '''
-        features = []
+        return ''.join(self.iter_results_geojson(results))
+
+    def iter_results_geojson(self, results, chunk_size=1000):
+        '''
+        Generates GeoJSON encoded results for the grid area requested in chunks, so the first bytes
+        are available before the whole result set is encoded.
+
+        @param results Sub-area results to be encoded
+        @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @param chunk_size # of polygons to encode per chunk
+        @paramType int
+        @returns Iterator over the encoded chunks
+        @returnType iterator of string/GeoJSON
+        '''
+        return iter_results_geojson(self.get_cell_results(results), self.style_strategy, chunk_size)
+
+    def write_results_geojson(self, results, stream, chunk_size=1000):
+        '''
+        Writes GeoJSON encoded results for the grid area requested to the stream as they are encoded.
+
+        @param results Sub-area results to be encoded
+        @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @param stream Destination of the encoded results
+        @paramType file-like object with write() or socket with sendall()
+        @param chunk_size # of polygons to encode per chunk
+        @paramType int
+        @returns # of characters written
+        @returnType int
+        '''
+        return write_chunks(self.iter_results_geojson(results, chunk_size), stream)
+
+    def encode_results_mvt(self, results, zoom, x, y):
+        '''
+        Generates a Mapbox Vector Tile holding the grid cells which fall inside the z/x/y tile.
+
+        @param results Sub-area results to be encoded
+        @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @param zoom Zoom level of the tile
+        @paramType int
+        @param x Column of the tile, 0 being the western most
+        @paramType int
+        @param y Row of the tile, 0 being the northern most
+        @paramType int
+        @returns MVT encoded tile
+        @returnType string/binary
+        '''
+        return encode_results_mvt(self.get_cell_results(results), self.style_strategy, zoom, x, y)
+
+    def encode_results_png(self, results, pixels_per_cell=1):
+        '''
+        Renders the results for the whole grid area as a heat map image, one block of pixels per
+        grid cell with north at the top. Cells without results are transparent.
+
+        @param results Sub-area results to be rendered
+        @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @param pixels_per_cell Width and height of each grid cell in pixels
+        @paramType int
+        @returns PNG encoded image of the grid area
+        @returnType string/binary
+        '''
+        assert pixels_per_cell > 0, pixels_per_cell
+
+        cell_results = self.get_cell_results(results) # Styled on the cells' values, not the split pieces'
+        self.style_strategy.prep_styling(cell_results)
+        cells = self._render_cells(self._get_value_grid(cell_results))[::-1] # Flip so north is up
+
+        pixels = cells.repeat(pixels_per_cell, axis=0).repeat(pixels_per_cell, axis=1)
+        return encode_png(pixels)
+
+    def encode_results_png_tile(self, results, zoom, x, y, tile_size=256):
+        '''
+        Renders the results as a z/x/y web mercator heat map tile. Pixels outside of the grid area or
+        over cells without results are transparent.
+
+        @param results Sub-area results to be rendered
+        @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @param zoom Zoom level of the tile
+        @paramType int
+        @param x Column of the tile, 0 being the western most
+        @paramType int
+        @param y Row of the tile, 0 being the northern most
+        @paramType int
+        @param tile_size Width and height of the tile in pixels
+        @paramType int
+        @returns PNG encoded tile
+        @returnType string/binary
+        '''
+        cell_results = self.get_cell_results(results) # Styled on the cells' values, not the split pieces'
+        self.style_strategy.prep_styling(cell_results)
+        cells = self._render_cells(self._get_value_grid(cell_results))
+        lat_steps, lon_steps = self._get_grid_shape()
+
+        # Find the grid cell under each pixel
+        lats = get_pixel_lats(zoom, y, tile_size)
+        lons = get_pixel_lons(zoom, x, tile_size)
+        rows = numpy.clip(numpy.floor((lats - self.coordinate_box['min_lat']) / self.resolution).astype(int),
+            0, lat_steps - 1)
+        columns = numpy.clip(numpy.floor((lons - self.coordinate_box['min_lon']) / self.resolution).astype(int),
+            0, lon_steps - 1)
+        pixels = cells[rows[:, numpy.newaxis], columns[numpy.newaxis, :]]
+
+        # Clear out any pixels which fall outside of the grid area
+        lats_inside = (lats >= self.coordinate_box['min_lat']) & (lats <= self.coordinate_box['max_lat'])
+        lons_inside = (lons >= self.coordinate_box['min_lon']) & (lons <= self.coordinate_box['max_lon'])
+        pixels[~(lats_inside[:, numpy.newaxis] & lons_inside[numpy.newaxis, :])] = 0
+
+        return encode_png(pixels)
+
+    def get_cell_position(self, lat, lon):
+        '''
+        @param lat Latitude of the point
+        @paramType float
+        @param lon Longitude of the point
+        @paramType float
+        @returns Grid position of the cell containing the point
+        @returnType tuple of int (lat step, lon step)
+        '''
+        lat_step = int(math.floor((lat - self.coordinate_box['min_lat']) / self.resolution + GRID_EPSILON))
+        lon_step = int(math.floor((lon - self.coordinate_box['min_lon']) / self.resolution + GRID_EPSILON))
+
+        return lat_step, lon_step
+
+    def get_cell_results(self, results):
+        '''
+        @param results Sub-area results, including those of split cells
+        @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @returns One result per grid cell reported on, results for boxes smaller than a grid cell
+        being summed into the cell which contains them, see sum_results()
+        @returnType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        '''
+        def get_cell(result):
+            lat_step, lon_step = self.get_cell_position(result['min_lat'], result['min_lon'])
+            min_lat = self.coordinate_box['min_lat'] + lat_step * self.resolution
+            min_lon = self.coordinate_box['min_lon'] + lon_step * self.resolution
+
+            return {
+                'min_lat' : min_lat,
+                'min_lon' : min_lon,
+                'max_lat' : min(min_lat + self.resolution, self.coordinate_box['max_lat']),
+                'max_lon' : min(min_lon + self.resolution, self.coordinate_box['max_lon'])
+            }
+
+        return sum_results(results, get_cell)
+
+    def get_coarser_strategy(self, factor):
+        '''
+        @param factor How many times larger the coarser grid's cells are along each axis
+        @paramType int
+        @returns Grid strategy over the same area with larger cells
+        @returnType SimpleGridStrategy
+        '''
+        assert factor >= 1, factor
+
+        return SimpleGridStrategy(
+            self.coordinate_box, self.resolution * factor, copy.deepcopy(self.style_strategy)
+        )
+
+    def _get_grid_shape(self):
+        '''
+        @returns # of grid cells along the latitude and longitude axes
+        @returnType tuple of int (lat_steps, lon_steps)
+        '''
+        lat_steps = int((self.coordinate_box['max_lat'] - self.coordinate_box['min_lat']) / self.resolution) + 1
+        lon_steps = int((self.coordinate_box['max_lon'] - self.coordinate_box['min_lon']) / self.resolution) + 1
 
-        # Prime the style strategy
-        self.style_strategy.prep_styling(results)
-        
-        for result in results: # Encode the results as polygons
-            logger.debug(
-                "(%s, %s) : (%s %s) = %s", result['min_lon'], result['min_lat'], result['max_lon'],
-                result['max_lat'], result['result']
-            )
-            corner1 = (result['min_lon'], result['min_lat'])
-            corner2 = (result['min_lon'], result['max_lat'])
-            corner3 = (result['max_lon'], result['max_lat'])
-            corner4 = (result['max_lon'], result['min_lat'])
+        return lat_steps, lon_steps
 
-            polygon = Polygon([[corner1, corner2, corner3, corner4, corner1]])
-            style = self.style_strategy.style_result_geojson(result)
-            features.append(Feature(geometry=polygon, properties=style))
+    def _get_value_grid(self, results):
+        '''
+        Arranges the sub-area results by grid position. Results for boxes smaller than a grid cell
+        are summed into the cell which contains them.
 
-        return geojson.dumps(FeatureCollection(features))
+        @param results Sub-area results to be arranged
+        @paramType List of dictionaries containing keys 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'result'
+        @returns Result values indexed by [lat step, lon step], NaN where no result was provided
+        @returnType numpy array of float
+        '''
+        lat_steps, lon_steps = self._get_grid_shape()
+        values = numpy.zeros((lat_steps, lon_steps))
+        has_value = numpy.zeros((lat_steps, lon_steps), dtype=bool)
+
+        for result in results:
+            lat_step, lon_step = self.get_cell_position(result['min_lat'], result['min_lon'])
+            if 0 <= lat_step < lat_steps and 0 <= lon_step < lon_steps:
+                values[lat_step, lon_step] += result['result']
+                has_value[lat_step, lon_step] = True
+
+        values[~has_value] = numpy.nan
+        return values
+
+    def _render_cells(self, values):
+        '''
+        Colors each grid cell using the style strategy. Must be called after prep_styling().
+
+        @param values Result values indexed by grid position, NaN where no result was provided
+        @paramType numpy array of float
+        @returns RGBA color of each grid cell, transparent where no result was provided
+        @returnType numpy array of uint8 with a trailing dimension of size 4
+        '''
+        cells = numpy.zeros(values.shape + (4,), dtype=numpy.uint8)
+        has_value = ~numpy.isnan(values)
+
+        cells[has_value, :3] = self.style_strategy.get_rgb_colors(values[has_value])
+        cells[has_value, 3] = 255
+
+        return cells
+
+    def get_inscribed_box_array(self):
+        '''
+        @returns The grid's coordinate boxes in the order of iter_inscribed_boxes(), built without
+        any per-cell Python objects for bulk consumers
+        @returnType numpy array of float with shape (# of boxes, 4) holding columns min_lat, min_lon,
+        max_lat, max_lon
+        '''
+        lat_steps, lon_steps = self._get_grid_shape()
+
+        start_lats = self.coordinate_box['min_lat'] + numpy.arange(lat_steps) * self.resolution
+        stop_lats = numpy.minimum(start_lats + self.resolution, self.coordinate_box['max_lat'])
+        start_lons = self.coordinate_box['min_lon'] + numpy.arange(lon_steps) * self.resolution
+        stop_lons = numpy.minimum(start_lons + self.resolution, self.coordinate_box['max_lon'])
+
+        boxes = numpy.empty((lat_steps, lon_steps, 4))
+        boxes[:, :, 0] = start_lats[:, numpy.newaxis]
+        boxes[:, :, 1] = start_lons[numpy.newaxis, :]
+        boxes[:, :, 2] = stop_lats[:, numpy.newaxis]
+        boxes[:, :, 3] = stop_lons[numpy.newaxis, :]
+
+        return boxes.reshape(-1, 4)
 
     def get_inscribed_boxes(self):
         ''' {@inheritDocs} '''
-        coordinate_boxes = []
+        return list(self.iter_inscribed_boxes())
 
+    def get_num_boxes(self):
+        ''' {@inheritDocs} '''
+        lat_steps, lon_steps = self._get_grid_shape()
+
+        return lat_steps * lon_steps
+
+    def iter_inscribed_boxes(self):
+        ''' {@inheritDocs} '''
         max_lat = self.coordinate_box['max_lat']
         max_lon = self.coordinate_box['max_lon']
         min_lat = self.coordinate_box['min_lat']
         min_lon = self.coordinate_box['min_lon']
 
-        lat_steps = int((max_lat - min_lat) / self.resolution) + 1
-        lon_steps = int((max_lon - min_lon) / self.resolution) + 1
+        lat_steps, lon_steps = self._get_grid_shape()
 
-        for lat_step in range(lat_steps):
+        for lat_step in xrange(lat_steps):
             start_lat = min_lat + lat_step * self.resolution
             stop_lat = start_lat + self.resolution
             if stop_lat > max_lat: 
                 stop_lat = max_lat
 
-            for lon_step in range(lon_steps):
+            for lon_step in xrange(lon_steps):
                 start_lon = min_lon + lon_step * self.resolution
                 stop_lon = start_lon + self.resolution
                 if stop_lon > max_lon:
                     stop_lon = max_lon
 
-                coordinate_boxes.append({
+                yield {
                     'min_lat' : start_lat, 
                     'min_lon' : start_lon, 
                     'max_lat' : stop_lat,
                     'max_lon' : stop_lon
-                })
-
-        return coordinate_boxes
+                }
 
     def to_dict(self):
         ''' {@ineritDocs} '''
@@ -0,0 +1,118 @@
+''' Unit tests for the GeoJsonPolygonStrategy class. '''
+
+import json
+import numpy
+
+from smcity.polygons import geojson_polygon_strategy
+from smcity.polygons.geojson_polygon_strategy import GeoJsonPolygonStrategy, GeoJsonPolygonStrategyFactory, \
+    decompose_polygon
+from smcity.polygons.geometry import get_edges, points_in_polygon
+from smcity.polygons.test.test_quadtree_strategy import MockStyleStrategyFactory
+from smcity.polygons.test.test_simple_grid_strategy import MockStyleStrategy
+
+# An L shape covering three quarters of the 0..4 square
+L_SHAPE = {
+    'type' : 'Polygon',
+    'coordinates' : [[[0, 0], [4, 0], [4, 2], [2, 2], [2, 4], [0, 4], [0, 0]]]
+}
+
+# A 0..4 square with a 1..3 hole
+DONUT = {
+    'type' : 'Polygon',
+    'coordinates' : [
+        [[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]],
+        [[1, 1], [3, 1], [3, 3], [1, 3], [1, 1]]
+    ]
+}
+
+TRIANGLE = {
+    'type' : 'MultiPolygon',
+    'coordinates' : [[[[0, 0], [4, 0], [0, 4], [0, 0]]]]
+}
+
+def count_inside(boxes, lons, lats):
+    ''' Counts the points which the decomposed boxes hold, testing boundary boxes' rings. '''
+    count = 0
+    for box in boxes:
+        in_box = (lons >= box['min_lon']) & (lons < box['max_lon']) & \
+            (lats >= box['min_lat']) & (lats < box['max_lat'])
+        if 'rings' in box:
+            in_box &= points_in_polygon(lons, lats, get_edges(box['rings']))
+        count += int(in_box.sum())
+    return count
+
+class TestGeoJsonPolygonStrategy:
+    ''' Unit tests for the GeoJsonPolygonStrategy class. '''
+
+    def test_decompose_polygon(self):
+        ''' Tests that cells inside the polygon are merged and no boundary boxes are needed for an aligned shape. '''
+        boxes = decompose_polygon(L_SHAPE, 0.5)
+
+        inside_boxes = [box for box in boxes if 'rings' not in box]
+        area = sum([(box['max_lat'] - box['min_lat']) * (box['max_lon'] - box['min_lon']) for box in inside_boxes])
+        assert area == 12, area
+        assert len(inside_boxes) <= 3, inside_boxes
+
+    def test_decompose_polygon_points(self):
+        ''' Tests that the boxes hold exactly the points inside the polygon. '''
+        random = numpy.random.RandomState(0)
+        lons = random.uniform(-1, 5, 5000)
+        lats = random.uniform(-1, 5, 5000)
+
+        for geometry in (L_SHAPE, DONUT, TRIANGLE):
+            boxes = decompose_polygon(geometry, 0.5)
+            expected = int(points_in_polygon(lons, lats, get_edges(geometry['coordinates'][0]
+                if geometry['type'] == 'MultiPolygon' else geometry['coordinates'])).sum())
+            assert count_inside(boxes, lons, lats) == expected, geometry
+
+    def test_decompose_polygon_resolution(self):
+        ''' Tests that boundary boxes are no larger than the resolution. '''
+        for box in decompose_polygon(TRIANGLE, 0.5):
+            if 'rings' in box:
+                assert box['max_lat'] - box['min_lat'] <= 0.5, box
+                assert box['max_lon'] - box['min_lon'] <= 0.5, box
+
+    def test_get_inscribed_boxes_cached(self):
+        ''' Tests that the decomposition is cached by polygon. '''
+        geojson_polygon_strategy._decomposition_cache.clear()
+
+        strategy = GeoJsonPolygonStrategy(DONUT, 0.5, MockStyleStrategy())
+        boxes = strategy.get_inscribed_boxes()
+        assert len(geojson_polygon_strategy._decomposition_cache) == 1
+
+        # An equal polygon reuses the decomposition
+        other = GeoJsonPolygonStrategy(json.loads(json.dumps(DONUT)), 0.5, MockStyleStrategy())
+        assert other.get_inscribed_boxes() == boxes
+        assert len(geojson_polygon_strategy._decomposition_cache) == 1
+
+        # Modifying the returned boxes does not corrupt the cache
+        boxes[0]['min_lat'] = 100
+        assert strategy.get_inscribed_boxes()[0]['min_lat'] != 100
+
+    def test_get_box_results_split(self):
+        ''' Tests that the results of a split box are summed back up into the box. '''
+        strategy = GeoJsonPolygonStrategy(TRIANGLE, 0.5, MockStyleStrategy())
+        box = strategy.get_inscribed_boxes()[-1] # Boundary box, carrying the rings
+        assert 'rings' in box, box
+        mid_lon = (box['min_lon'] + box['max_lon']) / 2.0
+        results = [dict(box, max_lon=mid_lon, result=2), dict(box, min_lon=mid_lon, result=3)]
+
+        box_results = strategy.get_box_results(results)
+        assert len(box_results) == 1, box_results
+        assert box_results[0]['result'] == 5, box_results
+        assert [box_results[0][key] for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon')] == \
+            [box[key] for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon')], (box_results, box)
+
+        collection = json.loads(strategy.encode_results_geojson(results))
+        assert len(collection['features']) == 1, collection['features']
+        assert collection['features'][0]['properties']['fill'] == '#000005', collection['features'][0]
+
+    def test_to_dict(self):
+        ''' Tests serializing and reconstructing the strategy. '''
+        strategy = GeoJsonPolygonStrategy(TRIANGLE, 0.5, MockStyleStrategy())
+
+        state = json.loads(json.dumps(strategy.to_dict()))
+        assert state['class'] == 'geojson_polygon', state['class']
+
+        rebuilt = GeoJsonPolygonStrategyFactory(MockStyleStrategyFactory()).from_dict(state)
+        assert rebuilt.get_inscribed_boxes() == strategy.get_inscribed_boxes()
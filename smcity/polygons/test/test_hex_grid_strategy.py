@@ -0,0 +1,104 @@
+''' Unit tests for the HexGridStrategy class. '''
+
+import json
+import numpy
+
+from smcity.polygons.geometry import get_edges, points_in_polygon
+from smcity.polygons.hex_grid_strategy import HexGridStrategy, HexGridStrategyFactory, HexIndex
+from smcity.polygons.test.test_quadtree_strategy import MockStyleStrategyFactory
+from smcity.polygons.test.test_simple_grid_strategy import MockStyleStrategy
+
+class TestHexGridStrategy:
+    ''' Unit tests for the HexGridStrategy class. '''
+
+    def setup(self):
+        ''' Set up before each test. '''
+        self.coordinate_box = {'min_lat' : 50, 'min_lon' : 10, 'max_lat' : 51, 'max_lon' : 12}
+        self.strategy = HexGridStrategy(self.coordinate_box, 0.1, MockStyleStrategy())
+
+        random = numpy.random.RandomState(0)
+        self.lats = random.uniform(50, 51, 2000)
+        self.lons = random.uniform(10, 12, 2000)
+
+    def test_get_hex_positions(self):
+        ''' Tests that each point is placed in the hex whose outline contains it. '''
+        qs, rs = self.strategy.get_hex_positions(self.lats, self.lons)
+
+        for index in range(0, len(self.lats), 50):
+            edges = get_edges([self.strategy.get_hex_ring(qs[index], rs[index])])
+            assert points_in_polygon([self.lons[index]], [self.lats[index]], edges)[0], index
+
+    def test_get_hex_positions_center(self):
+        ''' Tests that hex centers map back onto their own hex. '''
+        center_lat, center_lon = self.strategy.get_hex_center(3, -2)
+        qs, rs = self.strategy.get_hex_positions([center_lat], [center_lon])
+        assert (qs[0], rs[0]) == (3, -2), (qs, rs)
+
+    def test_bin_points(self):
+        ''' Tests that binning agrees with testing the points against each hex's outline. '''
+        boxes = self.strategy.get_hex_boxes()
+        counts = self.strategy.bin_points(self.lats, self.lons)
+
+        assert len(counts) == len(boxes), (len(counts), len(boxes))
+        assert counts.sum() == len(self.lats), counts.sum()
+
+        for index in range(0, len(boxes), 7):
+            inside = points_in_polygon(self.lons, self.lats, get_edges(boxes[index]['rings']))
+            assert counts[index] == inside.sum(), index
+
+    def test_get_inscribed_boxes(self):
+        ''' Tests that the scan tiles cover every hex and bin the points like the whole grid does. '''
+        tiles = self.strategy.get_inscribed_boxes()
+        assert len(tiles) == self.strategy.get_num_boxes(), (len(tiles), self.strategy.get_num_boxes())
+        assert len(tiles) < len(self.strategy.get_hex_boxes()) / 10, len(tiles)
+
+        covered = set([tuple(position) for tile in tiles for position in tile['hexes']])
+        assert covered == set(self.strategy.get_hex_positions_overlapping()), len(covered)
+
+        results = []
+        for tile in tiles: # As a worker would count each tile
+            inside = (self.lats >= tile['min_lat']) & (self.lats < tile['max_lat']) & \
+                (self.lons >= tile['min_lon']) & (self.lons < tile['max_lon'])
+            counts = HexIndex(tile['hex_grid'], tile['hexes']).count_points(self.lats[inside], self.lons[inside])
+            results.append({'min_lat' : tile['min_lat'], 'min_lon' : tile['min_lon'], 'max_lat' : tile['max_lat'],
+                'max_lon' : tile['max_lon'], 'result' : counts})
+
+        hex_results = self.strategy.get_hex_results(results)
+        assert [result['result'] for result in hex_results if result['result'] > 0] == \
+            [count for count in self.strategy.bin_points(self.lats, self.lons) if count > 0]
+
+    def test_get_hex_results_split(self):
+        ''' Tests that the results of a split tile are summed back up per hex. '''
+        tile = self.strategy.get_inscribed_boxes()[0]
+        hex_key = '%d_%d' % tuple(tile['hexes'][0])
+        quarters = [{'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 0, 'max_lon' : 0, 'result' : {hex_key : count}}
+            for count in [1, 2, 3, 4]]
+
+        hex_results = self.strategy.get_hex_results(quarters)
+        assert len(hex_results) == 1, hex_results
+        assert hex_results[0]['result'] == 10, hex_results
+        assert (hex_results[0]['q'], hex_results[0]['r']) == tuple(tile['hexes'][0]), hex_results
+
+        encoded = json.loads(self.strategy.encode_results_geojson(quarters))
+        assert len(encoded['features']) == 1, encoded
+        assert encoded['features'][0]['properties']['fill'] == '#000010', encoded['features'][0]['properties']
+
+    def test_iter_results_geojson(self):
+        ''' Tests that results of single hexes are encoded as hexes. '''
+        boxes = self.strategy.get_hex_boxes()[:2]
+        results = [dict(box, result=index) for index, box in enumerate(boxes)]
+
+        encoded = json.loads(self.strategy.encode_results_geojson(results))
+        assert len(encoded['features']) == 2, encoded
+        for index in range(2):
+            ring = encoded['features'][index]['geometry']['coordinates'][0]
+            assert len(ring) == 7, ring
+            assert numpy.allclose(ring, boxes[index]['rings'][0]), (ring, boxes[index]['rings'][0])
+
+    def test_to_dict(self):
+        ''' Tests serializing and reconstructing the strategy. '''
+        state = json.loads(json.dumps(self.strategy.to_dict()))
+        assert state['class'] == 'hex_grid', state['class']
+
+        rebuilt = HexGridStrategyFactory(MockStyleStrategyFactory()).from_dict(state)
+        assert rebuilt.get_inscribed_boxes() == self.strategy.get_inscribed_boxes()
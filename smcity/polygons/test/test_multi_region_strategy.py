@@ -0,0 +1,142 @@
+''' Unit tests for the MultiRegionStrategy and RegionIndex classes. '''
+
+import json
+import math
+
+from smcity.polygons.multi_region_strategy import MultiRegionStrategy, MultiRegionStrategyFactory, RegionIndex, \
+    get_tile_index
+from smcity.polygons.test.test_quadtree_strategy import MockStyleStrategyFactory
+from smcity.polygons.test.test_simple_grid_strategy import MockStyleStrategy
+
+class MockRegionStore:
+    ''' Mock RegionStore holding a single region set. '''
+
+    def __init__(self, regions):
+        self.regions = regions
+
+    def add_regions(self, regions):
+        self.regions = regions
+        return 'region-set'
+
+    def get_regions(self, region_set_id):
+        assert region_set_id == 'region-set', region_set_id
+        return self.regions
+
+def ring(lon, lat, radius, num_vertices):
+    angles = [2 * math.pi * index / num_vertices for index in range(num_vertices)]
+    return [[lon + radius * math.cos(angle), lat + radius * math.sin(angle)] for angle in angles] + \
+        [[lon + radius, lat]]
+
+def square(min_lon, min_lat, size):
+    return {
+        'type' : 'Polygon',
+        'coordinates' : [[
+            [min_lon, min_lat], [min_lon + size, min_lat], [min_lon + size, min_lat + size],
+            [min_lon, min_lat + size], [min_lon, min_lat]
+        ]]
+    }
+
+class TestMultiRegionStrategy:
+    ''' Unit tests for the MultiRegionStrategy class. '''
+
+    def setup(self):
+        ''' Set up before each test. '''
+        self.regions = [
+            {'name' : 'west', 'geometry' : square(0, 0, 1)},
+            {'name' : 'east', 'geometry' : square(3, 0, 1)},
+            {'name' : 'triangle', 'geometry' : {
+                'type' : 'MultiPolygon', 'coordinates' : [[[[0, 3], [4, 3], [0, 4], [0, 3]]]]
+            }}
+        ]
+        self.region_store = MockRegionStore(self.regions)
+        self.strategy = MultiRegionStrategy(self.regions, 2, MockStyleStrategy(), 'region-set')
+
+    def test_get_inscribed_boxes(self):
+        ''' Tests that the scan tiles refer to the regions overlapping them. '''
+        tiles = self.strategy.get_inscribed_boxes()
+
+        assert len(tiles) == 4, tiles
+        assert self.strategy.get_num_boxes() == 4
+
+        region_ids = sorted([region_id for tile in tiles for region_id in tile['region_ids']])
+        assert region_ids == [0, 1, 2, 2], region_ids
+        assert all([tile['region_set_id'] == 'region-set' for tile in tiles]), tiles
+
+    def test_get_inscribed_boxes_many_regions(self):
+        ''' Tests that neither the job record nor the tasks grow with the regions' outlines. '''
+        regions = [{'name' : str(index), 'geometry' : {
+            'type' : 'Polygon', 'coordinates' : [ring(index % 20, index / 20, 0.45, 100)]
+        }} for index in range(300)]
+        strategy = MultiRegionStrategy(regions, 2, MockStyleStrategy(), 'region-set')
+
+        assert len(json.dumps(strategy.to_dict())) < 1024, strategy.to_dict()
+        tiles = strategy.get_inscribed_boxes()
+        assert max([len(json.dumps(tile)) for tile in tiles]) < 1024, tiles
+        assert sorted(set([region_id for tile in tiles for region_id in tile['region_ids']])) == range(300)
+
+        region_index = get_tile_index(MockRegionStore(regions), tiles[0])
+        counts = region_index.count_points([0, 1, 1.2], [0, 1, 1.2])
+        counts = dict([(region_id, count) for region_id, count in counts.items() if count > 0])
+        assert counts == {0 : 1, 21 : 2}, counts
+
+    def test_get_region_results(self):
+        ''' Tests that the tile results are summed per region. '''
+        results = [
+            {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 2, 'max_lon' : 2, 'result' : {'0' : 3}},
+            {'min_lat' : 2, 'min_lon' : 0, 'max_lat' : 4, 'max_lon' : 2, 'result' : {'2' : 4}},
+            {'min_lat' : 2, 'min_lon' : 2, 'max_lat' : 4, 'max_lon' : 4, 'result' : {'2' : 1}}
+        ]
+
+        region_results = self.strategy.get_region_results(results)
+        assert [(result['name'], result['result']) for result in region_results] == [('west', 3), ('triangle', 5)], \
+            region_results
+
+        encoded = json.loads(self.strategy.encode_results_geojson(results))
+        assert len(encoded['features']) == 2, encoded
+        assert encoded['features'][1]['properties']['name'] == 'triangle', encoded['features'][1]
+        assert encoded['features'][1]['geometry']['type'] == 'MultiPolygon', encoded['features'][1]
+
+    def test_get_region_results_split(self):
+        ''' Tests that the results of a split tile are summed back up per region. '''
+        quarters = [
+            {'min_lat' : 2, 'min_lon' : 0, 'max_lat' : 3, 'max_lon' : 1, 'result' : {'2' : 0}},
+            {'min_lat' : 2, 'min_lon' : 1, 'max_lat' : 3, 'max_lon' : 2, 'result' : {'2' : 0}},
+            {'min_lat' : 3, 'min_lon' : 0, 'max_lat' : 4, 'max_lon' : 1, 'result' : {'2' : 2}},
+            {'min_lat' : 3, 'min_lon' : 1, 'max_lat' : 4, 'max_lon' : 2, 'result' : {'2' : 1}}
+        ]
+
+        encoded = json.loads(self.strategy.encode_results_geojson(quarters))
+        assert len(encoded['features']) == 1, encoded
+        assert encoded['features'][0]['properties']['fill'] == '#000003', encoded['features'][0]
+
+    def test_get_tile_index(self):
+        ''' Tests attributing points to the regions of a tile, or of a quarter of one. '''
+        tile = self.strategy.get_inscribed_boxes()[0]
+        counts = get_tile_index(self.region_store, tile).count_points([0.5, 1.5], [0.5, 1.5])
+        assert counts == {0 : 1}, counts
+
+        quarter = dict(tile, min_lat=1.2, min_lon=1.2) # None of the regions reach into it
+        counts = get_tile_index(self.region_store, quarter).count_points([0.5, 1.5], [0.5, 1.5])
+        assert counts == {}, counts
+
+    def test_region_index(self):
+        ''' Tests attributing points to the regions of a tile. '''
+        region_index = RegionIndex([
+            {'id' : 0, 'rings' : self.regions[0]['geometry']['coordinates']},
+            {'id' : 2, 'rings' : self.regions[2]['geometry']['coordinates'][0]}
+        ])
+
+        counts = region_index.count_points([0.5, 0.5, 3.1, 3.9, 10], [0.5, 0.9, 0.1, 3.9, 10])
+        assert counts == {0 : 2, 2 : 1}, counts
+
+        counts = region_index.count_points([0.5, 0.5, 3.1, 3.9, 10], [0.5, 0.9, 0.1, 3.9, 10], [3, 4, 5, 6, 7])
+        assert counts == {0 : 7, 2 : 5}, counts
+
+    def test_to_dict(self):
+        ''' Tests serializing and reconstructing the strategy. '''
+        state = json.loads(json.dumps(self.strategy.to_dict()))
+        assert state['class'] == 'multi_region', state['class']
+
+        assert 'regions' not in state, state
+        rebuilt = MultiRegionStrategyFactory(MockStyleStrategyFactory(), self.region_store).from_dict(state)
+        assert rebuilt.get_inscribed_boxes() == json.loads(json.dumps(self.strategy.get_inscribed_boxes()))
@@ -0,0 +1,95 @@
+''' Unit tests for the Mapbox Vector Tile encoder. '''
+
+import struct
+
+from smcity.polygons.mvt_encoder import encode_results_mvt
+from smcity.polygons.tiles import get_covering_tiles
+
+class MockStyleStrategy:
+    def prep_styling(self, results):
+        pass
+
+    def style_result_geojson(self, result):
+        return {'fill' : '#ffffff'}
+
+def read_varint(data, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = ord(data[position])
+        value |= (byte & 0x7f) << shift
+        position += 1
+        shift += 7
+        if byte < 0x80:
+            return value, position
+
+def decode_message(data):
+    ''' Decodes a protobuf message into a dictionary of field number, list of raw values. '''
+    fields = {}
+    position = 0
+    while position < len(data):
+        key, position = read_varint(data, position)
+        field, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, position = read_varint(data, position)
+        elif wire_type == 1:
+            value, = struct.unpack('<d', data[position:position + 8])
+            position += 8
+        elif wire_type == 2:
+            length, position = read_varint(data, position)
+            value = data[position:position + length]
+            position += length
+        fields.setdefault(field, []).append(value)
+
+    return fields
+
+def decode_packed(data):
+    values = []
+    position = 0
+    while position < len(data):
+        value, position = read_varint(data, position)
+        values.append(value)
+
+    return values
+
+class TestMvtEncoder:
+    ''' Unit tests for the Mapbox Vector Tile encoder. '''
+
+    def test_encode_results_mvt(self):
+        ''' Tests the encode_results_mvt function. '''
+        results = [
+            {'min_lat' : -10, 'min_lon' : 0, 'max_lat' : 0, 'max_lon' : 90, 'result' : 3},
+            {'min_lat' : -10, 'min_lon' : -90, 'max_lat' : 0, 'max_lon' : -80, 'result' : 4}
+        ]
+
+        tile = decode_message(encode_results_mvt(results, MockStyleStrategy(), 1, 1, 1, extent=4096))
+
+        layer = decode_message(tile[3][0])
+        assert layer[15] == [2], layer[15]
+        assert layer[1] == ['results'], layer[1]
+        assert layer[5] == [4096], layer[5]
+        assert layer[3] == ['fill', 'result'], layer[3]
+        assert len(layer[2]) == 1, layer[2] # The western box is outside of the tile
+
+        feature = decode_message(layer[2][0])
+        assert feature[3] == [3], feature[3]
+        assert decode_packed(feature[2][0]) == [0, 0, 1, 1], decode_packed(feature[2][0])
+        assert decode_message(layer[4][1])[3] == [3.0], decode_message(layer[4][1])
+
+        # MoveTo(0, 0), LineTo(+2048, 0), LineTo(0, +228), LineTo(-2048, 0), ClosePath
+        geometry = decode_packed(feature[4][0])
+        assert geometry[0] == 9, geometry
+        assert geometry[1:3] == [0, 0], geometry
+        assert geometry[3] == 26, geometry
+        assert geometry[4:6] == [4096, 0], geometry
+        assert geometry[6] == 0 and geometry[7] > 0 and geometry[7] % 2 == 0, geometry
+        assert geometry[8:10] == [4095, 0], geometry
+        assert geometry[10] == 15, geometry
+
+    def test_get_covering_tiles(self):
+        ''' Tests the get_covering_tiles function. '''
+        tiles = get_covering_tiles({'min_lat' : -10, 'min_lon' : -10, 'max_lat' : 10, 'max_lon' : 10}, 1)
+        assert tiles == [(0, 0), (1, 0), (0, 1), (1, 1)], tiles
+
+        tiles = get_covering_tiles({'min_lat' : 1, 'min_lon' : 1, 'max_lat' : 2, 'max_lon' : 2}, 2)
+        assert tiles == [(2, 1)], tiles
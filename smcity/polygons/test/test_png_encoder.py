@@ -0,0 +1,45 @@
+''' Unit tests for the PNG encoder. '''
+
+import numpy
+import struct
+import zlib
+
+from smcity.polygons.png_encoder import PNG_SIGNATURE, encode_png
+
+def decode_png(png):
+    ''' Decodes the RGBA PNGs produced by encode_png. '''
+    assert png[:8] == PNG_SIGNATURE
+
+    position = 8
+    chunks = {}
+    while position < len(png):
+        length, = struct.unpack('>I', png[position:position + 4])
+        chunk_type = png[position + 4:position + 8]
+        data = png[position + 8:position + 8 + length]
+        crc, = struct.unpack('>I', png[position + 8 + length:position + 12 + length])
+        assert crc == zlib.crc32(chunk_type + data) & 0xffffffff, chunk_type
+        chunks[chunk_type] = data
+        position += 12 + length
+
+    width, height = struct.unpack('>II', chunks['IHDR'][:8])
+    scanlines = numpy.frombuffer(zlib.decompress(chunks['IDAT']), dtype=numpy.uint8)
+    scanlines = scanlines.reshape(height, width * 4 + 1)
+    assert (scanlines[:, 0] == 0).all()
+
+    return scanlines[:, 1:].reshape(height, width, 4)
+
+class TestPngEncoder:
+    ''' Unit tests for the PNG encoder. '''
+
+    def test_encode_png(self):
+        ''' Tests the encode_png function. '''
+        pixels = numpy.zeros((2, 3, 4), dtype=numpy.uint8)
+        pixels[0, 0] = [255, 0, 0, 255]
+        pixels[1, 2] = [0, 0, 255, 128]
+
+        png = encode_png(pixels)
+
+        assert 'IEND' in png[-12:]
+        decoded = decode_png(png)
+        assert decoded.shape == (2, 3, 4), decoded.shape
+        assert (decoded == pixels).all(), decoded
@@ -0,0 +1,92 @@
+''' Unit tests for the QuadtreeStrategy class. '''
+
+import json
+
+from smcity.polygons.quadtree_strategy import QuadtreeStrategyFactory, build_quadtree_strategy, \
+    estimate_from_results, get_leaves
+from smcity.polygons.test.test_simple_grid_strategy import MockStyleStrategy
+
+class MockStyleStrategyFactory:
+    def from_dict(self, state):
+        return MockStyleStrategy()
+
+class TestQuadtreeStrategy:
+    ''' Unit tests for the QuadtreeStrategy class. '''
+
+    def setup(self):
+        ''' Set up before each test. '''
+        self.coordinate_box = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 4, 'max_lon' : 4}
+
+        # All of the tweets are in the south west corner
+        self.estimate_count = estimate_from_results([
+            {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1, 'result' : 100},
+            {'min_lat' : 1, 'min_lon' : 1, 'max_lat' : 4, 'max_lon' : 4, 'result' : 0}
+        ])
+
+    def test_build_quadtree_strategy(self):
+        ''' Tests that only the dense cells are split. '''
+        strategy = build_quadtree_strategy(self.coordinate_box, self.estimate_count, 30, MockStyleStrategy())
+        boxes = strategy.get_inscribed_boxes()
+
+        # The root and the south west quarter are split, as is the south west 1x1 cell
+        assert len(boxes) == 10, boxes
+        areas = sorted([(box['max_lat'] - box['min_lat']) * (box['max_lon'] - box['min_lon']) for box in boxes])
+        assert areas == [0.25] * 4 + [1] * 3 + [4] * 3, areas
+        assert sum(areas) == 16, areas
+
+        for box in boxes:
+            assert self.estimate_count(box) <= 30, box
+
+    def test_build_quadtree_strategy_max_depth(self):
+        ''' Tests that cells stop splitting at the maximum depth. '''
+        strategy = build_quadtree_strategy(self.coordinate_box, self.estimate_count, 1, MockStyleStrategy(),
+            max_depth=1)
+
+        assert len(strategy.get_inscribed_boxes()) == 4, strategy.get_inscribed_boxes()
+
+    def test_get_leaves(self):
+        ''' Tests the get_leaves function. '''
+        leaves = get_leaves(self.coordinate_box, '101000000')
+        assert leaves == [
+            {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 2, 'max_lon' : 2},
+            {'min_lat' : 0, 'min_lon' : 2, 'max_lat' : 1, 'max_lon' : 3},
+            {'min_lat' : 0, 'min_lon' : 3, 'max_lat' : 1, 'max_lon' : 4},
+            {'min_lat' : 1, 'min_lon' : 2, 'max_lat' : 2, 'max_lon' : 3},
+            {'min_lat' : 1, 'min_lon' : 3, 'max_lat' : 2, 'max_lon' : 4},
+            {'min_lat' : 2, 'min_lon' : 0, 'max_lat' : 4, 'max_lon' : 2},
+            {'min_lat' : 2, 'min_lon' : 2, 'max_lat' : 4, 'max_lon' : 4}
+        ], leaves
+
+    def test_estimate_from_results(self):
+        ''' Tests the estimate_from_results function. '''
+        assert self.estimate_count(self.coordinate_box) == 100
+        assert self.estimate_count({'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 0.5, 'max_lon' : 1}) == 50
+        assert self.estimate_count({'min_lat' : 2, 'min_lon' : 2, 'max_lat' : 4, 'max_lon' : 4}) == 0
+
+    def test_get_leaf_results_split(self):
+        ''' Tests that the results of a split leaf are summed back up into the leaf. '''
+        strategy = build_quadtree_strategy(self.coordinate_box, self.estimate_count, 30, MockStyleStrategy())
+        leaf = [box for box in strategy.get_inscribed_boxes() if box['max_lat'] - box['min_lat'] == 2][0]
+        mid_lat = (leaf['min_lat'] + leaf['max_lat']) / 2.0
+        results = [dict(leaf, result=5)]
+        for min_lat, max_lat in ((leaf['min_lat'], mid_lat), (mid_lat, leaf['max_lat'])): # Split in halves
+            results.append(dict(leaf, min_lat=min_lat, max_lat=max_lat, result=1))
+
+        leaf_results = strategy.get_leaf_results(results)
+        assert leaf_results == [dict(leaf, result=7)], leaf_results
+
+        collection = json.loads(strategy.encode_results_geojson(results[1:]))
+        assert len(collection['features']) == 1, collection['features']
+        assert collection['features'][0]['properties']['fill'] == '#000002', collection['features'][0]
+
+    def test_to_dict(self):
+        ''' Tests serializing and reconstructing the strategy. '''
+        strategy = build_quadtree_strategy(self.coordinate_box, self.estimate_count, 30, MockStyleStrategy())
+
+        state = json.loads(json.dumps(strategy.to_dict()))
+        assert state['class'] == 'quadtree', state['class']
+        assert state['splits'] == '1110000000000', state['splits'] # One flag per cell, not the leaf boxes
+
+        rebuilt = QuadtreeStrategyFactory(MockStyleStrategyFactory()).from_dict(state)
+        assert rebuilt.get_inscribed_boxes() == strategy.get_inscribed_boxes()
+        assert rebuilt.coordinate_box == self.coordinate_box, rebuilt.coordinate_box
@@ -0,0 +1,57 @@
+''' Unit tests for the StrTree class. '''
+
+import numpy
+
+from smcity.polygons.rtree import StrTree
+
+class TestStrTree:
+    ''' Unit tests for the StrTree class. '''
+
+    def setup(self):
+        ''' Set up before each test. '''
+        random = numpy.random.RandomState(0)
+        min_lats = random.uniform(0, 10, 500)
+        min_lons = random.uniform(0, 10, 500)
+        self.boxes = numpy.column_stack([
+            min_lats, min_lons, min_lats + random.uniform(0, 1, 500), min_lons + random.uniform(0, 1, 500)
+        ])
+        self.tree = StrTree(self.boxes, node_capacity=4)
+
+    def test_levels(self):
+        ''' Tests that the tree is packed into levels of full nodes. '''
+        assert len(self.tree.level_boxes) > 2, len(self.tree.level_boxes)
+        assert len(self.tree.level_boxes[-1]) <= 4, len(self.tree.level_boxes[-1])
+        assert len(self.tree.level_boxes[1]) == 125, len(self.tree.level_boxes[1])
+
+    def test_query_box(self):
+        ''' Tests that box queries agree with a brute force search. '''
+        area = {'min_lat' : 2, 'min_lon' : 3, 'max_lat' : 4, 'max_lon' : 7}
+
+        expected = numpy.flatnonzero((self.boxes[:, 0] <= 4) & (self.boxes[:, 2] >= 2) &
+            (self.boxes[:, 1] <= 7) & (self.boxes[:, 3] >= 3)).tolist()
+        assert self.tree.query_box(area) == expected, self.tree.query_box(area)
+
+    def test_query_points(self):
+        ''' Tests that point queries agree with a brute force search. '''
+        random = numpy.random.RandomState(1)
+        lats = random.uniform(0, 11, 300)
+        lons = random.uniform(0, 11, 300)
+
+        points, boxes = self.tree.query_points(lats, lons)
+        found = sorted(zip(points.tolist(), boxes.tolist()))
+
+        expected = []
+        for point in range(len(lats)):
+            for box in range(len(self.boxes)):
+                if self.boxes[box, 0] <= lats[point] <= self.boxes[box, 2] and \
+                        self.boxes[box, 1] <= lons[point] <= self.boxes[box, 3]:
+                    expected.append((point, box))
+
+        assert found == expected, (len(found), len(expected))
+
+    def test_query_points_empty(self):
+        ''' Tests a point query which matches nothing. '''
+        points, boxes = self.tree.query_points([50], [50])
+
+        assert len(points) == 0, points
+        assert len(boxes) == 0, boxes
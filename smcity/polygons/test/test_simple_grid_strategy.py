@@ -1,6 +1,25 @@
 ''' Unit tests for the SimpleGridStrategy class. '''
 
+import json
+import numpy
+
+from StringIO import StringIO
+
 from smcity.polygons.simple_grid_strategy import SimpleGridStrategy
+from smcity.polygons.test.test_png_encoder import decode_png
+
+class MockStyleStrategy:
+    def get_rgb_colors(self, values):
+        return numpy.array([[value, value, value] for value in values], dtype=numpy.uint8)
+
+    def prep_styling(self, results):
+        self.prepped = sorted([result['result'] for result in results])
+
+    def style_result_geojson(self, result):
+        return {'fill' : '#%06d' % result['result']}
+
+    def to_dict(self):
+        return {'class' : 'mock_style'}
 
 class TestSimpleGridStrategy:
     
@@ -8,7 +27,7 @@ class TestSimpleGridStrategy:
         ''' Tests the function get_inscribed_boxes. '''
         coordinate_box = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}
         resolution = 0.6
-        strategy = SimpleGridStrategy(coordinate_box, resolution)
+        strategy = SimpleGridStrategy(coordinate_box, resolution, MockStyleStrategy())
  
         coordinate_boxes = strategy.get_inscribed_boxes()
 
@@ -30,11 +49,26 @@ class TestSimpleGridStrategy:
         assert coordinate_boxes[3]['max_lat'] == 1, coordinate_boxes[3]['max_lat']
         assert coordinate_boxes[3]['max_lon'] == 1, coordinate_boxes[3]['max_lon']
 
+    def test_iter_inscribed_boxes(self):
+        ''' Tests that the lazy, array and counted forms of the boxes agree. '''
+        coordinate_box = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 2.5}
+        strategy = SimpleGridStrategy(coordinate_box, 0.3, MockStyleStrategy())
+
+        boxes = list(strategy.iter_inscribed_boxes())
+        assert strategy.get_num_boxes() == len(boxes) == 36, (strategy.get_num_boxes(), len(boxes))
+        assert strategy.get_inscribed_boxes() == boxes
+
+        box_array = strategy.get_inscribed_box_array()
+        assert box_array.shape == (36, 4), box_array.shape
+        for index in range(len(boxes)):
+            expected = [boxes[index]['min_lat'], boxes[index]['min_lon'], boxes[index]['max_lat'], boxes[index]['max_lon']]
+            assert list(box_array[index]) == expected, (box_array[index], expected)
+
     def test_to_dict(self):
         ''' Tests the to_dict function. '''
         coordinate_box = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}
         resolution = 0.6
-        strategy = SimpleGridStrategy(coordinate_box, resolution)
+        strategy = SimpleGridStrategy(coordinate_box, resolution, MockStyleStrategy())
 
         flattened = strategy.to_dict()
 
@@ -44,3 +78,112 @@ class TestSimpleGridStrategy:
         assert flattened['coordinate_box']['min_lon'] == 0, flattened['coordinate_box']['min_lon']
         assert flattened['coordinate_box']['max_lat'] == 1, flattened['coordinate_box']['max_lat']
         assert flattened['coordinate_box']['max_lon'] == 1, flattened['cooridnate_box']['max_lon']
+
+    def test_iter_results_geojson(self):
+        ''' Tests the iter_results_geojson and encode_results_geojson functions. '''
+        coordinate_box = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}
+        strategy = SimpleGridStrategy(coordinate_box, 0.6, MockStyleStrategy())
+        results = []
+        for box in strategy.get_inscribed_boxes():
+            box['result'] = len(results)
+            results.append(box)
+
+        chunks = list(strategy.iter_results_geojson(results, chunk_size=2))
+        assert len(chunks) == 3, len(chunks)
+
+        collection = json.loads(''.join(chunks))
+        assert collection['type'] == 'FeatureCollection', collection['type']
+        assert len(collection['features']) == 4, len(collection['features'])
+        assert collection['features'][3]['properties']['fill'] == '#000003', \
+            collection['features'][3]['properties']
+        assert collection['features'][1]['geometry']['coordinates'][0][0] == [0.6, 0], \
+            collection['features'][1]['geometry']['coordinates'][0][0]
+
+        assert json.loads(strategy.encode_results_geojson(results)) == collection
+
+        # Try to encode an empty result set
+        collection = json.loads(strategy.encode_results_geojson([]))
+        assert collection['features'] == [], collection['features']
+
+    def test_iter_results_geojson_split(self):
+        ''' Tests that the results of a split cell are summed back up into the cell. '''
+        coordinate_box = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}
+        strategy = SimpleGridStrategy(coordinate_box, 0.5, MockStyleStrategy())
+        results = [
+            {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 0.25, 'max_lon' : 0.25, 'result' : 1},
+            {'min_lat' : 0.5, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 0.5, 'result' : 5},
+            {'min_lat' : 0, 'min_lon' : 0.25, 'max_lat' : 0.25, 'max_lon' : 0.5, 'result' : 2},
+            {'min_lat' : 0.25, 'min_lon' : 0, 'max_lat' : 0.5, 'max_lon' : 0.25, 'result' : 3},
+            {'min_lat' : 0.25, 'min_lon' : 0.25, 'max_lat' : 0.5, 'max_lon' : 0.5, 'result' : 4}
+        ]
+
+        collection = json.loads(strategy.encode_results_geojson(results))
+        assert len(collection['features']) == 2, collection['features']
+        assert collection['features'][0]['properties']['fill'] == '#000010', collection['features'][0]
+        assert collection['features'][0]['geometry']['coordinates'][0] == \
+            [[0, 0], [0, 0.5], [0.5, 0.5], [0.5, 0], [0, 0]], collection['features'][0]['geometry']
+        assert collection['features'][1]['properties']['fill'] == '#000005', collection['features'][1]
+
+    def test_write_results_geojson(self):
+        ''' Tests the write_results_geojson function. '''
+        coordinate_box = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}
+        strategy = SimpleGridStrategy(coordinate_box, 0.6, MockStyleStrategy())
+        results = [{'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 0.6, 'max_lon' : 0.6, 'result' : 7}]
+
+        stream = StringIO()
+        num_written = strategy.write_results_geojson(results, stream)
+
+        assert num_written == len(stream.getvalue()), num_written
+        assert stream.getvalue() == strategy.encode_results_geojson(results), stream.getvalue()
+
+    def test_encode_results_png(self):
+        ''' Tests the encode_results_png function. '''
+        coordinate_box = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 1, 'max_lon' : 1}
+        strategy = SimpleGridStrategy(coordinate_box, 0.6, MockStyleStrategy())
+        results = [
+            {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 0.6, 'max_lon' : 0.6, 'result' : 10},
+            {'min_lat' : 0.6, 'min_lon' : 0.6, 'max_lat' : 1, 'max_lon' : 1, 'result' : 20},
+            {'min_lat' : 0.6, 'min_lon' : 0.6, 'max_lat' : 0.8, 'max_lon' : 0.8, 'result' : 5}
+        ]
+
+        pixels = decode_png(strategy.encode_results_png(results, pixels_per_cell=2))
+
+        assert pixels.shape == (4, 4, 4), pixels.shape
+        assert list(pixels[3, 0]) == [10, 10, 10, 255], pixels[3, 0] # South west cell
+        assert list(pixels[0, 3]) == [25, 25, 25, 255], pixels[0, 3] # North east cell, sub-boxes summed
+        assert pixels[0, 0, 3] == 0, pixels[0, 0] # No result for the north west cell
+
+    def test_encode_results_png_split(self):
+        ''' Tests that the styling is prepped on the values of the cells, not of their split pieces. '''
+        coordinate_box = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 80, 'max_lon' : 170}
+        style_strategy = MockStyleStrategy()
+        strategy = SimpleGridStrategy(coordinate_box, 90, style_strategy)
+        results = [
+            {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 40, 'max_lon' : 45, 'result' : 1},
+            {'min_lat' : 0, 'min_lon' : 45, 'max_lat' : 40, 'max_lon' : 90, 'result' : 2},
+            {'min_lat' : 40, 'min_lon' : 0, 'max_lat' : 80, 'max_lon' : 45, 'result' : 3},
+            {'min_lat' : 40, 'min_lon' : 45, 'max_lat' : 80, 'max_lon' : 90, 'result' : 4},
+            {'min_lat' : 0, 'min_lon' : 90, 'max_lat' : 80, 'max_lon' : 170, 'result' : 8}
+        ]
+
+        pixels = decode_png(strategy.encode_results_png(results))
+        assert style_strategy.prepped == [8, 10], style_strategy.prepped
+        assert list(pixels[0, 0]) == [10, 10, 10, 255], pixels[0, 0]
+
+        style_strategy.prepped = None
+        pixels = decode_png(strategy.encode_results_png_tile(results, 1, 1, 0, tile_size=4))
+        assert style_strategy.prepped == [8, 10], style_strategy.prepped
+        assert list(pixels[3, 0]) == [10, 10, 10, 255], pixels[3, 0]
+
+    def test_encode_results_png_tile(self):
+        ''' Tests the encode_results_png_tile function. '''
+        coordinate_box = {'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 80, 'max_lon' : 170}
+        strategy = SimpleGridStrategy(coordinate_box, 90, MockStyleStrategy())
+        results = [{'min_lat' : 0, 'min_lon' : 0, 'max_lat' : 80, 'max_lon' : 90, 'result' : 7}]
+
+        pixels = decode_png(strategy.encode_results_png_tile(results, 1, 1, 0, tile_size=4))
+
+        assert pixels.shape == (4, 4, 4), pixels.shape
+        assert list(pixels[3, 0]) == [7, 7, 7, 255], pixels[3, 0]
+        assert pixels[3, 3, 3] == 0, pixels[3, 3] # Cell without a result
+        assert pixels[0, 0, 3] == 0, pixels[0, 0] # North of the grid area
@@ -0,0 +1,121 @@
+''' Helpers for working with z/x/y web mercator map tiles. '''
+
+import math
+import numpy
+
+# Latitude limit of the web mercator projection
+MAX_LAT = 85.0511287798
+
+def get_covering_tiles(coordinate_box, zoom):
+    '''
+    @param coordinate_box Area to be covered
+    @paramType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+    @param zoom Zoom level of the tiles
+    @paramType int
+    @returns Tiles which overlap the area
+    @returnType list of (x, y) tuples
+    '''
+    max_tile = 2 ** zoom - 1
+    min_x = max(0, int(math.floor(lon_to_tile_x(zoom, coordinate_box['min_lon']))))
+    max_x = min(max_tile, int(math.floor(lon_to_tile_x(zoom, coordinate_box['max_lon']))))
+    min_y = max(0, int(math.floor(lat_to_tile_y(zoom, min(coordinate_box['max_lat'], MAX_LAT)))))
+    max_y = min(max_tile, int(math.floor(lat_to_tile_y(zoom, max(coordinate_box['min_lat'], -MAX_LAT)))))
+
+    return [(x, y) for y in range(min_y, max_y + 1) for x in range(min_x, max_x + 1)]
+
+def get_pixel_lats(zoom, y, tile_size=256):
+    '''
+    @param zoom Zoom level of the tile
+    @paramType int
+    @param y Row of the tile, 0 being the northern most
+    @paramType int
+    @param tile_size Height of the tile in pixels
+    @paramType int
+    @returns Latitude at the center of each pixel row, from north to south
+    @returnType numpy array of float
+    '''
+    rows = (y + (numpy.arange(tile_size) + 0.5) / tile_size) / float(2 ** zoom)
+
+    return numpy.degrees(numpy.arctan(numpy.sinh(math.pi * (1 - 2 * rows))))
+
+def get_pixel_lons(zoom, x, tile_size=256):
+    '''
+    @param zoom Zoom level of the tile
+    @paramType int
+    @param x Column of the tile, 0 being the western most
+    @paramType int
+    @param tile_size Width of the tile in pixels
+    @paramType int
+    @returns Longitude at the center of each pixel column, from west to east
+    @returnType numpy array of float
+    '''
+    columns = (x + (numpy.arange(tile_size) + 0.5) / tile_size) / float(2 ** zoom)
+
+    return columns * 360.0 - 180.0
+
+def get_tile_box(zoom, x, y):
+    '''
+    @param zoom Zoom level of the tile
+    @paramType int
+    @param x Column of the tile, 0 being the western most
+    @paramType int
+    @param y Row of the tile, 0 being the northern most
+    @paramType int
+    @returns Area covered by the tile
+    @returnType dictionary with keys 'min_lat', 'min_lon', 'max_lat', 'max_lon'
+    '''
+    assert 0 <= x < 2 ** zoom, x
+    assert 0 <= y < 2 ** zoom, y
+
+    return {
+        'min_lat' : tile_y_to_lat(zoom, y + 1),
+        'min_lon' : tile_x_to_lon(zoom, x),
+        'max_lat' : tile_y_to_lat(zoom, y),
+        'max_lon' : tile_x_to_lon(zoom, x + 1)
+    }
+
+def lat_to_tile_y(zoom, lat):
+    '''
+    @param zoom Zoom level
+    @paramType int
+    @param lat Latitude to project
+    @paramType float
+    @returns Fractional tile row of the latitude
+    @returnType float
+    '''
+    lat_rad = math.radians(lat)
+
+    return (1 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2 * 2 ** zoom
+
+def lon_to_tile_x(zoom, lon):
+    '''
+    @param zoom Zoom level
+    @paramType int
+    @param lon Longitude to project
+    @paramType float
+    @returns Fractional tile column of the longitude
+    @returnType float
+    '''
+    return (lon + 180.0) / 360.0 * 2 ** zoom
+
+def tile_x_to_lon(zoom, x):
+    '''
+    @param zoom Zoom level
+    @paramType int
+    @param x Fractional tile column
+    @paramType float
+    @returns Longitude of the column
+    @returnType float
+    '''
+    return x / float(2 ** zoom) * 360.0 - 180.0
+
+def tile_y_to_lat(zoom, y):
+    '''
+    @param zoom Zoom level
+    @paramType int
+    @param y Fractional tile row
+    @paramType float
+    @returns Latitude of the row
+    @returnType float
+    '''
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / float(2 ** zoom)))))
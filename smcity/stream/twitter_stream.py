@@ -17,7 +17,7 @@ logger = Logger(__name__)
 class TwitterStreamListener(StreamListener):
     ''' Consumes the twitter stream and uploads the messages into the database. '''
     
-    def __init__(self, config, tweet_factory):
+    def __init__(self, config, tweet_factory, standing_queries=None, rollup=None):
         '''
         Constructor.
 
@@ -29,6 +29,10 @@ class TwitterStreamListener(StreamListener):
         @paramType ConfigParser
         @param tweet_factory Interface for creating new tweets
         @paramType TweetFactory
+        @param standing_queries Standing queries to update as tweets arrive, if any
+        @paramType StandingQueryRegistry
+        @param rollup Hourly rollup to count the tweets towards as they arrive, if any
+        @paramType TweetRollup
         @returns n/a
         '''
         assert tweet_factory is not None, "tweet_factory must not be None"
@@ -54,8 +58,10 @@ class TwitterStreamListener(StreamListener):
         listener = self
         self.stream = Stream(auth_handler, listener)
 
-        self.tweet_factory = tweet_factory       
-        self.num_tweets    = 0
+        self.tweet_factory    = tweet_factory
+        self.standing_queries = standing_queries
+        self.rollup           = rollup
+        self.num_tweets       = 0
 
     def _consume_stream(self, min_lon, min_lat, max_lon, max_lat):
         '''
@@ -129,6 +135,11 @@ class TwitterStreamListener(StreamListener):
                                 .strftime('%Y-%m-%d %X') # TODO Temp +0000
 
             self.tweet_factory.create_tweet(id, message, place, timestamp, lat, lon)
+
+            if self.standing_queries is not None: # Incrementally update any live maps
+                self.standing_queries.add_tweet(lat, lon, timestamp)
+            if self.rollup is not None: # Saves reading the hour back from the table
+                self.rollup.add_tweet(lat, lon, timestamp, message)
         except:
             logger.warn("Bad Tweet: %s", tweet_str)
             logger.exception()
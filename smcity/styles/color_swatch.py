@@ -1,5 +1,7 @@
 ''' Encapsulates a set of color values that can be assigned to style polygons. '''
 
+import numpy
+
 class ColorSwatch:
     ''' Encapsulates a set of color values that can be assigned to style polygons. '''
 
@@ -15,6 +17,13 @@ class ColorSwatch:
  
         self.colors = colors
 
+        # Precompute the lookup tables used when styling many results at once
+        self.color_table = numpy.array(colors)
+        self.rgb_table = numpy.array(
+            [[int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16)] for color in colors],
+            dtype=numpy.uint8
+        )
+
     def get_color(self, index):
         '''
         @param index Position in the swatch whose color we want
@@ -26,6 +35,15 @@ class ColorSwatch:
 
         return self.colors[index]
 
+    def get_colors(self, indices):
+        '''
+        @param indices Positions in the swatch whose colors we want
+        @paramType numpy array of int
+        @returns Colors at those index positions
+        @returnType numpy array of string/hex color notation (#XXXXXX)
+        '''
+        return self.color_table[indices]
+
     def get_num_colors(self):
         '''
         @returns # of colors in this swatch
@@ -33,6 +51,15 @@ class ColorSwatch:
         '''
         return len(self.colors)
 
+    def get_rgb_colors(self, indices):
+        '''
+        @param indices Positions in the swatch whose colors we want
+        @paramType numpy array of int
+        @returns Red, green and blue components of the colors at those index positions
+        @returnType numpy array of uint8 with a trailing dimension of size 3
+        '''
+        return self.rgb_table[indices]
+
     def to_dict(self):
         '''
         @returns This object flattened into a dictionary for later JSON encoding
@@ -1,14 +1,18 @@
 ''' Generates heat map styling for polygons in a result set. '''
 
+import numpy
+
 from smcity.logging.logger import Logger
 from smcity.styles.style_strategy import StyleStrategy, StyleStrategyFactory
 
 logger = Logger(__name__)
 
+SCALES = ('linear', 'log', 'quantile')
+
 class HeatMapStyleStrategy(StyleStrategy):
     ''' Generates heap map styling for polygons in a result set. '''
 
-    def __init__(self, color_swatch, min_value=None, max_value=None):
+    def __init__(self, color_swatch, min_value=None, max_value=None, scale='linear'):
         '''
         Constructor.
 
@@ -18,41 +22,107 @@ class HeatMapStyleStrategy(StyleStrategy):
         @paramType numeric
         @param max_value Max value to use when heat coloring the individual results
         @paramType numeric
+        @param scale How values are mapped onto the colors, one of 'linear', 'log' or 'quantile'
+        @paramType string
         @returns n/a
         '''
+        assert scale in SCALES, scale
+
+        self.breaks = None
         self.color_swatch = color_swatch
+        self.fills = {} # Result value to its heat color, for the values of the prepared result set
         self.min_value = min_value
         self.max_value = max_value
+        self.scale = scale
 
-    def prep_styling(self, results):
+    def get_colors(self, values):
+        '''
+        Looks up the heat colors of many result values in one vectorised pass.
+
+        @param values Result values to be colored
+        @paramType sequence or numpy array of numeric
+        @returns Heat colors of the values
+        @returnType numpy array of string/hex color notation (#XXXXXX)
+        '''
+        return self.color_swatch.get_colors(self.style_values(values))
+
+    def get_rgb_colors(self, values):
         ''' {@inheritDocs} '''
-        self.min_value = 99999999
-        self.max_value = -99999999
+        return self.color_swatch.get_rgb_colors(self.style_values(values))
+
+    def prep_styling(self, results):
+        ''' Also colors each distinct result value once, for style_result_geojson() to look up. {@inheritDocs} '''
+        values = numpy.asarray([result['result'] for result in results], dtype=float)
+        self.prep_values(values) # Quantile breaks need every value, not just the distinct ones
 
-        for result in results:
-            if result['result'] < self.min_value:
-                self.min_value = result['result']
-            if result['result'] > self.max_value:
-                self.max_value = result['result']
+        distinct_values = numpy.unique(values)
+        self.fills = dict(zip(distinct_values.tolist(), self.get_colors(distinct_values).tolist()))
+
+    def prep_values(self, values):
+        '''
+        Extracts the value range (and quantile breaks) needed to heat color the provided values.
+
+        @param values All of the result values in the result set
+        @paramType sequence or numpy array of numeric
+        @returns n/a
+        '''
+        values = numpy.asarray(values, dtype=float)
+        self.fills = {} # Colored for the previous value range
+
+        if len(values) == 0: # Nothing to style
+            self.min_value = 0
+            self.max_value = 0
+            self.breaks = numpy.zeros(0)
+            return
+
+        self.min_value = float(values.min())
+        self.max_value = float(values.max())
+
+        if self.scale == 'quantile': # Split the values into equally populated color classes
+            num_colors = self.color_swatch.get_num_colors()
+            self.breaks = numpy.percentile(values, numpy.linspace(0, 100, num_colors + 1)[1:-1])
 
         logger.debug("Min: %s, Max: %s", self.min_value, self.max_value)
 
     def style_result_geojson(self, result):
         ''' {@inheritDocs} '''
+        fill = self.fills.get(result['result'])
+        if fill is None: # Not part of the prepared result set
+            fill = self.color_swatch.get_color(self.style_values([result['result']])[0])
+
+        return {'fill' : fill}
+
+    def style_values(self, values):
+        '''
+        Computes the heat color index of many result values in one vectorised pass.
+
+        @param values Result values to be colored
+        @paramType sequence or numpy array of numeric
+        @returns Positions of the values' heat colors in the color swatch
+        @returnType numpy array of int
+        '''
         assert self.min_value is not None, "Must call prep_styling() first!"
         assert self.max_value is not None, "Must call prep_styling() first!"
 
-        value_range = float(self.max_value - self.min_value)
-        heat_index = 0
-        if value_range > 0:
-            print "Result: ", result['result']
-            print "ValueRange: ", value_range
-            print "Ratio: ", (result['result'] / value_range)
-            print "# Colors: ", self.color_swatch.get_num_colors()
-            heat_index = int((result['result'] / value_range) * (self.color_swatch.get_num_colors() - 1))
-        heat_color = self.color_swatch.get_color(heat_index)
+        values = numpy.asarray(values, dtype=float)
+        num_colors = self.color_swatch.get_num_colors()
+
+        if self.scale == 'quantile':
+            assert self.breaks is not None, "Must call prep_styling() first!"
+            heat_indices = numpy.searchsorted(self.breaks, values, side='right')
+        else:
+            value_range = float(self.max_value - self.min_value)
+            if value_range <= 0: # Every value gets the coolest color
+                return numpy.zeros(values.shape, dtype=int)
+
+            offsets = numpy.clip(values - self.min_value, 0, value_range)
+            if self.scale == 'log':
+                ratios = numpy.log1p(offsets) / numpy.log1p(value_range)
+            else:
+                ratios = offsets / value_range
+            heat_indices = (ratios * (num_colors - 1)).astype(int)
 
-        return {'fill' : heat_color}
+        return numpy.clip(heat_indices, 0, num_colors - 1)
 
     def to_dict(self):
         ''' {@inheritDocs} '''
@@ -60,7 +130,8 @@ class HeatMapStyleStrategy(StyleStrategy):
             'class' : 'heat_map',
             'color_swatch' : self.color_swatch.to_dict(),
             'min_value' : self.min_value,
-            'max_value' : self.max_value
+            'max_value' : self.max_value,
+            'scale' : self.scale
         }
 
 class HeatMapStyleStrategyFactory(StyleStrategyFactory):
@@ -84,6 +155,6 @@ class HeatMapStyleStrategyFactory(StyleStrategyFactory):
 
         return HeatMapStyleStrategy(
             self.color_swatch_factory.from_dict(state['color_swatch']), 
-            state['min_value'], state['max_value']
+            state['min_value'], state['max_value'], state.get('scale', 'linear')
         )
         
@@ -3,6 +3,17 @@
 class StyleStrategy:
     ''' Strategy for generating polygon styles based on analytics results. '''
 
+    def get_rgb_colors(self, values):
+        '''
+        Generates raster colors for many result values at once. Must be called after prep_styling().
+
+        @param values Result values to be colored
+        @paramType sequence or numpy array of numeric
+        @returns Red, green and blue components of each value's color
+        @returnType numpy array of uint8 with a trailing dimension of size 3
+        '''
+        raise NotImplementedError()
+
     def prep_styling(self, results):
         '''
         Parses the entire result set to extract any needed data to control styling. For example,
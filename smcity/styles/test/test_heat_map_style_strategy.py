@@ -0,0 +1,125 @@
+''' Unit tests for the HeatMapStyleStrategy class. '''
+
+import numpy
+import sys
+
+from StringIO import StringIO
+
+from smcity.styles.color_swatch import ColorSwatch, ColorSwatchFactory
+from smcity.styles.heat_map_style_strategy import HeatMapStyleStrategy, HeatMapStyleStrategyFactory
+
+COLORS = ['#000000', '#111111', '#222222', '#333333', '#444444']
+
+class CountingColorSwatch(ColorSwatch):
+    def __init__(self, colors):
+        ColorSwatch.__init__(self, colors)
+        self.num_color_calls = 0
+        self.num_colors_calls = 0
+
+    def get_color(self, index):
+        self.num_color_calls += 1
+        return ColorSwatch.get_color(self, index)
+
+    def get_colors(self, indices):
+        self.num_colors_calls += 1
+        return ColorSwatch.get_colors(self, indices)
+
+class TestHeatMapStyleStrategy:
+    ''' Unit tests for the HeatMapStyleStrategy class. '''
+
+    def test_style_values_linear(self):
+        ''' Tests linear heat coloring. '''
+        strategy = HeatMapStyleStrategy(ColorSwatch(COLORS))
+        strategy.prep_values([10, 20, 30, 50])
+
+        heat_indices = strategy.style_values([10, 20, 30, 50, 100])
+        assert list(heat_indices) == [0, 1, 2, 4, 4], heat_indices
+
+    def test_style_values_log(self):
+        ''' Tests logarithmic heat coloring. '''
+        strategy = HeatMapStyleStrategy(ColorSwatch(COLORS), scale='log')
+        strategy.prep_values([0, 1, 10, 100, 1000])
+
+        heat_indices = strategy.style_values([0, 1, 10, 100, 1000])
+        assert list(heat_indices) == [0, 0, 1, 2, 4], heat_indices
+
+    def test_style_values_quantile(self):
+        ''' Tests quantile heat coloring. '''
+        strategy = HeatMapStyleStrategy(ColorSwatch(COLORS), scale='quantile')
+        values = [1, 1, 2, 2, 3, 3, 4, 4, 1000, 1000]
+        strategy.prep_values(values)
+
+        heat_indices = strategy.style_values(values)
+        assert list(heat_indices) == [0, 0, 1, 1, 2, 2, 3, 3, 4, 4], heat_indices
+
+    def test_style_values_empty_range(self):
+        ''' Tests heat coloring when every value is the same. '''
+        strategy = HeatMapStyleStrategy(ColorSwatch(COLORS))
+        strategy.prep_styling([{'result' : 5}, {'result' : 5}])
+
+        assert strategy.style_result_geojson({'result' : 5}) == {'fill' : '#000000'}
+
+    def test_style_result_geojson(self):
+        ''' Tests styling individual results without writing to stdout. '''
+        strategy = HeatMapStyleStrategy(ColorSwatch(COLORS))
+        strategy.prep_styling([{'result' : 0}, {'result' : 8}])
+
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            style = strategy.style_result_geojson({'result' : 4})
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+        assert style == {'fill' : '#222222'}, style
+        assert output == '', output
+
+    def test_style_result_geojson_quantile(self):
+        ''' Tests that the prepared colors of a result set match its batch colors. '''
+        strategy = HeatMapStyleStrategy(ColorSwatch(COLORS), scale='quantile')
+        results = [{'result' : value} for value in [1, 1, 2, 2, 3, 3, 4, 4, 1000, 1000]]
+        strategy.prep_styling(results)
+
+        fills = [strategy.style_result_geojson(result)['fill'] for result in results]
+        assert fills == list(strategy.get_colors([result['result'] for result in results])), fills
+        assert strategy.style_result_geojson({'result' : 5})['fill'] == '#333333' # Not prepared
+
+    def test_get_colors_large(self):
+        ''' Tests that a large result set is styled in one vectorised pass, not value by value. '''
+        color_swatch = CountingColorSwatch(COLORS)
+        strategy = HeatMapStyleStrategy(color_swatch)
+        values = numpy.arange(100000)
+
+        strategy.prep_values(values)
+        colors = strategy.get_colors(values)
+
+        assert len(colors) == 100000, len(colors)
+        assert colors[0] == '#000000', colors[0]
+        assert colors[-1] == '#444444', colors[-1]
+        assert color_swatch.num_colors_calls == 1, color_swatch.num_colors_calls
+        assert color_swatch.num_color_calls == 0, color_swatch.num_color_calls
+
+    def test_prep_styling_distinct(self):
+        ''' Tests that preparing a result set colors its distinct values in a single batch. '''
+        color_swatch = CountingColorSwatch(COLORS)
+        strategy = HeatMapStyleStrategy(color_swatch)
+        strategy.prep_styling([{'result' : value % 5} for value in range(10000)])
+
+        assert sorted(strategy.fills.keys()) == [0, 1, 2, 3, 4], strategy.fills
+        assert color_swatch.num_colors_calls == 1, color_swatch.num_colors_calls
+
+        fills = [strategy.style_result_geojson({'result' : value})['fill'] for value in range(5)]
+        assert fills == COLORS, fills
+        assert color_swatch.num_colors_calls == 1 and color_swatch.num_color_calls == 0
+
+    def test_to_dict(self):
+        ''' Tests flattening and reconstructing the strategy. '''
+        strategy = HeatMapStyleStrategy(ColorSwatch(COLORS), 0, 10, 'log')
+
+        flattened = strategy.to_dict()
+        assert flattened['scale'] == 'log', flattened['scale']
+
+        strategy = HeatMapStyleStrategyFactory(ColorSwatchFactory()).from_dict(flattened)
+        assert strategy.scale == 'log', strategy.scale
+        assert strategy.max_value == 10, strategy.max_value